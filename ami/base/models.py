@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.auth.models import AbstractUser, AnonymousUser
 from django.db import models
 from django.db.models import Q, QuerySet
@@ -39,6 +42,44 @@ def has_many_to_many_project_relation(model: type[models.Model]) -> bool:
     return False
 
 
+# The permissions of each user on each project, shared by every object serialized for
+# a request (see shared_project_permissions). Scoped to the current thread/coroutine,
+# like _skip_membership_signal in ami/users/signals.py.
+_shared_project_perms: ContextVar[dict | None] = ContextVar("_shared_project_perms", default=None)
+
+
+@contextmanager
+def shared_project_permissions(request):
+    """
+    Resolve each user's permissions on each project once per request.
+
+    Calls to ``get_project_perms`` in this block reuse the permissions already
+    resolved for the request, so a page of objects costs one permission lookup per
+    project instead of one or two per object. Without a request, nothing is shared.
+    """
+    cache = None
+    if request is not None:
+        cache = getattr(request, "_project_perms", None)
+        if cache is None:
+            cache = request._project_perms = {}
+    token = _shared_project_perms.set(cache)
+    try:
+        yield
+    finally:
+        _shared_project_perms.reset(token)
+
+
+def get_project_perms(user, project) -> list[str]:
+    """guardian's ``get_perms(user, project)``, shared within ``shared_project_permissions``."""
+    cache = _shared_project_perms.get()
+    if cache is None:
+        return get_perms(user, project)
+    key = (user.pk, project.pk)
+    if key not in cache:
+        cache[key] = get_perms(user, project)
+    return cache[key]
+
+
 class BaseQuerySet(QuerySet):
     def visible_for_user(self, user: User | AnonymousUser) -> QuerySet:
         """
@@ -176,7 +217,7 @@ class BaseModel(models.Model):
             return []
 
         model_name = self._meta.model_name
-        all_perms = get_perms(user, project)
+        all_perms = get_project_perms(user, project)
         object_perms = [perm for perm in all_perms if perm.endswith(f"_{model_name}")]
         return object_perms
 
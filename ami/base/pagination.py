@@ -1,16 +1,35 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import F, Q, QuerySet
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from ami.main.models import get_project_data_version
 
+from .models import shared_project_permissions
 from .permissions import add_collection_level_permissions
 
 
 class LimitOffsetPaginationWithPermissions(LimitOffsetPagination):
     def get_paginated_response(self, data):
+        paginated_response = super().get_paginated_response(data=data)
+        return self.add_permissions(paginated_response)
+
+    def add_permissions(self, paginated_response: Response) -> Response:
         model = self._get_current_model()
         project = self._get_project()
-        paginated_response = super().get_paginated_response(data=data)
-        paginated_response.data = add_collection_level_permissions(
-            user=self.request.user, response_data=paginated_response.data, model=model, project=project
-        )
+        with shared_project_permissions(self.request):
+            paginated_response.data = add_collection_level_permissions(
+                user=self.request.user, response_data=paginated_response.data, model=model, project=project
+            )
         return paginated_response
 
     def _get_current_model(self):
@@ -29,3 +48,214 @@ class LimitOffsetPaginationWithPermissions(LimitOffsetPagination):
         if hasattr(view, "get_active_project"):
             return view.get_active_project()
         return None
+
+
+class KeysetPaginationWithPermissions(LimitOffsetPaginationWithPermissions):
+    """
+    Limit/offset pagination, or keyset ("cursor") pagination when the request has a ``cursor`` param,
+    for tables with millions of rows.
+
+    OFFSET pages have to skip over every row before them. Keyset pages continue after the
+    last row of the previous page instead, by the active ordering field and the primary key.
+    Request the first page with an empty cursor, then follow the ``next`` links:
+
+    GET /occurrences/?project_id=1&ordering=-detections_count&limit=50&cursor=
+
+    Pages can only be followed forward. Rows with a null ordering value come last, in
+    either direction.
+
+    In both modes, the count is exact up to ``exact_count_limit`` rows and estimated by the
+    query planner beyond that, flagged by ``count_is_approximate``. Counts are cached per
+    query and project data version (see ``get_project_data_version``), so paging through a
+    list doesn't count it again until the project's data changes. Whether there is a next
+    page never depends on an estimated count: pages are fetched with one extra row instead.
+    """
+
+    cursor_query_param = "cursor"
+    cursor_query_description = "Keyset pagination: empty for the first page, then the cursor of the `next` link."
+    invalid_cursor_message = "Invalid cursor"
+    # Counts beyond this many rows are estimated
+    exact_count_limit = 10_000
+    # Changes that don't bump the data version, like deletions, show within this many seconds
+    count_cache_timeout = 10 * 60
+    cursor_key = "_cursor_key"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_is_approximate = False
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return self.paginate_queryset_by_offset(queryset, request)
+
+        self.limit = self.get_limit(request)
+        self.ordering, descending = self.get_cursor_ordering(queryset)
+        queryset = queryset.annotate(**{self.cursor_key: F(self.ordering.lstrip("-"))}).order_by(
+            OrderBy(F(self.cursor_key), descending=descending, nulls_last=True),
+            OrderBy(F("pk"), descending=descending),
+        )
+        self.count = self.get_count(queryset)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after_position_q(*position, descending=descending))
+
+        page = list(queryset[: self.limit + 1])
+        self.next_position = None
+        if len(page) > self.limit:
+            page = page[: self.limit]
+            self.next_position = (getattr(page[-1], self.cursor_key), page[-1].pk)
+        return page
+
+    def paginate_queryset_by_offset(self, queryset, request):
+        """
+        Limit/offset pagination like ``LimitOffsetPagination.paginate_queryset``.
+
+        An estimated count can be too low or too high, so it isn't used to clip the offset or
+        to decide whether there is a next page. One more row than the limit is fetched instead.
+        """
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if not self.count_is_approximate:
+            if self.count == 0 or self.offset > self.count:
+                return []
+            return list(queryset[self.offset : self.offset + self.limit])
+
+        page = list(queryset[self.offset : self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        return page[: self.limit]
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            paginated_response = super().get_paginated_response(data)
+            paginated_response.data["count_is_approximate"] = self.count_is_approximate
+            return paginated_response
+        paginated_response = Response(
+            {
+                "count": self.count,
+                "count_is_approximate": self.count_is_approximate,
+                "next": self.get_next_link(),
+                "previous": None,
+                "results": data,
+            }
+        )
+        return self.add_permissions(paginated_response)
+
+    def get_count(self, queryset):
+        """
+        Count the queryset exactly up to ``exact_count_limit`` rows, or estimate the count beyond that.
+
+        Sets ``count_is_approximate``. Counts of a project's lists are cached until its data version changes.
+        """
+        queryset = queryset.order_by().values("pk")
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        key = None
+        project = self._get_project()
+        if project is not None:
+            # The query covers the filters, the ordering-independent annotations and the user's visibility
+            signature = hashlib.sha256(repr((sql, params)).encode()).hexdigest()
+            key = f"pagination:count:{project.pk}:{get_project_data_version(project.pk)}:{signature}"
+            cached = cache.get(key)
+            if cached is not None:
+                count, self.count_is_approximate = cached
+                return count
+
+        count = queryset[: self.exact_count_limit + 1].count()
+        self.count_is_approximate = count > self.exact_count_limit
+        if self.count_is_approximate:
+            count = max(count, self.estimate_count(queryset))
+        if key is not None:
+            cache.set(key, (count, self.count_is_approximate), timeout=self.count_cache_timeout)
+        return count
+
+    def estimate_count(self, queryset: QuerySet) -> int:
+        """The number of rows the query planner expects the queryset to return (EXPLAIN, without running it)."""
+        plan = json.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            if not self.count_is_approximate:
+                return super().get_next_link()
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_cursor_ordering(self, queryset: QuerySet) -> tuple[str, bool]:
+        """The first field the queryset is ordered by, as ``"field"`` or ``"-field"``, and whether it's descending."""
+        order_by = queryset.query.order_by or queryset.model._meta.ordering
+        if not order_by:
+            return "pk", False
+        first = order_by[0]
+        if isinstance(first, str) and first != "?":
+            name, descending = first.lstrip("-"), first.startswith("-")
+        elif isinstance(first, OrderBy) and isinstance(first.expression, F):
+            name, descending = first.expression.name, first.descending
+        else:
+            raise ValidationError({self.cursor_query_param: "Keyset pagination doesn't support this ordering."})
+        return f"-{name}" if descending else name, descending
+
+    def after_position_q(self, value, pk, descending: bool) -> Q:
+        """The rows after ``(value, pk)`` in the order of the page, where null values come last."""
+        after_pk = Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+        key = self.cursor_key
+        if value is None:
+            return Q(**{f"{key}__isnull": True}) & after_pk
+        after_value = Q(**{f"{key}__lt" if descending else f"{key}__gt": value})
+        return after_value | (Q(**{key: value}) & after_pk) | Q(**{f"{key}__isnull": True})
+
+    def encode_cursor(self, value, pk) -> str:
+        # str() keeps the full precision of datetimes and decimals, which the filter parses back
+        position = json.dumps({"o": self.ordering, "v": value, "pk": pk}, default=str)
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request) -> tuple | None:
+        """The ``(value, pk)`` the page continues after, or None for the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering, value, pk = position["o"], position["v"], int(position["pk"])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering:
+            # The cursor is from a page with another ordering
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_approximate"] = {
+            "type": "boolean",
+            "description": f"Whether the count is the query planner's estimate, beyond {self.exact_count_limit} rows.",
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": self.cursor_query_description,
+                "schema": {"type": "string"},
+            }
+        ]
@@ -3,9 +3,9 @@ from __future__ import annotations
 import logging
 
 from django.contrib.auth.models import AbstractBaseUser, AnonymousUser, User
-from guardian.shortcuts import get_perms
 from rest_framework import permissions
 
+from ami.base.models import get_project_perms
 from ami.main.models import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -71,7 +71,7 @@ def add_collection_level_permissions(user: User | None, response_data: dict, mod
     permissions = response_data.get("user_permissions", set())
     if user and user.is_superuser:
         permissions.add("create")
-    if user and project and f"create_{model.__name__.lower()}" in get_perms(user, project):
+    if user and project and f"create_{model.__name__.lower()}" in get_project_perms(user, project):
         permissions.add("create")
     response_data["user_permissions"] = list(permissions)
     return response_data
@@ -104,7 +104,7 @@ def add_m2m_object_permissions(user, instance, project, response_data: dict) ->
         perms.update(["update", "delete"])
     else:
         model_name = instance._meta.model_name
-        all_perms = get_perms(user, project)
+        all_perms = get_project_perms(user, project)
         for perm in all_perms:
             if perm.endswith(f"_{model_name}"):
                 action = perm.split("_", 1)[0]
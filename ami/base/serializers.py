@@ -8,6 +8,7 @@ from rest_framework import serializers
 from rest_framework.request import Request
 from rest_framework.reverse import reverse
 
+from .models import shared_project_permissions
 from .permissions import add_object_level_permissions
 
 logger = logging.getLogger(__name__)
@@ -54,8 +55,10 @@ class DefaultSerializer(serializers.HyperlinkedModelSerializer):
         )
 
     def to_representation(self, instance):
-        instance_data = super().to_representation(instance)
-        instance_data = self.get_permissions(instance=instance, instance_data=instance_data)
+        # All objects serialized for the request share the user's permissions on each project
+        with shared_project_permissions(self.context.get("request")):
+            instance_data = super().to_representation(instance)
+            instance_data = self.get_permissions(instance=instance, instance_data=instance_data)
         return instance_data
 
 
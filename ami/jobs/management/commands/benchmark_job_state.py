@@ -0,0 +1,106 @@
+"""
+Compare Redis memory and update latency of the async job state backends.
+
+Runs entirely against the configured Redis (the same connection the workers
+use) under a throwaway job ID; no database rows or NATS resources are touched.
+
+Usage:
+
+    python manage.py benchmark_job_state --images 2000000 --batch 50 --updates 2000
+    python manage.py benchmark_job_state --images 100000 --stride 7  # sparse image IDs
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from redis.exceptions import ResponseError
+
+from ami.ml.orchestration.async_job_state import JOB_STATE_BACKENDS
+
+# Far above any real Job.pk so a benchmark run never touches live job keys
+BENCHMARK_JOB_ID = 9_000_000_000
+
+
+class Command(BaseCommand):
+    help = "Benchmark memory and update_state() latency of the async job state backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=100_000, help="Images in the job (default: %(default)s)")
+        parser.add_argument(
+            "--batch", type=int, default=50, help="Image IDs per update_state() call (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--updates", type=int, default=500, help="update_state() calls to time (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--stride",
+            type=int,
+            default=1,
+            help="Gap between consecutive image IDs, to simulate sparse collections (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--first-id", type=int, default=1_000_000, help="Lowest image ID in the job (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--backend",
+            action="append",
+            choices=sorted(JOB_STATE_BACKENDS),
+            help="Backend(s) to benchmark (default: all)",
+        )
+
+    def handle(self, *args, **options):
+        image_ids = [str(options["first_id"] + i * options["stride"]) for i in range(options["images"])]
+        batch_size = options["batch"]
+        batches = [set(image_ids[i : i + batch_size]) for i in range(0, batch_size * options["updates"], batch_size)]
+        batches = [batch for batch in batches if batch]
+
+        self.stdout.write(
+            f"{len(image_ids)} images (ID stride {options['stride']}), "
+            f"{len(batches)} updates of {batch_size} IDs per stage"
+        )
+        for name in options["backend"] or sorted(JOB_STATE_BACKENDS):
+            self._run(name, image_ids, batches)
+
+    def _run(self, name: str, image_ids: list[str], batches: list[set[str]]):
+        manager = JOB_STATE_BACKENDS[name](BENCHMARK_JOB_ID)
+        manager.cleanup()
+        try:
+            start = time.perf_counter()
+            manager.initialize_job(image_ids)
+            init_seconds = time.perf_counter() - start
+            memory = self._memory_usage(manager)
+
+            latencies = []
+            for batch in batches:
+                for stage in manager.STAGES:
+                    start = time.perf_counter()
+                    manager.update_state(batch, stage)
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            pending = manager.get_pending_image_ids()
+            scan_seconds = time.perf_counter() - start
+        finally:
+            manager.cleanup()
+
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        p95 = latencies_ms[int(len(latencies_ms) * 0.95)] if latencies_ms else 0.0
+        memory_desc = f"{memory / 1024 / 1024:.2f} MiB" if memory is not None else "n/a (MEMORY USAGE unsupported)"
+        self.stdout.write(self.style.SUCCESS(f"[{name}]"))
+        self.stdout.write(f"  initialize_job:        {init_seconds * 1000:.1f} ms")
+        self.stdout.write(f"  memory after init:     {memory_desc}")
+        if latencies_ms:
+            self.stdout.write(
+                f"  update_state:          p50 {statistics.median(latencies_ms):.2f} ms, "
+                f"p95 {p95:.2f} ms, max {latencies_ms[-1]:.2f} ms"
+            )
+        self.stdout.write(f"  get_pending_image_ids: {scan_seconds * 1000:.1f} ms ({len(pending)} pending)")
+
+    def _memory_usage(self, manager) -> int | None:
+        redis = manager._get_redis()
+        keys = [manager._get_pending_key(stage) for stage in manager.STAGES]
+        try:
+            return sum(redis.memory_usage(key, samples=0) or 0 for key in keys)
+        except ResponseError:
+            return None
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_periodic_tasks(apps, schema_editor):
+    CrontabSchedule = apps.get_model("django_celery_beat", "CrontabSchedule")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+
+    schedule, _ = CrontabSchedule.objects.get_or_create(
+        minute="30",
+        hour="3",
+        day_of_week="*",
+        day_of_month="*",
+        month_of_year="*",
+    )
+    PeriodicTask.objects.get_or_create(
+        name="jobs.prune_job_logs",
+        defaults={
+            "task": "ami.jobs.tasks.prune_job_logs",
+            "crontab": schedule,
+            "description": "Delete per-job log lines older than JOB_LOG_RETENTION_DAYS (finished jobs only).",
+        },
+    )
+
+
+def delete_periodic_tasks(apps, schema_editor):
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    PeriodicTask.objects.filter(name="jobs.prune_job_logs").delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("jobs", "0024_alter_joblog_created_at"),
+        ("django_celery_beat", "0018_improve_crontab_helptext"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_periodic_tasks, delete_periodic_tasks),
+    ]
@@ -1,25 +1,35 @@
+import atexit
+import concurrent.futures
 import datetime
+import functools
+import itertools
 import logging
+import math
 import random
+import threading
 import time
 import typing
 from dataclasses import dataclass
+from urllib.parse import urljoin
 
+import celery.exceptions
 import pydantic
 from celery import uuid
 from celery.result import AsyncResult
 from django.conf import settings
 from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django_pydantic_field import SchemaField
-from guardian.shortcuts import get_perms
 
-from ami.base.models import BaseModel
+from ami.base.models import BaseModel, get_project_perms
 from ami.base.schemas import ConfigurableStage, ConfigurableStageParam
 from ami.jobs.tasks import cleanup_async_job_if_needed, run_job
 from ami.main.models import Deployment, Project, SourceImage, SourceImageCollection
+from ami.main.models_future.summary import queue_project_summary_rewarm
 from ami.ml.models import Pipeline
 from ami.ml.post_processing.registry import get_postprocessing_task
+from ami.ml.schemas import PipelineRequest, PipelineResultsResponse
 from ami.utils.schemas import OrderedEnum
 
 logger = logging.getLogger(__name__)
@@ -343,6 +353,9 @@ class JobLog(BaseModel):
 
     project_accessor = "job__project"
 
+    # Set when the line is logged, not when the row is inserted: JobLogHandler
+    # buffers records and writes them in batches (see JobLogBuffer).
+    created_at = models.DateTimeField(default=timezone.now)
     job = models.ForeignKey("Job", on_delete=models.CASCADE, related_name="log_entries")
     level = models.CharField(max_length=20)
     message = models.TextField()
@@ -377,8 +390,8 @@ def serialize_job_logs(job: "Job", *, limit: int = JOB_LOGS_DEFAULT_LIMIT) -> di
     """Return ``{stdout, stderr}`` in the shape the UI already parses.
 
     Reads joined ``JobLog`` rows first (newest-first, capped at ``limit`` per
-    request — there is no per-job storage cap; the data integrity check
-    framework handles retention). Jobs created before the table existed and
+    request — there is no per-job storage cap; the daily ``prune_job_logs``
+    task handles retention). Jobs created before the table existed and
     jobs written while ``JOB_LOG_PERSIST_ENABLED=False`` have no rows and fall
     back to the legacy ``jobs_job.logs`` JSON column so their UI log panel
     stays populated.
@@ -400,6 +413,102 @@ def serialize_job_logs(job: "Job", *, limit: int = JOB_LOGS_DEFAULT_LIMIT) -> di
     return _legacy_logs_shape(job)
 
 
+class JobLogBuffer:
+    """
+    Process-wide write buffer for JobLog rows.
+
+    Chatty jobs log hundreds of thousands of lines; inserting each one as it is
+    emitted costs a round trip per line. Records are collected here and written
+    with one ``bulk_create`` when any trigger fires:
+
+    - size: ``JOB_LOG_BUFFER_SIZE`` records are waiting
+    - time: the oldest waiting record is ``JOB_LOG_FLUSH_INTERVAL`` seconds old
+      (a daemon timer, so an idle process still flushes)
+    - job end: Celery task_postrun and process exit call flush()
+
+    Records logged inside a transaction enter the buffer when it commits, as the
+    per-line INSERT they replace would have; that also keeps a batch from
+    referencing a job row another connection can't see yet.
+
+    Loss policy: at most the records buffered in a process that dies before its
+    next flush (bounded by the size and time triggers). If a batch insert fails,
+    rows are retried one by one and only the failing ones (e.g. for a job deleted
+    meanwhile) are dropped. Every line is also written to the container log by
+    JobLogHandler before it is buffered, so nothing is lost from stdout.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: list[JobLog] = []
+        self._timer: threading.Timer | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: "JobLog") -> None:
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(functools.partial(self._append, entry))
+        else:
+            self._append(entry)
+
+    def _append(self, entry: "JobLog") -> None:
+        with self._lock:
+            self._entries.append(entry)
+            size_reached = len(self._entries) >= settings.JOB_LOG_BUFFER_SIZE
+            if not size_reached and self._timer is None:
+                self._timer = threading.Timer(settings.JOB_LOG_FLUSH_INTERVAL, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if size_reached:
+            self.flush_soon()
+
+    def flush_soon(self) -> None:
+        """Flush now, or when the current transaction commits if there is one."""
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self.flush)
+        else:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every buffered record. Returns the number of rows written."""
+        with self._lock:
+            entries, self._entries = self._entries, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not entries:
+            return 0
+        try:
+            JobLog.objects.bulk_create(entries, batch_size=500)
+            return len(entries)
+        except Exception as e:
+            logger.warning(f"Bulk insert of {len(entries)} job log lines failed, retrying one by one: {e}")
+
+        saved = 0
+        for entry in entries:
+            try:
+                entry.save()
+                saved += 1
+            except Exception as e:
+                logger.error(f"Failed to save log for job #{entry.job_id}: {e}")
+        return saved
+
+    def _flush_from_timer(self) -> None:
+        from django.db import connection
+
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread gets its own DB connection; don't leak it.
+            connection.close()
+
+
+job_log_buffer = JobLogBuffer()
+atexit.register(job_log_buffer.flush)
+
+
 class JobLogHandler(logging.Handler):
     """
     Class for handling logs from a job and writing them to the job instance.
@@ -423,12 +532,17 @@ class JobLogHandler(logging.Handler):
         # Append-only insert on the JobLog child table. Unlike the legacy
         # jobs_job.logs JSONB update path, this does not contend with
         # _update_job_progress on the parent row.
+        entry = JobLog(
+            job_id=self.job.pk,
+            level=record.levelname,
+            message=self.format(record),
+            created_at=datetime.datetime.fromtimestamp(record.created),
+        )
+        if settings.JOB_LOG_BUFFER_SIZE > 1:
+            job_log_buffer.add(entry)
+            return
         try:
-            JobLog.objects.create(
-                job_id=self.job.pk,
-                level=record.levelname,
-                message=self.format(record),
-            )
+            entry.save()
         except Exception as e:
             logger.error(f"Failed to save log for job #{self.job.pk}: {e}")
 
@@ -507,6 +621,21 @@ class MLJob(JobType):
             progress=0,
         )
 
+        if job.dispatch_mode != JobDispatchMode.ASYNC_API and not job.shuffle:
+            # Send batches to the processing service while the rest of the images are still collected
+            stream = job.pipeline.stream_images(
+                collection=job.source_image_collection,
+                deployment=job.deployment,
+                source_images=[job.source_image_single] if job.source_image_single else None,
+                job=job,
+                reprocess_all_images=job.project.feature_flags.reprocess_all_images,
+            )
+            image_count = min(stream.total, job.limit) if job.limit else stream.total
+            job.progress.update_stage("collect", total_images=stream.total)
+            job.save()
+            cls.process_images(job, cls._stream_collected_images(job, stream), image_count=image_count)
+            return
+
         images: list[SourceImage] = list(
             # @TODO return generator plus image count
             # @TODO pass to celery group chain?
@@ -562,8 +691,49 @@ class MLJob(JobType):
             cls.process_images(job, images)
 
     @classmethod
-    def process_images(cls, job, images):
-        image_count = len(images)
+    def _stream_collected_images(cls, job: "Job", stream) -> typing.Iterator[SourceImage]:
+        """Yield the streamed images up to the job's limit, then mark the collect stage done."""
+        yielded = 0
+        for batch in stream:
+            for image in batch:
+                if job.limit and yielded >= job.limit:
+                    break
+                yielded += 1
+                yield image
+            else:
+                continue
+            break
+
+        if job.limit and yielded >= job.limit:
+            job.logger.warn(f"Limiting number of images to {job.limit} (out of up to {stream.total})")
+            job.progress.add_stage_param("collect", "Limit", yielded)
+        else:
+            job.logger.info(f"Found {yielded} out of {stream.total} images to process")
+            job.progress.update_stage("collect", total_images=yielded)
+        job.progress.update_stage("collect", status=JobState.SUCCESS, progress=1)
+        job.save()
+
+    @classmethod
+    def process_images(cls, job, images, image_count: int | None = None):
+        """
+        Send the images to the pipeline's processing service in batches and save the results.
+
+        Up to ``request_concurrency`` batch requests (pipeline config, default
+        ``settings.ML_SYNC_REQUEST_CONCURRENCY``) are kept in flight at once so the
+        service is not left idle between batches. Only the HTTP requests run in worker
+        threads: batches are prepared, and their results handed to save sub-tasks, in
+        this thread, in the order the responses arrive. While
+        ``settings.ML_SYNC_MAX_PENDING_SAVES`` save sub-tasks are unfinished, no new
+        batch is sent.
+
+        ``images`` can be a lazy iterable, such as images still being collected (see
+        ``MLJob.run``): batches are read from it as they are sent, and ``image_count``
+        estimates its length for progress reporting.
+        """
+        from ami.ml.models.pipeline import parse_pipeline_response, prepare_pipeline_request, send_pipeline_request
+
+        if image_count is None:
+            image_count = len(images)
         # Keep track of sub-tasks for saving results, pair with batch number
         save_tasks: list[tuple[int, AsyncResult]] = []
         save_tasks_completed: list[tuple[int, AsyncResult]] = []
@@ -571,26 +741,54 @@ class MLJob(JobType):
         total_detections = 0
         total_classifications = 0
 
-        config = job.pipeline.get_config(project_id=job.project.pk)
+        project_id = job.project.pk
+        config = job.pipeline.get_config(project_id=project_id)
         chunk_size = config.get("request_source_image_batch_size", 1)
-        chunks = [images[i : i + chunk_size] for i in range(0, image_count, chunk_size)]  # noqa
+        concurrency = max(int(config.get("request_concurrency", settings.ML_SYNC_REQUEST_CONCURRENCY)), 1)
+        reprocess_all_images = job.project.feature_flags.reprocess_all_images
+        image_iter = iter(images)
+        images_read = 0
         request_failed_images = []
-        job.logger.info(f"Processing {image_count} images in {len(chunks)} batches of up to {chunk_size}")
+        batches_finished = 0
+        images_finished = 0
+        job.logger.info(
+            f"Processing {image_count} images in {math.ceil(image_count / chunk_size)} batches of up to "
+            f"{chunk_size}, {concurrency} batch(es) at a time"
+        )
 
-        for i, chunk in enumerate(chunks):
-            request_sent = time.time()
-            job.logger.info(f"Processing image batch {i+1} of {len(chunks)}")
-            try:
-                results = job.pipeline.process_images(
-                    images=chunk,
-                    job_id=job.pk,
-                    project_id=job.project.pk,
-                    reprocess_all_images=job.project.feature_flags.reprocess_all_images,
+        def read_chunk() -> list[SourceImage]:
+            nonlocal image_count, images_read
+            chunk = list(itertools.islice(image_iter, chunk_size))
+            images_read += len(chunk)
+            # The estimate can be short, e.g. if images were added to the collection meanwhile
+            image_count = max(image_count, images_read)
+            return chunk
+
+        def batch_count() -> int:
+            return max(math.ceil(image_count / chunk_size), 1)
+
+        def wait_for_pending_saves():
+            # Backpressure: results that can't be saved as fast as they arrive would
+            # otherwise pile up in the broker and in worker memory.
+            pending = [t for t in save_tasks if not t[1].ready()]
+            while len(pending) >= settings.ML_SYNC_MAX_PENDING_SAVES:
+                batch_num, sub_task = pending[0]
+                job.logger.info(
+                    f"{len(pending)} batches are still saving results, "
+                    f"waiting for batch {batch_num} before sending more (sub-task {sub_task.id})"
                 )
-                job.logger.info(f"Processed image batch {i+1} in {time.time() - request_sent:.2f}s")
-            except Exception as e:
-                # Log error about image batch and continue
-                job.logger.error(f"Failed to process image batch {i+1}: {e}")
+                try:
+                    sub_task.wait(disable_sync_subtasks=False, timeout=60, propagate=False)
+                except celery.exceptions.TimeoutError:
+                    # Keep waiting; a save that takes this long is slow, not lost
+                    job.logger.warning(f"Batch {batch_num} has been saving results for over a minute")
+                pending = [t for t in pending if not t[1].ready()]
+
+        def finish_batch(i, chunk, results=None):
+            nonlocal batches_finished, images_finished, save_tasks_completed
+            nonlocal total_captures, total_detections, total_classifications
+
+            if results is None:
                 request_failed_images.extend([img.pk for img in chunk])
             else:
                 total_captures += len(results.source_images)
@@ -603,13 +801,16 @@ class MLJob(JobType):
                     save_tasks.append((i + 1, save_results_task))
                     job.logger.info(f"Saving results for batch {i+1} in sub-task {save_results_task.id}")
 
+            # Batches can finish out of order, so count them rather than using the batch number
+            batches_finished += 1
+            images_finished += len(chunk)
             job.progress.update_stage(
                 "process",
                 status=JobState.STARTED,
-                progress=(i + 1) / len(chunks),
-                processed=min((i + 1) * chunk_size, image_count),
+                progress=min(batches_finished / batch_count(), 1),
+                processed=images_finished,
                 failed=len(request_failed_images),
-                remaining=max(image_count - ((i + 1) * chunk_size), 0),
+                remaining=max(image_count - images_finished, 0),
             )
 
             # count the completed, successful, and failed save_tasks:
@@ -623,7 +824,7 @@ class MLJob(JobType):
             job.progress.update_stage(
                 "results",
                 status=JobState.FAILURE if failed_save_tasks else JobState.STARTED,
-                progress=len(save_tasks_completed) / len(chunks),
+                progress=min(len(save_tasks_completed) / batch_count(), 1),
                 captures=total_captures,
                 detections=total_detections,
                 classifications=total_classifications,
@@ -637,6 +838,78 @@ class MLJob(JobType):
                 if throw_on_save_error:
                     failed_task.maybe_throw()
 
+        # Maps each in-flight request to its batch number, images, request and send time
+        in_flight: dict[concurrent.futures.Future, tuple[int, list, PipelineRequest, float]] = {}
+        next_chunk = 0
+        all_read = False
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"job-{job.pk}")
+        try:
+            while not all_read or in_flight:
+                while not all_read and len(in_flight) < concurrency:
+                    wait_for_pending_saves()
+                    chunk = read_chunk()
+                    if not chunk:
+                        all_read = True
+                        break
+                    i = next_chunk
+                    next_chunk += 1
+                    request_sent = time.time()
+                    job.logger.info(f"Processing image batch {i+1} of {batch_count()}")
+                    try:
+                        request_data = prepare_pipeline_request(
+                            pipeline=job.pipeline,
+                            images=chunk,
+                            job=job,
+                            project_id=project_id,
+                            reprocess_all_images=reprocess_all_images,
+                        )
+                        if request_data is not None:
+                            # Chosen last: choosing counts the request to the service as outstanding
+                            processing_service = job.pipeline.get_sync_processing_service(project_id, job.pk)
+                    except Exception as e:
+                        # Log error about image batch and continue
+                        job.logger.error(f"Failed to process image batch {i+1}: {e}")
+                        finish_batch(i, chunk)
+                        continue
+                    if request_data is None:
+                        # Every image in the batch has already been processed
+                        finish_batch(
+                            i,
+                            chunk,
+                            PipelineResultsResponse(
+                                pipeline=job.pipeline.slug, source_images=[], detections=[], total_time=0
+                            ),
+                        )
+                        continue
+                    future = executor.submit(
+                        send_pipeline_request,
+                        urljoin(processing_service.endpoint_url, "/process"),
+                        request_data,
+                        processing_service=processing_service,
+                    )
+                    in_flight[future] = (i, chunk, request_data, request_sent)
+
+                if not in_flight:
+                    continue
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    i, chunk, request_data, request_sent = in_flight.pop(future)
+                    try:
+                        results = parse_pipeline_response(
+                            pipeline=job.pipeline, request_data=request_data, resp=future.result(), job=job
+                        )
+                        job.logger.info(f"Processed image batch {i+1} in {time.time() - request_sent:.2f}s")
+                    except Exception as e:
+                        # Log error about image batch and continue
+                        job.logger.error(f"Failed to process image batch {i+1}: {e}")
+                        finish_batch(i, chunk)
+                    else:
+                        finish_batch(i, chunk, results)
+        finally:
+            # Don't hold up a failing job on requests that are still in flight
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        image_count = images_read
         if image_count:
             percent_successful = 1 - len(request_failed_images) / image_count if image_count else 0
             job.logger.info(f"Processed {percent_successful:.0%} of images successfully.")
@@ -1382,6 +1655,8 @@ class Job(BaseModel):
             self.setup(save=False)
         super().save(*args, **kwargs)
         logger.debug(f"Saved job {self}")
+        if self.project_id and self.status in JobState.final_states():
+            queue_project_summary_rewarm(self.project_id)
         if self.progress.summary.status != self.status:
             logger.warning(f"Job {self} status mismatches progress: {self.progress.summary.status} != {self.status}")
 
@@ -1389,7 +1664,7 @@ class Job(BaseModel):
         job_type = self.job_type_key.lower()
         if self.source_image_single:
             action = "run_single_image"
-        if action in ["run", "cancel", "retry"]:
+        if action in ["run", "cancel", "retry", "dead_letters", "replay_dead_letters"]:
             permission_codename = f"run_{job_type}_job"
         else:
             permission_codename = f"{action}_{job_type}_job"
@@ -1404,7 +1679,7 @@ class Job(BaseModel):
 
         custom_perms = set()
         model_name = "job"
-        perms = get_perms(user, project)
+        perms = get_project_perms(user, project)
         job_type = self.job_type_key.lower()
         for perm in perms:
             # permissions are in the format "action_modelname"
@@ -1,6 +1,8 @@
 import pydantic
 from drf_spectacular.utils import OpenApiParameter
 
+from ami.ml.schemas import PipelineProcessingTask
+
 
 class QueuedTaskAcknowledgment(pydantic.BaseModel):
     """Acknowledgment for a single result that was queued for background processing."""
@@ -10,6 +12,16 @@ class QueuedTaskAcknowledgment(pydantic.BaseModel):
     task_id: str
 
 
+class JobTaskBatch(pydantic.BaseModel):
+    """Tasks reserved from one job's queue by a multi-job task fetch.
+
+    Results for these tasks must be posted back to that job's ``/result/`` endpoint.
+    """
+
+    job_id: int
+    tasks: list[PipelineProcessingTask]
+
+
 ids_only_param = OpenApiParameter(
     name="ids_only",
     description="Return only job IDs instead of full objects",
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django_pydantic_field.rest_framework import SchemaField
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
@@ -15,7 +16,7 @@ from ami.ml.schemas import PipelineProcessingTask, PipelineTaskResult, Processin
 from ami.ml.serializers import PipelineNestedSerializer
 
 from .models import JOB_LOGS_DEFAULT_LIMIT, Job, JobProgress, MLJob, _legacy_logs_shape, serialize_job_logs
-from .schemas import QueuedTaskAcknowledgment
+from .schemas import JobTaskBatch, QueuedTaskAcknowledgment
 
 
 class JobProjectNestedSerializer(DefaultSerializer):
@@ -200,6 +201,16 @@ class MLJobTasksRequestSerializer(serializers.Serializer):
     """
 
     batch_size = serializers.IntegerField(min_value=1, required=True)
+    wait = serializers.FloatField(
+        min_value=0,
+        max_value=settings.NATS_TASKS_MAX_WAIT,
+        required=False,
+        default=0,
+        help_text=(
+            "Long-poll: seconds to wait server-side for tasks when the queue is empty. "
+            "The response is returned as soon as any task is available. 0 returns immediately."
+        ),
+    )
     client_info = SchemaField(schema=ProcessingServiceClientInfo, required=False, default=None)
 
 
@@ -214,6 +225,17 @@ class MLJobTasksResponseSerializer(serializers.Serializer):
     tasks = SchemaField(schema=list[PipelineProcessingTask], default=[])
 
 
+class MLJobsTasksResponseSerializer(serializers.Serializer):
+    """POST /jobs/tasks/ — tasks reserved across all jobs the worker is eligible for.
+
+    Takes the same request body as the per-job endpoint (MLJobTasksRequestSerializer).
+    Tasks are grouped by job because results must be posted to each job's own
+    ``/result/`` endpoint. Only jobs that delivered tasks are included.
+    """
+
+    jobs = SchemaField(schema=list[JobTaskBatch], default=[])
+
+
 class MLJobResultsRequestSerializer(serializers.Serializer):
     """POST /jobs/{id}/result/ — request body sent by a processing service to deliver results.
 
@@ -240,3 +262,50 @@ class MLJobResultsResponseSerializer(serializers.Serializer):
     job_id = serializers.IntegerField()
     results_queued = serializers.IntegerField()
     tasks = SchemaField(schema=list[QueuedTaskAcknowledgment], default=[])
+
+
+class DeadLetterGroupSerializer(serializers.Serializer):
+    reason = serializers.CharField()
+    count = serializers.IntegerField()
+    replayable = serializers.IntegerField()
+    replayed = serializers.IntegerField()
+    image_ids = serializers.ListField(child=serializers.CharField())
+
+
+class DeadLettersResponseSerializer(serializers.Serializer):
+    """GET /jobs/{id}/dead_letters/ — the job's dead letters grouped by failure reason."""
+
+    job_id = serializers.IntegerField()
+    count = serializers.IntegerField()
+    groups = DeadLetterGroupSerializer(many=True)
+
+
+class DeadLetterReplayRequestSerializer(serializers.Serializer):
+    """POST /jobs/{id}/replay_dead_letters/ — which dead letters to re-publish.
+
+    Omit ``reasons`` and ``image_ids`` to replay every dead letter not yet replayed.
+    """
+
+    reasons = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    image_ids = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    limit = serializers.IntegerField(min_value=1, required=False, default=None)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+
+class DeadLetterReplayQueuedSerializer(serializers.Serializer):
+    """POST /jobs/{id}/replay_dead_letters/ — the queued replay, whose outcome is written to the job's logs."""
+
+    job_id = serializers.IntegerField()
+    task_id = serializers.CharField()
+    status = serializers.CharField()
+    detail = serializers.CharField()
+
+
+class DeadLetterReplayResponseSerializer(serializers.Serializer):
+    job_id = serializers.IntegerField()
+    matched = serializers.IntegerField()
+    replayed = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    unavailable = serializers.IntegerField()
+    dry_run = serializers.BooleanField()
+    image_ids = serializers.ListField(child=serializers.CharField())
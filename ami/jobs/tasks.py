@@ -9,11 +9,13 @@ from typing import TYPE_CHECKING
 from asgiref.sync import async_to_sync, sync_to_async
 from cachalot.api import cachalot_disabled
 from celery.signals import task_failure, task_postrun, task_prerun
-from django.db import transaction
+from django.conf import settings
+from django.db import DatabaseError, transaction
 from redis.exceptions import RedisError
 
 from ami.main.checks.schemas import IntegrityCheckResult
-from ami.ml.orchestration.async_job_state import AsyncJobStateManager
+from ami.ml.orchestration.async_job_state import get_job_state_manager
+from ami.ml.orchestration.metrics import record_images
 from ami.ml.orchestration.nats_queue import ConsumerState, TaskQueueManager
 from ami.ml.schemas import PipelineResultsError, PipelineResultsResponse
 from ami.tasks import default_soft_time_limit, default_time_limit
@@ -21,12 +23,17 @@ from config import celery_app
 
 if TYPE_CHECKING:
     from ami.jobs.models import JobState
+    from ami.ml.orchestration.async_job_state import AsyncJobStateManager
 
 logger = logging.getLogger(__name__)
 # Minimum success rate. Jobs with fewer than this fraction of images
 # processed successfully are marked as failed. Also used in MLJob.process_images().
 FAILURE_THRESHOLD = 0.5
 
+# Job.progress stage params that are per-result deltas rather than snapshots.
+# _flush_job_progress parks them in Redis between coalesced writes.
+PROGRESS_COUNT_PARAMS = ("detections", "classifications", "captures")
+
 # Heartbeat window for the "online recently" count in _log_worker_availability.
 # Intentionally broader than the codebase-wide 60s PROCESSING_SERVICE_LAST_SEEN_MAX:
 # ADC's registration heartbeat can slip past 60s under normal operation, and
@@ -258,7 +265,7 @@ def process_nats_pipeline_result(self, job_id: int, result_data: dict, reply_sub
         processed_image_ids = {str(img.id) for img in pipeline_result.source_images}
         failed_image_ids = set()  # No failures for successful results
 
-    state_manager = AsyncJobStateManager(job_id)
+    state_manager = get_job_state_manager(job_id)
 
     try:
         progress_info = state_manager.update_state(
@@ -291,7 +298,8 @@ def process_nats_pipeline_result(self, job_id: int, result_data: dict, reply_sub
         complete_state = JobState.SUCCESS
         if progress_info.total > 0 and (progress_info.failed / progress_info.total) > FAILURE_THRESHOLD:
             complete_state = JobState.FAILURE
-        _update_job_progress(
+        _flush_job_progress(
+            state_manager,
             job_id,
             "process",
             progress_info.percentage,
@@ -313,6 +321,12 @@ def process_nats_pipeline_result(self, job_id: int, result_data: dict, reply_sub
             job.logger.error(
                 f"Pipeline returned error for job {job_id}, image {error_result.image_id}: {error_result.error}"
             )
+        # newly_removed is 0 on a replay, so redelivered results aren't counted twice
+        record_images(
+            job.pipeline.slug if job.pipeline else None,
+            "failed" if error_result else "processed",
+            progress_info.newly_removed,
+        )
     except Job.DoesNotExist:
         # don't raise and ack so that we don't retry since the job doesn't exists
         logger.error(f"Job {job_id} not found")
@@ -326,7 +340,8 @@ def process_nats_pipeline_result(self, job_id: int, result_data: dict, reply_sub
         if pipeline_result:
             # should never happen since otherwise we could not be processing results here
             assert job.pipeline is not None, "Job pipeline is None"
-            job.pipeline.save_results(results=pipeline_result, job_id=job.pk)
+            # Counted below, once it's known whether this result was saved before
+            job.pipeline.save_results(results=pipeline_result, job_id=job.pk, count_saved=False)
             job.logger.info(f"Successfully saved results for job {job_id}")
 
             _, t = t(
@@ -385,7 +400,10 @@ def process_nats_pipeline_result(self, job_id: int, result_data: dict, reply_sub
         counts_to_apply = (
             (detections_count, classifications_count, captures_count) if is_first_processing else (0, 0, 0)
         )
-        _update_job_progress(
+        if pipeline_result:
+            record_images(job.pipeline.slug if job.pipeline else None, "saved", progress_info.newly_removed)
+        _flush_job_progress(
+            state_manager,
             job_id,
             "results",
             progress_info.percentage,
@@ -595,6 +613,52 @@ def _log_job_throughput(job, stage: str) -> None:
     )
 
 
+def _flush_job_progress(
+    state_manager: "AsyncJobStateManager",
+    job_id: int,
+    stage: str,
+    progress_percentage: float,
+    complete_state: "JobState",
+    force: bool = False,
+    **state_params,
+) -> bool:
+    """
+    Coalescing front end to _update_job_progress().
+
+    Writing Job.progress for every result makes every worker contend on one
+    ``jobs_job`` row. Instead, at most one write per stage happens every
+    ``JOB_PROGRESS_FLUSH_INTERVAL`` seconds. Count params (detections,
+    classifications, captures) are deltas, so they're parked in Redis and summed
+    into whichever call next wins the flush. The percentage and the
+    processed/remaining/failed params are snapshots, so skipped writes lose
+    nothing, and the max() guard in _update_job_progress keeps the progress the
+    UI sees monotonic.
+
+    A stage reaching 100% (or ``force``) always flushes: that write is what marks
+    the job complete and fires cleanup.
+
+    Returns True if Job.progress was written.
+    """
+    counts = {name: state_params.pop(name) for name in PROGRESS_COUNT_PARAMS if name in state_params}
+    deltas = state_manager.claim_progress_flush(
+        stage,
+        counts,
+        interval=settings.JOB_PROGRESS_FLUSH_INTERVAL,
+        force=force or progress_percentage >= 1.0,
+    )
+    if deltas is None:
+        return False
+
+    try:
+        _update_job_progress(job_id, stage, progress_percentage, complete_state, **state_params, **deltas)
+    except DatabaseError:
+        # The progress write rolled back; hand the drained counts back so the
+        # next flush applies them instead of dropping them.
+        state_manager.add_progress_counts(stage, deltas)
+        raise
+    return True
+
+
 def _update_job_progress(
     job_id: int, stage: str, progress_percentage: float, complete_state: "JobState", **state_params
 ) -> None:
@@ -816,7 +880,7 @@ def mark_lost_images_failed(minutes: int | None = None, dry_run: bool = False) -
             # means we can't verify the state is ours — skip.
             continue
 
-        state_manager = AsyncJobStateManager(pk)
+        state_manager = get_job_state_manager(pk)
         lost_ids = state_manager.get_pending_image_ids()
         if not lost_ids:
             continue
@@ -889,7 +953,7 @@ def _reconcile_lost_images(
         )
         return "raced"
 
-    state_manager = AsyncJobStateManager(job_id)
+    state_manager = get_job_state_manager(job_id)
 
     # Stage "process": SREM from pending_images:process and SADD to failed_images.
     process_progress = state_manager.update_state(lost_ids, stage="process", failed_image_ids=lost_ids)
@@ -908,11 +972,15 @@ def _reconcile_lost_images(
     if process_progress.total > 0 and (process_progress.failed / process_progress.total) > FAILURE_THRESHOLD:
         complete_state = JobState.FAILURE
 
-    _update_job_progress(
+    # Forced flushes: any counts still parked in Redis by coalesced result
+    # writes are folded in now rather than waiting for a result that won't come.
+    _flush_job_progress(
+        state_manager,
         job_id,
         "process",
         process_progress.percentage,
         complete_state=complete_state,
+        force=True,
         processed=process_progress.processed,
         remaining=process_progress.remaining,
         failed=process_progress.failed,
@@ -921,11 +989,13 @@ def _reconcile_lost_images(
     # passing zeros here preserves whatever save_results already counted on
     # the non-lost branch. We do NOT have detections/classifications for the
     # lost images — by definition we never got their results.
-    _update_job_progress(
+    _flush_job_progress(
+        state_manager,
         job_id,
         "results",
         results_progress.percentage,
         complete_state=complete_state,
+        force=True,
         detections=0,
         classifications=0,
         captures=0,
@@ -1350,6 +1420,59 @@ def jobs_health_check() -> dict:
     return dataclasses.asdict(result)
 
 
+@celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
+def prune_job_logs(days: int | None = None, batch_size: int = 10_000) -> int:
+    """
+    Delete JobLog rows older than ``days`` (default JOB_LOG_RETENTION_DAYS).
+
+    Jobs that are still running keep their whole log. Rows are deleted in
+    batches of ``batch_size`` so one run never holds a long lock on the table.
+    Returns the number of rows deleted.
+    """
+    from ami.jobs.models import JobLog, JobState
+
+    days = settings.JOB_LOG_RETENTION_DAYS if days is None else days
+    if days <= 0:
+        return 0
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    expired = JobLog.objects.filter(created_at__lt=cutoff).exclude(job__status__in=JobState.running_states())
+    deleted = 0
+    while True:
+        batch = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            break
+        deleted += JobLog.objects.filter(pk__in=batch).delete()[0]
+
+    logger.info(f"Pruned {deleted} job log lines older than {days} days")
+    return deleted
+
+
+@celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
+def replay_job_dead_letters(
+    job_id: int,
+    reasons: list[str] | None = None,
+    image_ids: list[str] | None = None,
+    limit: int | None = None,
+) -> dict | None:
+    """
+    Re-publish a job's dead letters, queued by ``JobViewSet.replay_dead_letters``.
+
+    Publishing is paced (NATS_DLQ_REPLAY_RATE), so a large replay can take minutes.
+    Its outcome is written to the job's logs. Returns the counts of ``replay_dead_letters``,
+    or None if the job can no longer be replayed.
+    """
+    from ami.jobs.models import Job
+    from ami.ml.orchestration.dead_letters import replay_dead_letters
+
+    job = Job.objects.get(pk=job_id)
+    try:
+        return replay_dead_letters(job, reasons=reasons, image_ids=image_ids, limit=limit)
+    except ValueError as e:
+        job.logger.warning(f"Could not replay dead letters: {e}")
+        return None
+
+
 def cleanup_async_job_if_needed(job) -> None:
     """
     Clean up async resources (NATS/Redis) if this job uses them.
@@ -1466,6 +1589,16 @@ def update_job_failure(sender, task_id, exception, *args, **kwargs):
     cleanup_async_job_if_needed(job)
 
 
+@task_postrun.connect
+def flush_job_logs(**kwargs):
+    # Job end trigger for the buffered JobLog sink. task_postrun also fires for
+    # failed tasks (after task_failure), and this receiver is connected after
+    # the run_job handlers above, so the status lines they log are included.
+    from ami.jobs.models import job_log_buffer
+
+    job_log_buffer.flush_soon()
+
+
 def log_time(start: float = 0, msg: str | None = None) -> tuple[float, Callable]:
     """
     Small helper to measure time between calls.
@@ -1,8 +1,15 @@
 # from rich import print
+import json
 import logging
+import threading
+import time
+import uuid
 from typing import Any
+from unittest.mock import patch
 
-from django.test import TestCase
+import celery.exceptions
+import requests
+from django.test import TestCase, override_settings
 from guardian.shortcuts import assign_perm
 from rest_framework import status
 from rest_framework.test import APIRequestFactory, APITestCase
@@ -18,11 +25,13 @@ from ami.jobs.models import (
     MLJob,
     RegroupEventsJob,
     SourceImageCollectionPopulateJob,
+    job_log_buffer,
 )
 from ami.main.models import Deployment, Event, Project, SourceImage, SourceImageCollection
 from ami.ml.models import Pipeline
 from ami.ml.models.processing_service import ProcessingService
 from ami.ml.orchestration.jobs import queue_images_to_nats
+from ami.ml.schemas import PipelineResultsResponse, SourceImageResponse
 from ami.tests.fixtures.main import create_captures
 from ami.users.models import User
 
@@ -33,6 +42,11 @@ def joined_job_log_messages(job: Job) -> str:
     return "\n".join(JobLog.objects.filter(job=job).order_by("-created_at", "-pk").values_list("message", flat=True))
 
 
+def streamed_json(response) -> Any:
+    """The JSON body of a long-poll response, which is streamed once the poll finishes if it had to wait."""
+    return json.loads(b"".join(response))
+
+
 class TestJobProgress(TestCase):
     def setUp(self):
         self.project = Project.objects.create(name="Test project")
@@ -829,6 +843,180 @@ class TestJobView(APITestCase):
         self.assertIn("Tasks fetched", joined)
         self.assertIn("delivered=3", joined)
 
+    def _create_active_async_job(self, name: str, pipeline: Pipeline, num_images: int = 0) -> Job:
+        job = self._create_ml_job(name, pipeline)
+        job.dispatch_mode = JobDispatchMode.ASYNC_API
+        job.status = JobState.STARTED
+        job.save(update_fields=["dispatch_mode", "status"])
+        if num_images:
+            images = [
+                SourceImage.objects.create(
+                    path=f"{name.replace(' ', '_')}_{i}.jpg",
+                    public_base_url="http://example.com",
+                    project=self.project,
+                )
+                for i in range(num_images)
+            ]
+            queue_images_to_nats(job, images)
+        return job
+
+    def test_tasks_endpoint_long_poll_returns_queued_tasks_immediately(self):
+        """A long-poll against a queue that already has tasks doesn't wait."""
+        import time
+
+        job = self._create_active_async_job("Job for long-poll test", self._create_pipeline(), num_images=3)
+
+        self.client.force_authenticate(user=self.user)
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params={"project_id": self.project.pk})
+        start = time.monotonic()
+        resp = self.client.post(tasks_url, {"batch_size": 3, "wait": 10}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(streamed_json(resp)["tasks"]), 3)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertIn("wait=10s", joined_job_log_messages(job))
+
+    def test_tasks_endpoint_long_poll_returns_empty_after_wait(self):
+        """A long-poll on a dry queue returns an empty list once the wait expires."""
+        job = self._create_active_async_job("Job for empty long-poll test", self._create_pipeline())
+
+        self.client.force_authenticate(user=self.user)
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params={"project_id": self.project.pk})
+        resp = self.client.post(tasks_url, {"batch_size": 5, "wait": 0.2}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(streamed_json(resp), {"tasks": []})
+
+    def test_tasks_endpoint_long_polls_are_capped(self):
+        """Beyond NATS_TASKS_MAX_LONG_POLLS, a long-poll on a dry queue returns without waiting."""
+        import time
+
+        job = self._create_active_async_job("Job for capped long-poll test", self._create_pipeline())
+
+        self.client.force_authenticate(user=self.user)
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params={"project_id": self.project.pk})
+        start = time.monotonic()
+        with self.settings(NATS_TASKS_MAX_LONG_POLLS=0):
+            resp = self.client.post(tasks_url, {"batch_size": 5, "wait": 10}, format="json")
+            self.assertEqual(streamed_json(resp), {"tasks": []})
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_tasks_endpoint_long_poll_returns_503_when_nats_is_down(self):
+        """An outage is reported before the long poll starts, so workers back off instead of polling again."""
+        from unittest import mock
+
+        job = self._create_active_async_job("Job for long-poll outage test", self._create_pipeline())
+
+        self.client.force_authenticate(user=self.user)
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params={"project_id": self.project.pk})
+        with mock.patch(
+            "ami.ml.orchestration.nats_queue.TaskQueueManager.__aenter__", side_effect=OSError("Connection refused")
+        ):
+            resp = self.client.post(tasks_url, {"batch_size": 5, "wait": 10}, format="json")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.json()["tasks"], [])
+
+    def test_tasks_endpoint_rejects_wait_above_max(self):
+        from django.conf import settings
+
+        job = self._create_active_async_job("Job for wait validation test", self._create_pipeline())
+
+        self.client.force_authenticate(user=self.user)
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params={"project_id": self.project.pk})
+        for value in [-1, settings.NATS_TASKS_MAX_WAIT + 1, "soon"]:
+            with self.subTest(wait=value):
+                resp = self.client.post(tasks_url, {"batch_size": 1, "wait": value}, format="json")
+                self.assertEqual(resp.status_code, 400)
+
+    def test_dead_letters_triage_and_replay(self):
+        """Tasks that run out of deliveries are listed by reason and can be replayed one by one."""
+        import time
+        from unittest import mock
+
+        from ami.jobs.tasks import replay_job_dead_letters
+        from ami.ml.orchestration.async_job_state import get_job_state_manager
+        from ami.ml.orchestration.jobs import cleanup_async_job_resources
+
+        # A single one-second delivery attempt per task, so unacked tasks dead-letter quickly
+        with mock.patch("ami.ml.orchestration.nats_queue.TASK_TTR", 1), mock.patch(
+            "ami.ml.orchestration.nats_queue.NATS_MAX_DELIVER", 1
+        ):
+            job = self._create_active_async_job("Job with dead letters", self._create_pipeline(), num_images=3)
+        self.addCleanup(cleanup_async_job_resources, job.pk)
+
+        self.client.force_authenticate(user=self.user)
+        params = {"project_id": self.project.pk}
+        tasks_url = reverse_with_params("api:job-tasks", args=[job.pk], params=params)
+        self.assertEqual(len(self.client.post(tasks_url, {"batch_size": 3}, format="json").json()["tasks"]), 3)
+        time.sleep(1.5)
+        self.assertEqual(self.client.post(tasks_url, {"batch_size": 3}, format="json").json()["tasks"], [])
+
+        resp = self.client.get(reverse_with_params("api:job-dead-letters", args=[job.pk], params=params))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["count"], 3)
+        [group] = resp.json()["groups"]
+        self.assertEqual((group["reason"], group["replayable"]), ("max_deliveries_exceeded", 3))
+
+        image_id = group["image_ids"][0]
+        replay_url = reverse_with_params("api:job-replay-dead-letters", args=[job.pk], params=params)
+        resp = self.client.post(replay_url, {"image_ids": [image_id], "dry_run": True}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.json()["matched"], resp.json()["replayed"]), (1, 0))
+
+        with mock.patch("ami.jobs.views.replay_job_dead_letters.delay") as mock_delay:
+            mock_delay.return_value.id = "replay-task"
+            resp = self.client.post(replay_url, {"image_ids": [image_id]}, format="json")
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual((resp.json()["task_id"], resp.json()["status"]), ("replay-task", "queued"))
+        mock_delay.assert_called_once_with(job.pk, reasons=[], image_ids=[image_id], limit=None)
+
+        result = replay_job_dead_letters(job.pk, image_ids=[image_id])
+        self.assertEqual((result["matched"], result["replayed"]), (1, 1))
+        self.assertIn(image_id, get_job_state_manager(job.pk).get_pending_image_ids())
+
+        resp = self.client.post(tasks_url, {"batch_size": 3}, format="json")
+        self.assertEqual([task["image_id"] for task in resp.json()["tasks"]], [image_id])
+
+        # Already replayed, so a second replay publishes nothing
+        result = replay_job_dead_letters(job.pk, image_ids=[image_id])
+        self.assertEqual((result["matched"], result["replayed"]), (0, 0))
+
+    def test_replay_dead_letters_rejects_non_async_job(self):
+        self.client.force_authenticate(user=self.user)
+        replay_url = reverse_with_params(
+            "api:job-replay-dead-letters", args=[self.job.pk], params={"project_id": self.project.pk}
+        )
+        resp = self.client.post(replay_url, {}, format="json")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_claim_tasks_fetches_across_jobs(self):
+        """The multi-job endpoint fills a batch from several jobs and groups tasks by job."""
+        pipeline = self._create_pipeline()
+        job_a = self._create_active_async_job("Multi job A", pipeline, num_images=2)
+        job_b = self._create_active_async_job("Multi job B", pipeline, num_images=2)
+
+        self.client.force_authenticate(user=self.user)
+        claim_url = reverse_with_params("api:job-claim-tasks", params={"pipeline__slug__in": pipeline.slug})
+        resp = self.client.post(claim_url, {"batch_size": 10, "wait": 1}, format="json")
+        self.assertEqual(resp.status_code, 200)
+
+        delivered = {batch["job_id"]: len(batch["tasks"]) for batch in streamed_json(resp)["jobs"]}
+        self.assertEqual(sum(delivered.values()), 4)
+        self.assertEqual(set(delivered), {job_a.pk, job_b.pk})
+
+    def test_claim_tasks_skips_ineligible_jobs(self):
+        """Jobs on other pipelines, sync jobs and finished jobs are never swept."""
+        pipeline = self._create_pipeline()
+        other_pipeline = self._create_pipeline(name="Other pipeline", slug="other-pipeline")
+        self._create_active_async_job("Other pipeline job", other_pipeline, num_images=2)
+        finished = self._create_active_async_job("Finished job", pipeline, num_images=2)
+        finished.status = JobState.SUCCESS
+        finished.save(update_fields=["status"])
+
+        self.client.force_authenticate(user=self.user)
+        claim_url = reverse_with_params("api:job-claim-tasks", params={"pipeline__slug__in": pipeline.slug})
+        resp = self.client.post(claim_url, {"batch_size": 10}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"jobs": []})
+
 
 class TestJobThroughputLogging(TestCase):
     """Unit tests for _log_job_throughput (Task 3)."""
@@ -920,6 +1108,193 @@ class TestJobThroughputLogging(TestCase):
         self.assertIn("ETA=unknown", joined)
 
 
+class TestMLJobSyncDispatch(TestCase):
+    """MLJob.process_images keeps several batch requests in flight and throttles on slow saves."""
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Sync dispatch project")
+        self.pipeline = Pipeline.objects.create(name="Sync dispatch pipeline", slug="sync-dispatch-pipeline")
+        self.pipeline.projects.add(self.project)
+        self.job = Job.objects.create(
+            job_type_key=MLJob.key,
+            project=self.project,
+            name="Sync dispatch job",
+            pipeline=self.pipeline,
+            dispatch_mode=JobDispatchMode.SYNC_API,
+        )
+        self.job.progress.add_stage("process")
+        self.job.progress.add_stage("results")
+        self.job.save()
+        self.images = [
+            SourceImage.objects.create(
+                path=f"sync_{i}.jpg", public_base_url="http://example.com", project=self.project
+            )
+            for i in range(6)
+        ]
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.sent_image_ids = []
+
+    def _send(self, endpoint_url, request_data, **kwargs):
+        # Stands in for the HTTP POST, which runs in the dispatcher's worker threads
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+            self.sent_image_ids.extend(image.id for image in request_data.source_images)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = (
+            PipelineResultsResponse(
+                pipeline=request_data.pipeline,
+                source_images=[
+                    SourceImageResponse(id=image.id, url=image.url) for image in request_data.source_images
+                ],
+                detections=[],
+                total_time=0.05,
+            )
+            .json()
+            .encode()
+        )
+        return resp
+
+    def _process_images(self, save_results_async, image_count=None):
+        processing_service = ProcessingService(name="Sync service", endpoint_url="http://processing-service")
+        with patch("ami.ml.models.pipeline.send_pipeline_request", side_effect=self._send), patch.object(
+            Pipeline, "get_sync_processing_service", return_value=processing_service
+        ), patch.object(Pipeline, "save_results_async", side_effect=save_results_async):
+            MLJob.process_images(self.job, self.images, image_count=image_count)
+        self.job.refresh_from_db()
+
+    @override_settings(ML_SYNC_REQUEST_CONCURRENCY=3)
+    def test_keeps_requests_in_flight(self):
+        save_tasks = []
+
+        def save_results_async(results, job_id=None):
+            save_tasks.append(FakeSaveTask(done=True))
+            return save_tasks[-1]
+
+        self._process_images(save_results_async)
+
+        self.assertEqual(self.peak_in_flight, 3)
+        self.assertEqual(sorted(self.sent_image_ids), sorted(str(image.pk) for image in self.images))
+        self.assertEqual(len(save_tasks), 6)
+        self.assertEqual(self.job.status, JobState.SUCCESS)
+        process_stage = self.job.progress.get_stage("process")
+        self.assertEqual(self.job.progress.get_stage_param("process", "processed").value, 6)
+        self.assertEqual(self.job.progress.get_stage_param("process", "failed").value, 0)
+        self.assertEqual(process_stage.status, JobState.SUCCESS)
+
+    @override_settings(ML_SYNC_REQUEST_CONCURRENCY=2, ML_SYNC_MAX_PENDING_SAVES=2)
+    def test_waits_for_saves_that_fall_behind(self):
+        save_tasks = []
+        unfinished_saves_at_send = []
+        send = self._send
+
+        def send_and_count(endpoint_url, request_data, **kwargs):
+            unfinished_saves_at_send.append(len([task for task in save_tasks if not task.ready()]))
+            return send(endpoint_url, request_data, **kwargs)
+
+        self._send = send_and_count
+
+        def save_results_async(results, job_id=None):
+            # Saves never finish on their own; the dispatcher has to wait for them
+            save_tasks.append(FakeSaveTask(done=False))
+            return save_tasks[-1]
+
+        self._process_images(save_results_async)
+
+        self.assertEqual(len(unfinished_saves_at_send), 6)
+        self.assertLess(max(unfinished_saves_at_send), 2)
+        self.assertTrue(all(task.waited for task in save_tasks))
+        self.assertEqual(self.job.status, JobState.SUCCESS)
+
+    @override_settings(ML_SYNC_REQUEST_CONCURRENCY=2, ML_SYNC_MAX_PENDING_SAVES=2)
+    def test_keeps_waiting_for_saves_that_time_out(self):
+        save_tasks = []
+
+        def save_results_async(results, job_id=None):
+            # Each save outlasts the first wait for it
+            save_tasks.append(FakeSaveTask(done=False, timeouts=1))
+            return save_tasks[-1]
+
+        self._process_images(save_results_async)
+
+        self.assertTrue(all(task.done for task in save_tasks))
+        self.assertIn("saving results for over a minute", joined_job_log_messages(self.job))
+        self.assertEqual(self.job.status, JobState.SUCCESS)
+
+    def test_failed_requests_count_as_failed_images(self):
+        send = self._send
+
+        def send_failing(endpoint_url, request_data, **kwargs):
+            if request_data.source_images[0].id == str(self.images[0].pk):
+                raise requests.ConnectionError("Connection refused")
+            return send(endpoint_url, request_data, **kwargs)
+
+        self._send = send_failing
+        self._process_images(lambda results, job_id=None: FakeSaveTask(done=True))
+
+        self.assertEqual(self.job.progress.get_stage_param("process", "failed").value, 1)
+        self.assertEqual(self.job.progress.get_stage_param("process", "processed").value, 6)
+        self.assertIn("Failed to process image batch 1", joined_job_log_messages(self.job))
+
+    @override_settings(ML_SYNC_REQUEST_CONCURRENCY=1)
+    def test_sends_batches_while_images_are_still_collected(self):
+        images_collected = []
+        collected_at_send = []
+        send = self._send
+
+        def send_and_count(endpoint_url, request_data, **kwargs):
+            collected_at_send.append(len(images_collected))
+            return send(endpoint_url, request_data, **kwargs)
+
+        images = self.images
+
+        def collect():
+            for image in images:
+                images_collected.append(image)
+                yield image
+
+        self._send = send_and_count
+        self.images = collect()
+        # An estimate that falls short of the images actually collected
+        self._process_images(lambda results, job_id=None: FakeSaveTask(done=True), image_count=4)
+
+        self.assertEqual(collected_at_send, [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.job.progress.get_stage_param("process", "processed").value, 6)
+        self.assertEqual(self.job.progress.get_stage_param("process", "remaining").value, 0)
+        self.assertEqual(self.job.progress.get_stage("process").progress, 1)
+        self.assertEqual(self.job.status, JobState.SUCCESS)
+
+
+class FakeSaveTask:
+    """Stands in for the AsyncResult of a save_results sub-task."""
+
+    def __init__(self, done: bool, timeouts: int = 0):
+        self.id = uuid.uuid4().hex
+        self.done = done
+        self.waited = False
+        # The number of waits that time out before the save finishes
+        self.timeouts = timeouts
+
+    def ready(self):
+        return self.done
+
+    def successful(self):
+        return self.done
+
+    def wait(self, **kwargs):
+        self.waited = True
+        if self.timeouts:
+            self.timeouts -= 1
+            raise celery.exceptions.TimeoutError("The operation timed out.")
+        self.done = True
+
+
 class TestJobLogPersistence(TestCase):
     """Exercise the JobLog table / legacy-JSON fallback paths on JobLogHandler.emit."""
 
@@ -1075,6 +1450,91 @@ class TestJobLogPersistence(TestCase):
         self.assertGreaterEqual(JOB_LOGS_DEFAULT_LIMIT, 1)
 
 
+@override_settings(JOB_LOG_BUFFER_SIZE=3, JOB_LOG_FLUSH_INTERVAL=60)
+class TestBufferedJobLogs(TestCase):
+    """JobLogHandler.emit buffers rows and writes them with bulk_create."""
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Buffered JobLog Project")
+        self.job = Job.objects.create(job_type_key=MLJob.key, project=self.project, name="Buffered log job")
+
+    def tearDown(self):
+        # Don't leak buffered rows or a pending flush timer into other tests
+        job_log_buffer.flush()
+
+    def test_lines_are_written_when_buffer_fills(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.job.logger.info("first")
+            self.job.logger.info("second")
+        self.assertFalse(JobLog.objects.filter(job=self.job).exists())
+        self.assertEqual(len(job_log_buffer), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.job.logger.warning("third")
+        messages = list(JobLog.objects.filter(job=self.job).order_by("pk").values_list("message", flat=True))
+        self.assertEqual(messages, ["first", "second", "third"])
+        self.assertEqual(len(job_log_buffer), 0)
+
+    def test_rows_keep_the_time_they_were_logged(self):
+        import datetime
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.job.logger.info("early")
+        logged_before = datetime.datetime.now()
+        job_log_buffer.flush()
+
+        entry = JobLog.objects.get(job=self.job)
+        self.assertLessEqual(entry.created_at, logged_before)
+
+    def test_lines_from_rolled_back_transaction_are_dropped(self):
+        from django.db import transaction
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.job.logger.info("rolled back")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(len(job_log_buffer), 0)
+
+    def test_failed_bulk_insert_falls_back_to_single_rows(self):
+        from unittest.mock import patch
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.job.logger.info("one")
+            self.job.logger.info("two")
+        with patch.object(JobLog.objects, "bulk_create", side_effect=Exception("batch rejected")):
+            self.assertEqual(job_log_buffer.flush(), 2)
+        self.assertEqual(JobLog.objects.filter(job=self.job).count(), 2)
+
+    def test_prune_job_logs_keeps_recent_and_running_jobs(self):
+        import datetime
+
+        from ami.jobs.tasks import prune_job_logs
+
+        old = datetime.datetime.now() - datetime.timedelta(days=40)
+        running_job = Job.objects.create(
+            job_type_key=MLJob.key, project=self.project, name="Running log job", status=JobState.STARTED
+        )
+        self.job.status = JobState.SUCCESS
+        self.job.save(update_fields=["status"])
+        JobLog.objects.bulk_create(
+            [
+                JobLog(job=self.job, level="INFO", message="old", created_at=old),
+                JobLog(job=self.job, level="INFO", message="recent"),
+                JobLog(job=running_job, level="INFO", message="old but running", created_at=old),
+            ]
+        )
+
+        self.assertEqual(prune_job_logs(days=30, batch_size=1), 1)
+        self.assertEqual(
+            set(JobLog.objects.values_list("message", flat=True)),
+            {"recent", "old but running"},
+        )
+        self.assertEqual(prune_job_logs(days=0), 0)
+
+
 class TestJobLogsLimitHTTPValidation(APITestCase):
     """``?logs_limit=`` validation runs at the view boundary, so a bad value
     must produce HTTP 400 (not 500). Validated via the actual API path rather
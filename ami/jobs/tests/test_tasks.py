@@ -12,16 +12,19 @@ from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from django.core.cache import cache
-from django.test import TransactionTestCase
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django_redis import get_redis_connection
 from rest_framework.test import APITestCase
 
 from ami.base.serializers import reverse_with_params
 from ami.jobs.models import Job, JobDispatchMode, JobState, MLJob
-from ami.jobs.tasks import _update_job_progress, process_nats_pipeline_result
+from ami.jobs.tasks import _flush_job_progress, _update_job_progress, process_nats_pipeline_result
 from ami.main.models import Detection, Project, SourceImage, SourceImageCollection
 from ami.ml.models import Algorithm, Pipeline
 from ami.ml.models.algorithm import AlgorithmTaskType
 from ami.ml.orchestration.async_job_state import AsyncJobStateManager
+from ami.ml.orchestration.metrics import IMAGES_KEY, reset_recorded_metrics
 from ami.ml.schemas import PipelineResultsError, PipelineResultsResponse, SourceImageResponse
 from ami.users.models import User
 
@@ -433,6 +436,8 @@ class TestProcessNatsPipelineResultError(TransactionTestCase):
         Scenario: deliver the same result twice. Counters should reflect one
         batch, not two.
         """
+        reset_recorded_metrics()
+        self.addCleanup(reset_recorded_metrics)
         self._setup_mock_nats(mock_manager_class)
 
         detection_algorithm = Algorithm.objects.create(
@@ -484,6 +489,8 @@ class TestProcessNatsPipelineResultError(TransactionTestCase):
             1,
             f"replay must not inflate captures counter (got {captures_after_replay}, expected 1)",
         )
+        saved = get_redis_connection("default").hget(IMAGES_KEY, "test-pipeline|saved")
+        self.assertEqual(int(saved), 1, "replay must not count the image as saved twice")
 
     @patch("ami.jobs.tasks.TaskQueueManager")
     def test_process_nats_pipeline_result_error_job_not_found(self, mock_manager_class):
@@ -1762,3 +1769,78 @@ class TestCancelCompletionRace(TransactionTestCase):
             JobState.REVOKED.value,
             f"late completion resurrected a REVOKED job to {self.job.status!r}",
         )
+
+
+@override_settings(JOB_PROGRESS_FLUSH_INTERVAL=60)
+class TestCoalescedJobProgress(TestCase):
+    """`_flush_job_progress` writes Job.progress at most once per interval per stage."""
+
+    def setUp(self):
+        cache.clear()
+        self.project = Project.objects.create(name="Coalesced Progress Project")
+        self.pipeline = Pipeline.objects.create(name="CP Pipeline", slug="cp-pipeline")
+        self.collection = SourceImageCollection.objects.create(name="CP Collection", project=self.project)
+        self.job = Job.objects.create(
+            job_type_key=MLJob.key,
+            project=self.project,
+            name="Coalesced Progress Job",
+            pipeline=self.pipeline,
+            source_image_collection=self.collection,
+            dispatch_mode=JobDispatchMode.ASYNC_API,
+            status=JobState.STARTED,
+        )
+        self.state_manager = AsyncJobStateManager(self.job.pk)
+
+    def tearDown(self):
+        cache.clear()
+
+    def _flush(self, percentage: float, detections: int, **kwargs) -> bool:
+        return _flush_job_progress(
+            self.state_manager,
+            self.job.pk,
+            "results",
+            percentage,
+            complete_state=JobState.SUCCESS,
+            detections=detections,
+            classifications=detections * 2,
+            captures=1,
+            **kwargs,
+        )
+
+    def _results_stage(self):
+        self.job.refresh_from_db()
+        return self.job.progress.get_stage("results")
+
+    def test_writes_inside_interval_are_folded_into_next_flush(self):
+        self.assertTrue(self._flush(0.25, detections=3))
+        self.assertEqual(self._results_stage().progress, 0.25)
+
+        # Inside the interval: Redis only, Job.progress untouched
+        self.assertFalse(self._flush(0.5, detections=4))
+        self.assertFalse(self._flush(0.75, detections=5))
+        stage = self._results_stage()
+        self.assertEqual(stage.progress, 0.25)
+        self.assertEqual(self.job.progress.get_stage_param("results", "detections").value, 3)
+
+        # Stage completion always flushes, with every parked delta
+        self.assertTrue(self._flush(1.0, detections=1))
+        stage = self._results_stage()
+        self.assertEqual(stage.progress, 1.0)
+        self.assertEqual(self.job.progress.get_stage_param("results", "detections").value, 13)
+        self.assertEqual(self.job.progress.get_stage_param("results", "classifications").value, 26)
+        self.assertEqual(self.job.progress.get_stage_param("results", "captures").value, 4)
+
+    def test_force_flushes_inside_interval(self):
+        self.assertTrue(self._flush(0.25, detections=3))
+        self.assertTrue(self._flush(0.5, detections=4, force=True))
+        self.assertEqual(self._results_stage().progress, 0.5)
+        self.assertEqual(self.job.progress.get_stage_param("results", "detections").value, 7)
+
+    def test_failed_write_hands_counts_back(self):
+        with patch("ami.jobs.tasks._update_job_progress", side_effect=DatabaseError("deadlock detected")):
+            with self.assertRaises(DatabaseError):
+                self._flush(0.25, detections=3)
+
+        self.assertTrue(self._flush(0.5, detections=4, force=True))
+        self.assertEqual(self._results_stage().progress, 0.5)
+        self.assertEqual(self.job.progress.get_stage_param("results", "detections").value, 7)
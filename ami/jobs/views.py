@@ -1,19 +1,24 @@
 import asyncio
 import logging
+import threading
+from collections.abc import Callable
 
 import kombu.exceptions
 import nats.errors
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.core.cache import cache
 from django.db.models import Q
 from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django_filters import rest_framework as filters
 from drf_spectacular.utils import extend_schema, extend_schema_view
-from rest_framework import serializers
+from rest_framework import serializers, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.filters import BaseFilterBackend
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from ami.base.pagination import LimitOffsetPaginationWithPermissions
@@ -23,20 +28,27 @@ from ami.base.views import ProjectMixin
 from ami.jobs.models import JOB_LOGS_MAX_LIMIT
 from ami.jobs.schemas import ids_only_param, incomplete_only_param, logs_limit_param
 from ami.jobs.serializers import (
+    DeadLetterReplayQueuedSerializer,
+    DeadLetterReplayRequestSerializer,
+    DeadLetterReplayResponseSerializer,
+    DeadLettersResponseSerializer,
     MLJobResultsRequestSerializer,
     MLJobResultsResponseSerializer,
+    MLJobsTasksResponseSerializer,
     MLJobTasksRequestSerializer,
     MLJobTasksResponseSerializer,
 )
 from ami.jobs.tasks import (
     HEARTBEAT_THROTTLE_SECONDS,
     process_nats_pipeline_result,
+    replay_job_dead_letters,
     update_async_services_seen_for_pipelines,
     update_async_services_seen_for_project,
     update_pipeline_pull_services_seen,
 )
 from ami.main.api.schemas import project_id_doc_param
 from ami.main.api.views import DefaultViewSet
+from ami.ml.schemas import PipelineProcessingTask
 from ami.utils.fields import url_boolean_param
 
 from .models import Job, JobDispatchMode, JobState
@@ -44,6 +56,10 @@ from .serializers import JobListSerializer, JobSerializer, MinimalJobSerializer
 
 logger = logging.getLogger(__name__)
 
+# Cap on how many jobs a single multi-job task fetch (``POST /jobs/tasks/``) will
+# sweep. Each eligible job costs a permission check and a NATS subscription.
+CLAIM_TASKS_MAX_JOBS = 50
+
 
 def _actor_log_context(request) -> tuple[str, str | None]:
     """
@@ -108,6 +124,26 @@ def _mark_async_services_seen_for_project(project_id: int) -> None:
         logger.warning(f"Failed to enqueue non-critical project heartbeat for project {project_id}: {exc}")
 
 
+def _log_tasks_fetched(
+    job: "Job", requested: int, delivered: int, wait: float, user_desc: str, token_fingerprint: str | None
+) -> None:
+    """
+    Record a task fetch on the per-job logger.
+
+    Empty fetches go to DEBUG so idle (long-)polling doesn't flood the job log;
+    fetches that handed out work are logged at INFO.
+    """
+    token_suffix = f", token_id={token_fingerprint}" if token_fingerprint is not None else ""
+    wait_suffix = f", wait={wait:g}s" if wait else ""
+    fetch_msg = (
+        f"Tasks fetched: requested={requested}, delivered={delivered}{wait_suffix}, user={user_desc}{token_suffix}"
+    )
+    if delivered > 0:
+        job.logger.info(fetch_msg)
+    else:
+        job.logger.debug(fetch_msg)
+
+
 def _mark_pipeline_pull_services_seen(job: "Job") -> None:
     """
     Enqueue a fire-and-forget heartbeat for async (pull-mode) processing services
@@ -137,6 +173,68 @@ def _mark_pipeline_pull_services_seen(job: "Job") -> None:
         job.logger.warning(msg)
 
 
+# Long polls for tasks that this process is waiting on (see ``_long_poll``)
+_long_polls = 0
+_long_polls_lock = threading.Lock()
+
+
+def _long_poll(
+    job_ids: list[int],
+    batch_size: int,
+    wait: float,
+    on_reserved: Callable[[dict[int, list[PipelineProcessingTask]]], dict],
+    on_error: Callable[[Exception], dict],
+) -> Response | StreamingHttpResponse:
+    """
+    Long poll for tasks, answering with the tasks that are queued right away if there are any.
+
+    Under ASGI, Django runs every sync view of a process on one shared thread, so a view
+    that waited for tasks itself would hold up all other sync requests for the whole wait.
+    Only when the queues are dry does the view wait, by returning a streaming response whose
+    poll the server awaits on its event loop. At most ``NATS_TASKS_MAX_LONG_POLLS`` polls
+    wait at once per process; further requests get an empty batch, as if they hadn't asked
+    to wait.
+
+    ``on_reserved`` and ``on_error`` build the body from the reserved tasks or the NATS
+    error, and may use the database. NATS is contacted before the response is returned, so
+    an outage is answered with a 503. Only if NATS drops during the wait itself, after the
+    200 has been sent, does the body report the error instead.
+    """
+    from ami.ml.orchestration.nats_queue import TaskQueueManager
+
+    async def reserve(poll_wait: float) -> dict[int, list[PipelineProcessingTask]]:
+        async with TaskQueueManager() as manager:
+            return await manager.reserve_tasks_long_poll(job_ids, count=batch_size, wait=poll_wait)
+
+    try:
+        reserved = async_to_sync(reserve)(0)
+    except (asyncio.TimeoutError, OSError, nats.errors.Error) as e:
+        return Response(on_error(e), status=503)
+    if reserved or wait <= 0:
+        return Response(on_reserved(reserved))
+
+    async def body():
+        global _long_polls
+
+        with _long_polls_lock:
+            waiting = _long_polls < settings.NATS_TASKS_MAX_LONG_POLLS
+            if waiting:
+                _long_polls += 1
+        try:
+            reserved = await reserve(wait) if waiting else {}
+        except (asyncio.TimeoutError, OSError, nats.errors.Error) as e:
+            data = await sync_to_async(on_error)(e)
+        else:
+            data = await sync_to_async(on_reserved)(reserved)
+        finally:
+            if waiting:
+                with _long_polls_lock:
+                    _long_polls -= 1
+        yield JSONRenderer().render(data)
+
+    return StreamingHttpResponse(body(), content_type="application/json")
+
+
 class JobFilterSet(filters.FilterSet):
     """Custom filterset to enable pipeline name filtering."""
 
@@ -426,10 +524,14 @@ class JobViewSet(DefaultViewSet, ProjectMixin):
         1. POST to this endpoint with {"batch_size": N}
         2. Process the tasks
         3. POST to /jobs/{id}/result/ with the results
+
+        Pass {"wait": seconds} to long-poll: when the queue is empty the request is held
+        open until a task is published or the wait expires, instead of returning at once.
         """
         serializer = MLJobTasksRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         batch_size = serializer.validated_data["batch_size"]
+        wait = serializer.validated_data["wait"]
 
         job: Job = self.get_object()
 
@@ -458,29 +560,98 @@ class JobViewSet(DefaultViewSet, ProjectMixin):
         _mark_pipeline_pull_services_seen(job)
 
         # Get tasks from NATS JetStream
-        from ami.ml.orchestration.nats_queue import TaskQueueManager
+        from ami.ml.orchestration.nats_queue import LONG_POLL_FETCH_TIMEOUT, TaskQueueManager
+
+        def log_error(e: Exception) -> dict:
+            msg = f"NATS unavailable while fetching tasks for job {job.pk}: {e}"
+            logger.warning(msg)
+            token_suffix = f", token_id={token_fingerprint}" if token_fingerprint is not None else ""
+            job.logger.warning(f"{msg} user={user_desc}{token_suffix}")
+            return {"tasks": [], "error": "Task queue temporarily unavailable"}
+
+        if wait > 0:
+
+            def log_reserved(reserved: dict[int, list[PipelineProcessingTask]]) -> dict:
+                tasks = reserved.get(job.pk, [])
+                _log_tasks_fetched(job, batch_size, len(tasks), wait, user_desc, token_fingerprint)
+                return {"tasks": [task.dict() for task in tasks]}
+
+            return _long_poll([job.pk], batch_size, wait, on_reserved=log_reserved, on_error=log_error)
 
         async def get_tasks():
             async with TaskQueueManager() as manager:
-                return [task.dict() for task in await manager.reserve_tasks(job.pk, count=batch_size, timeout=0.5)]
+                tasks = await manager.reserve_tasks(job.pk, count=batch_size, timeout=LONG_POLL_FETCH_TIMEOUT)
+                return [task.dict() for task in tasks]
 
         try:
             tasks = async_to_sync(get_tasks)()
         except (asyncio.TimeoutError, OSError, nats.errors.Error) as e:
-            msg = f"NATS unavailable while fetching tasks for job {job.pk}: {e}"
-            logger.warning(msg)
-            token_suffix = f", token_id={token_fingerprint}" if token_fingerprint is not None else ""
-            job.logger.warning(f"{msg} user={user_desc}{token_suffix}")
-            return Response({"error": "Task queue temporarily unavailable"}, status=503)
+            return Response(log_error(e), status=503)
 
-        token_suffix = f", token_id={token_fingerprint}" if token_fingerprint is not None else ""
-        fetch_msg = f"Tasks fetched: requested={batch_size}, delivered={len(tasks)}, user={user_desc}{token_suffix}"
-        if len(tasks) > 0:
-            job.logger.info(fetch_msg)
-        else:
-            job.logger.debug(fetch_msg)
+        _log_tasks_fetched(job, batch_size, len(tasks), wait, user_desc, token_fingerprint)
         return Response({"tasks": tasks})
 
+    @extend_schema(
+        request=MLJobTasksRequestSerializer,
+        responses={200: MLJobsTasksResponseSerializer},
+        parameters=[project_id_doc_param],
+    )
+    @action(detail=False, methods=["post"], url_path="tasks", name="claim_tasks")
+    def claim_tasks(self, request):
+        """
+        Fetch tasks from any job the worker is eligible for (POST).
+
+        Multi-job companion to `/jobs/{id}/tasks/` for workers that serve several jobs.
+        Narrow the candidate jobs with the usual list filters (e.g. `?pipeline__slug__in=`
+        or `?project_id=`); only active async_api jobs the user may fetch tasks from are
+        swept. Accepts the same body as the per-job endpoint, including `wait` to hold the
+        request until a task is published to any of the candidate jobs.
+
+        Tasks come back grouped by job; post each group's results to that job's
+        `/jobs/{id}/result/` endpoint.
+        """
+        serializer = MLJobTasksRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch_size = serializer.validated_data["batch_size"]
+        wait = serializer.validated_data["wait"]
+
+        candidates = (
+            self.filter_queryset(self.get_queryset())
+            .filter(
+                dispatch_mode=JobDispatchMode.ASYNC_API,
+                status__in=JobState.active_states(),
+                pipeline__isnull=False,
+            )
+            .select_related("project")
+            .order_by("?")[:CLAIM_TASKS_MAX_JOBS]
+        )
+        jobs = {job.pk: job for job in candidates if job.check_permission(request.user, "tasks")}
+        if not jobs:
+            return Response({"jobs": []})
+
+        for job in jobs.values():
+            _mark_pipeline_pull_services_seen(job)
+
+        # Candidates were drawn in random order, so concurrent workers sweep jobs in
+        # different orders instead of all draining the same one first.
+        job_ids = list(jobs)
+        user_desc, token_fingerprint = _actor_log_context(request)
+
+        def log_error(e: Exception) -> dict:
+            logger.warning(f"NATS unavailable while fetching tasks for jobs {job_ids}: {e}")
+            return {"jobs": [], "error": "Task queue temporarily unavailable"}
+
+        def log_reserved(reserved: dict[int, list[PipelineProcessingTask]]) -> dict:
+            for job_id, tasks in reserved.items():
+                _log_tasks_fetched(jobs[job_id], batch_size, len(tasks), wait, user_desc, token_fingerprint)
+            return {
+                "jobs": [
+                    {"job_id": job_id, "tasks": [task.dict() for task in tasks]} for job_id, tasks in reserved.items()
+                ]
+            }
+
+        return _long_poll(job_ids, batch_size, wait, on_reserved=log_reserved, on_error=log_error)
+
     @extend_schema(
         request=MLJobResultsRequestSerializer,
         responses={200: MLJobResultsResponseSerializer},
@@ -562,3 +733,72 @@ class JobViewSet(DefaultViewSet, ProjectMixin):
                 },
                 status=503,
             )
+
+    @extend_schema(responses={200: DeadLettersResponseSerializer}, parameters=[project_id_doc_param])
+    @action(detail=True, methods=["get"], name="dead_letters")
+    def dead_letters(self, request, pk=None):
+        """
+        List the job's dead letters (tasks NATS gave up delivering), grouped by failure reason.
+        """
+        from ami.ml.orchestration.dead_letters import summarize_dead_letters
+
+        job: Job = self.get_object()
+        if job.dispatch_mode != JobDispatchMode.ASYNC_API:
+            raise ValidationError("Only async_api jobs have dead letters")
+
+        try:
+            groups = summarize_dead_letters(job)
+        except (asyncio.TimeoutError, OSError, nats.errors.Error) as e:
+            logger.warning(f"NATS unavailable while listing dead letters for job {job.pk}: {e}")
+            return Response({"error": "Task queue temporarily unavailable"}, status=503)
+
+        return Response({"job_id": job.pk, "count": sum(group["count"] for group in groups), "groups": groups})
+
+    @extend_schema(
+        request=DeadLetterReplayRequestSerializer,
+        responses={200: DeadLetterReplayResponseSerializer, 202: DeadLetterReplayQueuedSerializer},
+        parameters=[project_id_doc_param],
+    )
+    @action(detail=True, methods=["post"], name="replay_dead_letters")
+    def replay_dead_letters(self, request, pk=None):
+        """
+        Re-publish the job's dead letters to its task queue, optionally filtered by reason or image.
+
+        The replay is queued as a Celery task and its outcome is written to the job's logs;
+        a dry run lists what would be replayed right away. Replayed images count as pending
+        again until their results arrive. Only possible while the job is running, and only
+        for dead letters of the last hour, which is how long NATS advisories are kept.
+        """
+        from ami.ml.orchestration.dead_letters import check_replayable, replay_dead_letters
+
+        serializer = DeadLetterReplayRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        job: Job = self.get_object()
+        try:
+            check_replayable(job)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        if not options["dry_run"]:
+            task = replay_job_dead_letters.delay(
+                job.pk, reasons=options["reasons"], image_ids=options["image_ids"], limit=options["limit"]
+            )
+            return Response(
+                {
+                    "job_id": job.pk,
+                    "task_id": task.id,
+                    "status": "queued",
+                    "detail": "The replay's outcome will be written to the job's logs",
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        try:
+            result = replay_dead_letters(job, **options)
+        except (asyncio.TimeoutError, OSError, nats.errors.Error) as e:
+            logger.warning(f"NATS unavailable while replaying dead letters for job {job.pk}: {e}")
+            return Response({"error": "Task queue temporarily unavailable"}, status=503)
+
+        return Response(result)
@@ -1,9 +1,12 @@
 import html
 import logging
+import typing
 
 import requests
 from django.http import HttpResponse
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import LimitOffsetPagination
@@ -17,15 +20,16 @@ from ami.labelstudio.serializers import (
 )
 from ami.main.api.views import DefaultReadOnlyViewSet
 from ami.main.models import DEFAULT_RANKS, Deployment, Detection, Occurrence, Project, SourceImage, TaxaList, Taxon
+from ami.main.models_future.taxonomy import cached_taxa_tree
 
 logger = logging.getLogger(__name__)
 
 
 def taxa_tree_to_xml(taxa_tree):
     """
-    # Recursively build the XML from taxa_tree
+    # Recursively build the XML from a serialized taxa_tree (see serialize_taxa_tree)
     # Which looks like:
-    # {"taxon": <Taxon: 1>, "children": [{"taxon": <Taxon: 2>, "children": []}]}}
+    # {"display_name": "Lepidoptera", "rank": "ORDER", "children": [{"display_name": ..., "children": []}]}
 
     # Example of a nested Choice XML
     <Choice value="Parent">
@@ -37,8 +41,8 @@ def taxa_tree_to_xml(taxa_tree):
 
     def _node_to_xml(node, level=0):
         indent = "  " * level
-        value = html.escape(str(node["taxon"].get_display_name()))
-        rank = html.escape(str(node["taxon"].rank))
+        value = html.escape(str(node["display_name"]))
+        rank = html.escape(str(node["rank"]))
         xml = f'\n{indent}<Choice value="{value}" hint="{rank}">'
         for child in node["children"]:
             xml += _node_to_xml(child, level + 1)
@@ -49,6 +53,20 @@ def taxa_tree_to_xml(taxa_tree):
     return taxonomy_choices_xml
 
 
+def taxonomy_xml_response(request, taxa_tree: dict, render: typing.Callable[[dict], str]) -> HttpResponse:
+    """
+    Render a cached taxa tree (see ``cached_taxa_tree``) as XML, with an ETag of its content.
+
+    Returns 304 Not Modified without rendering it if the client has the same version.
+    """
+    etag = quote_etag(f"{taxa_tree['hash']}-{request.resolver_match.url_name}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(render(taxa_tree["tree"]), content_type="text/xml")
+    response["ETag"] = etag
+    return response
+
+
 class LabelStudioFlatPaginator(LimitOffsetPagination):
     """
     A custom paginator that does not nest the data under a "results" key.
@@ -196,41 +214,35 @@ class LabelStudioConfigViewSet(viewsets.ViewSet):
     def speciesclassification(self, request):
         """ """
         taxa_list_id = request.query_params.get("taxa_list", None)
-        if taxa_list_id:
-            taxa_list = TaxaList.objects.get(id=taxa_list_id)
-            taxa_tree = taxa_list.taxa.tree()  # type: ignore
-        else:
-            taxa_tree = Taxon.objects.tree()
-
-        data = {
-            "label_config": {
-                "taxonomy_choices_xml": taxa_tree_to_xml(taxa_tree),
+        taxa_list = TaxaList.objects.get(id=taxa_list_id) if taxa_list_id else None
+        taxa_tree = cached_taxa_tree(taxa_list)
+
+        def render(tree: dict) -> str:
+            data = {
+                "label_config": {
+                    "taxonomy_choices_xml": taxa_tree_to_xml(tree),
+                }
             }
-        }
+            return render_to_string("labelstudio/species_classification.xml", data)
 
-        content = render_to_string("labelstudio/species_classification.xml", data)
-
-        return HttpResponse(content, content_type="text/xml")
+        return taxonomy_xml_response(request, taxa_tree, render)
 
     @action(detail=False, methods=["get"], name="all_in_one")
     def all_in_one(self, request):
         """ """
         taxa_list_id = request.query_params.get("taxa_list", None)
-        if taxa_list_id:
-            taxa_list = TaxaList.objects.get(id=taxa_list_id)
-            taxa_tree = taxa_list.taxa.tree()  # type: ignore
-        else:
-            taxa_tree = Taxon.objects.tree()
-
-        data = {
-            "label_config": {
-                "taxonomy_choices_xml": taxa_tree_to_xml(taxa_tree),
+        taxa_list = TaxaList.objects.get(id=taxa_list_id) if taxa_list_id else None
+        taxa_tree = cached_taxa_tree(taxa_list)
+
+        def render(tree: dict) -> str:
+            data = {
+                "label_config": {
+                    "taxonomy_choices_xml": taxa_tree_to_xml(tree),
+                }
             }
-        }
+            return render_to_string("labelstudio/all_in_one.xml", data)
 
-        content = render_to_string("labelstudio/all_in_one.xml", data)
-
-        return HttpResponse(content, content_type="text/xml")
+        return taxonomy_xml_response(request, taxa_tree, render)
 
     @action(detail=False, methods=["get"], name="taxonomy")
     def taxonomy(self, request):
@@ -253,14 +265,13 @@ class LabelStudioConfigViewSet(viewsets.ViewSet):
             closest_parent = path_parts[-1]
             parent = Taxon.objects.filter(display_name=closest_parent).first()
             if parent:
-                taxa_tree = Taxon.objects.tree(root=parent, filter_ranks=DEFAULT_RANKS)
+                taxa_tree = cached_taxa_tree(root=parent, filter_ranks=DEFAULT_RANKS)
             else:
                 # If a matching node is not found, return an empty response
                 return HttpResponse("", content_type="text/xml")
         else:
-            taxa_tree = Taxon.objects.tree(filter_ranks=DEFAULT_RANKS)
-        content = taxa_tree_to_xml(taxa_tree)
-        return HttpResponse(content, content_type="text/xml")
+            taxa_tree = cached_taxa_tree(filter_ranks=DEFAULT_RANKS)
+        return taxonomy_xml_response(request, taxa_tree, taxa_tree_to_xml)
 
 
 def get_labelstudio_config() -> LabelStudioConfig | None:
@@ -2,11 +2,11 @@ import collections
 import datetime
 
 from django.db.models import QuerySet
-from guardian.shortcuts import get_perms
 from rest_framework import serializers
 from rest_framework.request import Request
 
 from ami.base.fields import DateStringField
+from ami.base.models import get_project_perms
 from ami.base.permissions import add_m2m_object_permissions
 from ami.base.serializers import DefaultSerializer, MinimalNestedModelSerializer, reverse_with_params
 from ami.base.views import get_active_project
@@ -74,13 +74,15 @@ class UserNestedSerializer(DefaultSerializer):
 
 
 class SourceImageThumbnailSerializer(DefaultSerializer):
-    """Adds a ``thumbnails`` field via :meth:`SourceImage.thumbnail_urls`.
+    """Adds ``thumbnails`` and ``thumbnail_variants`` fields via :meth:`SourceImage.thumbnail_urls`
+    and :meth:`SourceImage.thumbnail_variant_urls`.
     Viewsets must apply :meth:`SourceImageQuerySet.with_thumbnails`.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["thumbnails"] = serializers.SerializerMethodField()
+        self.fields["thumbnail_variants"] = serializers.SerializerMethodField()
 
     def get_thumbnails(self, obj: SourceImage) -> dict[str, str] | None:
         # Draft projects aren't anonymously readable, so the <img>-loaded thumbnail
@@ -89,6 +91,25 @@ class SourceImageThumbnailSerializer(DefaultSerializer):
             return None
         return obj.thumbnail_urls(request=self.context.get("request"))
 
+    def get_thumbnail_variants(self, obj: SourceImage) -> dict[str, dict[str, str]] | None:
+        if obj.project is None or not obj.project.thumbnails_enabled:
+            return None
+        return obj.thumbnail_variant_urls()
+
+
+class DetectionImageSerializer(DefaultSerializer):
+    """Adds a ``url_variants`` field next to ``url`` (the JPEG) with the detection's cropped
+    image in other formats (see :meth:`Detection.variant_urls`), for ``<picture>`` sources.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if "url" in self.fields:
+            self.fields["url_variants"] = serializers.SerializerMethodField()
+
+    def get_url_variants(self, obj: Detection) -> dict[str, str]:
+        return obj.variant_urls()
+
 
 class SourceImageNestedSerializer(DefaultSerializer):
     event_id = serializers.PrimaryKeyRelatedField(source="event", read_only=True)
@@ -887,7 +908,7 @@ class BulkIdentificationResponseSerializer(serializers.Serializer):
     results = BulkIdentificationResultSerializer(many=True)
 
 
-class TaxonDetectionsSerializer(DefaultSerializer):
+class TaxonDetectionsSerializer(DetectionImageSerializer):
     class Meta:
         model = Detection
         # queryset = Detection.objects.prefetch_related("classifications")
@@ -1118,7 +1139,7 @@ class ClassificationNestedSerializer(ClassificationSerializer):
         ]
 
 
-class CaptureDetectionsSerializer(DefaultSerializer):
+class CaptureDetectionsSerializer(DetectionImageSerializer):
     occurrence = CaptureOccurrenceSerializer(read_only=True)
     classifications = serializers.SerializerMethodField()
 
@@ -1161,7 +1182,7 @@ class DetectionCaptureNestedSerializer(DefaultSerializer):
         ]
 
 
-class DetectionNestedSerializer(DefaultSerializer):
+class DetectionNestedSerializer(DetectionImageSerializer):
     classifications = ClassificationNestedSerializer(many=True, read_only=True)
     capture = DetectionCaptureNestedSerializer(read_only=True, source="source_image")
 
@@ -1182,7 +1203,7 @@ class DetectionNestedSerializer(DefaultSerializer):
         ]
 
 
-class DetectionListSerializer(DefaultSerializer):
+class DetectionListSerializer(DetectionImageSerializer):
     class Meta:
         model = Detection
         fields = [
@@ -1200,7 +1221,7 @@ class DetectionListSerializer(DefaultSerializer):
         ]
 
 
-class DetectionSerializer(DefaultSerializer):
+class DetectionSerializer(DetectionImageSerializer):
     detection_algorithm = AlgorithmSerializer(read_only=True)
     detection_algorithm_id = serializers.PrimaryKeyRelatedField(
         queryset=Algorithm.objects.all(), source="detection_algorithm", write_only=True
@@ -1362,6 +1383,8 @@ class SourceImageCollectionSerializer(DefaultSerializer):
     kwargs = SourceImageCollectionCommonKwargsSerializer(required=False, partial=True)
     jobs = JobStatusSerializer(many=True, read_only=True)
     project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all())
+    # Only present when the list is requested for a pipeline (?pipeline=<id>)
+    source_images_unprocessed_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = SourceImageCollection
@@ -1376,6 +1399,7 @@ class SourceImageCollectionSerializer(DefaultSerializer):
             "source_images_count",
             "source_images_with_detections_count",
             "source_images_processed_count",
+            "source_images_unprocessed_count",
             "occurrences_count",
             "taxa_count",
             "description",
@@ -1388,7 +1412,7 @@ class SourceImageCollectionSerializer(DefaultSerializer):
         request: Request = self.context["request"]
         user = request.user
         project = instance.get_project()
-        permissions = get_perms(user, project)
+        permissions = get_project_perms(user, project)
         source_image_collection_permissions = {
             perm.split("_")[0] for perm in permissions if perm.endswith("_sourceimagecollection")
         }
@@ -1451,6 +1475,8 @@ class OccurrenceListSerializer(DefaultSerializer):
     event = EventNestedSerializer(read_only=True)
     # first_appearance = TaxonSourceImageNestedSerializer(read_only=True)
     detection_images = serializers.SerializerMethodField()
+    # The same images in other formats than JPEG, e.g. [{"webp": url}], for <picture> sources
+    detection_image_variants = serializers.SerializerMethodField()
     determination_details = serializers.SerializerMethodField()
     best_machine_prediction = serializers.SerializerMethodField()
     identifications = OccurrenceIdentificationSerializer(many=True, read_only=True)
@@ -1460,7 +1486,7 @@ class OccurrenceListSerializer(DefaultSerializer):
         user = request.user
         project = instance.get_project()
         permissions = set()
-        if Project.Permissions.CREATE_IDENTIFICATION in get_perms(user, project):
+        if Project.Permissions.CREATE_IDENTIFICATION in get_project_perms(user, project):
             # check if the user has identification permissions on this project,
             # then add  update permission to response
             permissions.add("update")
@@ -1489,6 +1515,7 @@ class OccurrenceListSerializer(DefaultSerializer):
             "determination",
             "detections_count",
             "detection_images",
+            "detection_image_variants",
             "determination_score",
             "determination_details",
             "best_machine_prediction",
@@ -1502,6 +1529,11 @@ class OccurrenceListSerializer(DefaultSerializer):
 
         return detection_image_urls_from_prefetch(obj, limit=self.detection_images_limit)
 
+    def get_detection_image_variants(self, obj: Occurrence) -> list[dict[str, str]]:
+        from ami.main.models_future.occurrence import detection_image_variant_urls_from_prefetch
+
+        return detection_image_variant_urls_from_prefetch(obj, limit=self.detection_images_limit)
+
     def get_determination_details(self, obj: Occurrence):
         from ami.main.models_future.occurrence import best_identification_from_prefetch, best_prediction_from_prefetch
 
@@ -1,22 +1,22 @@
 import datetime
 import logging
-from statistics import mode
 
 from django.conf import settings
-from django.contrib.postgres.search import TrigramSimilarity
 from django.core import exceptions
-from django.core.files.storage import default_storage
 from django.db import models
 from django.db.models import OuterRef, Prefetch, Q, Subquery
 from django.db.models.query import QuerySet
 from django.forms import BooleanField, CharField, IntegerField
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiParameter, extend_schema
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import exceptions as api_exceptions
-from rest_framework import filters, serializers, status, viewsets
+from rest_framework import filters, permissions, renderers, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.filters import SearchFilter
@@ -28,7 +28,7 @@ from rest_framework.views import APIView
 from ami.base.filters import NullsLastOrderingFilter, ThresholdFilter
 from ami.base.metadata import ResponseSchemaMetadata
 from ami.base.models import BaseQuerySet
-from ami.base.pagination import LimitOffsetPaginationWithPermissions
+from ami.base.pagination import KeysetPaginationWithPermissions, LimitOffsetPaginationWithPermissions
 from ami.base.permissions import IsActiveStaffOrReadOnly, IsProjectMemberOrReadOnly, ObjectPermission
 from ami.base.serializers import FilterParamsSerializer, SingleParamSerializer
 from ami.base.views import ProjectMixin
@@ -36,8 +36,13 @@ from ami.main.api.schemas import limit_doc_param, project_id_doc_param
 from ami.main.api.serializers import TagSerializer
 from ami.main.models_future.identifications import create_identifications_batch, resolve_occurrences
 from ami.main.models_future.occurrence import model_agreement_for_project, top_identifiers_for_project
+from ami.main.models_future.summary import cached_project_summary_counts, project_summary_counts
+from ami.main.models_future.taxon_suggestions import suggest_taxa
 from ami.ml.models.algorithm import Algorithm
+from ami.ml.models.pipeline import Pipeline
+from ami.ml.orchestration.metrics import generate_metrics
 from ami.ml.serializers import AlgorithmSerializer
+from ami.utils.media import preferred_image_format
 from ami.utils.requests import get_default_classification_threshold
 from ami.utils.storages import ConnectionTestResult
 
@@ -60,9 +65,9 @@ from ..models import (
     Tag,
     TaxaList,
     Taxon,
+    TaxonClosure,
     TaxonRank,
     User,
-    update_detection_counts,
 )
 from .serializers import (
     BulkIdentificationRequestSerializer,
@@ -504,16 +509,14 @@ class EventViewSet(DefaultViewSet, ProjectMixin):
         )
         resolution = datetime.timedelta(minutes=resolution_minutes)
 
-        qs = SourceImage.objects.filter(event=event).with_was_processed()  # type: ignore
-
-        # Bulk update all source images where detections_count is null
-        update_detection_counts(qs=qs, null_only=True)
+        # Captures whose detections_count isn't cached yet are counted on the fly
+        qs = SourceImage.objects.filter(event=event).with_current_detections_count()  # type: ignore
 
         # Fetch aggregated data for efficiency
         aggregates = qs.aggregate(
-            min_detections=models.Min("detections_count"),
-            max_detections=models.Max("detections_count"),
-            total_detections=models.Sum("detections_count"),
+            min_detections=models.Min("current_detections_count"),
+            max_detections=models.Max("current_detections_count"),
+            total_detections=models.Sum("current_detections_count"),
             first_capture=models.Min("timestamp"),
             last_capture=models.Max("timestamp"),
         )
@@ -527,50 +530,31 @@ class EventViewSet(DefaultViewSet, ProjectMixin):
         if aggregates["last_capture"]:
             end_time = min(end_time, aggregates["last_capture"])
 
-        source_images = list(
-            qs.filter(timestamp__range=(start_time, end_time))
-            .order_by("timestamp")
-            .values("id", "timestamp", "detections_count", "was_processed")
-        )
+        # The captures are bucketed and summarized by the database, one row per interval with captures
+        intervals = qs.filter(timestamp__range=(start_time, end_time)).timeline_intervals(start_time, resolution)
 
         timeline = []
         current_time = start_time
-        image_index = 0
+        interval_index = 0
 
         while current_time <= end_time:
             interval_end = min(current_time + resolution, end_time)
-            interval_data = {
-                "start": current_time,
-                "end": interval_end,
-                "first_capture": None,
-                "top_capture": None,
-                "captures_count": 0,
-                "detections_count": 0,
-                "detection_counts": [],
-                "was_processed": False,
-            }
-
-            while image_index < len(source_images) and source_images[image_index]["timestamp"] <= interval_end:
-                image = source_images[image_index]
-                if interval_data["first_capture"] is None:
-                    interval_data["first_capture"] = SourceImage(pk=image["id"])
-                interval_data["captures_count"] += 1
-                interval_data["detections_count"] += image["detections_count"] or 0
-                interval_data["detection_counts"] += [image["detections_count"]]
-                if image["detections_count"] >= max(interval_data["detection_counts"]):
-                    interval_data["top_capture"] = SourceImage(pk=image["id"])
-                # Track if any image in this interval was processed
-                if image["was_processed"]:
-                    interval_data["was_processed"] = True
-                image_index += 1
-
-            # Set a meaningful average detection count to display for the interval
-            # Remove zero values and calculate the mode
-            interval_data["detection_counts"] = [x for x in interval_data["detection_counts"] if x > 0]
-            interval_data["detections_avg"] = mode(interval_data["detection_counts"] or [0])
-
-            timeline.append(interval_data)
+            interval = intervals.get(interval_index)
+            timeline.append(
+                {
+                    "start": current_time,
+                    "end": interval_end,
+                    "first_capture": SourceImage(pk=interval["first_capture_id"]) if interval else None,
+                    "top_capture": SourceImage(pk=interval["top_capture_id"]) if interval else None,
+                    "captures_count": interval["captures_count"] if interval else 0,
+                    "detections_count": interval["detections_count"] if interval else 0,
+                    # A meaningful average detection count to display: the mode of the non-zero counts
+                    "detections_avg": (interval["detections_avg"] or 0) if interval else 0,
+                    "was_processed": interval["was_processed"] if interval else False,
+                }
+            )
             current_time = interval_end
+            interval_index += 1
 
             if current_time >= end_time:
                 break
@@ -604,12 +588,16 @@ class SourceImageViewSet(DefaultViewSet, ProjectMixin):
     Standard list endpoint:
     GET /captures/?event=1&limit=10&offset=0&ordering=-timestamp
 
+    Keyset list endpoint, for paging deep into large projects (see KeysetPaginationWithPermissions):
+    GET /captures/?project_id=1&limit=100&ordering=-timestamp&cursor=
+
     Standard detail endpoint:
     GET /captures/1/
     """
 
     require_project_for_list = True  # Unfiltered list scans are too expensive on this table
     queryset = SourceImage.objects.all()
+    pagination_class = KeysetPaginationWithPermissions  # Opt in with ?cursor=
 
     serializer_class = SourceImageSerializer
     filterset_fields = [
@@ -915,17 +903,43 @@ class SourceImageThumbnailViewSet(DefaultReadOnlyViewSet, ProjectMixin):
                 detail=f"Invalid thumbnail size label provided: {label} not in {', '.join(_sizes.keys())}"
             )
         obj: SourceImage = self.get_object()
+        if not settings.THUMBNAILS_GENERATE_ON_REQUEST:
+            thumb = obj.thumbnails.filter(label=label).first()
+            if not obj.thumbnail_is_valid(size, thumb):
+                if obj.thumbnail_generation_failed():
+                    # Don't keep queueing a capture whose image can't be fetched or decoded
+                    raise api_exceptions.NotFound(detail="The thumbnail of this capture could not be generated.")
+                # Generating can take seconds per capture; never make the gallery wait.
+                obj.queue_thumbnail_generation()
+                return self.placeholder_response(obj, size)
         try:
             thumb = obj.find_or_generate_thumbnail_for_label(label)
         except exceptions.ObjectDoesNotExist as e:
             raise api_exceptions.NotFound(detail=f"{e}")
-        response = redirect(default_storage.url(thumb.path))
+        # <img> requests list the image formats the browser can display in Accept
+        response = redirect(thumb.url(preferred_image_format(request.headers.get("Accept"), thumb.variants)))
+        patch_vary_headers(response, ["Accept"])
         # Redirects aren't browser-cached by default. max-age stays well below the
         # presigned-URL lifetime (AWS_QUERYSTRING_EXPIRE default 3600s) so a cached
         # redirect never points at an expired signature.
         response["Cache-Control"] = "private, max-age=300"
         return response
 
+    def placeholder_response(self, obj: SourceImage, size: dict) -> HttpResponse:
+        """A blank image with the thumbnail's dimensions, served until it has been generated."""
+        width = size["width"]
+        height = size.get("height", None)
+        if not height:
+            height = round(width * obj.height / obj.width) if obj.width and obj.height else round(width * 3 / 4)
+        svg = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+            '<rect width="100%" height="100%" fill="#e0e0e0"/></svg>'
+        )
+        response = HttpResponse(svg, content_type="image/svg+xml")
+        # The next page view should get the real thumbnail once it exists
+        response["Cache-Control"] = "no-store"
+        return response
+
 
 class SourceImageCollectionViewSet(DefaultViewSet, ProjectMixin):
     """
@@ -983,6 +997,18 @@ class SourceImageCollectionViewSet(DefaultViewSet, ProjectMixin):
                 classification_threshold=classification_threshold, project=project, request=self.request
             )
 
+        if "pipeline" in self.request.query_params:
+            # How many images of each capture set the pipeline would process in a new job
+            pipeline_id = SingleParamSerializer[int].clean(
+                "pipeline",
+                field=serializers.IntegerField(required=True, min_value=0),
+                data=self.request.query_params,
+            )
+            pipeline = Pipeline.objects.filter(pk=pipeline_id).first()
+            if not pipeline:
+                raise api_exceptions.NotFound(detail=f"Pipeline with id {pipeline_id} not found")
+            query_set = query_set.with_source_images_unprocessed_count(pipeline)  # type: ignore
+
         return query_set
 
     @action(detail=True, methods=["post"], name="populate")
@@ -1130,6 +1156,7 @@ class DetectionViewSet(DefaultViewSet, ProjectMixin):
     require_project_for_list = True  # Unfiltered list scans are too expensive on this table
     queryset = Detection.objects.valid().select_related("source_image", "detection_algorithm")
     serializer_class = DetectionSerializer
+    pagination_class = KeysetPaginationWithPermissions  # Opt in with ?cursor=
     filterset_fields = ["source_image", "detection_algorithm", "source_image__project"]
     ordering_fields = ["created_at", "updated_at", "detection_score", "timestamp"]
 
@@ -1177,7 +1204,7 @@ class CustomTaxonFilter(filters.BaseFilterBackend):
         taxon = self.get_filter_taxon(request)
         if taxon:
             # Here the queryset is the Taxon queryset
-            return queryset.filter(models.Q(id=taxon.pk) | models.Q(parents_json__contains=[{"id": taxon.pk}]))
+            return queryset.filter(id__in=TaxonClosure.objects.descendant_ids([taxon]))
         else:
             # No taxon id in the query params
             return queryset
@@ -1196,11 +1223,8 @@ class CustomOccurrenceDeterminationFilter(CustomTaxonFilter):
         taxon = self.get_filter_taxon(request, query_params=self.query_params)
         if taxon:
             # Here the queryset is the Occurrence queryset.
-            # The literal parents_json containment (constant RHS) is what the GIN index from
-            # migration 0087 serves — this hierarchical taxon filter is the index's main consumer.
-            return queryset.filter(
-                models.Q(determination=taxon) | models.Q(determination__parents_json__contains=[{"id": taxon.pk}])
-            )
+            # A semi-join on the indexed closure table, however many taxa are below this one.
+            return queryset.filter(determination__in=TaxonClosure.objects.descendant_ids([taxon]))
         else:
             return queryset
 
@@ -1350,28 +1374,16 @@ class OccurrenceTaxaListFilter(filters.BaseFilterBackend):
             if taxa_list:
                 taxa = taxa_list.taxa.all()  # Get taxa list taxon objects
 
-                # Filter by the exact determination
-                query_filter = Q(determination__in=taxa)
-
-                # Filter by the taxon's children
-                for taxon in taxa:
-                    query_filter |= Q(determination__parents_json__contains=[{"id": taxon.pk}])
-
-                queryset = queryset.filter(query_filter)
+                # Filter by the taxa and their children
+                queryset = queryset.filter(determination__in=TaxonClosure.objects.descendant_ids(taxa))
 
         if taxalist_id_exclusive:
             taxa_list = TaxaList.objects.filter(id=taxalist_id_exclusive).first()
             if taxa_list:
                 taxa = taxa_list.taxa.all()  # Get taxa list taxon objects
 
-                # Filter by the exact determination
-                query_filter = Q(determination__in=taxa)
-
-                # Filter by the taxon's children
-                for taxon in taxa:
-                    query_filter |= Q(determination__parents_json__contains=[{"id": taxon.pk}])
-
-                queryset = queryset.exclude(query_filter)
+                # Exclude the taxa and their children
+                queryset = queryset.exclude(determination__in=TaxonClosure.objects.descendant_ids(taxa))
 
         return queryset
 
@@ -1401,6 +1413,7 @@ class OccurrenceViewSet(DefaultViewSet, ProjectMixin):
 
     require_project_for_list = True  # Unfiltered list scans are too expensive on this table
     queryset = Occurrence.objects.all()
+    pagination_class = KeysetPaginationWithPermissions  # Opt in with ?cursor=
 
     serializer_class = OccurrenceSerializer
     filter_backends = DefaultViewSetMixin.filter_backends + list(OCCURRENCE_FILTER_BACKENDS)
@@ -1652,14 +1665,12 @@ class TaxonTaxaListFilter(filters.BaseFilterBackend):
 
         def _get_filter(taxa_list: TaxaList) -> models.Q:
             taxa = taxa_list.taxa.all()  # Get taxa in the taxa list
-            query_filter = Q(id__in=taxa)
 
             # Only include descendants if explicitly requested
             if include_descendants:
-                for taxon in taxa:
-                    query_filter |= Q(parents_json__contains=[{"id": taxon.pk}])
+                return Q(id__in=TaxonClosure.objects.descendant_ids(taxa))
 
-            return query_filter
+            return Q(id__in=taxa)
 
         if taxalist_id:
             taxa_list = TaxaList.objects.filter(id=taxalist_id).first()
@@ -1746,6 +1757,8 @@ class TaxonViewSet(DefaultViewSet, ProjectMixin):
     def suggest(self, request):
         """
         Return a list of taxa that match the query.
+
+        Served from this process's suggestion index when it's current (see ``suggest_taxa``).
         """
         min_query_length = 2
         default_results_limit = 10
@@ -1755,28 +1768,7 @@ class TaxonViewSet(DefaultViewSet, ProjectMixin):
         )
 
         if query and len(query) >= min_query_length:
-            taxa = (
-                Taxon.objects.filter(active=True)
-                # .select_related("parent")
-                .filter(models.Q(name__icontains=query) | models.Q(search_names__icontains=query))
-                .annotate(
-                    # Calculate similarity for the name field
-                    name_similarity=TrigramSimilarity("name", query),
-                    # Cast array to string before similarity calculation
-                    search_names_similarity=TrigramSimilarity(
-                        models.functions.Cast("search_names", models.TextField()), query
-                    ),
-                    # Take the maximum similarity between name and search_names
-                    similarity=models.functions.Greatest(
-                        models.F("name_similarity"), models.F("search_names_similarity")
-                    ),
-                )
-                .order_by("-similarity")[:default_results_limit]
-                .defer(
-                    "notes",
-                    "parent__notes",
-                )[:limit]
-            )
+            taxa = suggest_taxa(query, min(limit, default_results_limit))
 
             return Response(TaxonSearchResultSerializer(taxa, many=True, context={"request": request}).data)
         else:
@@ -2163,32 +2155,21 @@ class SummaryView(GenericAPIView, ProjectMixin):
     def get(self, request):
         """
         Return counts of all models, applying visibility filters for draft projects.
+
+        The project's counts are cached until its data changes (see ``cached_project_summary_counts``).
         """
         user = request.user
         project = self.get_active_project()
+        if Project.objects.visible_for_user(user).filter(pk=project.pk).exists():  # type: ignore
+            counts = cached_project_summary_counts(project, request=self.request)
+        else:
+            # Counts of only the objects this user can see, which aren't cached
+            counts = project_summary_counts(project, request=self.request, user=user)
         data = {
             "projects_count": Project.objects.visible_for_user(  # type: ignore
                 user
             ).count(),  # @TODO filter by current user, here and everywhere!
-            "deployments_count": Deployment.objects.visible_for_user(user)  # type: ignore
-            .filter(project=project)
-            .count(),
-            "events_count": Event.objects.visible_for_user(user)  # type: ignore
-            .filter(deployment__project=project, deployment__isnull=False)
-            .count(),
-            "captures_count": SourceImage.objects.visible_for_user(user)  # type: ignore
-            .filter(deployment__project=project)
-            .count(),
-            # "detections_count": Detection.objects.filter(occurrence__project=project).count(),
-            "occurrences_count": Occurrence.objects.visible_for_user(user)  # type: ignore
-            .apply_default_filters(project=project, request=self.request)  # type: ignore
-            .valid()
-            .filter(project=project)
-            .count(),  # type: ignore
-            "taxa_count": Occurrence.objects.visible_for_user(user)  # type: ignore
-            .apply_default_filters(project=project, request=self.request)  # type: ignore
-            .unique_taxa(project=project)
-            .count(),
+            **counts,
         }
 
         aliases = {
@@ -2238,6 +2219,32 @@ class StorageStatus(APIView):
         return Response(data)
 
 
+class PrometheusTextRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "prometheus"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Error responses (e.g. 403) arrive as dicts rather than pre-rendered text.
+        return data if isinstance(data, bytes) else str(data).encode(self.charset)
+
+
+class MetricsView(APIView):
+    """
+    Pipeline throughput and queue depth in the Prometheus text exposition format.
+
+    Staff only. Point the scraper at this URL with a staff user's API token in an
+    ``Authorization: Token <key>`` header.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [PrometheusTextRenderer, renderers.JSONRenderer]
+
+    @extend_schema(responses={200: OpenApiTypes.STR})
+    def get(self, request):
+        return Response(generate_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
 class PageViewSet(DefaultViewSet):
     """
     API endpoint that allows pages to be viewed or edited.
@@ -16,6 +16,13 @@ const EXAMPLE_PLOTS = [
     type: 'scatter',
     showRangeSlider: true,
 }
+
+The project charts read the per-deployment rollups in ChartHourlyRollup and
+ChartDailyRollup (see refresh_chart_rollups) instead of aggregating captures,
+detections and occurrences on every request. Until all of a project's deployments
+have rollups (see chart_rollups_ready), its charts aggregate the raw tables as
+before. The session charts always query the raw tables, which are small for a
+single session.
 """
 
 import datetime
@@ -23,31 +30,104 @@ import itertools
 
 from django.apps import apps
 from django.db import models
+from django.db.models.functions import ExtractMonth, TruncDate, TruncHour
 from rest_framework.request import Request
 
-from ami.main.models_future.filters import build_occurrence_default_filters_q
+from ami.main.models_future.filters import build_occurrence_default_filters_q, build_taxa_recursive_filter_q
 from ami.utils.dates import shift_to_nighttime
+from ami.utils.requests import get_apply_default_filters_flag
+
+
+def use_rollups(project_pk: int) -> bool:
+    from ami.main.models import chart_rollups_ready
+
+    return chart_rollups_ready(project_pk)
+
+
+def hourly_rollups(project_pk: int) -> models.QuerySet:
+    ChartHourlyRollup = apps.get_model("main", "ChartHourlyRollup")
+    return ChartHourlyRollup.objects.filter(project_id=project_pk)
+
+
+def daily_rollups(project_pk: int) -> models.QuerySet:
+    ChartDailyRollup = apps.get_model("main", "ChartDailyRollup")
+    return ChartDailyRollup.objects.filter(project_id=project_pk)
+
+
+def rollup_default_filters_q(project_pk: int, request: Request | None = None, apply_default_taxa_filter=True):
+    """
+    The project's default filters (see build_occurrence_default_filters_q) for the rollup tables.
+
+    The rollups record whether each count passed the project's score threshold, and
+    the taxon it was determined as, so both filters apply to the counts as they are.
+    """
+    if get_apply_default_filters_flag(request) is False:
+        return models.Q()
+
+    filter_q = models.Q(above_score_threshold=True)
+    if apply_default_taxa_filter:
+        Project = apps.get_model("main", "Project")
+        project = Project.objects.get(pk=project_pk)
+        filter_q &= build_taxa_recursive_filter_q(
+            project.default_filters_include_taxa.all(),
+            project.default_filters_exclude_taxa.all(),
+            taxon_accessor="taxon",
+        )
+    return filter_q
+
+
+def filtered_daily_rollups(project_pk: int, taxon_pk: int | None = None, request: Request | None = None):
+    if taxon_pk:
+        # Only apply the score threshold filter for taxon details view
+        qs = daily_rollups(project_pk).filter(
+            rollup_default_filters_q(project_pk, request, apply_default_taxa_filter=False)
+        )
+        return qs.filter(taxon_id=taxon_pk)
+    # Apply default filters if taxon_pk is not provided
+    return daily_rollups(project_pk).filter(rollup_default_filters_q(project_pk, request))
+
+
+def filtered_occurrences(project_pk: int, taxon_pk: int | None = None, request: Request | None = None):
+    # The raw table counterpart of filtered_daily_rollups
+    Occurrence = apps.get_model("main", "Occurrence")
+    Project = apps.get_model("main", "Project")
+    project = Project.objects.get(pk=project_pk)
+    if taxon_pk:
+        qs = Occurrence.objects.filter_by_score_threshold(project=project, request=request).filter(project=project)
+        qs = qs.filter(determination_id=taxon_pk)
+    else:
+        qs = Occurrence.objects.apply_default_filters(project=project, request=request).filter(project=project)
+    return qs.exclude(event__start=None)
 
 
 def captures_per_hour(project_pk: int):
     # Average captures per hour across all days
-    SourceImage = apps.get_model("main", "SourceImage")
 
     # First get captures per hour per day
-    captures_by_day_hour = (
-        SourceImage.objects.filter(project=project_pk)
-        .exclude(timestamp=None)
-        .values("timestamp__date", "timestamp__hour")
-        .annotate(count=models.Count("pk"))
-        .order_by("timestamp__date", "timestamp__hour")
-    )
+    if use_rollups(project_pk):
+        captures_by_day_hour = (
+            hourly_rollups(project_pk)
+            .filter(captures_count__gt=0)
+            .values("hour")
+            .annotate(count=models.Sum("captures_count"))
+            .order_by("hour")
+        )
+    else:
+        SourceImage = apps.get_model("main", "SourceImage")
+        captures_by_day_hour = (
+            SourceImage.objects.filter(project=project_pk)
+            .exclude(timestamp=None)
+            .values(hour=TruncHour("timestamp"))
+            .annotate(count=models.Count("pk"))
+            .order_by("hour")
+        )
 
     # Calculate average per hour
     hour_totals = {}
     hour_counts = {}
 
     for entry in captures_by_day_hour:
-        hour = entry["timestamp__hour"]
+        hour = entry["hour"].hour
         count = entry["count"]
 
         if hour not in hour_totals:
@@ -83,14 +163,23 @@ def captures_per_hour(project_pk: int):
 
 def captures_per_day(project_pk: int):
     # Capture counts per day
-    SourceImage = apps.get_model("main", "SourceImage")
-    captures_per_date = list(
-        SourceImage.objects.filter(project=project_pk)
-        .values_list("timestamp__date")
-        .annotate(num_captures=models.Count("pk"))
-        .order_by("timestamp__date")
-        .distinct()
-    )
+    if use_rollups(project_pk):
+        captures_per_date = list(
+            hourly_rollups(project_pk)
+            .filter(captures_count__gt=0)
+            .values_list(TruncDate("hour"))
+            .annotate(num_captures=models.Sum("captures_count"))
+            .order_by(TruncDate("hour"))
+        )
+    else:
+        SourceImage = apps.get_model("main", "SourceImage")
+        captures_per_date = list(
+            SourceImage.objects.filter(project=project_pk)
+            .exclude(timestamp=None)
+            .values_list(TruncDate("timestamp"))
+            .annotate(num_captures=models.Count("pk"))
+            .order_by(TruncDate("timestamp"))
+        )
 
     if captures_per_date:
         days, counts = list(zip(*captures_per_date))
@@ -111,14 +200,23 @@ def captures_per_day(project_pk: int):
 
 def captures_per_month(project_pk: int):
     # Capture counts per month
-    SourceImage = apps.get_model("main", "SourceImage")
-    captures_per_month = list(
-        SourceImage.objects.filter(project=project_pk)
-        .values_list("timestamp__month")
-        .annotate(num_captures=models.Count("pk"))
-        .order_by("timestamp__month")
-        .exclude(timestamp=None)
-    )
+    if use_rollups(project_pk):
+        captures_per_month = list(
+            hourly_rollups(project_pk)
+            .filter(captures_count__gt=0)
+            .values_list(ExtractMonth("hour"))
+            .annotate(num_captures=models.Sum("captures_count"))
+            .order_by(ExtractMonth("hour"))
+        )
+    else:
+        SourceImage = apps.get_model("main", "SourceImage")
+        captures_per_month = list(
+            SourceImage.objects.filter(project=project_pk)
+            .exclude(timestamp=None)
+            .values_list(ExtractMonth("timestamp"))
+            .annotate(num_captures=models.Count("pk"))
+            .order_by(ExtractMonth("timestamp"))
+        )
 
     # Create a dictionary mapping month numbers to capture counts
     month_to_count = {month: count for month, count in captures_per_month}
@@ -195,31 +293,39 @@ def events_per_month(project_pk: int):
 
 def detections_per_hour(project_pk: int, request: Request | None = None):
     # Average detections per hour across all days
-    Detection = apps.get_model("main", "Detection")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-    # Apply default filters
-    filters_q = build_occurrence_default_filters_q(
-        project=project,
-        request=request,
-        occurrence_accessor="occurrence",
-    )
-    # Get detections per hour per day
-    detections_by_day_hour = (
-        Detection.objects.filter(filters_q)
-        .filter(occurrence__project=project)
-        .exclude(source_image__timestamp=None)
-        .values("source_image__timestamp__date", "source_image__timestamp__hour")
-        .annotate(count=models.Count("id"))
-        .order_by("source_image__timestamp__date", "source_image__timestamp__hour")
-    )
+    # Get detections per hour per day, with the default filters applied
+    if use_rollups(project_pk):
+        detections_by_day_hour = (
+            hourly_rollups(project_pk)
+            .filter(rollup_default_filters_q(project_pk, request), detections_count__gt=0)
+            .values("hour")
+            .annotate(count=models.Sum("detections_count"))
+            .order_by("hour")
+        )
+    else:
+        Detection = apps.get_model("main", "Detection")
+        Project = apps.get_model("main", "Project")
+        project = Project.objects.get(pk=project_pk)
+        filters_q = build_occurrence_default_filters_q(
+            project=project,
+            request=request,
+            occurrence_accessor="occurrence",
+        )
+        detections_by_day_hour = (
+            Detection.objects.filter(filters_q)
+            .filter(occurrence__project=project)
+            .exclude(source_image__timestamp=None)
+            .values(hour=TruncHour("source_image__timestamp"))
+            .annotate(count=models.Count("pk"))
+            .order_by("hour")
+        )
 
     # Calculate average per hour
     hour_totals = {}
     hour_counts = {}
 
     for entry in detections_by_day_hour:
-        hour = entry["source_image__timestamp__hour"]
+        hour = entry["hour"].hour
         count = entry["count"]
 
         if hour not in hour_totals:
@@ -257,23 +363,25 @@ def detections_per_hour(project_pk: int, request: Request | None = None):
 def occurrences_accumulated(project_pk: int, request: Request | None = None):
     # Line chart of the accumulated number of occurrences over time throughout the season
 
-    Occurrence = apps.get_model("main", "Occurrence")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
     # Apply default filters
-    filtered_occurrences = Occurrence.objects.apply_default_filters(project=project, request=request).filter(
-        project=project
-    )
-    occurrences_per_day = (
-        filtered_occurrences.values_list("event__start")
-        .exclude(event=None)
-        .exclude(event__start=None)
-        .exclude(detections=None)
-        .annotate(num_occurrences=models.Count("id"))
-        .order_by("event__start")
-    )
+    if use_rollups(project_pk):
+        occurrences_per_day = list(
+            daily_rollups(project_pk)
+            .filter(rollup_default_filters_q(project_pk, request), detected_occurrences_count__gt=0)
+            .values_list("date")
+            .annotate(num_occurrences=models.Sum("detected_occurrences_count"))
+            .order_by("date")
+        )
+    else:
+        occurrences_per_day = list(
+            filtered_occurrences(project_pk, request=request)
+            .exclude(detections=None)
+            .values_list(TruncDate("event__start"))
+            .annotate(num_occurrences=models.Count("pk"))
+            .order_by(TruncDate("event__start"))
+        )
 
-    if filtered_occurrences.exists():
+    if occurrences_per_day:
         days, counts = list(zip(*occurrences_per_day))
         # Accumulate the counts
         counts = list(itertools.accumulate(counts))
@@ -372,19 +480,28 @@ def event_top_taxa(event_pk: int, top_n: int = 10, request: Request | None = Non
 
 
 def project_top_taxa(project_pk: int, top_n: int = 10, request: Request | None = None):
-    Taxon = apps.get_model("main", "Taxon")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-    filter_q = build_occurrence_default_filters_q(project=project, request=request, occurrence_accessor="occurrences")
-
-    top_taxa = (
-        Taxon.objects.filter(occurrences__project=project)
-        .annotate(occurrence_count=models.Count("occurrences", filter=filter_q, distinct=True))
-        .order_by("-occurrence_count")[:top_n]
-    )
+    if use_rollups(project_pk):
+        filter_q = rollup_default_filters_q(project_pk, request)
+        top_taxa = (
+            daily_rollups(project_pk)
+            .filter(taxon__isnull=False)
+            .values("taxon_id", taxon_name=models.F("taxon__name"))
+            .annotate(occurrence_count=models.Sum("occurrences_count", filter=filter_q))
+        )
+    else:
+        Occurrence = apps.get_model("main", "Occurrence")
+        Project = apps.get_model("main", "Project")
+        project = Project.objects.get(pk=project_pk)
+        filter_q = build_occurrence_default_filters_q(project=project, request=request)
+        top_taxa = (
+            Occurrence.objects.filter(project=project, determination__isnull=False)
+            .values("determination_id", taxon_name=models.F("determination__name"))
+            .annotate(occurrence_count=models.Count("pk", filter=filter_q))
+        )
+    top_taxa = list(top_taxa.order_by(models.F("occurrence_count").desc(nulls_last=True))[:top_n])
 
     if top_taxa:
-        taxa, counts = list(zip(*[(t.name, t.occurrence_count) for t in reversed(top_taxa)]))
+        taxa, counts = list(zip(*[(t["taxon_name"], t["occurrence_count"] or 0) for t in reversed(top_taxa)]))
     else:
         taxa, counts = [], []
 
@@ -398,19 +515,21 @@ def project_top_taxa(project_pk: int, top_n: int = 10, request: Request | None =
 
 def unique_species_per_month(project_pk: int, request: Request | None = None):
     # Unique species per month
-    Occurrence = apps.get_model("main", "Occurrence")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-
-    filtered_occurrences = Occurrence.objects.apply_default_filters(project=project, request=request).filter(
-        project=project
-    )
-
-    unique_species_per_month = (
-        filtered_occurrences.values_list("event__start__month")
-        .annotate(num_species=models.Count("determination_id", distinct=True))
-        .order_by("event__start__month")
-    )
+    if use_rollups(project_pk):
+        unique_species_per_month = (
+            daily_rollups(project_pk)
+            .filter(rollup_default_filters_q(project_pk, request), occurrences_count__gt=0)
+            .values_list(ExtractMonth("date"))
+            .annotate(num_species=models.Count("taxon_id", distinct=True))
+            .order_by(ExtractMonth("date"))
+        )
+    else:
+        unique_species_per_month = (
+            filtered_occurrences(project_pk, request=request)
+            .values_list(ExtractMonth("event__start"))
+            .annotate(num_species=models.Count("determination_id", distinct=True))
+            .order_by(ExtractMonth("event__start"))
+        )
 
     # Create a dictionary mapping month numbers to species counts
     month_to_count = {month: count for month, count in unique_species_per_month}
@@ -434,23 +553,21 @@ def unique_species_per_month(project_pk: int, request: Request | None = None):
 
 def average_occurrences_per_month(project_pk: int, taxon_pk: int | None = None, request=None):
     # Average occurrences per month
-    Occurrence = apps.get_model("main", "Occurrence")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-
-    if taxon_pk:
-        # Only apply the score threshold filter for taxon details view
-        qs = Occurrence.objects.filter_by_score_threshold(project=project, request=request).filter(project=project)
-        qs = qs.filter(determination_id=taxon_pk)
+    if use_rollups(project_pk):
+        occurrences_per_month = (
+            filtered_daily_rollups(project_pk, taxon_pk, request)
+            .filter(occurrences_count__gt=0)
+            .values_list(ExtractMonth("date"))
+            .annotate(num_occurrences=models.Sum("occurrences_count"))
+            .order_by(ExtractMonth("date"))
+        )
     else:
-        # Apply default filters if taxon_pk is not provided
-        qs = Occurrence.objects.apply_default_filters(project=project, request=request).filter(project=project)
-
-    occurrences_per_month = (
-        qs.values_list("event__start__month")
-        .annotate(num_occurrences=models.Count("id"))
-        .order_by("event__start__month")
-    )
+        occurrences_per_month = (
+            filtered_occurrences(project_pk, taxon_pk, request)
+            .values_list(ExtractMonth("event__start"))
+            .annotate(num_occurrences=models.Count("pk"))
+            .order_by(ExtractMonth("event__start"))
+        )
 
     # Create a dictionary mapping month numbers to occurrence counts
     month_to_count = {month: count for month, count in occurrences_per_month}
@@ -474,23 +591,21 @@ def average_occurrences_per_month(project_pk: int, taxon_pk: int | None = None,
 
 def average_occurrences_per_day(project_pk: int, taxon_pk: int | None = None, request=None):
     # Average occurrences per day
-    Occurrence = apps.get_model("main", "Occurrence")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-
-    if taxon_pk:
-        # Only apply the score threshold filter for taxon details view
-        qs = Occurrence.objects.filter_by_score_threshold(project=project, request=request).filter(project=project)
-        qs = qs.filter(determination_id=taxon_pk)
+    if use_rollups(project_pk):
+        occurrences_per_day = (
+            filtered_daily_rollups(project_pk, taxon_pk, request)
+            .filter(occurrences_count__gt=0)
+            .values_list("date")
+            .annotate(num_occurrences=models.Sum("occurrences_count"))
+            .order_by("date")
+        )
     else:
-        # Apply default filters if taxon_pk is not provided
-        qs = Occurrence.objects.apply_default_filters(project=project, request=request).filter(project=project)
-
-    occurrences_per_day = (
-        qs.values_list("event__start__date")
-        .annotate(num_occurrences=models.Count("id"))
-        .order_by("event__start__date")
-    )
+        occurrences_per_day = (
+            filtered_occurrences(project_pk, taxon_pk, request)
+            .values_list(TruncDate("event__start"))
+            .annotate(num_occurrences=models.Count("pk"))
+            .order_by(TruncDate("event__start"))
+        )
 
     if occurrences_per_day:
         occurrences_per_day_dict = {f"{d:%b %d}": count for d, count in occurrences_per_day if d is not None}
@@ -522,26 +637,31 @@ def average_occurrences_per_day(project_pk: int, taxon_pk: int | None = None, re
 
 
 def relative_occurrences_per_month(project_pk: int, taxon_pk: int, request=None):
-    Occurrence = apps.get_model("main", "Occurrence")
-    Project = apps.get_model("main", "Project")
-    project = Project.objects.get(pk=project_pk)
-    # Apply default filters
-    filtered_occurrences = Occurrence.objects.apply_default_filters(project=project, request=request).filter(
-        project=project
-    )
-    # Single query to get total occurrences and taxon-specific occurrences per month
-    occurrences_per_month = (
-        filtered_occurrences.values("event__start__month")
-        .annotate(
-            total_occurrences=models.Count("id"),
-            taxon_occurrences=models.Count("id", filter=models.Q(determination_id=taxon_pk)),
+    # Single query to get total occurrences and taxon-specific occurrences per month, with the default filters
+    if use_rollups(project_pk):
+        occurrences_per_month = (
+            filtered_daily_rollups(project_pk, request=request)
+            .values(month=ExtractMonth("date"))
+            .annotate(
+                total_occurrences=models.Sum("occurrences_count"),
+                taxon_occurrences=models.Sum("occurrences_count", filter=models.Q(taxon_id=taxon_pk), default=0),
+            )
+            .order_by("month")
+        )
+    else:
+        occurrences_per_month = (
+            filtered_occurrences(project_pk, request=request)
+            .values(month=ExtractMonth("event__start"))
+            .annotate(
+                total_occurrences=models.Count("pk"),
+                taxon_occurrences=models.Count("pk", filter=models.Q(determination_id=taxon_pk)),
+            )
+            .order_by("month")
         )
-        .order_by("event__start__month")
-    )
 
     # Create a dictionary mapping month numbers to occurrence counts
     month_data = {
-        month["event__start__month"]: {
+        month["month"]: {
             "total": month["total_occurrences"],
             "taxon": month["taxon_occurrences"],
         }
@@ -0,0 +1,136 @@
+"""
+Management command to compare image formats for capture thumbnails and detection crops.
+
+Thumbnails and crops are saved as JPEG, plus a variant in each of
+settings.IMAGE_VARIANT_FORMATS that browsers get when their Accept header lists it.
+This measures, for JPEG and each variant format, how long encoding takes and how
+large the files are. It reads a sample of a project's captures and their detections
+and writes nothing; without --project it uses synthetic captures.
+
+Usage:
+    python manage.py benchmark_image_formats [--project ID] [--images N] [--formats FORMAT ...]
+
+Examples:
+    python manage.py benchmark_image_formats --project 18 --images 20
+    python manage.py benchmark_image_formats --formats webp avif
+"""
+
+import collections
+import io
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from tqdm import tqdm
+
+from ami.main.models import Detection, SourceImage
+from ami.ml.media import crop_detection, encode_crop
+from ami.utils.media import IMAGE_VARIANT_MIME_TYPES, encode_image_variants, encode_thumbnail, fetch_image_content
+
+Sample = tuple[bytes, list[tuple[int, int, int, int]]]
+
+
+class Command(BaseCommand):
+    help = "Measure the encoding time and size of thumbnails and detection crops in each image format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", type=int, help="Sample the most recent captures of this project")
+        parser.add_argument("--images", type=int, default=10, help="Number of captures to sample")
+        parser.add_argument(
+            "--formats",
+            nargs="+",
+            choices=list(IMAGE_VARIANT_MIME_TYPES),
+            help="Formats to compare with JPEG (default: settings.IMAGE_VARIANT_FORMATS)",
+        )
+
+    def handle(self, *args, **options):
+        formats = options["formats"] or settings.IMAGE_VARIANT_FORMATS
+        Image.init()
+        missing = [image_format for image_format in formats if image_format.upper() not in Image.SAVE]
+        if missing:
+            raise CommandError(f"The installed Pillow can't encode: {', '.join(missing)}")
+
+        if options["project"]:
+            samples = self._project_samples(options["project"], options["images"])
+        else:
+            samples = self._synthetic_samples(options["images"])
+        if not samples:
+            raise CommandError("No captures to sample")
+
+        # {(kind, format): [seconds, bytes, count]}
+        totals: dict[tuple[str, str], list[float]] = collections.defaultdict(lambda: [0.0, 0, 0])
+
+        def measure(kind: str, img: Image.Image):
+            start = time.perf_counter()
+            content = encode_thumbnail(img) if kind != "crops" else encode_crop(img)
+            self._add(totals[(kind, "jpeg")], time.perf_counter() - start, len(content))
+            for image_format in formats:
+                start = time.perf_counter()
+                content = encode_image_variants(img, [image_format])[image_format]
+                self._add(totals[(kind, image_format)], time.perf_counter() - start, len(content))
+
+        for image_content, bboxes in tqdm(samples, desc="Encoding", unit="img"):
+            img = Image.open(io.BytesIO(image_content))
+            img.load()
+            for label, size in sorted(settings.THUMBNAILS["SIZES"].items(), key=lambda item: -item[1]["width"]):
+                thumbnail = img.copy()
+                thumbnail.thumbnail((size["width"], size.get("height") or img.height))
+                measure(label, thumbnail)
+            pixels = np.array(img)
+            for bbox in bboxes:
+                try:
+                    measure("crops", crop_detection(pixels, bbox))
+                except ValueError:
+                    continue
+
+        self._report(totals, formats)
+
+    def _add(self, total: list[float], seconds: float, size: int):
+        total[0] += seconds
+        total[1] += size
+        total[2] += 1
+
+    def _project_samples(self, project_id: int, image_count: int) -> list[Sample]:
+        captures = list(
+            SourceImage.objects.filter(project_id=project_id)
+            .select_related("deployment__data_source")
+            .order_by("-pk")[:image_count]
+        )
+        bboxes = collections.defaultdict(list)
+        for source_image_id, bbox in Detection.objects.filter(
+            source_image__in=captures, bbox__isnull=False
+        ).values_list("source_image_id", "bbox"):
+            bboxes[source_image_id].append(tuple(int(value) for value in bbox))
+        samples = []
+        for capture in tqdm(captures, desc="Fetching", unit="img"):
+            try:
+                samples.append((fetch_image_content(capture.public_url(raise_errors=True)), bboxes[capture.pk]))
+            except Exception as e:
+                self.stderr.write(f"Could not fetch capture #{capture.pk}: {e}")
+        return samples
+
+    def _synthetic_samples(self, image_count: int) -> list[Sample]:
+        from ami.tests.fixtures.images import generate_moth_series
+
+        self.stdout.write(f"Generating {image_count} synthetic 4096x2160 captures")
+        samples = []
+        for frame in generate_moth_series(num_frames=image_count, width=4096, height=2160, save_images=False):
+            buffer = io.BytesIO()
+            frame.image.save(buffer, format="JPEG", quality=90)
+            bboxes = [tuple(int(value) for value in box.bbox) for box in frame.bounding_boxes]
+            samples.append((buffer.getvalue(), bboxes))
+        return samples
+
+    def _report(self, totals: dict[tuple[str, str], list[float]], formats: list[str]):
+        kinds = list(dict.fromkeys(kind for kind, _ in totals))
+        self.stdout.write(f"{'':10} {'format':6} {'images':>7} {'ms/image':>9} {'KiB/image':>10} {'vs JPEG':>8}")
+        for kind in kinds:
+            _, jpeg_bytes, _ = totals[(kind, "jpeg")]
+            for image_format in ["jpeg", *formats]:
+                seconds, size, count = totals[(kind, image_format)]
+                self.stdout.write(
+                    f"{kind:10} {image_format:6} {count:7d} {seconds / count * 1000:9.1f} "
+                    f"{size / count / 1024:10.1f} {size / jpeg_bytes:8.0%}"
+                )
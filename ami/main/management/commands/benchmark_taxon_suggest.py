@@ -0,0 +1,102 @@
+"""
+Management command to measure the latency of taxon suggestions (the name autocomplete).
+
+Builds the suggestion index that the suggest endpoint serves from, then times queries
+like those of identifiers typing names: the first few letters of a name, or of one
+of its words. Without --sql, the index is built from a synthetic checklist of binomial
+names and common names, and nothing is read from the database. With --sql, it's built
+from the active taxa in the database, and each query is also timed in SQL, as it runs
+without the index.
+
+Usage:
+    python manage.py benchmark_taxon_suggest [--names N] [--queries N] [--sql]
+
+Examples:
+    python manage.py benchmark_taxon_suggest --names 200000
+    python manage.py benchmark_taxon_suggest --sql --queries 100
+"""
+
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ami.main.models import Taxon
+from ami.main.models_future.taxon_suggestions import TaxonSuggestionIndex, suggest_taxa_sql
+
+# About as many distinct trigrams as a real checklist of this size
+SYLLABLES = [consonant + vowel for consonant in "bcdfghlmnprstvxz" for vowel in "aeiouy"]
+SYLLABLES += ["ph", "th", "ch", "rh", "ps", "us", "is", "um", "ae", "ia"]
+COMMON_WORDS = ["moth", "hawk", "tiger", "lady", "white", "brown", "grey", "dart", "pug", "carpet", "emerald"]
+
+
+class Command(BaseCommand):
+    help = "Measure the latency of taxon name suggestions from the in-memory index (and SQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--names", type=int, default=200000, help="Number of synthetic taxa to index")
+        parser.add_argument("--queries", type=int, default=1000, help="Number of queries to time")
+        parser.add_argument("--limit", type=int, default=10, help="Number of suggestions per query")
+        parser.add_argument("--sql", action="store_true", help="Index the database's taxa and time SQL too")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic names and queries")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["sql"]:
+            taxa = list(Taxon.objects.filter(active=True).values_list("id", "name", "search_names"))
+        else:
+            taxa = self._synthetic_taxa(options["names"], rng)
+        if not taxa:
+            raise CommandError("No taxa to index")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        index = TaxonSuggestionIndex(taxa)
+        build_seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"Indexed {len(taxa)} taxa ({len(index)} names, {len(index.postings)} trigrams) "
+            f"in {build_seconds:.2f}s, peak {peak / 1024 / 1024:.0f} MiB"
+        )
+
+        queries = [self._query(taxa, rng) for _ in range(options["queries"])]
+        self._report("index", [self._time(lambda: index.search(query, options["limit"])) for query in queries])
+        if options["sql"]:
+            limit = options["limit"]
+            self._report("sql", [self._time(lambda: list(suggest_taxa_sql(query, limit))) for query in queries])
+
+    def _synthetic_taxa(self, count: int, rng: random.Random) -> list[tuple[int, str, list[str] | None]]:
+        def word(syllables: int) -> str:
+            return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+        genera = [word(rng.randint(2, 4)).capitalize() for _ in range(max(count // 20, 1))]
+        taxa = []
+        for taxon_id in range(1, count + 1):
+            name = f"{rng.choice(genera)} {word(rng.randint(2, 5))}"
+            search_names = None
+            if rng.random() < 0.3:
+                search_names = [f"{word(2).capitalize()} {rng.choice(COMMON_WORDS)}"]
+            taxa.append((taxon_id, name, search_names))
+        return taxa
+
+    def _query(self, taxa: list[tuple[int, str, list[str] | None]], rng: random.Random) -> str:
+        """The first 2-8 letters of a random taxon's name, or of one of its words."""
+        _, name, _ = rng.choice(taxa)
+        words = name.split()
+        text = name if rng.random() < 0.5 else rng.choice(words)
+        return text[: rng.randint(2, 8)]
+
+    def _time(self, search) -> float:
+        start = time.perf_counter()
+        search()
+        return (time.perf_counter() - start) * 1000
+
+    def _report(self, label: str, milliseconds: list[float]):
+        percentiles = statistics.quantiles(milliseconds, n=100)
+        self.stdout.write(
+            f"{label:6} {len(milliseconds)} queries: mean {statistics.mean(milliseconds):.2f} ms, "
+            f"p50 {percentiles[49]:.2f} ms, p95 {percentiles[94]:.2f} ms, p99 {percentiles[98]:.2f} ms"
+        )
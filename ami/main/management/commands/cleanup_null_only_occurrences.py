@@ -19,6 +19,7 @@ from django.db import transaction
 from django.db.models import Exists, OuterRef
 
 from ami.main.models import Detection, Occurrence, Project
+from ami.ml.models import ProcessedImage
 
 
 class Command(BaseCommand):
@@ -83,6 +84,8 @@ class Command(BaseCommand):
             return
 
         with transaction.atomic():
+            # The processed-image index would keep skipping the images that lose their markers
+            ProcessedImage.objects.filter(source_image__in=dangling_null_markers.values("source_image_id")).delete()
             dangling_null_markers.delete()
             phantom_occs.delete()
 
@@ -296,7 +296,9 @@ class Command(BaseCommand):
 
         logger.info("Updating cached values for all new or updated taxa")
         for taxon in tqdm(taxa_to_refresh):
-            taxon.save(update_calculated_fields=True)
+            taxon.update_calculated_fields(save=True, update_parents=False)
+        # The parents of the changed taxa and everything below them, all at once
+        Taxon.objects.update_subtree_parents(taxa_to_refresh)
 
     def create_taxon(self, taxon_data: dict, root_taxon_parent: Taxon) -> tuple[set[Taxon], set[Taxon], Taxon]:
         taxa_in_row = []
@@ -0,0 +1,42 @@
+"""
+Management command to rebuild the rollups that the project charts read.
+
+Deployments rebuild their rollups after their captures sync, results are saved or
+determinations change, and the periodic backfill_chart_rollups task queues them for
+deployments that have none yet (see refresh_chart_rollups in ami/main/models.py).
+Until then, the project's charts aggregate the raw tables. This command builds them
+right away, e.g. right after migrating.
+
+Usage:
+    python manage.py refresh_chart_rollups [--project ID] [--missing]
+
+Examples:
+    python manage.py refresh_chart_rollups --missing
+    python manage.py refresh_chart_rollups --project 18
+"""
+
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from ami.main.models import Deployment, refresh_chart_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-deployment rollups of captures, detections and occurrences read by the charts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", type=int, help="Only rebuild the rollups of this project's deployments")
+        parser.add_argument(
+            "--missing", action="store_true", help="Only build the rollups of deployments that have none"
+        )
+
+    def handle(self, *args, **options):
+        deployments = Deployment.objects.filter(project__isnull=False).order_by("pk")
+        if options["project"]:
+            deployments = deployments.filter(project_id=options["project"])
+        if options["missing"]:
+            deployments = deployments.filter(chart_rollups_updated_at__isnull=True)
+
+        for deployment in tqdm(deployments, desc="Rebuilding chart rollups", unit="deployment"):
+            refresh_chart_rollups(deployment)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the chart rollups of {deployments.count()} deployments"))
@@ -14,6 +14,9 @@ from ami.main.models import TaxaList, Taxon
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Fields that are copied into the parents_json of the taxa below a taxon
+HIERARCHY_FIELDS = {"name", "rank", "parent", "parent_id"}
+
 
 def read_csv(fname: str) -> list[dict[str, Any]]:
     with open(fname) as f:
@@ -149,6 +152,8 @@ class Command(BaseCommand):
         not_found = []
         # Track field update statistics
         field_update_stats = {}
+        # Taxa whose changes show in the parents_json of the taxa below them
+        taxa_to_reparent: list[Taxon] = []
 
         for i, taxon_data in enumerate(tqdm(incoming_taxa)):
             num_keys_with_values = len([key for key, value in taxon_data.items() if value])
@@ -215,7 +220,10 @@ class Command(BaseCommand):
             if update_fields:
                 if not dry_run:
                     taxon.updated_at = timezone.now()
-                    taxon.save(update_fields=update_fields + ["updated_at"])
+                    taxon.save(update_fields=update_fields + ["updated_at"], update_calculated_fields=False)
+                    taxon.update_calculated_fields(save=True, update_parents=False)
+                    if HIERARCHY_FIELDS.intersection(update_fields):
+                        taxa_to_reparent.append(taxon)
                     # Add to the specified taxa list if provided
                     if taxalist:
                         taxalist.taxa.add(taxon)
@@ -227,6 +235,10 @@ class Command(BaseCommand):
             else:
                 logger.debug(f"Row {i}: No fields to update for {taxon}")
 
+        if taxa_to_reparent:
+            self.stdout.write(f"Updating the cached parents below {len(taxa_to_reparent)} taxa")
+            Taxon.objects.update_subtree_parents(taxa_to_reparent)
+
         # Summary output
         self.stdout.write(self.style.SUCCESS(f"Found {total_found} taxa"))
         if dry_run:
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0095_grant_sync_deployment_to_mldatamanager"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="detection",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                help_text='Paths of the cropped detection image in other formats, e.g. {"webp": "detections/.../x.webp"}',
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sourceimagethumbnail",
+            name="variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0096_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deployment",
+            name="chart_rollups_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="ChartHourlyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("above_score_threshold", models.BooleanField(default=False)),
+                ("hour", models.DateTimeField()),
+                ("captures_count", models.IntegerField(default=0)),
+                ("detections_count", models.IntegerField(default=0)),
+                (
+                    "deployment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.deployment"
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.project"
+                    ),
+                ),
+                (
+                    "taxon",
+                    models.ForeignKey(
+                        null=True, on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.taxon"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["project", "hour"], name="main_charth_project_7a92d0_idx"),
+                    models.Index(fields=["deployment"], name="main_charth_deploym_587cab_idx"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ChartDailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("above_score_threshold", models.BooleanField(default=False)),
+                ("date", models.DateField()),
+                ("occurrences_count", models.IntegerField(default=0)),
+                ("detected_occurrences_count", models.IntegerField(default=0)),
+                (
+                    "deployment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.deployment"
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.project"
+                    ),
+                ),
+                (
+                    "taxon",
+                    models.ForeignKey(
+                        null=True, on_delete=django.db.models.deletion.CASCADE, related_name="+", to="main.taxon"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["project", "date"], name="main_chartd_project_0bc754_idx"),
+                    models.Index(fields=["deployment"], name="main_chartd_deploym_14fcf9_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.10 on 2026-10-19 10:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_taxon_closure(apps, schema_editor):
+    """Link every taxon to itself and to each of its ancestors, like ``rebuild_taxon_closure``."""
+    Taxon = apps.get_model("main", "Taxon")
+    TaxonClosure = apps.get_model("main", "TaxonClosure")
+
+    parents = dict(Taxon.objects.values_list("id", "parent_id"))
+    links = []
+    for taxon_id in parents:
+        ancestor_id, depth, seen = taxon_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(TaxonClosure(ancestor_id=ancestor_id, descendant_id=taxon_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    TaxonClosure.objects.bulk_create(links, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0097_chart_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaxonClosure",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("depth", models.PositiveSmallIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="main.taxon",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="main.taxon",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["descendant", "ancestor"], name="main_taxonc_descend_995735_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="taxonclosure",
+            constraint=models.UniqueConstraint(fields=("ancestor", "descendant"), name="unique_taxon_closure_pair"),
+        ),
+        migrations.RunPython(build_taxon_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_periodic_tasks(apps, schema_editor):
+    CrontabSchedule = apps.get_model("django_celery_beat", "CrontabSchedule")
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+
+    schedule, _ = CrontabSchedule.objects.get_or_create(
+        minute="15",
+        hour="*",
+        day_of_week="*",
+        day_of_month="*",
+        month_of_year="*",
+    )
+    PeriodicTask.objects.get_or_create(
+        name="main.backfill_chart_rollups",
+        defaults={
+            "task": "ami.tasks.backfill_chart_rollups",
+            "crontab": schedule,
+            "description": "Queue building the chart rollups of deployments that have never had them.",
+        },
+    )
+
+
+def delete_periodic_tasks(apps, schema_editor):
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    PeriodicTask.objects.filter(name="main.backfill_chart_rollups").delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0098_taxon_closure"),
+        ("django_celery_beat", "0018_improve_crontab_helptext"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_periodic_tasks, delete_periodic_tasks),
+    ]
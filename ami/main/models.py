@@ -1,4 +1,5 @@
 import collections
+import concurrent.futures
 import contextlib
 import datetime
 import functools
@@ -16,25 +17,26 @@ import pydantic
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, AnonymousUser
+from django.contrib.postgres.aggregates import BoolOr, JSONBAgg
+from django.contrib.postgres.aggregates.mixins import OrderableAggMixin
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.db import IntegrityError, models, transaction
 from django.db.models import Exists, OuterRef, Q
 from django.db.models.fields.files import ImageFieldFile
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Cast, Ceil, Coalesce, Extract, Greatest, JSONObject
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
 from django.template.defaultfilters import filesizeformat
 from django.utils import timezone
 from django_pydantic_field import SchemaField
-from guardian.shortcuts import get_perms
 from rest_framework.request import Request
 
 import ami.tasks
 import ami.utils
 from ami.base.fields import DateStringField
-from ami.base.models import BaseModel, BaseQuerySet
+from ami.base.models import BaseModel, BaseQuerySet, get_project_perms
 from ami.main import charts
 from ami.main.models_future.filters import (
     build_occurrence_default_filters_q,
@@ -44,7 +46,14 @@ from ami.main.models_future.filters import (
 from ami.main.models_future.projects import ProjectSettingsMixin
 from ami.ml.schemas import BoundingBox
 from ami.users.models import User
-from ami.utils.media import calculate_file_checksum, extract_timestamp, fetch_image_content
+from ami.utils.media import (
+    Thumbnail,
+    calculate_file_checksum,
+    extract_timestamp,
+    fetch_image_content,
+    image_variant_formats,
+    make_thumbnails,
+)
 from ami.utils.requests import get_apply_default_filters_flag, get_default_classification_threshold
 from ami.utils.schemas import OrderedEnum
 
@@ -591,6 +600,43 @@ class Project(ProjectSettingsMixin, BaseModel):
         ]
 
 
+def get_project_data_version(project_id: int) -> int:
+    """
+    The version of a project's data, which cached statistics of the project are keyed by.
+
+    A version missing from the cache starts from the current time, so entries cached
+    under a version that was evicted are never served again.
+    """
+    from django.core.cache import cache
+
+    key = f"projects:data_version:{project_id}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+def bump_project_data_version(project_ids: typing.Iterable[int | None]) -> None:
+    """
+    Invalidate the cached statistics of each project, once the current transaction commits.
+
+    Bumping after the commit keeps a concurrent request from caching statistics of the
+    old data under the new version.
+    """
+    from django.core.cache import cache
+
+    def bump(project_id: int):
+        key = f"projects:data_version:{project_id}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    for project_id in {project_id for project_id in project_ids if project_id}:
+        transaction.on_commit(functools.partial(bump, project_id))
+
+
 class UserProjectMembership(BaseModel):
     """
     Through model connecting User <-> Project.
@@ -799,6 +845,8 @@ class Deployment(BaseModel):
     taxa_count = models.IntegerField(blank=True, null=True)
     first_capture_timestamp = models.DateTimeField(blank=True, null=True)
     last_capture_timestamp = models.DateTimeField(blank=True, null=True)
+    # When the deployment's chart rollups were last rebuilt (see refresh_chart_rollups)
+    chart_rollups_updated_at = models.DateTimeField(blank=True, null=True)
 
     research_site = models.ForeignKey(
         Site,
@@ -977,6 +1025,10 @@ class Deployment(BaseModel):
 
         _compare_totals_for_sync(deployment, total_files)
 
+        if total_files and self.project and self.project.thumbnails_enabled:
+            # Pre-generate thumbnails so capture galleries don't wait for them
+            transaction.on_commit(lambda: ami.tasks.generate_thumbnails.delay(deployment_id=self.pk))
+
         # @TODO decide if we should delete SourceImages that are no longer in the data source
 
         if regroup_after:
@@ -1128,6 +1180,11 @@ class Deployment(BaseModel):
 
         self.first_capture_timestamp, self.last_capture_timestamp = self.get_first_and_last_timestamps()
 
+        if self.pk:
+            # This runs after captures sync and after results are saved
+            queue_chart_rollup_refresh([self.pk])
+            bump_project_data_version([self.project_id])
+
         if save:
             self.save(update_calculated_fields=False)
 
@@ -1147,6 +1204,197 @@ class Deployment(BaseModel):
                 # ami.tasks.model_task.delay("Project", self.project.pk, "update_children_project")
 
 
+# A deployment's chart rollups are rebuilt at most once per this many seconds after
+# its captures, results or determinations change.
+CHART_ROLLUP_QUEUE_TIMEOUT = 60
+
+
+class ChartHourlyRollup(models.Model):
+    """
+    Captures and detections per hour of capture time, for the charts in ``ami.main.charts``.
+
+    Captures are counted in rows without a taxon. Detections are counted by the
+    determination of their occurrence, and by whether its score passes the project's
+    default score threshold, so the project's default filters apply to the rollup.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="+")
+    deployment = models.ForeignKey(Deployment, on_delete=models.CASCADE, related_name="+")
+    taxon = models.ForeignKey("Taxon", on_delete=models.CASCADE, null=True, related_name="+")
+    above_score_threshold = models.BooleanField(default=False)
+    hour = models.DateTimeField()
+    captures_count = models.IntegerField(default=0)
+    detections_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "hour"]),
+            models.Index(fields=["deployment"]),
+        ]
+
+
+class ChartDailyRollup(models.Model):
+    """
+    Occurrences per day their session started, for the charts in ``ami.main.charts``.
+
+    Counted by determination and by whether the determination score passes the
+    project's default score threshold, like ``ChartHourlyRollup``.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="+")
+    deployment = models.ForeignKey(Deployment, on_delete=models.CASCADE, related_name="+")
+    taxon = models.ForeignKey("Taxon", on_delete=models.CASCADE, null=True, related_name="+")
+    above_score_threshold = models.BooleanField(default=False)
+    date = models.DateField()
+    occurrences_count = models.IntegerField(default=0)
+    # Occurrences that still have detections
+    detected_occurrences_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "date"]),
+            models.Index(fields=["deployment"]),
+        ]
+
+
+def queue_chart_rollup_refresh(deployment_ids: typing.Iterable[int]) -> None:
+    """Queue rebuilding the chart rollups of each deployment, unless that's already queued."""
+    from django.core.cache import cache
+
+    for deployment_id in set(deployment_ids):
+        if cache.add(f"chart_rollups:queued:{deployment_id}", True, timeout=CHART_ROLLUP_QUEUE_TIMEOUT):
+            transaction.on_commit(
+                functools.partial(ami.tasks.refresh_deployment_chart_rollups.delay, deployment_id=deployment_id)
+            )
+
+
+def refresh_chart_rollups(deployment: Deployment) -> None:
+    """
+    Rebuild the chart rollups of a deployment from its captures, detections and occurrences.
+
+    Each table is aggregated once, before anything is locked. The rows are then replaced
+    in one short transaction that locks the deployment row, so concurrent rebuilds don't
+    interleave. A rebuild that read the tables before the last one is discarded, so it
+    can't overwrite newer rollups.
+    """
+
+    def above_score_threshold(accessor: str = "") -> models.Case:
+        threshold = models.F(f"{accessor}project__default_filters_score_threshold")
+        return models.Case(
+            models.When(Q(**{f"{accessor}determination_score__gte": threshold}), then=True),
+            default=False,
+            output_field=models.BooleanField(),
+        )
+
+    started = timezone.now()
+    captures = (
+        SourceImage.objects.filter(deployment=deployment, project__isnull=False, timestamp__isnull=False)
+        .values("project_id", hour=models.functions.TruncHour("timestamp"))
+        .annotate(count=models.Count("pk"))
+        .order_by()
+    )
+    detections = (
+        Detection.objects.filter(
+            source_image__deployment=deployment,
+            source_image__timestamp__isnull=False,
+            occurrence__project__isnull=False,
+        )
+        .values(
+            "occurrence__project_id",
+            "occurrence__determination_id",
+            above=above_score_threshold("occurrence__"),
+            hour=models.functions.TruncHour("source_image__timestamp"),
+        )
+        .annotate(count=models.Count("pk"))
+        .order_by()
+    )
+    occurrences = (
+        Occurrence.objects.filter(deployment=deployment, project__isnull=False, event__start__isnull=False)
+        .annotate(has_detections=Exists(Detection.objects.filter(occurrence=OuterRef("pk"))))
+        .values(
+            "project_id",
+            "determination_id",
+            above=above_score_threshold(),
+            date=models.functions.TruncDate("event__start"),
+        )
+        .annotate(count=models.Count("pk"), detected_count=models.Count("pk", filter=Q(has_detections=True)))
+        .order_by()
+    )
+
+    # {(project, taxon, above threshold, hour): [captures, detections]}
+    hourly: dict[tuple, list[int]] = collections.defaultdict(lambda: [0, 0])
+    for row in captures:
+        hourly[(row["project_id"], None, False, row["hour"])][0] += row["count"]
+    for row in detections:
+        key = (row["occurrence__project_id"], row["occurrence__determination_id"], row["above"], row["hour"])
+        hourly[key][1] += row["count"]
+    occurrences = list(occurrences)
+
+    with transaction.atomic():
+        updated_at = (
+            Deployment.objects.select_for_update()
+            .filter(pk=deployment.pk)
+            .values_list("chart_rollups_updated_at", flat=True)
+            .first()
+        )
+        if updated_at is not None and updated_at >= started:
+            logger.info(f"Chart rollups for deployment {deployment} were rebuilt meanwhile; discarding this rebuild")
+            return
+
+        ChartHourlyRollup.objects.filter(deployment=deployment).delete()
+        ChartHourlyRollup.objects.bulk_create(
+            [
+                ChartHourlyRollup(
+                    project_id=project_id,
+                    deployment=deployment,
+                    taxon_id=taxon_id,
+                    above_score_threshold=above,
+                    hour=hour,
+                    captures_count=captures_count,
+                    detections_count=detections_count,
+                )
+                for (project_id, taxon_id, above, hour), (captures_count, detections_count) in hourly.items()
+            ],
+            batch_size=1000,
+        )
+        ChartDailyRollup.objects.filter(deployment=deployment).delete()
+        ChartDailyRollup.objects.bulk_create(
+            [
+                ChartDailyRollup(
+                    project_id=row["project_id"],
+                    deployment=deployment,
+                    taxon_id=row["determination_id"],
+                    above_score_threshold=row["above"],
+                    date=row["date"],
+                    occurrences_count=row["count"],
+                    detected_occurrences_count=row["detected_count"],
+                )
+                for row in occurrences
+            ],
+            batch_size=1000,
+        )
+        Deployment.objects.filter(pk=deployment.pk).update(chart_rollups_updated_at=started)
+    logger.info(f"Rebuilt chart rollups for deployment {deployment}: {len(hourly)} hourly rows")
+
+
+def chart_rollups_ready(project_pk: int) -> bool:
+    """
+    Whether all of the project's deployments have chart rollups.
+
+    Queues building the rollups of those that have never had them. Until they are built,
+    the charts aggregate the raw tables instead. The ``backfill_chart_rollups`` task
+    builds missing rollups ahead of time, so requests rarely have to.
+    """
+    missing = list(
+        Deployment.objects.filter(project_id=project_pk, chart_rollups_updated_at__isnull=True).values_list(
+            "pk", flat=True
+        )
+    )
+    if missing:
+        queue_chart_rollup_refresh(missing)
+    return not missing
+
+
 class EventQuerySet(BaseQuerySet):
     def with_taxa_count(self, project: Project | None = None, request: Request | None = None):
         """
@@ -2057,6 +2305,38 @@ def delete_source_image(sender, instance, **kwargs):
     instance.deployment.save()
 
 
+# A cold thumbnail request queues generation at most once per capture in this many
+# seconds; later requests serve the placeholder until the task has run.
+THUMBNAIL_QUEUE_TIMEOUT = 5 * 60
+# Once generating a capture's thumbnails has failed this many times (e.g. its image
+# can't be fetched), the thumbnail endpoint answers 404 instead of queueing it again,
+# until the failures are forgotten after THUMBNAIL_FAILURES_TIMEOUT seconds.
+THUMBNAIL_MAX_ATTEMPTS = 3
+THUMBNAIL_FAILURES_TIMEOUT = 24 * 60 * 60
+
+
+def thumbnail_failures_key(source_image_id: int) -> str:
+    return f"thumbnails:failures:{source_image_id}"
+
+
+class FirstInOrder(OrderableAggMixin, models.Aggregate):
+    """The first value of the expression in each group, in the aggregate's ``ordering``."""
+
+    function = "ARRAY_AGG"
+    template = "(%(function)s(%(expressions)s %(ordering)s))[1]"
+
+    @property
+    def output_field(self):
+        return self.get_source_expressions()[0].output_field
+
+
+class Mode(models.Aggregate):
+    """The most frequent value of the expression in each group (the smallest one on ties)."""
+
+    function = "MODE"
+    template = "%(function)s() WITHIN GROUP (ORDER BY %(expressions)s)"
+
+
 class SourceImageQuerySet(BaseQuerySet):
     def with_occurrences_count(self, project: Project | None = None, request=None):
         """
@@ -2127,6 +2407,58 @@ class SourceImageQuerySet(BaseQuerySet):
         processed_exists = models.Exists(Detection.objects.filter(source_image_id=models.OuterRef("pk")))
         return self.annotate(was_processed=processed_exists)
 
+    def with_current_detections_count(self):
+        """
+        Annotate each source image with ``current_detections_count``: the cached
+        ``detections_count``, or the number of valid detections where it hasn't been
+        cached yet. Reads only, unlike ``update_detection_counts``.
+        """
+        detections_subquery = (
+            Detection.objects.filter(source_image_id=models.OuterRef("pk"))
+            .valid()
+            .values("source_image_id")
+            .annotate(count=models.Count("id"))
+            .values("count")
+        )
+        return self.annotate(
+            current_detections_count=Coalesce(
+                "detections_count",
+                models.Subquery(detections_subquery, output_field=models.IntegerField()),
+                0,
+            )
+        )
+
+    def timeline_intervals(self, start: datetime.datetime, resolution: datetime.timedelta) -> dict[int, dict]:
+        """
+        Summarize the source images per timeline interval, in one grouped query.
+
+        The intervals are ``resolution`` long from ``start``, and each holds the images
+        taken after its start up to and including its end (the first one also holds
+        images taken at ``start``). Returns a dict of the intervals that have images, by
+        their index from ``start``. Expects ``with_current_detections_count()``.
+        """
+        elapsed = Extract(models.F("timestamp") - models.Value(start, output_field=models.DateTimeField()), "epoch")
+        interval = Greatest(Ceil(elapsed / resolution.total_seconds()) - 1, 0, output_field=models.FloatField())
+        detections = models.F("current_detections_count")
+        rows = (
+            self.annotate(
+                interval=Cast(interval, models.IntegerField()),
+                has_detections=models.Exists(Detection.objects.filter(source_image_id=models.OuterRef("pk"))),
+            )
+            .order_by()
+            .values("interval")
+            .annotate(
+                captures_count=models.Count("id"),
+                detections_count=models.Sum(detections),
+                first_capture_id=FirstInOrder("id", ordering=("timestamp", "id")),
+                # The last capture with the most detections
+                top_capture_id=FirstInOrder("id", ordering=(detections.desc(), "-timestamp", "-id")),
+                detections_avg=Mode(detections, filter=models.Q(current_detections_count__gt=0)),
+                was_processed=BoolOr("has_detections"),
+            )
+        )
+        return {row["interval"]: row for row in rows}
+
     def with_thumbnails(self):
         """Prefetch ``thumbnails`` so :meth:`SourceImage.thumbnail_urls` decides
         warm/cold in memory instead of firing a SELECT per row.
@@ -2208,6 +2540,16 @@ class SourceImage(BaseModel):
         """
         return urllib.parse.urljoin(base_url, path.lstrip("/"))
 
+    def content_version(self) -> str:
+        """
+        Identify the content of the image file by its checksum, size and modification time.
+
+        Keys the source image cache (see ``ami.utils.image_cache``), so a file that is
+        overwritten in storage and synced again isn't served from a stale cached copy.
+        """
+        last_modified = self.last_modified.isoformat() if self.last_modified else ""
+        return ":".join((self.checksum or "", str(self.size or ""), last_modified))
+
     def public_url(self, raise_errors=False) -> str | None:
         """
         Return the public URL for this image.
@@ -2382,7 +2724,7 @@ class SourceImage(BaseModel):
         if self.path and self.deployment and self.deployment.data_source:
             config = self.deployment.data_source.config
             try:
-                img = ami.utils.s3.read_image(config=config, key=self.path)
+                img = ami.utils.s3.read_image(config=config, key=self.path, version=self.content_version())
             except Exception as e:
                 logger.error(f"Could not determine image dimensions for {self.path}: {e}")
             else:
@@ -2427,7 +2769,7 @@ class SourceImage(BaseModel):
             return []
 
         custom_perms = set()
-        perms = get_perms(user, project)
+        perms = get_project_perms(user, project)
         for perm in perms:
             # permissions are in the format "action_modelname"
             if perm.endswith("_sourceimage"):
@@ -2461,7 +2803,8 @@ class SourceImage(BaseModel):
         """Per-label ``{label: url}`` for this capture's thumbnails.
 
         Warm (cached row valid for the spec) → direct storage URL. Cold/stale →
-        route URL into the thumbnail viewset, which (re)generates lazily.
+        route URL into the thumbnail viewset, which serves a placeholder and queues
+        (re)generation, or generates it lazily if ``THUMBNAILS_GENERATE_ON_REQUEST``.
 
         The warm path needs prefetched ``thumbnails``
         (:meth:`SourceImageQuerySet.with_thumbnails`). Without the prefetch — a
@@ -2470,18 +2813,20 @@ class SourceImage(BaseModel):
         querying. This never lazily loads per object (which would be an N+1 in
         list contexts); list endpoints must apply ``with_thumbnails`` to get the
         warm storage URLs, and the list query-count tests pin that.
+
+        Warm URLs are the JPEG thumbnails; :meth:`thumbnail_variant_urls` has the other
+        formats. Route URLs redirect to the format the image request's ``Accept`` lists.
         """
         # Local import avoids a models ↔ serializers cycle at module load time.
         from ami.base.serializers import reverse_with_params
 
-        prefetched = "thumbnails" in getattr(self, "_prefetched_objects_cache", {})
-        thumbs: dict[str, "SourceImageThumbnail"] = {t.label: t for t in self.thumbnails.all()} if prefetched else {}
+        thumbs = self._prefetched_thumbnails()
 
         out: dict[str, str] = {}
         for label, spec in settings.THUMBNAILS["SIZES"].items():
             thumb = thumbs.get(label)
             if self.thumbnail_is_valid(spec, thumb):
-                out[label] = default_storage.url(thumb.path)
+                out[label] = thumb.url()
             else:
                 # Qualified ``api:`` namespace so this also resolves when ``request``
                 # is None (management commands, template tags).
@@ -2493,46 +2838,76 @@ class SourceImage(BaseModel):
                 )
         return out
 
+    def thumbnail_variant_urls(self) -> dict[str, dict[str, str]]:
+        """Per-label URLs of the warm thumbnails in other formats, e.g. ``{"small": {"webp": url}}``.
+
+        For ``<picture>`` sources next to the JPEG URLs of :meth:`thumbnail_urls`, with
+        the same prefetch requirement. Labels without a valid thumbnail are left out.
+        """
+        thumbs = self._prefetched_thumbnails()
+        out: dict[str, dict[str, str]] = {}
+        for label, spec in settings.THUMBNAILS["SIZES"].items():
+            thumb = thumbs.get(label)
+            if self.thumbnail_is_valid(spec, thumb) and thumb.variants:
+                out[label] = {image_format: thumb.url(image_format) for image_format in thumb.variants}
+        return out
+
+    def _prefetched_thumbnails(self) -> dict[str, "SourceImageThumbnail"]:
+        prefetched = "thumbnails" in getattr(self, "_prefetched_objects_cache", {})
+        return {t.label: t for t in self.thumbnails.all()} if prefetched else {}
+
+    def queue_thumbnail_generation(self) -> bool:
+        """Queue generating this capture's missing thumbnails, unless that was queued recently.
+
+        The thumbnail endpoint calls this on every cold request, so requests for the
+        same capture within ``THUMBNAIL_QUEUE_TIMEOUT`` seconds queue a single task.
+        """
+        from django.core.cache import cache
+
+        if not cache.add(f"thumbnails:queued:{self.pk}", True, timeout=THUMBNAIL_QUEUE_TIMEOUT):
+            return False
+        transaction.on_commit(lambda: ami.tasks.generate_thumbnails.delay(source_image_ids=[self.pk]))
+        return True
+
+    def thumbnail_generation_failed(self) -> bool:
+        """Whether generating this capture's thumbnails has used up its ``THUMBNAIL_MAX_ATTEMPTS``."""
+        from django.core.cache import cache
+
+        return cache.get(thumbnail_failures_key(self.pk), 0) >= THUMBNAIL_MAX_ATTEMPTS
+
+    def thumbnail_key(self, label: str, image_format: str = "jpg") -> str:
+        return f"{settings.THUMBNAILS['STORAGE_PREFIX']}capture_{self.pk}/{label}.{image_format}"
+
+    def save_thumbnail_files(self, label: str, thumbnail: Thumbnail) -> tuple[str, dict[str, str]]:
+        """Save a generated thumbnail and its variants to storage, returning their paths.
+
+        Storage backends may overwrite the key in place or suffix on collision —
+        these are whichever paths the backend returns.
+        """
+        path = default_storage.save(self.thumbnail_key(label), BytesIO(thumbnail.content))
+        variants = {
+            image_format: default_storage.save(self.thumbnail_key(label, image_format), BytesIO(content))
+            for image_format, content in thumbnail.variants.items()
+        }
+        return path, variants
+
     def find_or_generate_thumbnail_for_label(self, label):
         try:
             thumb = self.thumbnails.get(label=label)
         except SourceImageThumbnail.DoesNotExist:
             thumb = None
         size = settings.THUMBNAILS["SIZES"].get(label)
-        prefix = settings.THUMBNAILS["STORAGE_PREFIX"]
 
         # The row is trusted without a storage existence check; an orphan row (blob
         # deleted out of band) shows a broken image until the row is removed.
         if not self.thumbnail_is_valid(size, thumb):
-            img = PIL.Image.open(BytesIO(fetch_image_content(self.public_url(raise_errors=True))))
-            # JPEG only supports L, RGB, CMYK — convert other modes (e.g. RGBA PNGs)
-            # or PIL raises ``OSError: cannot write mode <X> as JPEG``.
-            if img.mode not in ("L", "RGB", "CMYK"):
-                img = img.convert("RGB")
-            # Make the thumbnail
-            orig_width, orig_height = img.size
-            width = size["width"]
-            height = size.get("height", None)
-            if not height:
-                height = int(orig_height * (width / float(orig_width)))
-            new_size = (width, height)
-            img.thumbnail(new_size)
-
-            buffer = BytesIO()
-            # No ``exif=`` argument: detection boxes are overlaid on thumbnails in raw
-            # pixel coordinates, so the EXIF Orientation tag must not propagate.
-            img.save(buffer, format="JPEG", progressive=True, optimize=True, quality=82)
-            contents = buffer.getvalue()
-            file_size = len(contents)
-
-            # Snapshot the prior blob path before the upsert, for cleanup below.
-            prior_path = self.thumbnails.filter(label=label).values_list("path", flat=True).first()
-
-            # Storage backends may overwrite the key in place or suffix on collision —
-            # record whichever path the backend returns.
-            buffer.seek(0)
-            thumbnail_key = f"{prefix}capture_{self.pk}/{label}.jpg"
-            thumbnail_path = default_storage.save(thumbnail_key, buffer)
+            image_content = fetch_image_content(self.public_url(raise_errors=True), version=self.content_version())
+            thumbnail = make_thumbnails(image_content, {label: size}, image_variant_formats())[label]
+
+            # Snapshot the prior blob paths before the upsert, for cleanup below.
+            prior_paths = thumb.storage_paths() if thumb else []
+
+            thumbnail_path, variant_paths = self.save_thumbnail_files(label, thumbnail)
 
             # Atomic upsert: concurrent generation races on the (source_image, label)
             # unique constraint. ``width`` stores the requested spec width, not the
@@ -2542,9 +2917,10 @@ class SourceImage(BaseModel):
                 label=label,
                 defaults={
                     "path": thumbnail_path,
+                    "variants": variant_paths,
                     "width": size["width"],
-                    "height": img.size[1],
-                    "size": file_size,
+                    "height": thumbnail.height,
+                    "size": len(thumbnail.content),
                 },
             )
             # ``last_modified`` is ``auto_now_add`` (set on INSERT only) — force-bump it
@@ -2553,8 +2929,8 @@ class SourceImage(BaseModel):
                 type(thumb).objects.filter(pk=thumb.pk).update(last_modified=timezone.now())
                 thumb.refresh_from_db(fields=["last_modified"])
 
-            # Best-effort cleanup of the replaced blob; failure must not break the response.
-            if prior_path and prior_path != thumbnail_path:
+            # Best-effort cleanup of the replaced blobs; failure must not break the response.
+            for prior_path in set(prior_paths) - set(thumb.storage_paths()):
                 try:
                     default_storage.delete(prior_path)
                 except Exception as e:
@@ -2755,6 +3131,8 @@ class SourceImageThumbnail(BaseModel):
     """A thumbnail cache of a SourceImage"""
 
     path = models.CharField(max_length=255, blank=True)
+    # Paths of the same thumbnail in other formats, e.g. {"webp": "thumbnails/.../small.webp"}
+    variants = models.JSONField(default=dict, blank=True)
     label = models.CharField(max_length=255)
     width = models.IntegerField(null=True, blank=True)
     height = models.IntegerField(null=True, blank=True)
@@ -2766,6 +3144,13 @@ class SourceImageThumbnail(BaseModel):
     # The pre_delete signal in ``ami.main.signals`` cleans the storage blob.
     source_image = models.ForeignKey(SourceImage, on_delete=models.CASCADE, related_name="thumbnails")
 
+    def url(self, image_format: str | None = None) -> str:
+        """URL of the thumbnail in ``image_format`` if it has that variant, otherwise the JPEG."""
+        return default_storage.url(self.variants.get(image_format) or self.path)
+
+    def storage_paths(self) -> list[str]:
+        return [path for path in [self.path, *self.variants.values()] if path]
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -2778,6 +3163,118 @@ class SourceImageThumbnail(BaseModel):
         ]
 
 
+def generate_source_image_thumbnails(
+    source_images: typing.Iterable[SourceImage], io_threads: int | None = None
+) -> int:
+    """
+    Generate the missing or stale thumbnails of each source image, in every configured size.
+
+    Thumbnails without a variant in one of the ``IMAGE_VARIANT_FORMATS`` are regenerated
+    too, so running this over existing captures adds the variants.
+
+    Each image is fetched and decoded once for all of its sizes (see ``make_thumbnails``),
+    fetches and uploads run in a pool of ``io_threads`` threads, and the rows are
+    upserted in a single query. Images that fail are logged, counted and skipped; the
+    thumbnail endpoint queues them again when they are requested, until they have
+    failed ``THUMBNAIL_MAX_ATTEMPTS`` times.
+
+    Pass source images with their thumbnails prefetched
+    (:meth:`SourceImageQuerySet.with_thumbnails`) and their ``deployment__data_source``
+    selected, so checking and fetching them doesn't query per image.
+
+    Returns the number of thumbnails generated.
+    """
+    sizes = settings.THUMBNAILS["SIZES"]
+    variant_formats = image_variant_formats()
+    pending: list[tuple[SourceImage, list[str], list[str]]] = []
+    for source_image in source_images:
+        thumbs = {thumb.label: thumb for thumb in source_image.thumbnails.all()}
+        labels = [
+            label
+            for label, size in sizes.items()
+            if not source_image.thumbnail_is_valid(size, thumbs.get(label))
+            or not set(variant_formats) <= set(thumbs[label].variants)
+        ]
+        if labels:
+            prior_paths = [path for label in labels if label in thumbs for path in thumbs[label].storage_paths()]
+            pending.append((source_image, labels, prior_paths))
+    if not pending:
+        return 0
+
+    def generate(source_image: SourceImage, labels: list[str]) -> list[SourceImageThumbnail]:
+        image_content = fetch_image_content(
+            source_image.public_url(raise_errors=True), version=source_image.content_version()
+        )
+        thumbnails = make_thumbnails(image_content, {label: sizes[label] for label in labels}, variant_formats)
+        rows = []
+        for label, thumbnail in thumbnails.items():
+            path, variants = source_image.save_thumbnail_files(label, thumbnail)
+            rows.append(
+                SourceImageThumbnail(
+                    source_image=source_image,
+                    label=label,
+                    path=path,
+                    variants=variants,
+                    # The spec width, like ``find_or_generate_thumbnail_for_label``
+                    width=sizes[label]["width"],
+                    height=thumbnail.height,
+                    size=len(thumbnail.content),
+                )
+            )
+        return rows
+
+    thumbnails: list[SourceImageThumbnail] = []
+    replaced_paths: list[str] = []
+    failed_ids: list[int] = []
+    with concurrent.futures.ThreadPoolExecutor(io_threads or settings.THUMBNAILS_IO_THREADS) as pool:
+        futures = {
+            pool.submit(generate, source_image, labels): (source_image, prior_paths)
+            for source_image, labels, prior_paths in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            source_image, prior_paths = futures[future]
+            try:
+                generated = future.result()
+            except Exception as e:
+                logger.warning(f"Could not generate thumbnails for capture #{source_image.pk}: {e}")
+                failed_ids.append(source_image.pk)
+                continue
+            thumbnails.extend(generated)
+            new_paths = {path for thumb in generated for path in thumb.storage_paths()}
+            replaced_paths.extend(path for path in prior_paths if path not in new_paths)
+
+    # ``last_modified`` and ``updated_at`` are set on every row by bulk_create, and
+    # updated on conflict so the freshness check accepts regenerated rows.
+    SourceImageThumbnail.objects.bulk_create(
+        thumbnails,
+        update_conflicts=True,
+        unique_fields=["source_image", "label"],
+        update_fields=["path", "variants", "width", "height", "size", "last_modified", "updated_at"],
+    )
+    _record_thumbnail_failures(failed_ids)
+
+    for path in replaced_paths:
+        try:
+            default_storage.delete(path)
+        except Exception as e:
+            logger.warning(f"Could not delete prior thumbnail blob at {path}: {e}")
+    return len(thumbnails)
+
+
+def _record_thumbnail_failures(source_image_ids: list[int]) -> None:
+    from django.core.cache import cache
+
+    for source_image_id in source_image_ids:
+        key = thumbnail_failures_key(source_image_id)
+        # The failures of a capture are forgotten a day after its first one
+        cache.add(key, 0, timeout=THUMBNAIL_FAILURES_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired in between
+            cache.set(key, 1, timeout=THUMBNAIL_FAILURES_TIMEOUT)
+
+
 # @final
 # class IdentificationHistory(BaseModel):
 #     """A history of identifications for an occurrence."""
@@ -2878,7 +3375,9 @@ class Identification(BaseModel):
 
         super().save(*args, **kwargs)
 
-        update_occurrence_determination(self.occurrence)
+        if update_occurrence_determination(self.occurrence) and self.occurrence.deployment_id:
+            queue_chart_rollup_refresh([self.occurrence.deployment_id])
+        bump_project_data_version([self.occurrence.project_id])
 
     def delete(self, *args, **kwargs):
         """
@@ -2911,7 +3410,12 @@ class Identification(BaseModel):
         super().delete(*args, **kwargs)
 
         # Allow the update_occurrence_determination to determine the next best ID
-        update_occurrence_determination(self.occurrence, current_determination=self.taxon)
+        if (
+            update_occurrence_determination(self.occurrence, current_determination=self.taxon)
+            and self.occurrence.deployment_id
+        ):
+            queue_chart_rollup_refresh([self.occurrence.deployment_id])
+        bump_project_data_version([self.occurrence.project_id])
 
     def check_permission(self, user: AbstractUser | AnonymousUser, action: str) -> bool:
         """
@@ -3168,6 +3672,11 @@ class Detection(BaseModel):
             "not the default media storage. Migrate external URLs."
         ),
     )
+    image_variants = models.JSONField(
+        null=True,
+        blank=True,
+        help_text='Paths of the cropped detection image in other formats, e.g. {"webp": "detections/.../x.webp"}',
+    )
 
     occurrence = models.ForeignKey(
         "Occurrence",
@@ -3289,9 +3798,19 @@ class Detection(BaseModel):
         else:
             return (None, None)
 
-    def url(self) -> str | None:
+    def url(self, image_format: str | None = None) -> str | None:
+        """URL of the cropped image in ``image_format`` if it has that variant, otherwise the JPEG."""
+        variant_path = (self.image_variants or {}).get(image_format)
+        if variant_path:
+            return get_media_url(variant_path)
         return get_media_url(self.path) if self.path else None
 
+    def variant_urls(self) -> dict[str, str]:
+        """URLs of the cropped image in other formats than JPEG, e.g. ``{"webp": url}``."""
+        if not self.path:
+            return {}
+        return {image_format: get_media_url(path) for image_format, path in (self.image_variants or {}).items()}
+
     def associate_new_occurrence(self) -> "Occurrence":
         """
         Create and associate a new occurrence with this detection.
@@ -4283,52 +4802,57 @@ class TaxonManager(models.Manager.from_queryset(TaxonQuerySet)):
         assert root, "No root taxon found"
         return root
 
-    def update_all_parents(self):
-        """Efficiently update all parents for all taxa."""
-        taxa = self.get_queryset().select_related("parent")
-        logging.info(f"Updating the cached parent tree for {taxa.count()} taxa")
-
-        # Build a dictionary of taxon parents
-        parents = {taxon.id: taxon.parent_id for taxon in taxa}
-
-        # Precompute all parents in a single pass
-        all_parents = {}
-        for taxon_id in parents:
-            if taxon_id not in all_parents:
-                taxon_parents = []
-                current_id = taxon_id
-                while current_id in parents:
-                    current_id = parents[current_id]
-                    taxon_parents.append(current_id)
-                all_parents[taxon_id] = taxon_parents
-
-        # Prepare bulk update data
-        bulk_update_data = []
-        for taxon in taxa:
-            taxon_parents = all_parents[taxon.id]
-            parent_taxa = list(taxa.filter(id__in=taxon_parents))
-            taxon_parents = [
-                TaxonParent(
-                    id=taxon.id,
-                    name=taxon.name,
-                    rank=taxon.rank,
-                )
-                for taxon in parent_taxa
-            ]
-            taxon_parents.sort(key=lambda t: t.rank)
+    def update_all_parents(self) -> int:
+        """
+        Rebuild the closure table and the cached ``parents_json`` of all taxa, in one UPDATE.
 
-            bulk_update_data.append(taxon)
+        Returns the number of taxa updated.
+        """
+        rebuild_taxon_closure()
+        count = self.get_queryset().update(parents_json=self.parents_json_expression())
+        bump_taxa_version()
+        logger.info(f"Updated parents for {count} taxa")
+        return count
 
-        # Perform bulk update
-        # with transaction.atomic():
-        #     self.bulk_update(bulk_update_data, ["parents_json"], batch_size=1000)
-        # There is a bug that causes the bulk update to fail with a custom JSONField
-        # https://code.djangoproject.com/ticket/35167
-        # So we have to update each taxon individually
-        for taxon in bulk_update_data:
-            taxon.save(update_fields=["parents_json"])
+    def update_subtree_parents(self, taxa: typing.Iterable["Taxon"]) -> int:
+        """
+        Relink the given taxa in the closure table and update the cached ``parents_json`` of
+        the taxa and all taxa below them, in one UPDATE.
 
-        logging.info(f"Updated parents for {len(bulk_update_data)} taxa")
+        For commands that change the parents, names or ranks of many taxa without recalculating
+        them on each save. Returns the number of taxa updated.
+        """
+        taxa = list(taxa)
+        for taxon in taxa:
+            update_taxon_closure(taxon)
+        subtrees = self.get_queryset().filter(id__in=TaxonClosure.objects.descendant_ids(taxa))
+        count = subtrees.update(parents_json=self.parents_json_expression())
+        bump_taxa_version()
+        logger.info(f"Updated parents for {count} taxa below {len(taxa)} changed taxa")
+        return count
+
+    def parents_json_expression(self) -> models.Expression:
+        """
+        The ancestors of each taxon from the closure table, as ``Taxon.update_parents`` lists them:
+        sorted by rank, then from the nearest ancestor up.
+        """
+        rank_order = models.Case(
+            *[models.When(ancestor__rank=rank.name, then=index) for index, rank in enumerate(TaxonRank)],
+            default=len(TaxonRank),
+        )
+        ancestors = (
+            TaxonClosure.objects.filter(descendant=OuterRef("pk"), depth__gt=0)
+            .order_by()
+            .values("descendant")
+            .annotate(
+                parents=JSONBAgg(
+                    JSONObject(id="ancestor_id", name="ancestor__name", rank="ancestor__rank"),
+                    ordering=[rank_order, "depth"],
+                )
+            )
+            .values("parents")
+        )
+        return Coalesce(models.Subquery(ancestors), models.Value([], output_field=models.JSONField()))
 
     def with_children(self):
         qs = self.get_queryset()
@@ -4450,8 +4974,7 @@ class Taxon(BaseModel):
         return self.direct_children.count()
 
     def num_children_recursive(self) -> int:
-        # Use the parents_json field to get all children
-        return Taxon.objects.filter(parents_json__contains=[{"id": self.pk}]).count()
+        return TaxonClosure.objects.filter(ancestor=self, depth__gt=0).count()
 
     def occurrences_count(self) -> int:
         # return self.occurrences.count()
@@ -4459,14 +4982,9 @@ class Taxon(BaseModel):
 
     def occurrences_count_recursive(self) -> int:
         """
-        Use the parents_json field to get all children, count their occurrences and sum them.
+        Count the occurrences of this taxon and all taxa below it.
         """
-        return (
-            Taxon.objects.filter(models.Q(models.Q(parents_json__contains=[{"id": self.pk}]) | models.Q(id=self.pk)))
-            .annotate(occurrences_count=models.Count("occurrences"))
-            .aggregate(models.Sum("occurrences_count"))["occurrences_count__sum"]
-            or 0
-        )
+        return Occurrence.objects.filter(determination__in=TaxonClosure.objects.descendant_ids([self])).count()
 
     def detections_count(self) -> int:
         # return Detection.objects.filter(occurrence__determination=self).count()
@@ -4616,9 +5134,10 @@ class Taxon(BaseModel):
             models.Index(fields=["ordering", "name"]),
         ]
 
-    def update_calculated_fields(self, save=False):
+    def update_calculated_fields(self, save=False, update_parents=True):
         self.display_name = self.get_display_name()
-        self.update_parents(save=False)
+        if update_parents:
+            self.update_parents(save=False)
         self.update_search_names(save=False)
         if save:
             self.save(update_calculated_fields=False)
@@ -4627,6 +5146,135 @@ class Taxon(BaseModel):
         super().save(*args, **kwargs)
         if update_calculated_fields:
             self.update_calculated_fields(save=True)
+            update_taxon_closure(self)
+
+
+class TaxonClosureQuerySet(models.QuerySet):
+    def descendant_ids(self, taxa: models.QuerySet | typing.Iterable[Taxon | int]) -> models.QuerySet:
+        """
+        The IDs of the given taxa and all taxa below them, for filtering with ``__in``.
+
+        >>> Occurrence.objects.filter(determination__in=TaxonClosure.objects.descendant_ids([family]))
+        """
+        return self.filter(ancestor__in=taxa).values("descendant_id")
+
+
+class TaxonClosure(models.Model):
+    """
+    Every ancestor/descendant pair of the taxonomy, with one row for each taxon itself at depth 0.
+
+    Filters that include the taxa below a taxon join this table instead of checking each
+    taxon's ``parents_json``, so they can use the index on either direction. Rebuilt by
+    ``TaxonManager.update_all_parents`` and updated when a taxon's parent changes. The cached
+    ``parents_json`` of many taxa is recalculated from it in one query, see
+    ``TaxonManager.parents_json_expression``.
+    """
+
+    # Indexed by the constraint and the index below, in both directions
+    ancestor = models.ForeignKey(Taxon, on_delete=models.CASCADE, related_name="descendant_links", db_index=False)
+    descendant = models.ForeignKey(Taxon, on_delete=models.CASCADE, related_name="ancestor_links", db_index=False)
+    # 0 for the taxon itself, 1 for its parent, etc.
+    depth = models.PositiveSmallIntegerField()
+
+    objects = TaxonClosureQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_taxon_closure_pair"),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "ancestor"]),
+        ]
+
+
+def rebuild_taxon_closure() -> int:
+    """Rebuild the whole closure table from the taxa's parents. Returns the number of rows."""
+    parents = dict(Taxon.objects.values_list("id", "parent_id"))
+    links = []
+    for taxon_id in parents:
+        ancestor_id, depth, seen = taxon_id, 0, set()
+        # A parent cycle ends at the first taxon seen twice
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(TaxonClosure(ancestor_id=ancestor_id, descendant_id=taxon_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+    with transaction.atomic():
+        TaxonClosure.objects.all().delete()
+        TaxonClosure.objects.bulk_create(links, batch_size=5000)
+    logger.info(f"Rebuilt the taxon closure table with {len(links)} rows for {len(parents)} taxa")
+    return len(links)
+
+
+def update_taxon_closure(taxon: Taxon) -> None:
+    """
+    Link a taxon and the taxa below it to the taxon's current ancestors in the closure table.
+
+    Does nothing if the taxon's parent hasn't changed since its rows were written. Otherwise the
+    taxa below it keep their links within the subtree, and the links above it are replaced with
+    the ancestors of its new parent.
+    """
+    links = dict(TaxonClosure.objects.filter(descendant=taxon, depth__lte=1).values_list("depth", "ancestor_id"))
+    if links.get(0) == taxon.pk and links.get(1) == taxon.parent_id:
+        return
+
+    ancestors: list[tuple[int, int]] = []
+    if taxon.parent_id is not None:
+        parent_links = TaxonClosure.objects.filter(descendant_id=taxon.parent_id).values_list("ancestor_id", "depth")
+        ancestors = [(ancestor_id, depth + 1) for ancestor_id, depth in parent_links]
+        if not ancestors and taxon.parent:
+            update_taxon_closure(taxon.parent)
+            ancestors = [(ancestor_id, depth + 1) for ancestor_id, depth in parent_links.all()]
+
+    subtree = dict(TaxonClosure.objects.filter(ancestor=taxon).values_list("descendant_id", "depth"))
+    subtree[taxon.pk] = 0
+    if any(ancestor_id in subtree for ancestor_id, _ in ancestors):
+        logger.warning(f"Not linking {taxon} (#{taxon.pk}) to its ancestors, they include a taxon below it")
+        ancestors = []
+
+    with transaction.atomic():
+        TaxonClosure.objects.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+        TaxonClosure.objects.bulk_create(
+            [TaxonClosure(ancestor_id=taxon.pk, descendant_id=taxon.pk, depth=0)]
+            + [
+                TaxonClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth + ancestor_depth)
+                for descendant_id, depth in subtree.items()
+                for ancestor_id, ancestor_depth in ancestors
+            ],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+
+
+TAXA_VERSION_CACHE_KEY = "taxa:version"
+
+
+def get_taxa_version() -> int | None:
+    """
+    The version of the taxonomy, which copies of it (the suggestion index, cached trees) are keyed by.
+
+    Returns None if the cache is unavailable, in which case nothing should be served from a copy.
+    """
+    from django.core.cache import cache
+
+    version = cache.get(TAXA_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(TAXA_VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+        version = cache.get(TAXA_VERSION_CACHE_KEY)
+    return version
+
+
+def bump_taxa_version() -> None:
+    """Invalidate the copies of the taxonomy, e.g. cached trees, once the current transaction commits."""
+    from django.core.cache import cache
+
+    def bump():
+        try:
+            cache.incr(TAXA_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(TAXA_VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
 
 
 class TaxaListQuerySet(BaseQuerySet):
@@ -4801,6 +5449,22 @@ class SourceImageCollectionQuerySet(BaseQuerySet):
             )
         )
 
+    def with_source_images_unprocessed_count(self, pipeline):
+        """
+        Annotate each collection with the number of its images the pipeline has yet to process,
+        according to the processed-image index (see ``ami.ml.models.processed_image``).
+        """
+        from ami.ml.models.processed_image import ProcessedImage
+
+        processed = ProcessedImage.objects.covering(pipeline).values("source_image_id")
+        return self.annotate(
+            source_images_unprocessed_count=models.Count(
+                "images",
+                filter=~models.Q(images__in=processed),
+                distinct=True,
+            )
+        )
+
     def with_source_images_processed_by_algorithm_count(self, algorithm_id: int):
         return self.annotate(
             source_images_processed_by_algorithm_count=models.Count(
@@ -20,7 +20,7 @@ def build_taxa_recursive_filter_q(
     taxon_accessor: str = "",
 ) -> Q:
     """
-    Build a Q filter for taxa inclusion/exclusion (including descendants via parents_json).
+    Build a Q filter for taxa inclusion/exclusion (including descendants via the TaxonClosure table).
 
     This handles the hierarchy traversal for taxa filtering, supporting both inclusion
     and exclusion in a single unified method.
@@ -29,7 +29,7 @@ def build_taxa_recursive_filter_q(
         include_taxa: QuerySet of taxa to include (if any)
         exclude_taxa: QuerySet of taxa to exclude (if any)
         taxon_accessor: Path to the taxon field (without trailing __):
-            - "": Direct Taxon model (uses id__in, parents_json__contains)
+            - "": Direct Taxon model (uses id__in)
             - "determination": Occurrence's determination field
             - "occurrences__determination": Event→Occurrence→determination
             - "detections__occurrence__determination": Image→Detection→Occurrence→determination
@@ -51,39 +51,25 @@ def build_taxa_recursive_filter_q(
             >>> combined_q = score_q & taxa_q & Q(determination__isnull=False)
             >>> occurrences = Occurrence.objects.filter(combined_q)
     """
+    from ami.main.models import TaxonClosure
+
     result_q = Q()
 
     # Determine field names based on taxon_accessor
     if taxon_accessor:
         # For filtering through relationships, add __ separator and use the accessor path
         id_field = f"{taxon_accessor}__id__in"
-        parents_field = f"{taxon_accessor}__parents_json__contains"
     else:
         # For direct Taxon model filtering
         id_field = "id__in"
-        parents_field = "parents_json__contains"
 
-    # Handle inclusion
+    # The closure table links each taxon to itself and to every taxon below it, so each
+    # list is one indexed semi-join however many taxa it has
     if include_taxa and include_taxa.exists():
-        # Start with direct match
-        include_q = Q(**{id_field: include_taxa})
-
-        # Add descendants via parents_json traversal
-        for taxon in include_taxa:
-            include_q |= Q(**{parents_field: [{"id": taxon.pk}]})
-
-        result_q &= include_q
+        result_q &= Q(**{id_field: TaxonClosure.objects.descendant_ids(include_taxa)})
 
-    # Handle exclusion
     if exclude_taxa and exclude_taxa.exists():
-        # Start with direct match
-        exclude_q = Q(**{id_field: exclude_taxa})
-
-        # Add descendants via parents_json traversal
-        for taxon in exclude_taxa:
-            exclude_q |= Q(**{parents_field: [{"id": taxon.pk}]})
-
-        result_q &= ~exclude_q
+        result_q &= ~Q(**{id_field: TaxonClosure.objects.descendant_ids(exclude_taxa)})
 
     return result_q
 
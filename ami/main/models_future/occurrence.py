@@ -19,7 +19,7 @@ from ami.main.models import Project, TaxonRank, User
 from ami.utils.stats import cohens_kappa, wilson_interval
 
 if TYPE_CHECKING:
-    from ami.main.models import Classification, Identification, Occurrence
+    from ami.main.models import Classification, Detection, Identification, Occurrence
 
 TaxonTuple = tuple[int, str, list[dict]]
 
@@ -158,14 +158,26 @@ def detection_image_urls_from_prefetch(occurrence: Occurrence, limit: int | None
 
     Strict: requires `detections` prefetched. Pass `limit` to bound output.
     """
-    _require_prefetch(occurrence, "detections")
+    return [det.url() for det in _detections_with_images(occurrence, limit)]
+
 
-    from ami.main.models import get_media_url
+def detection_image_variant_urls_from_prefetch(
+    occurrence: Occurrence, limit: int | None = None
+) -> list[dict[str, str]]:
+    """The images of `detection_image_urls_from_prefetch` in other formats, in the same order.
+
+    Strict: requires `detections` prefetched.
+    """
+    return [det.variant_urls() for det in _detections_with_images(occurrence, limit)]
+
+
+def _detections_with_images(occurrence: Occurrence, limit: int | None) -> list[Detection]:
+    _require_prefetch(occurrence, "detections")
 
     detections = [det for det in occurrence.detections.all() if det.path]
     if limit is not None:
         detections = detections[:limit]
-    return [get_media_url(det.path) for det in detections]
+    return detections
 
 
 def model_agreement_for_project(
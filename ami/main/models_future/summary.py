@@ -0,0 +1,67 @@
+"""
+Project statistics for the dashboard (``SummaryView``), cached per project.
+
+The counts are cached under the project's data version (see
+``bump_project_data_version``), which changes when captures sync, results are
+saved, identifications are made or the project's default filters change. A
+cached entry is served until then, or for ``PROJECT_SUMMARY_CACHE_TIMEOUT``
+seconds. With ``PROJECT_SUMMARY_REWARM_AFTER_JOBS``, finishing a job recomputes
+the counts in the background, so the next dashboard load doesn't have to.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from rest_framework.request import Request
+
+from ami.main.models import Deployment, Event, Occurrence, Project, SourceImage, User, get_project_data_version
+from ami.utils.requests import get_apply_default_filters_flag
+
+# A project's counts are re-warmed at most once per this many seconds
+REWARM_QUEUE_TIMEOUT = 60
+
+
+def project_summary_counts(project: Project, request: Request | None = None, user: User | None = None) -> dict:
+    """
+    Count the project's deployments, sessions, captures, occurrences and taxa.
+
+    With a ``user``, only objects visible to them are counted. Without one, all of them
+    are, which is the same for every user who can see the project.
+    """
+
+    def visible(qs: QuerySet) -> QuerySet:
+        return qs.visible_for_user(user) if user is not None else qs  # type: ignore
+
+    occurrences = visible(Occurrence.objects.all()).apply_default_filters(project=project, request=request)
+    return {
+        "deployments_count": visible(Deployment.objects.all()).filter(project=project).count(),
+        "events_count": visible(Event.objects.all())
+        .filter(deployment__project=project, deployment__isnull=False)
+        .count(),
+        "captures_count": visible(SourceImage.objects.all()).filter(deployment__project=project).count(),
+        # "detections_count": Detection.objects.filter(occurrence__project=project).count(),
+        "occurrences_count": occurrences.valid().filter(project=project).count(),
+        "taxa_count": occurrences.unique_taxa(project=project).count(),
+    }
+
+
+def cached_project_summary_counts(project: Project, request: Request | None = None) -> dict:
+    """The counts of ``project_summary_counts`` for users who can see the project, from the cache if current."""
+    apply_defaults = get_apply_default_filters_flag(request)
+    key = f"projects:summary:{project.pk}:{get_project_data_version(project.pk)}:{apply_defaults}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = project_summary_counts(project, request)
+        cache.set(key, counts, timeout=settings.PROJECT_SUMMARY_CACHE_TIMEOUT)
+    return counts
+
+
+def queue_project_summary_rewarm(project_id: int) -> None:
+    """Queue recomputing the project's cached counts, if enabled and not already queued."""
+    from ami.main.tasks import warm_project_summary
+
+    if not settings.PROJECT_SUMMARY_REWARM_AFTER_JOBS:
+        return
+    if cache.add(f"projects:summary_rewarm_queued:{project_id}", True, timeout=REWARM_QUEUE_TIMEOUT):
+        transaction.on_commit(lambda: warm_project_summary.delay(project_id))
@@ -0,0 +1,273 @@
+"""
+Taxon suggestions for the name autocomplete of identifiers (``TaxonViewSet.suggest``).
+
+The SQL query (``suggest_taxa_sql``) matches the active taxa whose name or search names
+contain the query and ranks them by the greater pg_trgm similarity of the two. It runs
+on every keystroke, so each process keeps a trigram index of the same names
+(``TaxonSuggestionIndex``) that matches and ranks them the same way in memory. The index
+is rebuilt in the background when the taxonomy's version changes (see ``bump_taxa_version``).
+Until it is rebuilt, or if the cache holding the version is unavailable, suggestions come
+from SQL.
+"""
+
+import array
+import collections
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+import typing
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import models
+
+from ami.main.models import Taxon, get_taxa_version
+
+logger = logging.getLogger(__name__)
+
+# Joins the search names of a taxon into the one text that the query is matched against.
+# It can't be part of a query, so a match never spans two names.
+SEARCH_NAMES_SEPARATOR = "\x00"
+
+# The words that pg_trgm extracts trigrams from: runs of letters and digits
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    The trigrams of a text as pg_trgm extracts them, for ``similarity``.
+
+    Each lowercase word is padded with two spaces in front and one behind.
+    """
+    result = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a: str, b: str) -> float:
+    """The pg_trgm ``similarity`` of two texts: their shared trigrams over all of their trigrams."""
+    a_trigrams, b_trigrams = trigrams(a), trigrams(b)
+    common = len(a_trigrams & b_trigrams)
+    return common / (len(a_trigrams) + len(b_trigrams) - common) if common else 0.0
+
+
+class TaxonSuggestionIndex:
+    """
+    The names and search names of taxa, with the entries that have each trigram.
+
+    Each taxon has an entry for its name and, unless they are null, one for its search names,
+    which the SQL query compares as one text. Entries of the same taxon are next to each other.
+
+    >>> index = TaxonSuggestionIndex([(1, "Vanessa cardui", ["Painted Lady"])])
+    >>> index.search("lady", limit=10)
+    [(1, 0.38461538461538464)]
+    """
+
+    def __init__(self, taxa: typing.Iterable[tuple[int, str, list[str] | None]], version: int | None = None):
+        self.version = version
+        self.taxon_ids = array.array("q")
+        self.texts: list[str] = []
+        # The number of trigrams of each entry
+        self.sizes = array.array("I")
+        postings: dict[str, list[int]] = collections.defaultdict(list)
+
+        for taxon_id, name, search_names in taxa:
+            texts = [name] if search_names is None else [name, SEARCH_NAMES_SEPARATOR.join(search_names)]
+            for text in texts:
+                entry = len(self.texts)
+                entry_trigrams = trigrams(text)
+                self.taxon_ids.append(taxon_id)
+                self.texts.append(text.lower())
+                self.sizes.append(len(entry_trigrams))
+                for trigram in entry_trigrams:
+                    postings[trigram].append(entry)
+
+        self.postings = {trigram: array.array("i", entries) for trigram, entries in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, limit: int) -> list[tuple[int, float]]:
+        """
+        The IDs and similarities of the best matching taxa, most similar first.
+
+        Matches and ranks taxa as ``suggest_taxa_sql`` does.
+        """
+        needle = query.lower()
+        matched = [entry for entry in self._candidates(needle) if needle in self.texts[entry]]
+        if not matched:
+            return []
+
+        query_trigrams = trigrams(query)
+        entries = self._taxon_entries(matched)
+        postings = [self.postings.get(trigram, ()) for trigram in query_trigrams]
+        # Extracting the trigrams of an entry takes about as long as counting 100 postings
+        if len(entries) * 100 < sum(len(posting) for posting in postings):
+            common = {entry: len(query_trigrams & trigrams(self.texts[entry])) for entry in entries}
+        else:
+            common = collections.Counter(itertools.chain.from_iterable(postings))
+        scores: dict[int, float] = {}
+        for entry in entries:
+            shared = common.get(entry, 0)
+            score = shared / (len(query_trigrams) + self.sizes[entry] - shared) if shared else 0.0
+            taxon_id = self.taxon_ids[entry]
+            scores[taxon_id] = max(score, scores.get(taxon_id, 0.0))
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def _taxon_entries(self, entries: list[int]) -> set[int]:
+        """The given entries and the other entries of their taxa, which are ranked by both."""
+        result = set(entries)
+        for entry in entries:
+            for neighbour in (entry - 1, entry + 1):
+                if 0 <= neighbour < len(self.texts) and self.taxon_ids[neighbour] == self.taxon_ids[entry]:
+                    result.add(neighbour)
+        return result
+
+    def _candidates(self, needle: str) -> typing.Iterable[int]:
+        """
+        The entries that may contain the (lowercase) query, from its longest word.
+
+        A word of the query is part of a word of each entry that contains it, so the entries
+        have each of its trigrams. A word of two letters is part of one of their trigrams.
+        """
+        word = max(WORD_PATTERN.findall(needle), key=len, default="")
+        if len(word) >= 3:
+            postings = sorted(
+                (self.postings.get(word[i : i + 3], ()) for i in range(len(word) - 2)),
+                key=len,
+            )
+            entries = set(postings[0])
+            for posting in postings[1:]:
+                entries.intersection_update(posting)
+            return entries
+        if len(word) == 2:
+            return set(
+                itertools.chain.from_iterable(posting for trigram, posting in self.postings.items() if word in trigram)
+            )
+        return range(len(self.texts))
+
+
+# A process rebuilds its index at most once per this many seconds, e.g. while taxa are imported
+REBUILD_INTERVAL = 60
+
+_index: TaxonSuggestionIndex | None = None
+_index_lock = threading.Lock()
+_rebuild: threading.Thread | None = None
+_rebuild_started = 0.0
+
+
+def build_suggestion_index(version: int | None = None) -> TaxonSuggestionIndex:
+    """Index the names and search names of all active taxa."""
+    start = time.perf_counter()
+    taxa = (
+        Taxon.objects.filter(active=True)
+        .values_list("id", "name", "search_names")
+        .order_by()
+        .iterator(chunk_size=10000)
+    )
+    index = TaxonSuggestionIndex(taxa, version=version)
+    logger.info(f"Built the taxon suggestion index of {len(index)} names in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def get_suggestion_index(wait: bool = False) -> TaxonSuggestionIndex | None:
+    """
+    This process's suggestion index of the current taxonomy, if it's up to date.
+
+    An index that's out of date is rebuilt in a background thread, so requests aren't held up
+    by it, unless ``wait`` is set. Returns None until then, if the index is disabled, or if the
+    taxonomy's version is unknown.
+    """
+    global _index, _rebuild, _rebuild_started
+
+    if not settings.TAXON_SUGGEST_INDEX:
+        return None
+    # Taxa that change while the index is built bump the version again, so they aren't missed
+    version = get_taxa_version()
+    if version is None:
+        return None
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    if wait:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = build_suggestion_index(version)
+            return _index
+
+    with _index_lock:
+        if _rebuild is None and (_index is None or time.monotonic() - _rebuild_started >= REBUILD_INTERVAL):
+            _rebuild = threading.Thread(target=_rebuild_index, args=(version,), daemon=True)
+            _rebuild_started = time.monotonic()
+            _rebuild.start()
+    return None
+
+
+def _rebuild_index(version: int) -> None:
+    global _index, _rebuild
+
+    from django.db import connection
+
+    try:
+        index = build_suggestion_index(version)
+        with _index_lock:
+            _index = index
+    except Exception as e:
+        logger.error(f"Could not build the taxon suggestion index: {e}")
+    finally:
+        with _index_lock:
+            _rebuild = None
+        connection.close()
+
+
+def suggest_taxa_sql(query: str, limit: int) -> models.QuerySet[Taxon]:
+    """The active taxa whose name or search names contain the query, most similar first."""
+    return (
+        Taxon.objects.filter(active=True)
+        # .select_related("parent")
+        .filter(models.Q(name__icontains=query) | models.Q(search_names__icontains=query))
+        .annotate(
+            # Calculate similarity for the name field
+            name_similarity=TrigramSimilarity("name", query),
+            # Cast array to string before similarity calculation
+            search_names_similarity=TrigramSimilarity(
+                models.functions.Cast("search_names", models.TextField()), query
+            ),
+            # Take the maximum similarity between name and search_names
+            similarity=models.functions.Greatest(models.F("name_similarity"), models.F("search_names_similarity")),
+        )
+        .order_by("-similarity")
+        .defer(
+            "notes",
+            "parent__notes",
+        )[:limit]
+    )
+
+
+def suggest_taxa(query: str, limit: int) -> list[Taxon]:
+    """
+    The taxa of ``suggest_taxa_sql``, ranked by this process's suggestion index if it's available.
+
+    Each taxon has its ``similarity`` to the query.
+    """
+    index = get_suggestion_index()
+    if index is None:
+        return list(suggest_taxa_sql(query, limit))
+
+    ranked = index.search(query, limit)
+    taxa = Taxon.objects.defer("notes", "parent__notes").in_bulk([taxon_id for taxon_id, _ in ranked])
+    results = []
+    for taxon_id, taxon_similarity in ranked:
+        # Skip taxa deleted since the index was built
+        if taxon_id in taxa:
+            taxon = taxa[taxon_id]
+            taxon.similarity = taxon_similarity
+            results.append(taxon)
+    return results
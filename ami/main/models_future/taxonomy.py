@@ -0,0 +1,66 @@
+"""
+Serialized taxonomy trees for the Label Studio taxonomy endpoints, cached per taxa list.
+
+Building a tree (``TaxonManager.tree``) reads every active taxon and follows their parents,
+so the serialized tree is cached under the taxonomy's version (see ``bump_taxa_version``).
+The version changes when a taxon is saved or deleted, when the taxa of a list change and
+when ``update_all_parents`` or ``update_subtree_parents`` run. Each cached tree has a hash
+of its content, which the endpoints send as their ETag.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ami.main.models import TaxaList, Taxon, TaxonRank, get_taxa_version
+
+
+def serialize_taxa_tree(node: dict) -> dict:
+    """A tree of ``TaxonManager.tree`` as plain data, with what the taxonomy endpoints show of each taxon."""
+    taxon = node["taxon"]
+    return {
+        "id": taxon.pk,
+        "name": taxon.name,
+        "display_name": taxon.get_display_name(),
+        "rank": taxon.rank,
+        "children": [serialize_taxa_tree(child) for child in node["children"]],
+    }
+
+
+def cached_taxa_tree(
+    taxa_list: TaxaList | None = None,
+    root: Taxon | None = None,
+    filter_ranks: list[TaxonRank] | None = None,
+) -> dict:
+    """
+    The serialized tree of a taxa list's taxa, or of all taxa, and the hash of its content.
+
+    Returns ``{"tree": ..., "hash": ...}``, from the cache if the taxonomy hasn't changed since.
+    The arguments are those of ``TaxonManager.tree``.
+    """
+    filter_ranks = filter_ranks or []
+    version = get_taxa_version()
+    key = ":".join(
+        [
+            "taxa:tree",
+            str(version),
+            str(taxa_list.pk if taxa_list else "all"),
+            str(root.pk if root else "root"),
+            ",".join(rank.name for rank in filter_ranks),
+        ]
+    )
+    if version is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    taxa = taxa_list.taxa if taxa_list else Taxon.objects
+    tree = serialize_taxa_tree(taxa.tree(root=root, filter_ranks=filter_ranks))  # type: ignore
+    content = json.dumps(tree, sort_keys=True, separators=(",", ":"))
+    result = {"tree": tree, "hash": hashlib.sha256(content.encode()).hexdigest()}
+    # Without a version, a changed taxonomy couldn't invalidate it
+    if version is not None:
+        cache.set(key, result, timeout=settings.TAXA_TREE_CACHE_TIMEOUT)
+    return result
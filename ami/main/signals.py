@@ -3,11 +3,18 @@ import logging
 from django.contrib.auth.models import Group
 from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from guardian.shortcuts import assign_perm
 
-from ami.main.models import Project, SourceImageThumbnail
+from ami.main.models import (
+    Project,
+    SourceImageThumbnail,
+    TaxaList,
+    Taxon,
+    bump_project_data_version,
+    bump_taxa_version,
+)
 from ami.main.tasks import refresh_project_cached_counts
 from ami.users.roles import BasicMember, ProjectManager, create_roles_for_project
 
@@ -118,18 +125,30 @@ def delete_project_groups(sender, instance, **kwargs):
 
 @receiver(pre_delete, sender=SourceImageThumbnail)
 def delete_thumbnail_storage_blob(sender, instance, **kwargs):
-    """Delete the storage blob when a thumbnail row is deleted (directly or via
-    CASCADE from its capture) — no other code path reaps it. Best-effort:
-    failures are logged, never re-raised, so the row delete always completes.
+    """Delete the storage blobs (the JPEG and its variants) when a thumbnail row is
+    deleted (directly or via CASCADE from its capture) — no other code path reaps
+    them. Best-effort: failures are logged, never re-raised, so the row delete
+    always completes.
     """
-    if not instance.path:
-        return
-    try:
-        default_storage.delete(instance.path)
-    except Exception as e:
-        logger.warning(
-            f"Could not delete storage blob {instance.path} for SourceImageThumbnail " f"id={instance.pk}: {e}"
-        )
+    for path in instance.storage_paths():
+        try:
+            default_storage.delete(path)
+        except Exception as e:
+            logger.warning(f"Could not delete storage blob {path} for SourceImageThumbnail id={instance.pk}: {e}")
+
+
+@receiver(post_save, sender=Taxon)
+@receiver(post_delete, sender=Taxon)
+def taxon_changed(sender, instance, **kwargs):
+    """Rebuild the copies of the taxonomy (the suggestion index, cached trees) when a taxon changes."""
+    bump_taxa_version()
+
+
+@receiver(m2m_changed, sender=TaxaList.taxa.through)
+def taxa_list_taxa_changed(sender, instance, action, **kwargs):
+    """Rebuild the cached trees of taxa lists when their taxa are modified."""
+    if action in ["post_add", "post_remove", "post_clear"]:
+        bump_taxa_version()
 
 
 # ============================================================================
@@ -157,9 +176,10 @@ def refresh_cached_counts_for_project(project: Project):
     This fan-out can iterate hundreds of events and dozens of deployments, so
     running it inline in the request/save path would block the caller. The
     ``transaction.on_commit`` wrapper guarantees the task only runs if the
-    triggering save succeeds.
+    triggering save succeeds. The project's cached statistics are invalidated too.
     """
     logger.info(f"Scheduling cached-count refresh for project {project.pk} ({project.name})")
+    bump_project_data_version([project.pk])
     transaction.on_commit(lambda: refresh_project_cached_counts.delay(project.pk))
 
 
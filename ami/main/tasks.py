@@ -23,3 +23,16 @@ def refresh_project_cached_counts(project_id: int) -> None:
 
     logger.info(f"Refreshing cached counts for project {project.pk} ({project.name})")
     project.update_related_calculated_fields()
+
+
+@celery_app.task(ignore_result=True)
+def warm_project_summary(project_id: int) -> None:
+    """Compute a project's cached dashboard statistics, queued when one of its jobs finishes."""
+    from ami.main.models import Project
+    from ami.main.models_future.summary import cached_project_summary_counts
+
+    project = Project.objects.filter(pk=project_id).first()
+    if project is None:
+        logger.warning(f"Project {project_id} not found; skipping summary re-warm")
+        return
+    cached_project_summary_counts(project)
@@ -1,3 +1,4 @@
+import collections
 import copy
 import datetime
 import logging
@@ -15,11 +16,14 @@ from django.utils import timezone
 from guardian.shortcuts import assign_perm, get_perms, remove_perm
 from PIL import Image
 from rest_framework import status
+from rest_framework.request import Request
 from rest_framework.test import APIClient, APIRequestFactory, APITestCase
 from rich import print
 
+import ami.tasks
 from ami.exports.models import DataExport
-from ami.jobs.models import VALID_JOB_TYPES, Job
+from ami.jobs.models import VALID_JOB_TYPES, Job, JobState
+from ami.main import charts
 from ami.main.api.serializers import MAX_BULK_IDENTIFICATIONS
 from ami.main.models import (
     Classification,
@@ -38,9 +42,14 @@ from ami.main.models import (
     Tag,
     TaxaList,
     Taxon,
+    TaxonClosure,
     TaxonRank,
+    bump_project_data_version,
+    get_project_data_version,
     group_images_into_events,
+    refresh_chart_rollups,
 )
+from ami.ml.models.algorithm import Algorithm
 from ami.ml.models.pipeline import Pipeline
 from ami.ml.models.processing_service import ProcessingService
 from ami.ml.models.project_pipeline_config import ProjectPipelineConfig
@@ -234,6 +243,9 @@ NEW_THUMBNAIL_SETTINGS = copy.deepcopy(settings.THUMBNAILS)
 NEW_THUMBNAIL_SETTINGS["SIZES"]["small"]["width"] = 300
 
 
+# These cover generating thumbnails in the request; see TestThumbnailPregeneration for
+# the default of serving a placeholder and generating them in a task.
+@override_settings(THUMBNAILS_GENERATE_ON_REQUEST=True)
 class TestImageThumbnailViews(TestCase):
     base_url = "http://testserver/api/v2/captures/thumbnails/"
 
@@ -736,6 +748,400 @@ class TestImageThumbnailViews(TestCase):
         )
 
 
+class TestThumbnailPregeneration(TestCase):
+    def setUp(self) -> None:
+        from django.core.cache import cache
+
+        self.project, self.deployment = setup_test_project(reuse=False)
+        self.captures = [c[0] for c in create_captures_from_files(deployment=self.deployment)]
+        self.first_capture = self.captures[0]
+        for capture in self.captures:
+            cache.delete_many([f"thumbnails:queued:{capture.pk}", f"thumbnails:failures:{capture.pk}"])
+        return super().setUp()
+
+    def test_cold_thumbnail_serves_placeholder_and_queues_generation(self):
+        url = f"/api/v2/captures/thumbnails/{self.first_capture.pk}/?label=small"
+        with mock.patch("ami.tasks.generate_thumbnails.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(url)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertEqual(response["Cache-Control"], "no-store")
+        self.assertIn(b'width="240" height="180"', response.content)
+        self.assertFalse(self.first_capture.thumbnails.exists(), "The request must not generate thumbnails")
+        # The second request finds the capture already queued
+        mock_delay.assert_called_once_with(source_image_ids=[self.first_capture.pk])
+
+    def test_unfetchable_thumbnail_is_not_found_after_max_attempts(self):
+        from ami.main.models import THUMBNAIL_MAX_ATTEMPTS
+        from ami.tasks import generate_thumbnails
+
+        url = f"/api/v2/captures/thumbnails/{self.first_capture.pk}/?label=small"
+        with mock.patch("ami.main.models.fetch_image_content", side_effect=OSError("Not found in storage")):
+            for _ in range(THUMBNAIL_MAX_ATTEMPTS - 1):
+                self.assertEqual(generate_thumbnails(source_image_ids=[self.first_capture.pk]), 0)
+            with mock.patch("ami.tasks.generate_thumbnails.delay"):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+            self.assertEqual(generate_thumbnails(source_image_ids=[self.first_capture.pk]), 0)
+            with mock.patch("ami.tasks.generate_thumbnails.delay") as mock_delay:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        mock_delay.assert_not_called()
+
+    def test_warm_thumbnail_redirects(self):
+        from ami.tasks import generate_thumbnails
+
+        generate_thumbnails(source_image_ids=[self.first_capture.pk])
+        thumb = self.first_capture.thumbnails.get(label="small")
+        with mock.patch("ami.tasks.generate_thumbnails.delay") as mock_delay:
+            response = self.client.get(f"/api/v2/captures/thumbnails/{self.first_capture.pk}/?label=small")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers["Location"], f"/media/{thumb.path}")
+        mock_delay.assert_not_called()
+
+    def test_generate_thumbnails_for_deployment(self):
+        from ami.main.models import SourceImageThumbnail
+        from ami.tasks import generate_thumbnails
+
+        sizes = settings.THUMBNAILS["SIZES"]
+        with CaptureQueriesContext(connection) as ctx:
+            generated = generate_thumbnails(deployment_id=self.deployment.pk, batch_size=2)
+        self.assertEqual(generated, len(self.captures) * len(sizes))
+        upserts = [q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "main_sourceimagethumbnail"')]
+        self.assertEqual(len(upserts), -(-len(self.captures) // 2), "Rows should be written once per batch")
+
+        thumbs = SourceImageThumbnail.objects.filter(source_image__deployment=self.deployment)
+        self.assertEqual(thumbs.count(), len(self.captures) * len(sizes))
+        small = thumbs.get(source_image=self.first_capture, label="small")
+        self.assertEqual((small.width, small.height), (240, 180))
+
+        # Everything is up to date now
+        self.assertEqual(generate_thumbnails(deployment_id=self.deployment.pk), 0)
+
+    def test_generate_thumbnails_replaces_stale_rows(self):
+        from ami.tasks import generate_thumbnails
+
+        stale = self.first_capture.thumbnails.create(path="thumbnails/stale.jpg", label="small", width=100)
+        self.assertEqual(generate_thumbnails(source_image_ids=[self.first_capture.pk]), 3)
+        thumb = self.first_capture.thumbnails.get(label="small")
+        self.assertEqual(thumb.pk, stale.pk)
+        self.assertEqual(thumb.width, 240)
+        self.assertNotEqual(thumb.path, "thumbnails/stale.jpg")
+
+    def test_draft_projects_are_not_pregenerated(self):
+        from ami.tasks import generate_thumbnails
+
+        self.project.draft = True
+        self.project.save(update_fields=["draft"])
+        self.assertEqual(generate_thumbnails(deployment_id=self.deployment.pk), 0)
+
+    def test_thumbnail_variants_are_served_by_accept_header(self):
+        from django.core.files.storage import default_storage
+
+        from ami.tasks import generate_thumbnails
+
+        generate_thumbnails(source_image_ids=[self.first_capture.pk])
+        thumb = self.first_capture.thumbnails.get(label="small")
+        self.assertEqual(set(thumb.variants), {"webp"})
+        with default_storage.open(thumb.variants["webp"]) as f, Image.open(f) as img:
+            self.assertEqual(img.format, "WEBP")
+
+        url = f"/api/v2/captures/thumbnails/{self.first_capture.pk}/?label=small"
+        response = self.client.get(url, HTTP_ACCEPT="image/avif,image/webp,image/*,*/*;q=0.8")
+        self.assertEqual(response.headers["Location"], f"/media/{thumb.variants['webp']}")
+        self.assertIn("Accept", response.headers["Vary"])
+        response = self.client.get(url, HTTP_ACCEPT="*/*")
+        self.assertEqual(response.headers["Location"], f"/media/{thumb.path}")
+
+        # The JSON API lists every format instead of picking one by the JSON request's Accept
+        capture_url = f"/api/v2/captures/{self.first_capture.pk}/?project_id={self.project.pk}"
+        response = self.client.get(capture_url, HTTP_ACCEPT="application/json, image/webp")
+        self.assertEqual(response.json()["thumbnails"]["small"], f"/media/{thumb.path}")
+        self.assertEqual(response.json()["thumbnail_variants"]["small"], {"webp": f"/media/{thumb.variants['webp']}"})
+
+    def test_generate_thumbnails_adds_missing_variants(self):
+        from ami.tasks import generate_thumbnails
+
+        with override_settings(IMAGE_VARIANT_FORMATS=[]):
+            generate_thumbnails(source_image_ids=[self.first_capture.pk])
+        self.assertEqual(self.first_capture.thumbnails.get(label="small").variants, {})
+
+        self.assertEqual(generate_thumbnails(source_image_ids=[self.first_capture.pk]), 3)
+        self.assertEqual(set(self.first_capture.thumbnails.get(label="small").variants), {"webp"})
+
+    def test_detection_urls_per_format(self):
+        detection = Detection.objects.create(
+            source_image=self.first_capture,
+            bbox=[0, 0, 10, 10],
+            path="detections/crop.jpg",
+            image_variants={"webp": "detections/crop.webp"},
+        )
+        url = f"/api/v2/detections/{detection.pk}/?project_id={self.project.pk}"
+        response = self.client.get(url, HTTP_ACCEPT="application/json, image/webp")
+        self.assertEqual(response.json()["url"], "/media/detections/crop.jpg")
+        self.assertEqual(response.json()["url_variants"], {"webp": "/media/detections/crop.webp"})
+
+    def test_benchmark_image_formats_command(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("benchmark_image_formats", project=self.project.pk, images=2, stdout=out)
+        self.assertRegex(out.getvalue(), r"small +webp +2 ")
+
+    def test_make_thumbnails_decodes_jpeg_at_reduced_scale(self):
+        from PIL import JpegImagePlugin
+
+        from ami.utils.media import make_thumbnails
+
+        buffer = BytesIO()
+        Image.new("RGB", (4096, 2160), (10, 120, 30)).save(buffer, format="JPEG")
+        decoded_sizes = []
+        original_load = JpegImagePlugin.JpegImageFile.load
+
+        def load(img):
+            if img.tile:  # Not decoded yet
+                decoded_sizes.append(img.size)
+            return original_load(img)
+
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, "load", load):
+            thumbnails = make_thumbnails(buffer.getvalue(), {"small": {"width": 240}, "medium": {"width": 1024}})
+
+        # One decode, at 1/4 scale: the largest scale-down that still covers 1024px wide
+        self.assertEqual(decoded_sizes, [(1024, 540)])
+        self.assertEqual(thumbnails["medium"].height, 540)
+        self.assertEqual(thumbnails["small"].height, 126)
+        self.assertEqual(Image.open(BytesIO(thumbnails["small"].content)).size[1], 126)
+
+
+class TestChartRollups(TestCase):
+    def setUp(self) -> None:
+        from django.core.cache import cache
+
+        self.project, self.deployment = setup_test_project(reuse=False)
+        taxa = list(create_taxa(self.project).taxa.all())
+        self.low_taxon, self.high_taxon = taxa[0], taxa[1]
+        create_captures(deployment=self.deployment, num_nights=2, images_per_night=4, interval_minutes=40)
+        create_occurrences(deployment=self.deployment, num=3, determination_score=0.3, taxon=self.low_taxon)
+        create_occurrences(deployment=self.deployment, num=5, determination_score=0.9, taxon=self.high_taxon)
+        self.project.default_filters_score_threshold = 0.6
+        self.project.save()
+        cache.delete(f"chart_rollups:queued:{self.deployment.pk}")
+        return super().setUp()
+
+    def _chart_points(self, chart: dict) -> dict:
+        return {x: y for x, y in zip(chart["data"]["x"], chart["data"]["y"]) if y}
+
+    def _assert_charts_match_raw_tables(self, occurrence_q: models.Q, request: Request | None = None):
+        """Compare the charts to the same aggregates of the raw tables, which they used to query."""
+        pk = self.project.pk
+        captures = SourceImage.objects.filter(project=self.project).exclude(timestamp=None)
+        occurrences = Occurrence.objects.filter(occurrence_q, project=self.project).exclude(event__start=None)
+        detections = Detection.objects.filter(occurrence__in=occurrences).exclude(source_image__timestamp=None)
+
+        def month(number: int) -> str:
+            return datetime.date(3000, number, 1).strftime("%b")
+
+        def hourly_average(counts) -> dict:
+            by_hour = collections.defaultdict(list)
+            for (_, hour), count in counts.items():
+                by_hour[datetime.datetime.strptime(str(hour), "%H").strftime("%-I:00 %p")].append(count)
+            return {hour: round(sum(c) / len(c), 0) for hour, c in by_hour.items()}
+
+        def count_by(qs, *fields, count=models.Count("pk")) -> dict:
+            rows = qs.values_list(*fields).annotate(count=count).order_by()
+            return {row[:-1] if len(fields) > 1 else row[0]: row[-1] for row in rows}
+
+        self.assertEqual(
+            self._chart_points(charts.captures_per_hour(pk)),
+            hourly_average(count_by(captures, "timestamp__date", "timestamp__hour")),
+        )
+        self.assertEqual(
+            self._chart_points(charts.captures_per_day(pk)),
+            {f"{d:%b %d}": n for d, n in count_by(captures, "timestamp__date").items()},
+        )
+        self.assertEqual(
+            self._chart_points(charts.captures_per_month(pk)),
+            {month(m): n for m, n in count_by(captures, "timestamp__month").items()},
+        )
+        self.assertEqual(
+            self._chart_points(charts.detections_per_hour(pk, request=request)),
+            hourly_average(count_by(detections, "source_image__timestamp__date", "source_image__timestamp__hour")),
+        )
+        self.assertEqual(
+            self._chart_points(charts.average_occurrences_per_day(pk, request=request)),
+            {f"{d:%b %d}": n for d, n in count_by(occurrences, "event__start__date").items()},
+        )
+        self.assertEqual(
+            self._chart_points(charts.unique_species_per_month(pk, request=request)),
+            {
+                month(m): n
+                for m, n in count_by(
+                    occurrences, "event__start__month", count=models.Count("determination", distinct=True)
+                ).items()
+            },
+        )
+        top_taxa = charts.project_top_taxa(pk, request=request)["data"]
+        self.assertEqual(
+            {name: n for name, n in zip(top_taxa["y"], top_taxa["x"]) if n},
+            count_by(occurrences, "determination__name"),
+        )
+
+    def test_charts_match_raw_tables(self):
+        request = Request(APIRequestFactory().get("/", {"apply_defaults": "false"}))
+        # Without rollups the charts fall back to the raw tables; with them they read the rollups
+        for rollups in (False, True):
+            with self.subTest(rollups=rollups):
+                if rollups:
+                    refresh_chart_rollups(self.deployment)
+                self._assert_charts_match_raw_tables(models.Q(determination_score__gte=0.6))
+                self._assert_charts_match_raw_tables(models.Q(), request=request)
+
+    def test_charts_without_rollups_queue_them(self):
+        with mock.patch("ami.tasks.refresh_deployment_chart_rollups.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                chart = charts.captures_per_day(self.project.pk)
+        mock_delay.assert_called_once_with(deployment_id=self.deployment.pk)
+        self.assertEqual(sum(chart["data"]["y"]), SourceImage.objects.filter(project=self.project).count())
+
+    def test_backfill_queues_deployments_without_rollups(self):
+        other_deployment = Deployment.objects.create(name="Deployment with rollups", project=self.project)
+        refresh_chart_rollups(other_deployment)
+
+        with mock.patch("ami.tasks.refresh_deployment_chart_rollups.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                ami.tasks.backfill_chart_rollups()
+        queued = {call.kwargs["deployment_id"] for call in mock_delay.call_args_list}
+        self.assertIn(self.deployment.pk, queued)
+        self.assertNotIn(other_deployment.pk, queued)
+
+    def test_charts_read_only_rollups(self):
+        refresh_chart_rollups(self.deployment)
+
+        with CaptureQueriesContext(connection) as context:
+            self.project.summary_data()
+        raw_tables = {"main_sourceimage", "main_detection", "main_occurrence"}
+        for query in context.captured_queries:
+            self.assertFalse(
+                any(f'"{table}"' in query["sql"] for table in raw_tables), f"Chart queried a raw table: {query['sql']}"
+            )
+
+    def test_exclude_taxa_filter_applies_to_rollups(self):
+        self.project.default_filters_score_threshold = 0.0
+        self.project.save()
+        self.project.default_filters_exclude_taxa.add(self.high_taxon)
+        refresh_chart_rollups(self.deployment)
+
+        chart = charts.project_top_taxa(self.project.pk)
+        counts = dict(zip(chart["data"]["y"], chart["data"]["x"]))
+        self.assertEqual(counts[self.low_taxon.name], 3)
+        self.assertEqual(counts[self.high_taxon.name], 0)
+
+    def test_identification_refreshes_rollups(self):
+        refresh_chart_rollups(self.deployment)
+        occurrence = Occurrence.objects.filter(project=self.project, determination=self.high_taxon).first()
+        assert occurrence
+        user = User.objects.create_user(email="chart-identifier@insectai.org")
+
+        with mock.patch("ami.tasks.refresh_deployment_chart_rollups.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                Identification.objects.create(occurrence=occurrence, taxon=self.low_taxon, user=user)
+        mock_delay.assert_called_once_with(deployment_id=self.deployment.pk)
+
+        ami.tasks.refresh_deployment_chart_rollups(self.deployment.pk)
+        chart = charts.project_top_taxa(self.project.pk)
+        counts = dict(zip(chart["data"]["y"], chart["data"]["x"]))
+        self.assertEqual(counts[self.high_taxon.name], 4)
+
+    def test_rebuild_that_read_older_data_is_discarded(self):
+        from ami.main.models import ChartHourlyRollup
+
+        # A rebuild that started later has already written its rollups
+        later = timezone.now() + datetime.timedelta(minutes=1)
+        Deployment.objects.filter(pk=self.deployment.pk).update(chart_rollups_updated_at=later)
+
+        refresh_chart_rollups(self.deployment)
+
+        self.deployment.refresh_from_db()
+        self.assertEqual(self.deployment.chart_rollups_updated_at, later)
+        self.assertFalse(ChartHourlyRollup.objects.filter(deployment=self.deployment).exists())
+
+    def test_deployment_changes_queue_one_refresh(self):
+        with mock.patch("ami.tasks.refresh_deployment_chart_rollups.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.deployment.update_calculated_fields(save=True)
+                self.deployment.update_calculated_fields(save=True)
+        mock_delay.assert_called_once_with(deployment_id=self.deployment.pk)
+
+
+class TestProjectSummaryCache(APITestCase):
+    def setUp(self) -> None:
+        self.project, self.deployment = setup_test_project(reuse=False)
+        create_taxa(self.project)
+        create_captures(deployment=self.deployment, num_nights=1, images_per_night=3)
+        create_occurrences(deployment=self.deployment, num=3)
+        self.url = f"/api/v2/status/summary/?project_id={self.project.pk}"
+        return super().setUp()
+
+    def _get_summary(self) -> dict:
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_summary_is_cached_until_data_version_changes(self):
+        self._get_summary()
+        SourceImage.objects.filter(deployment=self.deployment).delete()
+        with CaptureQueriesContext(connection) as context:
+            cached = self._get_summary()
+        self.assertEqual(cached["captures_count"], 3)
+        self.assertFalse(any('"main_sourceimage"' in query["sql"] for query in context.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deployment.update_calculated_fields(save=True)
+        self.assertEqual(self._get_summary()["captures_count"], 0)
+
+    def test_identification_bumps_data_version(self):
+        version = get_project_data_version(self.project.pk)
+        occurrence = Occurrence.objects.filter(project=self.project).first()
+        assert occurrence
+        user = User.objects.create_user(email="summary-identifier@insectai.org")
+        with self.captureOnCommitCallbacks(execute=True):
+            Identification.objects.create(occurrence=occurrence, taxon=occurrence.determination, user=user)
+        self.assertGreater(get_project_data_version(self.project.pk), version)
+
+    def test_default_filter_change_bumps_data_version(self):
+        version = get_project_data_version(self.project.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.default_filters_score_threshold = 0.95
+            self.project.save()
+        self.assertGreater(get_project_data_version(self.project.pk), version)
+        self.assertEqual(self._get_summary()["occurrences_count"], 0)
+
+    @override_settings(PROJECT_SUMMARY_REWARM_AFTER_JOBS=True)
+    def test_finished_job_rewarms_summary(self):
+        from django.core.cache import cache
+
+        from ami.main.tasks import warm_project_summary
+
+        cache.delete(f"projects:summary_rewarm_queued:{self.project.pk}")
+        job = Job.objects.create(project=self.project, name="Test job", job_type_key="ml")
+        with mock.patch("ami.main.tasks.warm_project_summary.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                job.update_status(JobState.SUCCESS)
+        mock_delay.assert_called_once_with(self.project.pk)
+
+        warm_project_summary(self.project.pk)
+        with CaptureQueriesContext(connection) as context:
+            self._get_summary()
+        self.assertFalse(any('"main_occurrence"' in query["sql"] for query in context.captured_queries))
+
+
 class TestThumbnailDraftProjectVisibility(APITestCase):
     """PR #1306 follow-up: draft (non-public) projects must not route thumbnails
     through the auth-gated thumbnail endpoint.
@@ -1328,6 +1734,43 @@ class TestEvents(TestCase):
             self.assertEqual(event.occurrences_count, event.get_occurrences_count())
             self.assertGreater(event.calculated_fields_updated_at, last_updated)  # type: ignore
 
+    def test_event_timeline(self):
+        from ami.main.models import Detection
+
+        event = self.deployment.events.order_by("start").first()
+        captures = list(event.captures.order_by("timestamp"))
+        SourceImage.objects.filter(event=event).update(detections_count=0)
+        for capture, count in zip(captures, [3, 3, 0, 2, None]):
+            SourceImage.objects.filter(pk=capture.pk).update(detections_count=count)
+        # Counted on the fly, as its detections_count isn't cached
+        Detection.objects.create(source_image=captures[4], bbox=[0, 0, 10, 10])
+
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f"/api/v2/events/{event.pk}/timeline/", {"resolution_minutes": 15})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q["sql"] for q in queries.captured_queries if q["sql"].startswith("UPDATE")])
+
+        # Captures are 10 minutes apart, so the intervals hold 2, 2 and 1 of them
+        data = response.json()
+        self.assertEqual(data["meta"]["total_intervals"], 3)
+        self.assertEqual(data["meta"]["total_detections"], 9)
+        self.assertEqual(data["meta"]["max_detections"], 3)
+        intervals = data["data"]
+        self.assertEqual([interval["captures_count"] for interval in intervals], [2, 2, 1])
+        self.assertEqual([interval["detections_count"] for interval in intervals], [6, 2, 1])
+        self.assertEqual([interval["detections_avg"] for interval in intervals], [3, 2, 1])
+        self.assertEqual([interval["was_processed"] for interval in intervals], [False, False, True])
+        self.assertEqual(
+            [interval["first_capture"]["id"] for interval in intervals],
+            [captures[0].pk, captures[2].pk, captures[4].pk],
+        )
+        # The last capture with the most detections
+        self.assertEqual(
+            [interval["top_capture"]["id"] for interval in intervals],
+            [captures[1].pk, captures[3].pk, captures[4].pk],
+        )
+
 
 class TestDuplicateFieldsOnChildren(TestCase):
     def setUp(self) -> None:
@@ -1705,6 +2148,59 @@ class TestTaxonomy(TestCase):
         for taxon in Taxon.objects.exclude(parent=None):
             self._test_parents_json(taxon)
 
+    def test_update_all_parents_matches_update_parents(self):
+        expected = {taxon.pk: taxon.update_parents(save=False) for taxon in Taxon.objects.all()}
+        Taxon.objects.all().update(parents_json=[])
+
+        Taxon.objects.update_all_parents()
+
+        self.assertEqual({taxon.pk: taxon.parents_json for taxon in Taxon.objects.all()}, expected)
+
+    def test_update_subtree_parents(self):
+        genus = Taxon.objects.get(name="Vanessa")
+        other_family = Taxon.objects.create(name="Pieridae", parent=genus.parent.parent, rank=TaxonRank.FAMILY.name)
+        genus.parent = other_family
+        genus.save(update_calculated_fields=False)
+        species = list(Taxon.objects.filter(parent=genus))
+
+        # One UPDATE for the whole subtree, however many taxa are below
+        with self.assertNumQueries(8):
+            self.assertEqual(Taxon.objects.update_subtree_parents([genus]), 1 + len(species))
+
+        for taxon in [genus, *species]:
+            taxon.refresh_from_db()
+            self._test_parents_json(taxon)
+            self.assertIn(other_family.pk, [parent.id for parent in taxon.parents_json])
+
+    def _closure_ancestors(self, taxon: Taxon) -> set[int]:
+        return set(TaxonClosure.objects.filter(descendant=taxon, depth__gt=0).values_list("ancestor_id", flat=True))
+
+    def test_closure_follows_parent_changes(self):
+        family = Taxon.objects.get(name="Nymphalidae")
+        genus = Taxon.objects.get(name="Vanessa")
+        species = list(Taxon.objects.filter(parent=genus))
+        for taxon in [family, genus, *species]:
+            taxon.refresh_from_db()
+            self.assertEqual(self._closure_ancestors(taxon), {parent.id for parent in taxon.parents_json})
+
+        other_family = Taxon.objects.create(name="Pieridae", parent=family.parent, rank=TaxonRank.FAMILY.name)
+        genus.parent = other_family
+        genus.save()
+
+        for taxon in species:
+            self.assertEqual(self._closure_ancestors(taxon), {family.parent_id, other_family.pk, genus.pk})
+        self.assertEqual(set(Taxon.objects.filter(id__in=TaxonClosure.objects.descendant_ids([family]))), {family})
+        self.assertEqual(
+            set(Taxon.objects.filter(id__in=TaxonClosure.objects.descendant_ids([other_family]))),
+            {other_family, genus, *species},
+        )
+        self.assertEqual(other_family.num_children_recursive(), 1 + len(species))
+
+        # A full rebuild gives the same rows
+        rows = set(TaxonClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+        Taxon.objects.update_all_parents()
+        self.assertEqual(set(TaxonClosure.objects.values_list("ancestor_id", "descendant_id", "depth")), rows)
+
     def _test_parents_json(self, taxon):
         from ami.main.models import TaxonParent, TaxonRank
 
@@ -1892,6 +2388,125 @@ class TestTaxonomyViews(TestCase):
                 self.assertEqual(occurrence_count_total, occurrence_count_direct)
 
 
+@override_settings(TAXON_SUGGEST_INDEX=True)
+class TestTaxonSuggestions(APITestCase):
+    def setUp(self) -> None:
+        from ami.main.models_future import taxon_suggestions
+
+        self.project, _ = setup_test_project(reuse=False)
+        create_taxa(self.project)
+        Taxon.objects.filter(name="Vanessa cardui").update(search_names=["Painted Lady", "Cosmopolitan"])
+        Taxon.objects.filter(name="Vanessa atalanta").update(search_names=[])
+        # The index of another test's taxa may have the same version
+        taxon_suggestions._index = None
+        taxon_suggestions._rebuild = None
+        return super().setUp()
+
+    def _suggest(self, query: str) -> list[str]:
+        response = self.client.get("/api/v2/taxa/suggest/", {"q": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [taxon["name"] for taxon in response.json()]
+
+    def test_index_matches_sql(self):
+        from ami.main.models_future.taxon_suggestions import TaxonSuggestionIndex, suggest_taxa_sql
+
+        index = TaxonSuggestionIndex(Taxon.objects.filter(active=True).values_list("id", "name", "search_names"))
+        for query in ["vanessa", "Vanessa CA", "lady", "an", "ae", "polit", "nothing like it"]:
+            expected = {taxon.pk: taxon.similarity for taxon in suggest_taxa_sql(query, limit=100)}
+            results = dict(index.search(query, limit=100))
+            self.assertEqual(results.keys(), expected.keys(), query)
+            for taxon_id, similarity in results.items():
+                self.assertAlmostEqual(similarity, expected[taxon_id], places=5, msg=query)
+
+    def test_suggest_is_served_from_index(self):
+        from ami.main.models_future.taxon_suggestions import get_suggestion_index
+
+        # Falls back to SQL while the index is built in the background
+        with mock.patch("ami.main.models_future.taxon_suggestions.threading.Thread") as mock_thread:
+            self.assertEqual(self._suggest("cardui"), ["Vanessa cardui"])
+        mock_thread.return_value.start.assert_called_once()
+
+        self.assertIsNotNone(get_suggestion_index(wait=True))
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self._suggest("lady"), ["Vanessa cardui"])
+        self.assertFalse(any("SIMILARITY" in query["sql"].upper() for query in context.captured_queries))
+
+    def test_index_is_rebuilt_when_taxa_change(self):
+        from ami.main.models_future.taxon_suggestions import get_suggestion_index
+
+        index = get_suggestion_index(wait=True)
+        assert index
+        self.assertEqual(index.search("kershawi", limit=10), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            taxon = Taxon.objects.create(
+                name="Vanessa kershawi", parent=Taxon.objects.get(name="Vanessa"), rank=TaxonRank.SPECIES.name
+            )
+        index = get_suggestion_index(wait=True)
+        assert index
+        self.assertEqual([taxon_id for taxon_id, _ in index.search("kershawi", limit=10)], [taxon.pk])
+        self.assertEqual(self._suggest("kershawi"), ["Vanessa kershawi"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            taxon.delete()
+        self.assertEqual(get_suggestion_index(wait=True).search("kershawi", limit=10), [])  # type: ignore
+
+
+class TestTaxaTreeCache(APITestCase):
+    def setUp(self) -> None:
+        self.project, _ = setup_test_project(reuse=False)
+        # Bumps the taxa version, so trees cached by other tests aren't served
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taxa_list = create_taxa(self.project)
+        return super().setUp()
+
+    def _tree_names(self, node: dict) -> list[str]:
+        return [node["name"]] + [name for child in node["children"] for name in self._tree_names(child)]
+
+    def test_tree_is_cached_until_taxa_change(self):
+        from ami.main.models_future.taxonomy import cached_taxa_tree
+
+        tree = cached_taxa_tree()
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_taxa_tree(), tree)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            taxon = Taxon.objects.get(name="Vanessa itea")
+            taxon.name = "Vanessa kershawi"
+            taxon.save()
+        changed = cached_taxa_tree()
+        self.assertNotEqual(changed["hash"], tree["hash"])
+        self.assertIn("Vanessa kershawi", self._tree_names(changed["tree"]))
+        self.assertNotIn("Vanessa itea", self._tree_names(changed["tree"]))
+
+    def test_taxa_list_tree_follows_its_taxa(self):
+        from ami.main.models_future.taxonomy import cached_taxa_tree
+
+        self.assertNotIn("Vanessa cardui", self._tree_names(cached_taxa_tree(self.taxa_list)["tree"]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taxa_list.taxa.add(Taxon.objects.get(name="Vanessa cardui"))
+        self.assertIn("Vanessa cardui", self._tree_names(cached_taxa_tree(self.taxa_list)["tree"]))
+
+    def test_taxonomy_endpoint_etag(self):
+        url = "/api/v2/labelstudio/config/taxonomy/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('value="Nymphalidae"', response.content.decode())
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Taxon.objects.create(
+                name="Pieridae", parent=Taxon.objects.get(name="Lepidoptera"), rank=TaxonRank.FAMILY.name
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn('value="Pieridae"', response.content.decode())
+
+
 class TestIdentification(APITestCase):
     def setUp(self) -> None:
         project, deployment = setup_test_project()
@@ -2067,6 +2682,23 @@ class TestProjectSettingsFiltering(APITestCase):
         response_source_image_collection_ids = {result.get("id") for result in response_data["results"]}
         self.assertEqual(response_source_image_collection_ids, expected_project_collection_ids)
 
+    def test_project_collections_unprocessed_count(self):
+        project_id = self.project_ids[1]
+        pipeline = Pipeline.objects.create(name="Unprocessed count pipeline")
+        pipeline.algorithms.add(Algorithm.objects.create(name="Unprocessed count detector", task_type="localization"))
+        endpoint_url = f"/api/v2/captures/collections/?project_id={project_id}"
+
+        response_data = self.client.get(endpoint_url).json()
+        self.assertTrue(all("source_images_unprocessed_count" not in result for result in response_data["results"]))
+
+        response_data = self.client.get(f"{endpoint_url}&pipeline={pipeline.pk}").json()
+        self.assertTrue(response_data["results"])
+        for result in response_data["results"]:
+            self.assertEqual(result["source_images_unprocessed_count"], result["source_images_count"])
+
+        response = self.client.get(f"{endpoint_url}&pipeline=999999")
+        self.assertEqual(response.status_code, 404)
+
     def test_project_pipelines(self):
         project_id = self.project_ids[0]
         project = Project.objects.get(pk=project_id)
@@ -2949,6 +3581,18 @@ class TestDeploymentSyncCreatesEvents(TestCase):
         )
         logger.info(f"Initial events count: {initial_events_count}, Updated events count: {updated_events.count()}")
 
+    def test_sync_queues_thumbnail_generation(self):
+        project, deployment = setup_test_project(reuse=False)
+        assert deployment.data_source is not None
+        populate_bucket(
+            config=deployment.data_source.config, subdir=f"deployment_{deployment.pk}", skip_existing=False
+        )
+
+        with mock.patch("ami.tasks.generate_thumbnails.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                deployment.sync_captures()
+        mock_delay.assert_called_once_with(deployment_id=deployment.pk)
+
 
 class TestDeploymentSyncAll(APITestCase):
     """
@@ -4005,6 +4649,21 @@ class TestOccurrenceListQueryCount(APITestCase):
             f"Query count grew with page size: {small_count} -> {large_count} (likely N+1 regression)",
         )
 
+    def test_list_resolves_project_permissions_once(self):
+        """Every row (and nested object) shares the user's permissions on the project."""
+        import ami.base.models
+
+        create_occurrences(deployment=self.deployment, num=25, determination_score=0.9)
+
+        with mock.patch.object(ami.base.models, "get_perms", wraps=ami.base.models.get_perms) as get_perms:
+            self._list_occurrences(limit=25)
+        self.assertEqual(get_perms.call_count, 1)
+
+        # Nothing is shared between requests
+        with mock.patch.object(ami.base.models, "get_perms", wraps=ami.base.models.get_perms) as get_perms:
+            self._list_occurrences(limit=25)
+        self.assertEqual(get_perms.call_count, 1)
+
 
 class TestOccurrenceDetailQueryCount(APITestCase):
     """Guard against N+1 regressions on the detail endpoint.
@@ -4261,6 +4920,119 @@ class TestSourceImageListQueryCount(APITestCase):
 
 
 @override_settings(CACHALOT_ENABLED=False)
+class TestKeysetPagination(APITestCase):
+    def setUp(self):
+        self.project, self.deployment = setup_test_project()
+        self.captures = create_captures(deployment=self.deployment, num_nights=1, images_per_night=12)
+        self.user = User.objects.create_user(email="keyset@insectai.org", is_staff=False, is_superuser=False)
+        self.client.force_authenticate(user=self.user)
+
+    def _follow_pages(self, url: str) -> list[dict]:
+        rows = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertIsNone(res.data["previous"])
+            self.assertLessEqual(len(res.data["results"]), 5)
+            rows += res.data["results"]
+            url = res.data["next"]
+        return rows
+
+    def test_pages_follow_ordering(self):
+        url = f"/api/v2/captures/?project_id={self.project.pk}&ordering=-timestamp&limit=5&cursor="
+        first_page = self.client.get(url).data
+        self.assertEqual(first_page["count"], 12)
+        self.assertFalse(first_page["count_is_approximate"])
+        self.assertIn("user_permissions", first_page)
+
+        rows = self._follow_pages(url)
+        expected = SourceImage.objects.filter(project=self.project).order_by("-timestamp", "-pk")
+        self.assertEqual([row["id"] for row in rows], list(expected.values_list("pk", flat=True)))
+
+    def test_pages_with_ties_and_nulls(self):
+        counts = [3, 3, 3, None, 1, 1, None, 0, 3, None, 2, 1]
+        for capture, count in zip(self.captures, counts):
+            SourceImage.objects.filter(pk=capture.pk).update(detections_count=count)
+
+        for ordering in ["detections_count", "-detections_count"]:
+            url = f"/api/v2/captures/?project_id={self.project.pk}&ordering={ordering}&limit=5&cursor="
+            rows = self._follow_pages(url)
+            self.assertEqual(sorted(row["id"] for row in rows), sorted(capture.pk for capture in self.captures))
+            values = [row["detections_count"] for row in rows]
+            non_null = [value for value in values if value is not None]
+            # Nulls come last in either direction
+            self.assertEqual(values, non_null + [None] * 3)
+            self.assertEqual(non_null, sorted(non_null, reverse=ordering.startswith("-")))
+
+    def test_estimated_count(self):
+        from django.core.cache import caches
+
+        from ami.base.pagination import KeysetPaginationWithPermissions
+
+        with mock.patch.object(KeysetPaginationWithPermissions, "exact_count_limit", 10):
+            for params in ["limit=5&cursor=", "limit=5&offset=5"]:
+                caches["default"].clear()
+                res = self.client.get(f"/api/v2/captures/?project_id={self.project.pk}&{params}")
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertGreater(res.data["count"], 10)
+                self.assertTrue(res.data["count_is_approximate"])
+
+        caches["default"].clear()
+        res = self.client.get(f"/api/v2/captures/?project_id={self.project.pk}&limit=5&offset=5")
+        self.assertEqual(res.data["count"], 12)
+        self.assertFalse(res.data["count_is_approximate"])
+
+    def test_offset_pages_with_low_estimated_count(self):
+        from django.core.cache import caches
+
+        from ami.base.pagination import KeysetPaginationWithPermissions
+
+        caches["default"].clear()
+        # The planner estimates fewer rows than there are
+        with mock.patch.object(KeysetPaginationWithPermissions, "exact_count_limit", 4), mock.patch.object(
+            KeysetPaginationWithPermissions, "estimate_count", return_value=5
+        ):
+            url = f"/api/v2/captures/?project_id={self.project.pk}&ordering=timestamp&limit=5"
+            rows = []
+            while url:
+                res = self.client.get(url)
+                self.assertTrue(res.data["count_is_approximate"])
+                rows += res.data["results"]
+                url = res.data["next"]
+        self.assertEqual(sorted(row["id"] for row in rows), sorted(capture.pk for capture in self.captures))
+
+    def test_counts_cached_per_data_version(self):
+        from cachalot.api import cachalot_disabled
+        from django.core.cache import caches
+
+        def count_queries(url: str) -> int:
+            with cachalot_disabled(), CaptureQueriesContext(connection) as queries:
+                res = self.client.get(url)
+            self.assertEqual(res.data["count"], 12)
+            return len([q for q in queries.captured_queries if "COUNT(" in q["sql"]])
+
+        url = f"/api/v2/captures/?project_id={self.project.pk}&limit=5"
+        caches["default"].clear()
+        counted = count_queries(url)
+        self.assertEqual(count_queries(url + "&offset=5"), counted - 1)
+        # Other filters are counted separately
+        self.assertEqual(count_queries(url + f"&deployment={self.deployment.pk}"), counted)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_project_data_version([self.project.pk])
+        self.assertEqual(count_queries(url), counted)
+
+    def test_invalid_cursor(self):
+        url = f"/api/v2/captures/?project_id={self.project.pk}&ordering=timestamp&limit=5&cursor="
+        next_url = self.client.get(url).data["next"]
+        self.assertEqual(self.client.get(next_url).status_code, status.HTTP_200_OK)
+        # A cursor from another ordering
+        res = self.client.get(next_url.replace("ordering=timestamp", "ordering=-timestamp"))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        res = self.client.get(url + "not-a-cursor")
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class TestTaxonListQueryCount(APITestCase):
     """Audit TaxonViewSet.list for N+1 (follow-up to PR #1274, task #9/#15).
 
@@ -6788,6 +7560,18 @@ class TestCleanupNullOnlyOccurrencesCommand(TestCase):
             "SET_NULL it and strand the detection",
         )
 
+    def test_commit_removes_cleaned_images_from_processed_image_index(self):
+        from ami.ml.models import Pipeline, ProcessedImage
+
+        pipeline = Pipeline.objects.create(name="Cleanup pipeline")
+        for image in (self.img_with_real, self.img_only_null):
+            ProcessedImage.objects.create(source_image=image, pipeline=pipeline, algorithm_ids=[self.algorithm.pk])
+
+        self._call_command(f"--project={self.project.pk}", "--commit")
+
+        indexed = ProcessedImage.objects.values_list("source_image_id", flat=True)
+        self.assertEqual(list(indexed), [self.img_with_real.pk])
+
     def test_commit_is_idempotent(self):
         self._call_command(f"--project={self.project.pk}", "--commit")
         second_run = self._call_command(f"--project={self.project.pk}", "--commit")
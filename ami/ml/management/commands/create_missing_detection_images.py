@@ -1,8 +1,19 @@
+import concurrent.futures
+import io
+import time
+
+import numpy as np
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from PIL import Image
 from tqdm import tqdm
 
 from ami.main.models import SourceImage
-from ami.ml.media import create_detection_images_from_source_image, get_source_images_with_missing_detection_images
+from ami.ml.media import (
+    create_detection_images_for_source_images,
+    crop_and_encode,
+    get_source_images_with_missing_detection_images,
+)
 
 
 class Command(BaseCommand):
@@ -11,12 +22,32 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--project", type=int, help="Project ID to process")
         parser.add_argument("--batch-size", type=int, default=100, help="Batch size for processing")
+        parser.add_argument(
+            "--crop-threads",
+            type=int,
+            help="Threads cropping images (default: settings.DETECTION_IMAGES_CROP_THREADS)",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            help="Threads fetching and uploading images (default: settings.DETECTION_IMAGES_IO_THREADS)",
+        )
+        parser.add_argument(
+            "--benchmark",
+            type=int,
+            metavar="IMAGES",
+            help="Instead, measure crop throughput on this many synthetic images, one thread vs. the pool",
+        )
 
     def handle(self, *args, **options):
+        if options["benchmark"]:
+            self._benchmark(options["benchmark"], options["crop_threads"] or settings.DETECTION_IMAGES_CROP_THREADS)
+            return
+
         project_id = options["project"]
         batch_size = options["batch_size"]
 
-        queryset = SourceImage.objects.all()
+        queryset = SourceImage.objects.select_related("deployment__data_source")
         if project_id:
             queryset = queryset.filter(project_id=project_id)
 
@@ -25,29 +56,25 @@ class Command(BaseCommand):
 
         processed_images = 0
         processed_detections = 0
-        errors: list[tuple[SourceImage, str]] = []
+        errors: list[tuple[int, str]] = []
 
         with tqdm(total=total_images, desc="Processing images", unit="img") as pbar:
             while True:
                 # Exclude images that have known errors
-                queryset = queryset.exclude(id__in=[source_image.pk for source_image, _ in errors])
-                batch = get_source_images_with_missing_detection_images(queryset, batch_size)
+                queryset = queryset.exclude(id__in={source_image_id for source_image_id, _ in errors})
+                batch = list(get_source_images_with_missing_detection_images(queryset, batch_size))
                 if not batch:
                     break
 
-                for source_image in batch:
-                    try:
-                        processed_paths = create_detection_images_from_source_image(source_image)
-                        processed_detections += len(processed_paths)
-                        processed_images += 1
-                    except Exception as e:
-                        error_message = (
-                            f"Error processing image {source_image} from project '{source_image.project}': {str(e)}"
-                        )
-                        self.stderr.write(error_message)
-                        errors.append((source_image, error_message))
-                    finally:
-                        pbar.update(1)
+                result = create_detection_images_for_source_images(
+                    batch, crop_threads=options["crop_threads"], io_threads=options["threads"]
+                )
+                for source_image_id, error_message in result.errors:
+                    self.stderr.write(f"Error processing image #{source_image_id}: {error_message}")
+                errors.extend(result.errors)
+                processed_detections += len(result.paths)
+                processed_images += len(batch) - len({source_image_id for source_image_id, _ in result.errors})
+                pbar.update(len(batch))
 
                 self.stdout.write(
                     f"Processed {processed_images}/{total_images} images, {processed_detections} detections"
@@ -61,5 +88,41 @@ class Command(BaseCommand):
 
         if errors:
             self.stdout.write(self.style.WARNING(f"Encountered {len(errors)} errors:"))
-            for source_image, error_message in errors:
-                self.stdout.write(f"  - {error_message}")
+            for source_image_id, error_message in errors:
+                self.stdout.write(f"  - #{source_image_id}: {error_message}")
+
+    def _benchmark(self, image_count: int, threads: int, detections_per_image: int = 20):
+        """Crop synthetic camera-trap-sized images, without touching the database or storage."""
+        rng = np.random.default_rng(0)
+        height, width = 2160, 4096
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        image_content = buffer.getvalue()
+        bboxes = []
+        for detection_id in range(detections_per_image):
+            x1, y1 = int(rng.integers(0, width - 400)), int(rng.integers(0, height - 400))
+            bboxes.append((detection_id, (x1, y1, x1 + int(rng.integers(50, 400)), y1 + int(rng.integers(50, 400)))))
+
+        self.stdout.write(
+            f"Cropping {detections_per_image} detections from each of {image_count} synthetic "
+            f"{width}x{height} JPEG images"
+        )
+
+        start = time.time()
+        for _ in range(image_count):
+            crop_and_encode(image_content, bboxes)
+        serial_time = time.time() - start
+        self._report("1 thread", image_count, detections_per_image, serial_time)
+
+        start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            list(pool.map(crop_and_encode, [image_content] * image_count, [bboxes] * image_count))
+        pool_time = time.time() - start
+        self._report(f"{threads} threads", image_count, detections_per_image, pool_time)
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {serial_time / pool_time:.1f}x"))
+
+    def _report(self, label: str, image_count: int, detections_per_image: int, seconds: float):
+        self.stdout.write(
+            f"{label}: {image_count / seconds:.1f} images/s, "
+            f"{image_count * detections_per_image / seconds:.1f} crops/s ({seconds:.2f}s)"
+        )
@@ -0,0 +1,85 @@
+"""
+Management command to rebuild the index of images each pipeline has processed.
+
+save_results keeps the index up to date. This command adds results saved before
+the index existed, or fixes it after detections or classifications were deleted, by
+running the detection-based check of filter_processed_images over every image with
+detections from a pipeline's algorithms (see ami/ml/models/processed_image.py).
+Images that no longer pass the check leave the index; --clear also drops the entries
+of images left without any detections.
+
+Usage:
+    python manage.py rebuild_processed_image_index [--pipeline SLUG ...] [--project ID] [--clear]
+
+Examples:
+    python manage.py rebuild_processed_image_index
+    python manage.py rebuild_processed_image_index --pipeline moth-detector-global --clear
+"""
+
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+
+from ami.main.models import SourceImage
+from ami.ml.models import Pipeline
+from ami.ml.models.pipeline import FILTER_PROCESSED_BATCH_SIZE, filter_processed_images
+from ami.ml.models.processed_image import ProcessedImage, mark_images_processed
+
+
+class Command(BaseCommand):
+    help = "Rebuild the index of source images each pipeline has processed from their detections"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pipeline", action="append", dest="pipelines", help="Only rebuild the index of this pipeline (slug)"
+        )
+        parser.add_argument("--project", type=int, help="Only index source images of this project")
+        parser.add_argument(
+            "--clear", action="store_true", help="Delete the pipeline's existing index entries before rebuilding"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=FILTER_PROCESSED_BATCH_SIZE, help="Images checked per query"
+        )
+
+    def handle(self, *args, **options):
+        pipelines = Pipeline.objects.all()
+        if options["pipelines"]:
+            pipelines = pipelines.filter(slug__in=options["pipelines"])
+            missing = set(options["pipelines"]) - set(pipelines.values_list("slug", flat=True))
+            if missing:
+                raise CommandError(f"Pipeline(s) not found: {', '.join(sorted(missing))}")
+
+        for pipeline in pipelines:
+            self._rebuild(pipeline, options["project"], options["clear"], options["batch_size"])
+
+    def _rebuild(self, pipeline: Pipeline, project_id: int | None, clear: bool, batch_size: int):
+        images = SourceImage.objects.filter(detections__detection_algorithm__in=pipeline.algorithms.all())
+        if project_id:
+            images = images.filter(project_id=project_id)
+        if clear:
+            index = ProcessedImage.objects.filter(pipeline=pipeline)
+            if project_id:
+                index = index.filter(source_image__project_id=project_id)
+            deleted, _ = index.delete()
+            self.stdout.write(f"Deleted {deleted} index entries of pipeline {pipeline}")
+
+        image_ids = images.order_by("pk").values_list("pk", flat=True).distinct().iterator(chunk_size=batch_size)
+        total = images.values("pk").distinct().count()
+        indexed = 0
+        with tqdm(total=total, desc=f"Indexing {pipeline.slug}", unit="img") as pbar:
+            while batch_ids := list(itertools.islice(image_ids, batch_size)):
+                batch = [SourceImage(pk=image_id) for image_id in batch_ids]
+                unprocessed = {image.pk for image in filter_processed_images(batch, pipeline, batch_size=batch_size)}
+                processed = [image_id for image_id in batch_ids if image_id not in unprocessed]
+                if unprocessed:
+                    # E.g. some of their detections or classifications were deleted since
+                    ProcessedImage.objects.filter(pipeline=pipeline, source_image_id__in=unprocessed).delete()
+                if processed:
+                    mark_images_processed(processed, pipeline)
+                indexed += len(processed)
+                pbar.update(len(batch_ids))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {indexed} of {total} images with detections from pipeline {pipeline}")
+        )
@@ -0,0 +1,97 @@
+"""
+Management command to triage and replay dead letter queue messages for a job.
+
+Without --replay, lists the job's dead letters grouped by failure reason. With
+--replay, re-publishes them to the job's task queue (see
+ami/ml/orchestration/dead_letters.py).
+
+Usage:
+    python manage.py replay_dead_letters <job_id> [--replay] [--reason R ...] [--image-id ID ...]
+
+Examples:
+    python manage.py replay_dead_letters 123
+    python manage.py replay_dead_letters 123 --replay --reason max_deliveries_exceeded --rate 5
+    python manage.py replay_dead_letters 123 --replay --image-id 4567 --dry-run
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ami.jobs.models import Job
+from ami.ml.orchestration.dead_letters import replay_dead_letters, summarize_dead_letters
+
+
+class Command(BaseCommand):
+    help = "List a job's dead letters grouped by failure reason, or replay them to the job's task queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("job_id", type=int, help="Job ID whose dead letters to inspect or replay")
+        parser.add_argument("--replay", action="store_true", help="Re-publish the selected dead letters")
+        parser.add_argument(
+            "--reason", action="append", dest="reasons", help="Only replay dead letters with this failure reason"
+        )
+        parser.add_argument(
+            "--image-id", action="append", dest="image_ids", help="Only replay the dead letter of this image"
+        )
+        parser.add_argument("--limit", type=int, help="Replay at most this many dead letters")
+        parser.add_argument(
+            "--rate", type=float, help="Max tasks published per second (default: settings.NATS_DLQ_REPLAY_RATE)"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Show what would be replayed without publishing anything"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            job = Job.objects.get(pk=options["job_id"])
+        except Job.DoesNotExist:
+            raise CommandError(f"Job {options['job_id']} not found")
+
+        if not options["replay"]:
+            self._summarize(job)
+            return
+
+        try:
+            result = replay_dead_letters(
+                job,
+                reasons=options["reasons"],
+                image_ids=options["image_ids"],
+                limit=options["limit"],
+                max_per_second=options["rate"],
+                dry_run=options["dry_run"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"Failed to replay dead letters: {e}")
+
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(
+            f"{prefix}Matched {result['matched']} dead letter(s) for job {job.pk}: "
+            f"{result['unavailable']} no longer replayable"
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{prefix}Would replay {len(result['image_ids'])}: {result['image_ids']}")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Replayed {result['replayed']} task(s)"))
+        if result["failed"]:
+            self.stdout.write(self.style.WARNING(f"{result['failed']} task(s) failed to publish; run again to retry"))
+
+    def _summarize(self, job: Job):
+        try:
+            groups = summarize_dead_letters(job)
+        except Exception as e:
+            raise CommandError(f"Failed to read dead letters: {e}")
+
+        if not groups:
+            self.stdout.write(self.style.SUCCESS(f"No dead letters found for job {job.pk}"))
+            return
+
+        total = sum(group["count"] for group in groups)
+        self.stdout.write(self.style.WARNING(f"Found {total} dead letter(s) for job {job.pk}:"))
+        for group in groups:
+            self.stdout.write(
+                f"  {group['reason']}: {group['count']} "
+                f"({group['replayable']} replayable, {group['replayed']} already replayed)"
+            )
+            if group["image_ids"]:
+                self.stdout.write(f"    image IDs: {', '.join(group['image_ids'])}")
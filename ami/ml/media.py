@@ -1,15 +1,20 @@
+import collections
+import concurrent.futures
+import dataclasses
 import io
 import logging
 import os
+import typing
 
 import numpy as np
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.db.models import Exists, OuterRef, QuerySet
 from PIL import Image
 
 from ami.main.models import Detection, SourceImage
-from ami.utils.media import fetch_image_content
+from ami.utils.media import encode_image_variants, fetch_image_content, image_variant_formats
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +33,7 @@ def get_source_images_with_missing_detection_images(
 def load_source_image(source_image: SourceImage) -> np.ndarray:
     url = source_image.public_url(raise_errors=True)
     assert url
-    image_content = fetch_image_content(url)
+    image_content = fetch_image_content(url, version=source_image.content_version())
     image = Image.open(io.BytesIO(image_content))
     return np.array(image)
 
@@ -55,34 +60,177 @@ def crop_detection(image: np.ndarray, bbox: tuple[int, int, int, int]) -> Image.
     return img
 
 
-def save_crop(cropped_image: Image.Image, detection: Detection, source_image: SourceImage) -> str:
+def detection_image_path(detection: Detection, source_image: SourceImage, image_format: str = "jpg") -> str:
     source_basename = os.path.splitext(os.path.basename(source_image.path))[0]
-    image_name = f"{source_basename}_detection_{detection.pk}.jpg"
+    image_name = f"{source_basename}_detection_{detection.pk}.{image_format}"
     iso_day = detection.timestamp.date().isoformat() if detection.timestamp else "unknown_date"
-    assert source_image.project, "Source image must belong to a project"
-    image_path = f"detections/{source_image.project.pk}/{iso_day}/{image_name}"
+    assert source_image.project_id, "Source image must belong to a project"
+    return f"detections/{source_image.project_id}/{iso_day}/{image_name}"
+
 
+def encode_crop(cropped_image: Image.Image) -> bytes:
     img_byte_arr = io.BytesIO()
     cropped_image.save(img_byte_arr, format="JPEG")
-    img_byte_arr = img_byte_arr.getvalue()
+    return img_byte_arr.getvalue()
 
-    return default_storage.save(image_path, ContentFile(img_byte_arr))
+
+def save_crop(cropped_image: Image.Image, detection: Detection, source_image: SourceImage) -> str:
+    image_path = detection_image_path(detection, source_image)
+    return default_storage.save(image_path, ContentFile(encode_crop(cropped_image)))
+
+
+def crop_and_encode(
+    image_content: bytes,
+    bboxes: list[tuple[int, tuple[int, int, int, int]]],
+    variant_formats: typing.Sequence[str] = (),
+) -> list[tuple[int, bytes | None, dict[str, bytes], str | None]]:
+    """
+    Decode a source image once and return a JPEG crop of each detection's bounding box.
+
+    Runs in the crop thread pool; Pillow releases the GIL while it decodes and encodes, so
+    the threads crop in parallel. Returns ``(detection_id, jpeg_bytes, variants, error)``
+    per box, where ``variants`` has the crop encoded in each of ``variant_formats``.
+    """
+    image = np.array(Image.open(io.BytesIO(image_content)))
+    crops = []
+    for detection_id, bbox in bboxes:
+        try:
+            cropped_image = crop_detection(image, bbox)
+            variants = encode_image_variants(cropped_image, variant_formats)
+            crops.append((detection_id, encode_crop(cropped_image), variants, None))
+        except ValueError as e:
+            crops.append((detection_id, None, {}, str(e)))
+    return crops
+
+
+@dataclasses.dataclass
+class DetectionImagesResult:
+    paths: list[str] = dataclasses.field(default_factory=list)
+    # (source image ID, error message)
+    errors: list[tuple[int, str]] = dataclasses.field(default_factory=list)
+
+
+def create_detection_images_for_source_images(
+    source_images: typing.Iterable[SourceImage],
+    crop_threads: int | None = None,
+    io_threads: int | None = None,
+) -> DetectionImagesResult:
+    """
+    Crop, save and record the image of every detection of the source images that has none yet.
+
+    Each source image is fetched once, however many detections it has. Fetches and
+    uploads run concurrently in a pool of ``io_threads`` threads (default
+    ``settings.DETECTION_IMAGES_IO_THREADS``); decoding, cropping and encoding run in a
+    pool of ``crop_threads`` threads (default ``settings.DETECTION_IMAGES_CROP_THREADS``,
+    1 crops in the calling thread). The new paths are written back with a single ``bulk_update``.
+
+    Threads rather than processes, because this runs in Celery's prefork workers, which are
+    daemon processes and can't start processes of their own.
+
+    Each crop is also saved in the ``IMAGE_VARIANT_FORMATS`` (recorded in
+    ``Detection.image_variants``). A source image that can't be fetched, or a box that
+    can't be cropped, is recorded in ``errors`` and skipped; its detections stay without
+    a path so they are retried later.
+    """
+    crop_threads = settings.DETECTION_IMAGES_CROP_THREADS if crop_threads is None else crop_threads
+    io_threads = settings.DETECTION_IMAGES_IO_THREADS if io_threads is None else io_threads
+    source_images = {source_image.pk: source_image for source_image in source_images}
+    variant_formats = image_variant_formats()
+    result = DetectionImagesResult()
+
+    detections_by_image: dict[int, dict[int, Detection]] = collections.defaultdict(dict)
+    for detection in Detection.objects.filter(source_image_id__in=source_images.keys(), path__isnull=True).valid():
+        detections_by_image[detection.source_image_id][detection.pk] = detection
+    if not detections_by_image:
+        return result
+
+    def fetch(source_image: SourceImage) -> bytes:
+        url = source_image.public_url(raise_errors=True)
+        assert url
+        return fetch_image_content(url, version=source_image.content_version())
+
+    def upload(detection: Detection, content: bytes, variants: dict[str, bytes]) -> tuple[str, dict[str, str]]:
+        source_image = source_images[detection.source_image_id]
+        path = default_storage.save(detection_image_path(detection, source_image), ContentFile(content))
+        variant_paths = {
+            image_format: default_storage.save(
+                detection_image_path(detection, source_image, image_format), ContentFile(variant_content)
+            )
+            for image_format, variant_content in variants.items()
+        }
+        return path, variant_paths
+
+    crop_pool = (
+        concurrent.futures.ThreadPoolExecutor(crop_threads, thread_name_prefix="detection-crops")
+        if crop_threads > 1
+        else None
+    )
+    saved: list[Detection] = []
+    with concurrent.futures.ThreadPoolExecutor(max(io_threads, 1), thread_name_prefix="detection-images") as io_pool:
+        try:
+            fetches = {
+                io_pool.submit(fetch, source_images[source_image_id]): source_image_id
+                for source_image_id in detections_by_image
+            }
+            crops: dict[concurrent.futures.Future, int] = {}
+            for future in concurrent.futures.as_completed(fetches):
+                source_image_id = fetches[future]
+                try:
+                    image_content = future.result()
+                except Exception as e:
+                    result.errors.append((source_image_id, f"Could not fetch source image: {e}"))
+                    continue
+                bboxes = [(pk, detection.bbox) for pk, detection in detections_by_image[source_image_id].items()]
+                if crop_pool:
+                    crops[crop_pool.submit(crop_and_encode, image_content, bboxes, variant_formats)] = source_image_id
+                else:
+                    crops[_completed(crop_and_encode, image_content, bboxes, variant_formats)] = source_image_id
+
+            uploads: dict[concurrent.futures.Future, Detection] = {}
+            for future in concurrent.futures.as_completed(crops):
+                source_image_id = crops[future]
+                try:
+                    encoded = future.result()
+                except Exception as e:
+                    result.errors.append((source_image_id, f"Could not crop detections: {e}"))
+                    continue
+                for detection_id, content, variants, error in encoded:
+                    detection = detections_by_image[source_image_id][detection_id]
+                    if error:
+                        result.errors.append((source_image_id, f"Detection #{detection_id}: {error}"))
+                    else:
+                        uploads[io_pool.submit(upload, detection, content, variants)] = detection
+
+            for future in concurrent.futures.as_completed(uploads):
+                detection = uploads[future]
+                try:
+                    detection.path, detection.image_variants = future.result()
+                except Exception as e:
+                    result.errors.append((detection.source_image_id, f"Could not save detection image: {e}"))
+                    continue
+                saved.append(detection)
+                result.paths.append(detection.path)
+        finally:
+            if crop_pool:
+                crop_pool.shutdown(cancel_futures=True)
+
+    Detection.objects.bulk_update(saved, ["path", "image_variants"])
+    return result
+
+
+def _completed(fn, *args) -> concurrent.futures.Future:
+    """Run ``fn`` now and wrap its outcome in a finished future, like a pool would."""
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
 
 def create_detection_images_from_source_image(source_image: SourceImage) -> list[str]:
-    # Check if the source image has detections without images before loading the image
-    if not source_image.detections.filter(path__isnull=True).exists():
-        return []
-
-    image_np = load_source_image(source_image)
-    processed_paths = []
-
-    for detection in source_image.detections.filter(path__isnull=True):
-        if detection.bbox:
-            cropped_image = crop_detection(image_np, detection.bbox)
-            path = save_crop(cropped_image, detection, source_image)
-            detection.path = path
-            detection.save()
-            processed_paths.append(path)
-
-    return processed_paths
+    result = create_detection_images_for_source_images([source_image], crop_threads=1)
+    if result.errors:
+        # Detections that were cropped are saved; the rest are retried on the next run
+        raise ValueError("; ".join(error for _, error in result.errors))
+    return result.paths
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ml", "0028_normalize_empty_endpoint_url_to_null"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processingservice",
+            name="max_connections",
+            field=models.PositiveIntegerField(
+                default=10, help_text="Connections to the service each Antenna worker process keeps open for reuse."
+            ),
+        ),
+        migrations.AddField(
+            model_name="processingservice",
+            name="max_retries",
+            field=models.PositiveIntegerField(
+                default=3,
+                help_text="Times a request is retried after a connection error or a 500, 502, 503 or 504 response.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="processingservice",
+            name="request_timeout",
+            field=models.FloatField(
+                blank=True,
+                help_text="Seconds to wait for the service to respond to a batch of images. Leave empty to wait indefinitely.",
+                null=True,
+            ),
+        ),
+    ]
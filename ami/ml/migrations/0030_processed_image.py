@@ -0,0 +1,48 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:36
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main", "0095_grant_sync_deployment_to_mldatamanager"),
+        ("ml", "0029_processing_service_connection_settings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessedImage",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "algorithm_ids",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.IntegerField(), default=list, size=None
+                    ),
+                ),
+                (
+                    "pipeline",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="processed_images", to="ml.pipeline"
+                    ),
+                ),
+                (
+                    "source_image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="processed_by_pipelines",
+                        to="main.sourceimage",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Processed image",
+                "verbose_name_plural": "Processed images",
+                "unique_together": {("source_image", "pipeline")},
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from ami.ml.models.algorithm import Algorithm, AlgorithmCategoryMap
 from ami.ml.models.pipeline import Pipeline
+from ami.ml.models.processed_image import ProcessedImage
 from ami.ml.models.processing_service import ProcessingService
 from ami.ml.models.project_pipeline_config import ProjectPipelineConfig
 
@@ -7,6 +8,7 @@ __all__ = [
     "Algorithm",
     "AlgorithmCategoryMap",
     "Pipeline",
+    "ProcessedImage",
     "ProcessingService",
     "ProjectPipelineConfig",
 ]
@@ -40,6 +40,9 @@ from ami.main.models import (
 )
 from ami.ml.exceptions import PipelineNotConfigured
 from ami.ml.models.algorithm import Algorithm, AlgorithmCategoryMap
+from ami.ml.models.processed_image import exclude_processed_images, mark_images_processed
+from ami.ml.orchestration.metrics import observe_save_results, record_images
+from ami.ml.orchestration.service_scheduler import choose_service, request_cancelled, request_finished, request_started
 from ami.ml.schemas import (
     AlgorithmConfigResponse,
     AlgorithmReference,
@@ -53,7 +56,7 @@ from ami.ml.schemas import (
     SourceImageResponse,
 )
 from ami.ml.tasks import celery_app, create_detection_images
-from ami.utils.requests import create_session, extract_error_message_from_response
+from ami.utils.requests import extract_error_message_from_response, get_pooled_session
 
 logger = logging.getLogger(__name__)
 
@@ -220,30 +223,51 @@ def filter_processed_images(
                 last_progress_save_monotonic = now_monotonic
 
 
-def collect_images(
+@dataclasses.dataclass
+class ImageStream:
+    """
+    The images a job needs processed, read in id-ordered batches as they are iterated over.
+
+    ``total`` is the number of candidate images, counted up front. Images that the pipeline has
+    already processed are filtered out while streaming, so it's an upper bound on the number of
+    images yielded; ``collected`` counts those as they go.
+    """
+
+    total: int
+    batches: typing.Iterator[list[SourceImage]]
+    collected: int = 0
+
+    def __iter__(self) -> typing.Iterator[list[SourceImage]]:
+        for batch in self.batches:
+            self.collected += len(batch)
+            yield batch
+
+
+def stream_images(
     collection: SourceImageCollection | None = None,
     source_images: list[SourceImage] | None = None,
     deployment: Deployment | None = None,
-    job_id: int | None = None,
+    job: Job | None = None,
     pipeline: Pipeline | None = None,
     reprocess_all_images: bool = False,
-) -> typing.Iterable[SourceImage]:
+    batch_size: int = FILTER_PROCESSED_BATCH_SIZE,
+) -> ImageStream:
     """
-    Collect images from a collection, a list of images or a deployment.
+    Stream images from a collection, a list of images or a deployment.
+
+    Collections and deployments are read in primary key order through a server-side cursor,
+    ``batch_size`` rows at a time, so the first batch is available long before a large
+    collection has been read, and only one batch is held in memory.
     """
-    task_logger = logger
-    if job_id:
-        from ami.jobs.models import Job, JobState
+    task_logger = job.logger if job else logger
+    if job:
+        from ami.jobs.models import JobState
 
-        job = Job.objects.get(pk=job_id)
-        task_logger = job.logger
         # Persist the collect stage as STARTED for every path: the filtered branch's throttle
         # below updates only `progress` (never status), and reprocess-all has no loop at all,
         # so without this neither path reports STARTED while collection runs.
         job.progress.update_stage("collect", status=JobState.STARTED, progress=0)
         job.save(update_fields=["progress", "updated_at"])
-    else:
-        job = None
 
     # Set source to first argument that is not None. The collection- and
     # deployment-backed branches prefetch the deployment + data_source joins so
@@ -252,15 +276,24 @@ def collect_images(
     # iterable through unchanged — callers handing us a pre-built list are
     # responsible for any prefetching they need.
     if collection:
-        images = collection.images.select_related("deployment__data_source")
+        queryset = collection.images.select_related("deployment__data_source")
     elif source_images:
-        images = source_images
+        queryset = None
     elif deployment:
-        images = SourceImage.objects.filter(deployment=deployment).select_related("deployment__data_source")
+        queryset = SourceImage.objects.filter(deployment=deployment).select_related("deployment__data_source")
     else:
         raise ValueError("Must specify a collection, deployment or a list of images")
 
-    total_images = len(images)
+    if queryset is not None:
+        total_images = queryset.count()
+        if pipeline and not reprocess_all_images:
+            # Images recorded in the processed-image index never leave the database
+            queryset = exclude_processed_images(queryset, pipeline)
+        images = queryset.order_by("pk").iterator(chunk_size=batch_size)
+    else:
+        total_images = len(source_images)
+        images = iter(source_images)
+
     if pipeline and not reprocess_all_images:
         msg = f"Filtering images that have already been processed by pipeline {pipeline}"
         task_logger.info(msg)
@@ -268,20 +301,56 @@ def collect_images(
         # `collect` progress updates as it chews through the input — keeps the
         # reaper "no forward progress" heuristic happy on large collections
         # (issue #1321 follow-up).
-        images = list(
-            filter_processed_images(
-                images,
-                pipeline,
-                task_logger=task_logger,
-                job=job,
-                total=total_images,
-            )
+        # What's left after the index anti-join is mostly unprocessed images; the
+        # detection check still catches results the index has no record of.
+        images = filter_processed_images(
+            images,
+            pipeline,
+            task_logger=task_logger,
+            batch_size=batch_size,
+            job=job,
+            total=total_images,
         )
     else:
         msg = "NOT filtering images that have already been processed"
         task_logger.info(msg)
 
-    msg = f"Found {len(images)} out of {total_images} images to process"
+    def batches() -> typing.Iterator[list[SourceImage]]:
+        while batch := list(itertools.islice(images, batch_size)):
+            yield batch
+
+    return ImageStream(total=total_images, batches=batches())
+
+
+def collect_images(
+    collection: SourceImageCollection | None = None,
+    source_images: list[SourceImage] | None = None,
+    deployment: Deployment | None = None,
+    job_id: int | None = None,
+    pipeline: Pipeline | None = None,
+    reprocess_all_images: bool = False,
+) -> typing.Iterable[SourceImage]:
+    """
+    Collect images from a collection, a list of images or a deployment.
+    """
+    job = None
+    if job_id:
+        from ami.jobs.models import Job
+
+        job = Job.objects.get(pk=job_id)
+    task_logger = job.logger if job else logger
+
+    stream = stream_images(
+        collection=collection,
+        source_images=source_images,
+        deployment=deployment,
+        job=job,
+        pipeline=pipeline,
+        reprocess_all_images=reprocess_all_images,
+    )
+    images = [image for batch in stream for image in batch]
+
+    msg = f"Found {len(images)} out of {stream.total} images to process"
     task_logger.info(msg)
 
     return images
@@ -294,18 +363,52 @@ def process_images(
     job_id: int | None = None,
     project_id: int | None = None,
     reprocess_all_images: bool = False,
+    processing_service: ProcessingService | None = None,
 ) -> PipelineResultsResponse:
     """
     Process images using ML pipeline API.
     """
     job = None
-    task_logger = logger
 
     if job_id:
         from ami.jobs.models import Job
 
         job = Job.objects.get(pk=job_id)
-        task_logger = job.logger
+
+    request_data = prepare_pipeline_request(
+        pipeline=pipeline,
+        images=images,
+        job=job,
+        project_id=project_id,
+        reprocess_all_images=reprocess_all_images,
+    )
+    if request_data is None:
+        if processing_service:
+            request_cancelled(processing_service)
+        return PipelineResultsResponse(
+            pipeline=pipeline.slug,
+            source_images=[],
+            detections=[],
+            total_time=0,
+        )
+
+    resp = send_pipeline_request(endpoint_url, request_data, processing_service=processing_service)
+    return parse_pipeline_response(pipeline=pipeline, request_data=request_data, resp=resp, job=job)
+
+
+def prepare_pipeline_request(
+    pipeline: Pipeline,
+    images: typing.Iterable[SourceImage],
+    job: Job | None = None,
+    project_id: int | None = None,
+    reprocess_all_images: bool = False,
+) -> PipelineRequest | None:
+    """
+    Build the request for a batch of images, or return None if none of them need processing.
+
+    This is the part of `process_images` that reads from the database.
+    """
+    task_logger = job.logger if job else logger
 
     if project_id:
         project = Project.objects.get(pk=project_id)
@@ -328,12 +431,7 @@ def process_images(
 
     if not images:
         task_logger.info("No images to process")
-        return PipelineResultsResponse(
-            pipeline=pipeline.slug,
-            source_images=[],
-            detections=[],
-            total_time=0,
-        )
+        return None
     task_logger.info(f"Sending {len(images)} images to Pipeline {pipeline}")
     urls = [source_image.public_url() for source_image in images if source_image.public_url()]
 
@@ -370,9 +468,53 @@ def process_images(
         detections=detection_requests,
     )
     task_logger.debug(f"Pipeline request data: {request_data}")
+    return request_data
 
-    session = create_session()
-    resp = session.post(endpoint_url, json=request_data.dict())
+
+def send_pipeline_request(
+    endpoint_url: str,
+    request_data: PipelineRequest,
+    processing_service: ProcessingService | None = None,
+) -> requests.Response:
+    """
+    POST a prepared request to a processing service.
+
+    The request goes through the service's pooled session and uses its timeout, and its
+    latency and outcome are recorded for choosing services. Without a processing service
+    record, a pooled session with the default settings is used.
+
+    Does not touch the database or the job logger, so it is safe to call from a worker thread
+    (see `MLJob.process_images`, which keeps several requests in flight).
+    """
+    if not processing_service:
+        return get_pooled_session(urljoin(endpoint_url, "/")).post(endpoint_url, json=request_data.dict())
+
+    request_id = request_started(processing_service)
+    start_time = time.time()
+    ok = False
+    try:
+        resp = processing_service.get_session().post(
+            endpoint_url, json=request_data.dict(), timeout=processing_service.request_timeout
+        )
+        # Client errors are about the request, not the health of the service
+        ok = resp.status_code < 500
+        return resp
+    finally:
+        request_finished(processing_service.pk, request_id, time.time() - start_time, ok)
+
+
+def parse_pipeline_response(
+    pipeline: Pipeline,
+    request_data: PipelineRequest,
+    resp: requests.Response,
+    job: Job | None = None,
+) -> PipelineResultsResponse:
+    """
+    Turn a processing service response into results.
+
+    A failed request raises HTTPError, unless it was sent for a job: then the error is logged
+    and returned in the results, with the batch's images and no detections.
+    """
     if not resp.ok:
         summary = request_data.summary()
         error_msg = extract_error_message_from_response(resp)
@@ -389,7 +531,7 @@ def process_images(
             total_time=0,
             source_images=[
                 SourceImageResponse(id=source_image_request.id, url=source_image_request.url)
-                for source_image_request in source_image_requests
+                for source_image_request in request_data.source_images
             ],
             detections=[],
             errors=msg,
@@ -1014,10 +1156,14 @@ def save_results(
     results_json: str | None = None,
     job_id: int | None = None,
     return_created=False,
+    count_saved=True,
 ) -> PipelineSaveResults | None:
     """
     Save results from ML pipeline API.
 
+    Without ``count_saved``, the caller counts the saved images in the pipeline metrics
+    itself (see ``process_nats_pipeline_result``, which doesn't count redelivered results).
+
     @TODO Continue improving bulk create. Group everything / all loops by source image.
     """
     job = None
@@ -1124,9 +1270,19 @@ def save_results(
         algorithms_known=algorithms_known,
         logger=job_logger,
     )
+    # Same as the null markers: only record the images as processed once everything else is saved.
+    # Only the images the detection-based check now skips are recorded, since a partial result
+    # (e.g. from a service version without one of the classifiers) must be processed again.
+    unprocessed = {source_image.pk for source_image in filter_processed_images(source_images, pipeline)}
+    mark_images_processed(
+        [source_image.pk for source_image in source_images if source_image.pk not in unprocessed], pipeline
+    )
 
     total_time = time.time() - start_time
     job_logger.info(f"Saved results from pipeline {pipeline} in {total_time:.2f} seconds")
+    observe_save_results(pipeline.slug, total_time)
+    if count_saved:
+        record_images(pipeline.slug, "saved", len(results.source_images))
 
     if return_created:
         """
@@ -1270,11 +1426,26 @@ class Pipeline(BaseModel):
             reprocess_all_images=reprocess_all_images,
         )
 
+    def stream_images(
+        self,
+        collection: SourceImageCollection | None = None,
+        source_images: list[SourceImage] | None = None,
+        deployment: Deployment | None = None,
+        job: Job | None = None,
+        reprocess_all_images: bool = False,
+    ) -> ImageStream:
+        return stream_images(
+            collection=collection,
+            source_images=source_images,
+            deployment=deployment,
+            job=job,
+            pipeline=self,
+            reprocess_all_images=reprocess_all_images,
+        )
+
     def choose_processing_service_for_pipeline(
         self, job_id: int | None, pipeline_name: str, project_id: int
     ) -> ProcessingService:
-        # @TODO use the cached `last_seen_latency` and a max age to avoid checking every time
-
         job = None
         task_logger = logger
         if job_id:
@@ -1290,33 +1461,49 @@ class Pipeline(BaseModel):
             f"{[processing_service.name for processing_service in processing_services]}"
         )
 
-        # check the status of all processing services and pick the one with the lowest latency
-        lowest_latency = float("inf")
-        processing_service_lowest_latency = None
-
-        for processing_service in processing_services:
-            if processing_service.last_seen_live:
-                if processing_service.last_seen_latency and processing_service.last_seen_latency < lowest_latency:
-                    lowest_latency = processing_service.last_seen_latency
-                    processing_service_lowest_latency = processing_service
-                elif processing_service_lowest_latency is None:
-                    # Online but no latency data (e.g. async/pull-mode service) — use as fallback
-                    processing_service_lowest_latency = processing_service
-
-        if processing_service_lowest_latency is None:
+        online_services = [
+            processing_service for processing_service in processing_services if processing_service.last_seen_live
+        ]
+        if not online_services:
             msg = f'No processing services are online for the pipeline "{pipeline_name}".'
             task_logger.error(msg)
             raise Exception(msg)
 
-        if lowest_latency < float("inf"):
+        sync_services = [
+            processing_service for processing_service in online_services if processing_service.endpoint_url
+        ]
+        if not sync_services:
+            # Only async/pull-mode services are online; return one so the caller can report it has no endpoint
+            task_logger.info(f"Using processing service (no latency data): {online_services[0]}")
+            return online_services[0]
+
+        # Spread requests across the online services, see ami/ml/orchestration/service_scheduler.py
+        processing_service, health = choose_service(sync_services)
+        if health.latency is not None:
+            task_logger.info(
+                f"Using processing service with latency {round(health.latency, 4)}, "
+                f"{health.outstanding} outstanding requests, {health.error_rate:.0%} errors: {processing_service}"
+            )
+        elif processing_service.last_seen_latency:
             task_logger.info(
-                f"Using processing service with latency {round(lowest_latency, 4)}: "
-                f"{processing_service_lowest_latency}"
+                f"Using processing service with latency {round(processing_service.last_seen_latency, 4)}: "
+                f"{processing_service}"
             )
         else:
-            task_logger.info(f"Using processing service (no latency data): {processing_service_lowest_latency}")
+            task_logger.info(f"Using processing service (no latency data): {processing_service}")
+
+        return processing_service
+
+    def get_sync_processing_service(self, project_id: int, job_id: int | None = None) -> ProcessingService:
+        """Choose a processing service for this pipeline that images can be POSTed to."""
+        processing_service = self.choose_processing_service_for_pipeline(job_id, self.name, project_id)
 
-        return processing_service_lowest_latency
+        if not processing_service.endpoint_url:
+            raise PipelineNotConfigured(
+                f"No endpoint URL configured for this pipeline's processing service ({processing_service})"
+            )
+
+        return processing_service
 
     def process_images(
         self,
@@ -1325,12 +1512,7 @@ class Pipeline(BaseModel):
         job_id: int | None = None,
         reprocess_all_images: bool = False,
     ) -> PipelineResultsResponse:
-        processing_service = self.choose_processing_service_for_pipeline(job_id, self.name, project_id)
-
-        if not processing_service.endpoint_url:
-            raise PipelineNotConfigured(
-                f"No endpoint URL configured for this pipeline's processing service ({processing_service})"
-            )
+        processing_service = self.get_sync_processing_service(project_id, job_id)
 
         return process_images(
             endpoint_url=urljoin(processing_service.endpoint_url, "/process"),
@@ -1339,10 +1521,11 @@ class Pipeline(BaseModel):
             job_id=job_id,
             project_id=project_id,
             reprocess_all_images=reprocess_all_images,
+            processing_service=processing_service,
         )
 
-    def save_results(self, results: PipelineResultsResponse, job_id: int | None = None):
-        return save_results(results=results, job_id=job_id)
+    def save_results(self, results: PipelineResultsResponse, job_id: int | None = None, count_saved: bool = True):
+        return save_results(results=results, job_id=job_id, count_saved=count_saved)
 
     def save_results_async(self, results: PipelineResultsResponse, job_id: int | None = None):
         # Returns an AsyncResult
@@ -0,0 +1,86 @@
+import logging
+import typing
+
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+
+from ami.base.models import BaseModel, BaseQuerySet
+from ami.ml.models.algorithm import Algorithm
+
+if typing.TYPE_CHECKING:
+    from ami.ml.models.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessedImageQuerySet(BaseQuerySet):
+    def covering(self, pipeline: "Pipeline") -> "ProcessedImageQuerySet":
+        """
+        Filter to images processed with at least every algorithm the pipeline has now.
+
+        Results from another pipeline with the same algorithms count too, like the
+        detection-based check in ``filter_processed_images``. A pipeline that has
+        gained an algorithm since its images were processed covers none of them, and
+        neither does one without both a detection and a classification algorithm, whose
+        images ``filter_processed_images`` always reprocesses.
+        """
+        algorithms = list(pipeline.algorithms.values_list("pk", "task_type"))
+        detection_task_types = set(Algorithm.detection_task_types)
+        has_detection_algorithm = any(task_type in detection_task_types for _, task_type in algorithms)
+        has_classification_algorithm = any(task_type not in detection_task_types for _, task_type in algorithms)
+        if not (has_detection_algorithm and has_classification_algorithm):
+            return self.none()
+        return self.filter(algorithm_ids__contains=sorted(pk for pk, _ in algorithms))
+
+
+@typing.final
+class ProcessedImage(BaseModel):
+    """
+    Index of the source images each pipeline has processed, and with which algorithms.
+
+    Written by ``save_results`` for every image in a pipeline's results that the
+    detection-based check of ``filter_processed_images`` then skips, including images
+    that got only a null detection, so that collecting the images a job still needs to
+    process is a single anti-join (see ``exclude_processed_images``) instead of
+    inspecting every image's detections and classifications.
+
+    Results saved before this index existed, or whose detections or classifications were
+    deleted since, are reconciled by the ``rebuild_processed_image_index`` management command.
+    """
+
+    source_image = models.ForeignKey(
+        "main.SourceImage", related_name="processed_by_pipelines", on_delete=models.CASCADE
+    )
+    pipeline = models.ForeignKey("ml.Pipeline", related_name="processed_images", on_delete=models.CASCADE)
+    # The pipeline's algorithms when the image was processed
+    algorithm_ids = ArrayField(models.IntegerField(), default=list)
+
+    objects = ProcessedImageQuerySet.as_manager()
+
+    def __str__(self):
+        return f"#{self.source_image_id} processed by pipeline #{self.pipeline_id}"
+
+    class Meta:
+        unique_together = ("source_image", "pipeline")
+        verbose_name = "Processed image"
+        verbose_name_plural = "Processed images"
+
+
+def mark_images_processed(source_image_ids: typing.Iterable[int], pipeline: "Pipeline") -> None:
+    """Record that the pipeline processed the images with its current algorithms."""
+    algorithm_ids = sorted(pipeline.algorithms.values_list("pk", flat=True))
+    ProcessedImage.objects.bulk_create(
+        [
+            ProcessedImage(source_image_id=source_image_id, pipeline=pipeline, algorithm_ids=algorithm_ids)
+            for source_image_id in sorted(set(source_image_ids))
+        ],
+        update_conflicts=True,
+        unique_fields=["source_image", "pipeline"],
+        update_fields=["algorithm_ids", "updated_at"],
+    )
+
+
+def exclude_processed_images(images: models.QuerySet, pipeline: "Pipeline") -> models.QuerySet:
+    """Exclude the source images the index has recorded as processed with the pipeline's algorithms."""
+    processed = ProcessedImage.objects.covering(pipeline).filter(source_image_id=models.OuterRef("pk"))
+    return images.exclude(models.Exists(processed))
@@ -12,13 +12,14 @@ from ami.base.models import BaseQuerySet
 from ami.main.models import BaseModel, Project
 from ami.ml.models.pipeline import Pipeline, get_or_create_algorithm_and_category_map
 from ami.ml.models.project_pipeline_config import ProjectPipelineConfig
+from ami.ml.orchestration.service_scheduler import record_status_check
 from ami.ml.schemas import (
     PipelineConfigResponse,
     PipelineRegistrationResponse,
     ProcessingServiceInfoResponse,
     ProcessingServiceStatusResponse,
 )
-from ami.utils.requests import create_session
+from ami.utils.requests import get_pooled_session
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +71,19 @@ class ProcessingService(BaseModel):
     last_seen = models.DateTimeField(null=True)
     last_seen_live = models.BooleanField(null=True)
     last_seen_latency = models.FloatField(null=True)
+    max_connections = models.PositiveIntegerField(
+        default=10,
+        help_text="Connections to the service each Antenna worker process keeps open for reuse.",
+    )
+    max_retries = models.PositiveIntegerField(
+        default=3,
+        help_text="Times a request is retried after a connection error or a 500, 502, 503 or 504 response.",
+    )
+    request_timeout = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Seconds to wait for the service to respond to a batch of images. Leave empty to wait indefinitely.",
+    )
 
     objects = ProcessingServiceManager()
 
@@ -174,6 +188,22 @@ class ProcessingService(BaseModel):
             algorithms_created=algorithms_created,
         )
 
+    def get_session(self) -> requests.Session:
+        """
+        Return the HTTP session shared by all requests from this process to the service.
+
+        Its connections are kept alive between requests (job batches, status checks), and its
+        pool size and retries follow `max_connections` and `max_retries`.
+        """
+        assert self.endpoint_url, "Pull-mode processing services have no endpoint to connect to"
+        return get_pooled_session(
+            self.endpoint_url,
+            retries=self.max_retries,
+            backoff_factor=2,  # 0s, 2s, 4s delays between retries
+            status_forcelist=(500, 502, 503, 504),
+            pool_maxsize=self.max_connections,
+        )
+
     def mark_seen(self, live: bool = True) -> None:
         """
         Record that we heard from this processing service.
@@ -236,15 +266,8 @@ class ProcessingService(BaseModel):
         self.last_seen = timestamp
         resp = None
 
-        # Create session with retry logic for connection errors and timeouts
-        session = create_session(
-            retries=3,
-            backoff_factor=2,  # 0s, 2s, 4s delays between retries
-            status_forcelist=(500, 502, 503, 504),
-        )
-
         try:
-            resp = session.get(ready_check_url, timeout=timeout)
+            resp = self.get_session().get(ready_check_url, timeout=timeout)
             resp.raise_for_status()
             self.last_seen_live = True
         except requests.exceptions.RequestException as e:
@@ -261,6 +284,7 @@ class ProcessingService(BaseModel):
                     "last_seen_latency",
                 ]
             )
+            record_status_check(self.pk, self.last_seen_live)
 
         if self.last_seen_live:
             # The specific pipeline statuses are not required for the status response
@@ -295,7 +319,7 @@ class ProcessingService(BaseModel):
             return []
 
         info_url = urljoin(self.endpoint_url, "info")
-        resp = requests.get(info_url, timeout=timeout)
+        resp = self.get_session().get(info_url, timeout=timeout)
         resp.raise_for_status()
         info_data = ProcessingServiceInfoResponse.parse_obj(resp.json())
         return info_data.pipelines
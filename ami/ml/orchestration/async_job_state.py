@@ -29,11 +29,23 @@ How this relates to the Job model (ami/jobs/models.py):
 
 Flow: NATS result → AsyncJobStateManager.update_state() (Redis, internal)
       → _update_job_progress() (writes to Job model) → UI / API reads Job
+
+Two storage backends share this API. A job's state is initialized with the backend
+selected by settings.ASYNC_JOB_STATE_BACKEND, which is recorded next to the state, so
+get_job_state_manager() keeps returning that backend for the job even if the setting
+changes while it is in flight:
+
+  - "sets" (AsyncJobStateManager, default) — one Redis set member per image ID.
+    Simple, but a set of a few million IDs costs hundreds of MB.
+  - "bitmap" (BitmapJobStateManager) — one bit per image, indexed by the image's
+    primary key relative to the lowest key in the job. BITCOUNT replaces SCARD
+    and a single BITFIELD call clears a whole result batch.
 """
 
 import logging
 from dataclasses import dataclass
 
+from django.conf import settings
 from django_redis import get_redis_connection
 from redis.exceptions import RedisError
 
@@ -73,12 +85,15 @@ class AsyncJobStateManager:
 
     TIMEOUT = 86400 * 7  # 7 days in seconds
     STAGES = ["process", "results"]
+    BACKEND = "sets"
 
     def __init__(self, job_id: int):
         self.job_id = job_id
+        self._backend_key = backend_key(job_id)
         self._pending_key = f"job:{job_id}:pending_images"
         self._total_key = f"job:{job_id}:pending_images_total"
         self._failed_key = f"job:{job_id}:failed_images"
+        self._replayed_key = f"job:{job_id}:dead_letters_replayed"
 
     def _get_redis(self):
         return get_redis_connection("default")
@@ -101,6 +116,7 @@ class AsyncJobStateManager:
                         pipe.expire(pending_key, self.TIMEOUT)
                 pipe.delete(self._failed_key)
                 pipe.set(self._total_key, len(image_ids), ex=self.TIMEOUT)
+                pipe.set(self._backend_key, self.BACKEND, ex=self.TIMEOUT)
                 pipe.execute()
         except RedisError as e:
             logger.error(f"Redis error initializing job {self.job_id}: {e}")
@@ -212,6 +228,112 @@ class AsyncJobStateManager:
             failed=failed_count,
         )
 
+    def _get_progress_counts_key(self, stage: str) -> str:
+        return f"job:{self.job_id}:progress_counts:{stage}"
+
+    def _get_progress_flush_key(self, stage: str) -> str:
+        return f"job:{self.job_id}:progress_flush:{stage}"
+
+    def _get_progress_keys(self) -> list[str]:
+        keys = [self._get_progress_counts_key(stage) for stage in self.STAGES]
+        keys += [self._get_progress_flush_key(stage) for stage in self.STAGES]
+        return keys
+
+    def add_progress_counts(self, stage: str, counts: dict[str, int]) -> None:
+        """
+        Add per-result count deltas (detections, classifications, ...) to the
+        stage's unflushed totals. HINCRBY is atomic, so concurrent workers can
+        add without coordination.
+        """
+        counts = {name: value for name, value in counts.items() if value}
+        if not counts:
+            return
+        counts_key = self._get_progress_counts_key(stage)
+        with self._get_redis().pipeline() as pipe:
+            for name, value in counts.items():
+                pipe.hincrby(counts_key, name, value)
+            pipe.expire(counts_key, self.TIMEOUT)
+            pipe.execute()
+
+    def claim_progress_flush(
+        self, stage: str, counts: dict[str, int], interval: float, force: bool = False
+    ) -> dict[str, int] | None:
+        """
+        Record count deltas and decide whether this caller writes Job.progress.
+
+        At most one caller per ``interval`` seconds wins the flush (SET NX with a
+        TTL); the winner gets every count accumulated since the last flush, and the
+        counts are reset in the same MULTI so no delta is read twice. Everyone else
+        gets None and skips the database write. ``force`` (stage complete,
+        reconciliation) always flushes and re-opens the window, so a straggler
+        landing just after a completion flush is written straight away.
+
+        Raises:
+            redis.exceptions.RedisError: on transient Redis failures, like update_state().
+        """
+        self.add_progress_counts(stage, counts)
+
+        redis = self._get_redis()
+        flush_key = self._get_progress_flush_key(stage)
+        if force:
+            redis.delete(flush_key)
+        elif interval > 0 and not redis.set(flush_key, 1, nx=True, px=int(interval * 1000)):
+            return None
+
+        counts_key = self._get_progress_counts_key(stage)
+        with redis.pipeline() as pipe:
+            pipe.hgetall(counts_key)
+            pipe.delete(counts_key)
+            pending, _ = pipe.execute()
+        return {name.decode(): int(value) for name, value in pending.items()}
+
+    def requeue_images(self, image_ids: set[str]) -> int:
+        """
+        Mark images as pending again in every stage and drop them from the failed set.
+
+        Used when a dead-lettered task is re-published, so the result it eventually
+        produces is counted like any other. Returns how many of the images were
+        not already pending in the process stage.
+        """
+        if not image_ids:
+            return 0
+        redis = self._get_redis()
+        with redis.pipeline() as pipe:
+            for stage in self.STAGES:
+                pipe.sadd(self._get_pending_key(stage), *image_ids)
+                pipe.expire(self._get_pending_key(stage), self.TIMEOUT)
+            pipe.srem(self._failed_key, *image_ids)
+            results = pipe.execute()
+        return results[0]
+
+    def claim_dead_letter_replays(self, stream_seqs: list[int]) -> list[int]:
+        """
+        Record that the dead letters at these job stream sequences are being replayed.
+
+        Returns the sequences that had not been claimed before, so two concurrent
+        replays of the same job never re-publish one message twice. Max-delivery
+        advisories outlive the replay, so without this the next triage run would
+        offer the same dead letters again.
+        """
+        if not stream_seqs:
+            return []
+        redis = self._get_redis()
+        with redis.pipeline() as pipe:
+            for seq in stream_seqs:
+                pipe.sadd(self._replayed_key, seq)
+            pipe.expire(self._replayed_key, self.TIMEOUT)
+            added = pipe.execute()[:-1]
+        return [seq for seq, was_added in zip(stream_seqs, added) if was_added]
+
+    def release_dead_letter_replays(self, stream_seqs: list[int]) -> None:
+        """Forget replay claims whose re-publish failed, so they can be retried."""
+        if stream_seqs:
+            self._get_redis().srem(self._replayed_key, *stream_seqs)
+
+    def get_replayed_dead_letters(self) -> set[int]:
+        """Job stream sequences of dead letters that have already been replayed."""
+        return {int(seq) for seq in self._get_redis().smembers(self._replayed_key)}
+
     def get_pending_image_ids(self) -> set[str]:
         """Return the union of image IDs still pending in either stage's set.
 
@@ -235,7 +357,277 @@ class AsyncJobStateManager:
         try:
             redis = self._get_redis()
             keys = [self._get_pending_key(stage) for stage in self.STAGES]
-            keys += [self._failed_key, self._total_key]
+            keys += [self._failed_key, self._total_key, self._replayed_key, self._backend_key]
+            keys += self._get_progress_keys()
+            redis.delete(*keys)
+        except RedisError as e:
+            logger.warning(f"Redis error cleaning up job {self.job_id}: {e}")
+
+
+class BitmapJobStateManager(AsyncJobStateManager):
+    """
+    Bitmap-backed variant of AsyncJobStateManager for very large jobs.
+
+    Each stage's pending images and the shared failed images are stored as Redis
+    bitmaps (strings) with one bit per image. Bit ``n`` stands for the image whose
+    primary key is ``base + n``, where ``base`` is the lowest image ID in the job.
+    The bitmaps are therefore as long as the job's ID range, not the whole table:
+    2M images with contiguous keys take ~250 KB per bitmap, where the equivalent
+    Redis set takes well over 100 MB.
+
+    Image IDs must be integers (or integer strings, as passed by the NATS
+    pipeline). IDs outside the job's range are ignored, the same way SREM
+    ignores non-members.
+
+    The base offset, range length and image total live in a small hash that is
+    written once by initialize_job(). Workers read it once per manager instance.
+    """
+
+    BACKEND = "bitmap"
+
+    def __init__(self, job_id: int):
+        super().__init__(job_id)
+        self._index_key = f"job:{job_id}:image_index"
+        self._failed_key = f"job:{job_id}:failed_images_bitmap"
+        self._index: tuple[int, int] | None = None
+
+    def _get_pending_key(self, stage: str) -> str:
+        return f"job:{self.job_id}:pending_images_bitmap:{stage}"
+
+    def initialize_job(self, image_ids: list[str]) -> None:
+        """
+        Initialize job tracking with a list of image IDs to process.
+
+        Args:
+            image_ids: List of image IDs (integer primary keys) that need to be processed
+        """
+        ids = {int(image_id) for image_id in image_ids}
+        base = min(ids) if ids else 0
+        span = max(ids) - base + 1 if ids else 0
+        bitmap = bytearray((span + 7) // 8)
+        for image_id in ids:
+            offset = image_id - base
+            # Redis numbers bits from the most significant bit of the first byte
+            bitmap[offset >> 3] |= 0x80 >> (offset & 7)
+
+        try:
+            redis = self._get_redis()
+            with redis.pipeline() as pipe:
+                for stage in self.STAGES:
+                    pending_key = self._get_pending_key(stage)
+                    pipe.delete(pending_key)
+                    if ids:
+                        pipe.set(pending_key, bytes(bitmap), ex=self.TIMEOUT)
+                pipe.delete(self._failed_key)
+                pipe.delete(self._index_key)
+                pipe.hset(self._index_key, mapping={"base": base, "span": span, "total": len(ids)})
+                pipe.expire(self._index_key, self.TIMEOUT)
+                pipe.set(self._backend_key, self.BACKEND, ex=self.TIMEOUT)
+                pipe.execute()
+        except RedisError as e:
+            logger.error(f"Redis error initializing job {self.job_id}: {e}")
+            raise
+        self._index = (base, span)
+
+    def _get_index(self, redis) -> tuple[int, int] | None:
+        if self._index is None:
+            base, span = redis.hmget(self._index_key, ["base", "span"])
+            if base is None or span is None:
+                return None
+            self._index = (int(base), int(span))
+        return self._index
+
+    def _to_offsets(self, image_ids: set[str], index: tuple[int, int]) -> list[int]:
+        base, span = index
+        offsets = (int(image_id) - base for image_id in image_ids)
+        return [offset for offset in offsets if 0 <= offset < span]
+
+    def update_state(
+        self,
+        processed_image_ids: set[str],
+        stage: str,
+        failed_image_ids: set[str] | None = None,
+    ) -> "JobStateProgress | None":
+        """
+        Atomically update job state with newly processed images.
+
+        Same contract as AsyncJobStateManager.update_state(). All processed IDs
+        are cleared with one BITFIELD command, which returns each bit's previous
+        value, so ``newly_removed`` keeps its replay-safe meaning.
+        """
+        redis = self._get_redis()
+        index = self._get_index(redis)
+        if index is None:
+            return None
+
+        pending_key = self._get_pending_key(stage)
+        processed_offsets = self._to_offsets(processed_image_ids, index)
+        failed_offsets = self._to_offsets(failed_image_ids, index) if failed_image_ids else []
+
+        with redis.pipeline() as pipe:
+            if processed_offsets:
+                clear = pipe.bitfield(pending_key)
+                for offset in processed_offsets:
+                    clear.set("u1", f"#{offset}", 0)
+                clear.execute()
+                # BITFIELD creates the key if it was deleted since the index was
+                # read; keep the TTL so a concurrent cleanup can't leak it.
+                pipe.expire(pending_key, self.TIMEOUT)
+            if failed_offsets:
+                mark = pipe.bitfield(self._failed_key)
+                for offset in failed_offsets:
+                    mark.set("u1", f"#{offset}", 1)
+                mark.execute()
+                pipe.expire(self._failed_key, self.TIMEOUT)
+            pipe.bitcount(pending_key)
+            pipe.bitcount(self._failed_key)
+            pipe.hget(self._index_key, "total")
+            results = pipe.execute()
+
+        remaining, failed_count, total_raw = results[-3], results[-2], results[-1]
+        # BITFIELD returns the previous value of every bit it set
+        newly_removed = sum(results[0]) if processed_offsets else 0
+
+        if total_raw is None:
+            return None
+
+        total = int(total_raw)
+        processed = total - remaining
+        percentage = float(processed) / total if total > 0 else 1.0
+
+        logger.info(
+            f"Pending images from Redis for job {self.job_id} {stage}: " f"{remaining}/{total}: {percentage*100}%"
+        )
+
+        return JobStateProgress(
+            remaining=remaining,
+            total=total,
+            processed=processed,
+            percentage=percentage,
+            failed=failed_count,
+            newly_removed=newly_removed,
+        )
+
+    def get_progress(self, stage: str) -> "JobStateProgress | None":
+        """Read-only progress snapshot for the given stage."""
+        try:
+            redis = self._get_redis()
+            pending_key = self._get_pending_key(stage)
+
+            with redis.pipeline() as pipe:
+                pipe.bitcount(pending_key)
+                pipe.bitcount(self._failed_key)
+                pipe.hget(self._index_key, "total")
+                remaining, failed_count, total_raw = pipe.execute()
+        except RedisError as e:
+            logger.error(f"Redis error reading job {self.job_id} progress: {e}")
+            return None
+
+        if total_raw is None:
+            return None
+
+        total = int(total_raw)
+        processed = total - remaining
+        percentage = float(processed) / total if total > 0 else 1.0
+
+        return JobStateProgress(
+            remaining=remaining,
+            total=total,
+            processed=processed,
+            percentage=percentage,
+            failed=failed_count,
+        )
+
+    def requeue_images(self, image_ids: set[str]) -> int:
+        """Set the images' bits in every stage's pending bitmap and clear their failed bit."""
+        redis = self._get_redis()
+        index = self._get_index(redis)
+        offsets = self._to_offsets(image_ids, index) if index is not None else []
+        if not offsets:
+            return 0
+        with redis.pipeline() as pipe:
+            for stage in self.STAGES:
+                mark = pipe.bitfield(self._get_pending_key(stage))
+                for offset in offsets:
+                    mark.set("u1", f"#{offset}", 1)
+                mark.execute()
+                pipe.expire(self._get_pending_key(stage), self.TIMEOUT)
+            clear = pipe.bitfield(self._failed_key)
+            for offset in offsets:
+                clear.set("u1", f"#{offset}", 0)
+            clear.execute()
+            results = pipe.execute()
+        # BITFIELD returns the previous value of every bit it set
+        return len(offsets) - sum(results[0])
+
+    def get_pending_image_ids(self) -> set[str]:
+        """Return the image IDs whose bit is still set in either stage's bitmap."""
+        try:
+            redis = self._get_redis()
+            index = self._get_index(redis)
+            if index is None:
+                return set()
+            bitmaps = redis.mget([self._get_pending_key(stage) for stage in self.STAGES])
+        except RedisError as e:
+            logger.error(f"Redis error reading pending image ids for job {self.job_id}: {e}")
+            return set()
+
+        base, _span = index
+        pending = bytearray(max((len(b) for b in bitmaps if b), default=0))
+        for bitmap in bitmaps:
+            for i, byte in enumerate(bitmap or b""):
+                pending[i] |= byte
+
+        image_ids = set()
+        for i, byte in enumerate(pending):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (0x80 >> bit):
+                    image_ids.add(str(base + i * 8 + bit))
+        return image_ids
+
+    def cleanup(self) -> None:
+        """
+        Delete all Redis keys associated with this job.
+        """
+        try:
+            redis = self._get_redis()
+            keys = [self._get_pending_key(stage) for stage in self.STAGES]
+            keys += [self._failed_key, self._index_key, self._replayed_key, self._backend_key]
+            keys += self._get_progress_keys()
             redis.delete(*keys)
         except RedisError as e:
             logger.warning(f"Redis error cleaning up job {self.job_id}: {e}")
+        self._index = None
+
+
+JOB_STATE_BACKENDS: dict[str, type[AsyncJobStateManager]] = {
+    manager.BACKEND: manager for manager in (AsyncJobStateManager, BitmapJobStateManager)
+}
+
+
+def backend_key(job_id: int) -> str:
+    """Redis key of the name of the backend that a job's state was initialized with."""
+    return f"job:{job_id}:state_backend"
+
+
+def get_job_state_manager(job_id: int, new: bool = False) -> AsyncJobStateManager:
+    """
+    Return the progress state manager for a job.
+
+    That is the backend the job's state was initialized with, or the one selected by
+    settings.ASYNC_JOB_STATE_BACKEND if the job has no state yet. Pass ``new`` for a
+    manager that is about to (re)initialize the job's state, which always uses the
+    setting.
+    """
+    backend = settings.ASYNC_JOB_STATE_BACKEND
+    if not new:
+        try:
+            recorded = get_redis_connection("default").get(backend_key(job_id))
+        except RedisError as e:
+            logger.warning(f"Redis error reading the state backend of job {job_id}: {e}")
+        else:
+            if recorded is not None:
+                backend = recorded.decode() if isinstance(recorded, bytes) else recorded
+    return JOB_STATE_BACKENDS[backend](job_id)
@@ -0,0 +1,172 @@
+"""
+Triage and replay of an async job's dead letters.
+
+A dead letter is a task message that JetStream stopped delivering, usually
+because it ran out of delivery attempts (``NATS_MAX_DELIVER``) while workers were
+crashing or timing out on it. Its image stays pending in the job's Redis state
+until the jobs_health_check reconciler gives up on it and marks it failed.
+
+Replaying re-publishes the task to the job's stream as a new message, which gets
+a fresh delivery budget, so a handful of failed images no longer need a whole new
+job. Replays are only possible while the job is still running: once it finishes,
+cleanup deletes its stream.
+
+Dead letters are found through JetStream's advisories, which the shared advisory
+stream keeps for an hour (its ``max_age``). A dead letter older than that is no
+longer listed and can't be replayed; the reconciler marks its image failed.
+
+Used by ``JobViewSet.dead_letters`` / ``JobViewSet.replay_dead_letters`` (through the
+``replay_job_dead_letters`` task) and the ``replay_dead_letters`` management command.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from ami.jobs.models import Job, JobDispatchMode, JobState
+from ami.main.models import SourceImage
+from ami.ml.orchestration.async_job_state import get_job_state_manager
+from ami.ml.orchestration.nats_queue import DeadLetter, TaskQueueManager
+from ami.ml.schemas import PipelineProcessingTask
+
+logger = logging.getLogger(__name__)
+
+# Image IDs listed per reason group in a triage summary
+DEAD_LETTER_PREVIEW_LIMIT = 20
+
+
+def list_dead_letters(job: Job) -> list[DeadLetter]:
+    async def _list():
+        async with TaskQueueManager() as manager:
+            return await manager.list_dead_letters(job.pk)
+
+    return async_to_sync(_list)()
+
+
+def summarize_dead_letters(job: Job) -> list[dict]:
+    """
+    Group a job's dead letters by failure reason, largest group first.
+
+    Each group counts how many dead letters can still be replayed and how many
+    already were, and previews some of their image IDs.
+    """
+    replayed = get_job_state_manager(job.pk).get_replayed_dead_letters()
+    groups: dict[str, dict] = {}
+    for dead_letter in list_dead_letters(job):
+        group = groups.setdefault(
+            dead_letter.reason,
+            {"reason": dead_letter.reason, "count": 0, "replayable": 0, "replayed": 0, "image_ids": []},
+        )
+        group["count"] += 1
+        if dead_letter.stream_seq in replayed:
+            group["replayed"] += 1
+        elif dead_letter.task is not None:
+            group["replayable"] += 1
+        if dead_letter.image_id and len(group["image_ids"]) < DEAD_LETTER_PREVIEW_LIMIT:
+            group["image_ids"].append(dead_letter.image_id)
+    return sorted(groups.values(), key=lambda group: -group["count"])
+
+
+def _matches_reason(dead_letter: DeadLetter, reasons: list[str]) -> bool:
+    # "terminated" selects every "terminated: <detail>" group as well
+    return any(dead_letter.reason == reason or dead_letter.reason.startswith(f"{reason}: ") for reason in reasons)
+
+
+def _build_tasks(image_ids: list[str]) -> dict[str, PipelineProcessingTask]:
+    """Rebuild tasks from the source images, so replays carry freshly generated image URLs."""
+    images = SourceImage.objects.filter(pk__in=image_ids).select_related("deployment__data_source")
+    tasks = {}
+    for image in images:
+        image_url = image.url()
+        if image_url:
+            tasks[str(image.pk)] = PipelineProcessingTask(
+                id=str(image.pk), image_id=str(image.pk), image_url=image_url
+            )
+    return tasks
+
+
+def check_replayable(job: Job) -> None:
+    """Raise ValueError if the job is not a running async_api job, whose dead letters can be replayed."""
+    if job.dispatch_mode != JobDispatchMode.ASYNC_API:
+        raise ValueError("Only async_api jobs have dead letters")
+    if job.status not in JobState.running_states():
+        raise ValueError(f"Job {job.pk} is {job.status}; dead letters can only be replayed while it is running")
+
+
+def replay_dead_letters(
+    job: Job,
+    reasons: list[str] | None = None,
+    image_ids: list[str] | None = None,
+    limit: int | None = None,
+    max_per_second: float | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Re-publish a job's dead letters to its stream, optionally filtered by reason or image.
+
+    Each replayed image is marked pending again in the job's Redis state (and
+    removed from the failed images) before its task is published, so the result
+    it produces is counted like any other. Dead letters are claimed in Redis
+    first, so calling this twice never publishes the same message twice.
+
+    Raises ValueError if the job is not a running async_api job (see ``check_replayable``).
+
+    Returns a dict of counts: ``matched`` dead letters, of which ``replayed``
+    were published, ``failed`` could not be published (they can be retried), and
+    ``unavailable`` have no task left to publish (the message aged out of the
+    stream or the image is gone).
+    """
+    check_replayable(job)
+
+    state_manager = get_job_state_manager(job.pk)
+    already_replayed = state_manager.get_replayed_dead_letters()
+    image_id_filter = {str(image_id) for image_id in image_ids} if image_ids else None
+    selected = [
+        dead_letter
+        for dead_letter in list_dead_letters(job)
+        if dead_letter.stream_seq not in already_replayed
+        and (not reasons or _matches_reason(dead_letter, reasons))
+        and (image_id_filter is None or dead_letter.image_id in image_id_filter)
+    ][:limit]
+
+    tasks = _build_tasks([dead_letter.image_id for dead_letter in selected if dead_letter.image_id])
+    replayable = [dead_letter for dead_letter in selected if dead_letter.image_id in tasks]
+    result = {
+        "job_id": job.pk,
+        "matched": len(selected),
+        "replayed": 0,
+        "failed": 0,
+        "unavailable": len(selected) - len(replayable),
+        "dry_run": dry_run,
+        "image_ids": [dead_letter.image_id for dead_letter in replayable],
+    }
+    if dry_run or not replayable:
+        return result
+
+    claimed = set(state_manager.claim_dead_letter_replays([dead_letter.stream_seq for dead_letter in replayable]))
+    replayable = [dead_letter for dead_letter in replayable if dead_letter.stream_seq in claimed]
+    replay_tasks = [tasks[dead_letter.image_id] for dead_letter in replayable if dead_letter.image_id]
+    state_manager.requeue_images({task.image_id for task in replay_tasks})
+
+    async def _publish():
+        async with TaskQueueManager(job_logger=job.logger) as manager:
+            return await manager.publish_tasks_paced(
+                job.pk, replay_tasks, max_per_second=max_per_second or settings.NATS_DLQ_REPLAY_RATE
+            )
+
+    published = async_to_sync(_publish)()
+    failed_seqs = [dead_letter.stream_seq for dead_letter, ok in zip(replayable, published) if not ok]
+    # A failed publish leaves its image pending with no message behind it; the
+    # reconciler marks it failed again if nobody retries the replay.
+    state_manager.release_dead_letter_replays(failed_seqs)
+
+    result["replayed"] = len(replayable) - len(failed_seqs)
+    result["failed"] = len(failed_seqs)
+    result["image_ids"] = [task.image_id for task, ok in zip(replay_tasks, published) if ok]
+    job.logger.info(
+        f"Replayed {result['replayed']} dead-lettered task(s) for job {job.pk}"
+        + (f" (reasons: {', '.join(reasons)})" if reasons else "")
+        + (f", {result['failed']} failed to publish" if failed_seqs else "")
+    )
+    return result
@@ -5,7 +5,8 @@ from asgiref.sync import async_to_sync
 
 from ami.jobs.models import Job, JobState
 from ami.main.models import SourceImage
-from ami.ml.orchestration.async_job_state import AsyncJobStateManager
+from ami.ml.orchestration.async_job_state import get_job_state_manager
+from ami.ml.orchestration.metrics import record_images
 from ami.ml.orchestration.nats_queue import TaskQueueManager
 from ami.ml.schemas import PipelineProcessingTask
 
@@ -55,7 +56,7 @@ def cleanup_async_job_resources(job_id: int) -> bool:
 
     # Cleanup Redis state
     try:
-        state_manager = AsyncJobStateManager(job_id)
+        state_manager = get_job_state_manager(job_id)
         state_manager.cleanup()
         job_logger.info(f"Cleaned up Redis state for job {job_id}")
         redis_success = True
@@ -117,8 +118,12 @@ def queue_images_to_nats(job: "Job", images: list[SourceImage]):
         )
         tasks.append((image.pk, task))
 
-    # Store all image IDs in Redis for progress tracking
-    state_manager = AsyncJobStateManager(job.pk)
+    # Store all image IDs in Redis for progress tracking. State left by an earlier run
+    # of the job with another backend isn't overwritten by the new one, so drop it.
+    previous_state_manager = get_job_state_manager(job.pk)
+    state_manager = get_job_state_manager(job.pk, new=True)
+    if type(previous_state_manager) is not type(state_manager):
+        previous_state_manager.cleanup()
     state_manager.initialize_job(image_ids)
     job.logger.info(f"Initialized task state tracking for {len(image_ids)} images")
 
@@ -175,6 +180,7 @@ def queue_images_to_nats(job: "Job", images: list[SourceImage]):
 
     if tasks:
         successful_queues, failed_queues = async_to_sync(queue_all_images)()
+        record_images(job.pipeline.slug if job.pipeline else None, "queued", successful_queues)
         # Add skipped images to failed count
         failed_queues += skipped_count
     else:
@@ -0,0 +1,236 @@
+"""
+Pipeline throughput and queue-depth metrics in the Prometheus text exposition format.
+
+Two kinds of numbers are exported:
+
+  - **Recorded** counters and histograms (images queued / processed / failed /
+    saved per pipeline, ``save_results`` latency, source image cache hits,
+    misses and evictions). These are incremented by the gunicorn and Celery
+    processes as work happens, so they are kept in Redis rather than in
+    per-process prometheus_client objects — a scrape of any one web worker then
+    sees the totals for the whole deployment.
+  - **Live** gauges (NATS job stream pending / redelivered counts, DLQ size,
+    Celery queue depths) that are read from NATS and the broker at scrape time.
+
+Recording never raises: a Redis outage must not fail the result processing it
+is measuring, so errors are logged and the sample is dropped.
+
+Served by ``GET /api/v2/status/metrics/`` (see ``ami.main.api.views.MetricsView``).
+"""
+
+import logging
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django_redis import get_redis_connection
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from redis.exceptions import RedisError
+
+from ami.ml.orchestration.nats_queue import TaskQueueManager
+from ami.utils.image_cache import CACHE_EVENTS
+from ami.utils.image_cache import METRICS_KEY as SOURCE_IMAGE_CACHE_KEY
+from config import celery_app
+
+logger = logging.getLogger(__name__)
+
+IMAGES_KEY = "metrics:pipeline_images"
+SAVE_RESULTS_KEY = "metrics:save_results_seconds"
+
+IMAGE_STATUSES = ("queued", "processed", "failed", "saved")
+
+# Upper bounds (seconds) of the save_results latency buckets. A result batch
+# usually saves in well under a second; the tail covers large batches and
+# lock contention on busy projects.
+SAVE_RESULTS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Separates the label values packed into a Redis hash field. Pipeline slugs are
+# slugified, so they never contain it.
+FIELD_SEPARATOR = "|"
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def record_images(pipeline_slug: str | None, status: str, count: int = 1) -> None:
+    """Add ``count`` images to the ``status`` counter of a pipeline."""
+    if count <= 0:
+        return
+    assert status in IMAGE_STATUSES, f"Unknown image status {status!r}"
+    field = FIELD_SEPARATOR.join((pipeline_slug or "unknown", status))
+    try:
+        _redis().hincrby(IMAGES_KEY, field, count)
+    except RedisError as e:
+        logger.warning(f"Could not record {count} {status} images for pipeline {pipeline_slug}: {e}")
+
+
+def observe_save_results(pipeline_slug: str | None, seconds: float) -> None:
+    """Record one ``save_results`` call that took ``seconds``."""
+    pipeline_slug = pipeline_slug or "unknown"
+    bucket = next((str(bound) for bound in SAVE_RESULTS_BUCKETS if seconds <= bound), "+Inf")
+    try:
+        with _redis().pipeline(transaction=False) as pipe:
+            pipe.hincrby(SAVE_RESULTS_KEY, FIELD_SEPARATOR.join((pipeline_slug, "bucket", bucket)), 1)
+            pipe.hincrby(SAVE_RESULTS_KEY, FIELD_SEPARATOR.join((pipeline_slug, "count")), 1)
+            pipe.hincrbyfloat(SAVE_RESULTS_KEY, FIELD_SEPARATOR.join((pipeline_slug, "sum")), seconds)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not record save_results latency for pipeline {pipeline_slug}: {e}")
+
+
+def reset_recorded_metrics() -> None:
+    """Drop all recorded counters and histograms (the live gauges have no state)."""
+    _redis().delete(IMAGES_KEY, SAVE_RESULTS_KEY, SOURCE_IMAGE_CACHE_KEY)
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class PipelineMetricsCollector:
+    """
+    prometheus_client custom collector; everything is read fresh on each scrape.
+
+    Each source is collected independently so an unreachable NATS server or
+    broker only blanks its own metrics (and flips its ``*_up`` gauge to 0)
+    instead of failing the whole scrape.
+    """
+
+    def collect(self):
+        yield from self._collect_recorded()
+        yield from self._collect_nats()
+        yield from self._collect_celery_queues()
+
+    def _collect_recorded(self):
+        images = CounterMetricFamily(
+            "antenna_pipeline_images",
+            "Images handled by ML pipelines, by pipeline and status.",
+            labels=["pipeline", "status"],
+        )
+        save_results = HistogramMetricFamily(
+            "antenna_save_results_seconds",
+            "Time spent saving one batch of pipeline results to the database.",
+            labels=["pipeline"],
+        )
+        cache_events = CounterMetricFamily(
+            "antenna_source_image_cache_events",
+            "Source image cache hits, misses and evicted images (see ami/utils/image_cache.py).",
+            labels=["event"],
+        )
+        cache_bytes = CounterMetricFamily(
+            "antenna_source_image_cache_bytes",
+            "Bytes of source images read from the cache (hit), fetched into it (miss) or evicted.",
+            labels=["event"],
+        )
+        try:
+            redis = _redis()
+            image_counts = redis.hgetall(IMAGES_KEY)
+            latency_fields = redis.hgetall(SAVE_RESULTS_KEY)
+            cache_fields = {_decode(k): int(v) for k, v in redis.hgetall(SOURCE_IMAGE_CACHE_KEY).items()}
+        except RedisError as e:
+            logger.warning(f"Could not read recorded pipeline metrics: {e}")
+            return
+
+        for field, value in sorted((_decode(k), int(v)) for k, v in image_counts.items()):
+            pipeline_slug, status = field.rsplit(FIELD_SEPARATOR, 1)
+            images.add_metric([pipeline_slug, status], value)
+        yield images
+
+        per_pipeline: dict[str, dict[str, float]] = defaultdict(dict)
+        for field, value in latency_fields.items():
+            pipeline_slug, name = _decode(field).split(FIELD_SEPARATOR, 1)
+            per_pipeline[pipeline_slug][name] = float(value)
+        for pipeline_slug, values in sorted(per_pipeline.items()):
+            # Buckets are stored non-cumulative; the exposition format wants cumulative counts.
+            buckets, cumulative = [], 0.0
+            for bound in [str(bound) for bound in SAVE_RESULTS_BUCKETS] + ["+Inf"]:
+                cumulative += values.get(f"bucket{FIELD_SEPARATOR}{bound}", 0)
+                buckets.append((bound, cumulative))
+            save_results.add_metric([pipeline_slug], buckets, values.get("sum", 0.0))
+        yield save_results
+
+        for event in CACHE_EVENTS:
+            cache_events.add_metric([event], cache_fields.get(event, 0))
+            cache_bytes.add_metric([event], cache_fields.get(f"{event}_bytes", 0))
+        yield from (cache_events, cache_bytes)
+
+    def _collect_nats(self):
+        up = GaugeMetricFamily("antenna_nats_up", "Whether the NATS server answered this scrape.")
+        pending = GaugeMetricFamily(
+            "antenna_nats_stream_pending_messages",
+            "Task messages still in a job's NATS stream.",
+            labels=["job_id"],
+        )
+        redelivered = GaugeMetricFamily(
+            "antenna_nats_stream_redelivered_messages",
+            "Task messages redelivered at least once by a job's NATS consumer.",
+            labels=["job_id"],
+        )
+        dead_letters = GaugeMetricFamily(
+            "antenna_nats_dead_letter_messages",
+            "Max-delivery advisories retained in the dead letter advisory stream.",
+        )
+
+        async def _snapshot():
+            async with TaskQueueManager() as manager:
+                snapshots = await manager.list_job_stream_snapshots()
+                await manager.populate_redelivered_counts(snapshots)
+                return snapshots, await manager.get_dead_letter_count()
+
+        try:
+            snapshots, dead_letter_count = async_to_sync(_snapshot)()
+        except Exception as e:
+            logger.warning(f"Could not collect NATS metrics: {e}")
+            up.add_metric([], 0)
+            yield up
+            return
+
+        up.add_metric([], 1)
+        for snapshot in sorted(snapshots, key=lambda s: s["job_id"]):
+            pending.add_metric([str(snapshot["job_id"])], snapshot["messages"])
+            if snapshot["num_redelivered"] is not None:
+                redelivered.add_metric([str(snapshot["job_id"])], snapshot["num_redelivered"])
+        dead_letters.add_metric([], dead_letter_count)
+        yield from (up, pending, redelivered, dead_letters)
+
+    def _collect_celery_queues(self):
+        up = GaugeMetricFamily("antenna_celery_broker_up", "Whether the Celery broker answered this scrape.")
+        depth = GaugeMetricFamily(
+            "antenna_celery_queue_messages",
+            "Messages waiting in a Celery queue (not counting ones already prefetched by workers).",
+            labels=["queue"],
+        )
+        queues = sorted(
+            {settings.CELERY_TASK_DEFAULT_QUEUE} | {route["queue"] for route in settings.CELERY_TASK_ROUTES.values()}
+        )
+        try:
+            with celery_app.connection_for_read() as connection:
+                connection.ensure_connection(max_retries=1)
+                for queue in queues:
+                    # A passive declare reports the depth without creating the queue. It
+                    # raises if the queue doesn't exist yet (and closes the channel on
+                    # AMQP), so each queue gets its own channel.
+                    try:
+                        with connection.channel() as channel:
+                            depth.add_metric([queue], channel.queue_declare(queue=queue, passive=True).message_count)
+                    except connection.channel_errors:
+                        depth.add_metric([queue], 0)
+        except Exception as e:
+            logger.warning(f"Could not collect Celery queue metrics: {e}")
+            up.add_metric([], 0)
+            yield up
+            return
+
+        up.add_metric([], 1)
+        yield from (up, depth)
+
+
+registry = CollectorRegistry(auto_describe=False)
+registry.register(PipelineMetricsCollector())
+
+
+def generate_metrics() -> bytes:
+    """Render every metric in the Prometheus text exposition format."""
+    return generate_latest(registry)
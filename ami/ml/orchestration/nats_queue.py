@@ -58,6 +58,23 @@ NATS_MAX_DELIVER = getattr(settings, "NATS_MAX_DELIVER", 2)
 
 ADVISORY_STREAM_NAME = "advisories"  # Shared stream for max delivery advisories across all jobs
 
+# Per-consumer fetch timeout used while sweeping jobs during a long-poll. Kept at
+# the same short value the plain ``tasks`` endpoint has always used: the long wait
+# happens on a core-NATS "doorbell" subscription, never inside a JetStream pull
+# request. A pull request that outlives its HTTP request would keep pulling
+# messages into an inbox nobody reads, burning one of the NATS_MAX_DELIVER
+# attempts and hiding the task for a full TASK_TTR.
+LONG_POLL_FETCH_TIMEOUT = 0.5
+
+# Shortest per-consumer fetch timeout a sweep splits its remaining time into, so
+# that a fetch still has time for the round trip to a consumer with messages.
+LONG_POLL_MIN_FETCH_TIMEOUT = 0.05
+
+# How often a waiting long-poll re-sweeps its jobs without being woken up.
+# Redeliveries (ack_wait expiry) don't publish a new message on the subject, so
+# the doorbell never rings for them — a periodic sweep is the only way to see them.
+LONG_POLL_RESWEEP_INTERVAL = 5.0
+
 
 @dataclass
 class ConsumerState:
@@ -73,6 +90,32 @@ class ConsumerState:
     num_redelivered: int | None
 
 
+# Advisory types meaning JetStream will never deliver the task message again, and
+# the failure reason each is grouped under when triaging a job's dead letters.
+DEAD_LETTER_ADVISORY_TYPES = {
+    "io.nats.jetstream.advisory.v1.max_deliver": "max_deliveries_exceeded",
+    "io.nats.jetstream.advisory.v1.terminated": "terminated",
+}
+
+
+@dataclass
+class DeadLetter:
+    """A task message of a job that JetStream gave up delivering.
+
+    ``task`` is the original message, or ``None`` when it has already aged out of
+    the job stream (then it can be triaged but not replayed).
+    """
+
+    stream_seq: int
+    reason: str
+    deliveries: int | None
+    task: PipelineProcessingTask | None
+
+    @property
+    def image_id(self) -> str | None:
+        return self.task.image_id if self.task else None
+
+
 def _parse_nats_timestamp(raw: str) -> datetime.datetime:
     """Parse an RFC3339-ish NATS timestamp, tolerating sub-microsecond precision.
 
@@ -508,6 +551,121 @@ class TaskQueueManager:
             logger.error(f"Failed to reserve tasks from stream for job '{job_id}': {e}")
             return []
 
+    async def reserve_tasks_long_poll(
+        self, job_ids: list[int], count: int, wait: float
+    ) -> dict[int, list[PipelineProcessingTask]]:
+        """
+        Reserve up to `count` tasks across one or more jobs, waiting up to `wait`
+        seconds for work to appear if every queue is currently dry.
+
+        Returns as soon as any tasks are reserved. While waiting, a core-NATS
+        subscription on each job's subject acts as a doorbell: a ``publish_task``
+        for one of the jobs wakes the request up and only that job is fetched
+        from. Every ``LONG_POLL_RESWEEP_INTERVAL`` seconds all jobs with
+        in-flight work are swept again to pick up redeliveries, which don't
+        ring the doorbell.
+
+        Args:
+            job_ids: Jobs the caller is eligible to pull from. Swept in the given
+                order, so callers should shuffle for fairness.
+            count: Maximum number of tasks to reserve in total
+            wait: Maximum number of seconds to wait for tasks
+
+        Returns:
+            Dict of job_id -> reserved tasks, only containing jobs that delivered
+            at least one task. Empty if nothing arrived before the deadline.
+        """
+        if self.nc is None or self.js is None:
+            raise RuntimeError("Connection is not open. Use TaskQueueManager as an async context manager.")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        doorbell = asyncio.Event()
+        rung: set[int] = set()
+
+        def _make_ring(job_id: int):
+            async def _ring(msg) -> None:
+                rung.add(job_id)
+                doorbell.set()
+
+            return _ring
+
+        # Subscribe before the first sweep so a task published between the sweep
+        # and the wait still wakes us up.
+        subscriptions = []
+        try:
+            for job_id in job_ids:
+                subscriptions.append(await self.nc.subscribe(self._get_subject(job_id), cb=_make_ring(job_id)))
+
+            candidates = await self._jobs_with_work(job_ids)
+            while True:
+                # A request without a wait still gets one fetch's worth of time to sweep
+                sweep_deadline = max(deadline, loop.time() + LONG_POLL_FETCH_TIMEOUT)
+                reserved = await self._sweep_reserve(candidates, count, sweep_deadline)
+                if reserved:
+                    return reserved
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return {}
+                try:
+                    await asyncio.wait_for(doorbell.wait(), timeout=min(remaining, LONG_POLL_RESWEEP_INTERVAL))
+                    candidates = [job_id for job_id in job_ids if job_id in rung]
+                except asyncio.TimeoutError:
+                    if loop.time() >= deadline:
+                        return {}
+                    candidates = await self._jobs_with_work(job_ids)
+                doorbell.clear()
+                rung.clear()
+        finally:
+            for sub in subscriptions:
+                try:
+                    await sub.unsubscribe()
+                except Exception as e:
+                    logger.debug(f"Failed to unsubscribe long-poll doorbell: {e}")
+
+    async def _jobs_with_work(self, job_ids: list[int]) -> list[int]:
+        """Filter ``job_ids`` down to jobs whose consumer has anything to hand out.
+
+        Includes jobs with un-acked messages (``num_ack_pending``) because those
+        become deliverable again once their ack_wait expires. Jobs whose consumer
+        can't be read (not created yet, already cleaned up) are skipped.
+        """
+        states = await asyncio.gather(*(self.get_consumer_state(job_id) for job_id in job_ids))
+        return [
+            job_id
+            for job_id, state in zip(job_ids, states)
+            if state is not None and ((state.num_pending or 0) > 0 or (state.num_ack_pending or 0) > 0)
+        ]
+
+    async def _sweep_reserve(
+        self, job_ids: list[int], count: int, deadline: float
+    ) -> dict[int, list[PipelineProcessingTask]]:
+        """Reserve from each job in turn until `count` tasks have been collected.
+
+        Sequential on purpose: fetching from several consumers concurrently could
+        reserve more than `count` tasks, and a reserved task can't be handed back
+        without spending one of its delivery attempts.
+
+        The sweep stops at `deadline` (event loop time), so fetching from many
+        dry jobs can't hold the request past its wait. Each fetch gets an even
+        share of the time that's left, up to ``LONG_POLL_FETCH_TIMEOUT``.
+        """
+        loop = asyncio.get_running_loop()
+        reserved: dict[int, list[PipelineProcessingTask]] = {}
+        needed = count
+        for i, job_id in enumerate(job_ids):
+            remaining = deadline - loop.time()
+            if needed <= 0 or remaining <= 0:
+                break
+            share = remaining / (len(job_ids) - i)
+            timeout = max(min(share, LONG_POLL_FETCH_TIMEOUT), LONG_POLL_MIN_FETCH_TIMEOUT)
+            tasks = await self.reserve_tasks(job_id, count=needed, timeout=timeout)
+            if tasks:
+                reserved[job_id] = tasks
+                needed -= len(tasks)
+        return reserved
+
     async def acknowledge_task(self, reply_subject: str) -> bool:
         """
         Acknowledge (delete) a completed task using its reply subject.
@@ -762,7 +920,7 @@ class TaskQueueManager:
                 self.js.add_stream(
                     name=ADVISORY_STREAM_NAME,
                     subjects=["$JS.EVENT.ADVISORY.>"],
-                    max_age=3600,  # Keep advisories for 1 hour
+                    max_age=3600,  # Keep advisories for 1 hour, which bounds how long dead letters can be replayed
                 ),
                 timeout=NATS_JETSTREAM_TIMEOUT,
             )
@@ -848,6 +1006,103 @@ class TaskQueueManager:
 
         return dead_letter_ids[:n]
 
+    async def get_dead_letter_count(self) -> int:
+        """
+        Count max-delivery advisories retained in the advisory stream, across all jobs.
+
+        Advisories stay in the stream until its ``max_age`` expires, whether or not
+        :meth:`get_dead_letter_image_ids` has already read them, so this is the
+        number of tasks that exhausted their retries in the last hour.
+        """
+        if self.js is None:
+            raise RuntimeError("Connection is not open. Use TaskQueueManager as an async context manager.")
+
+        info = await asyncio.wait_for(
+            self.js.stream_info(ADVISORY_STREAM_NAME, subjects_filter="$JS.EVENT.ADVISORY.CONSUMER.MAX_DELIVERIES.>"),
+            timeout=NATS_JETSTREAM_TIMEOUT,
+        )
+        return sum((info.state.subjects or {}).values())
+
+    async def list_dead_letters(self, job_id: int) -> list[DeadLetter]:
+        """
+        Return every dead letter of a job still retained in the advisory stream.
+
+        Unlike :meth:`get_dead_letter_image_ids` this does not consume anything: it
+        reads through an ephemeral consumer that never acks, so it can be called
+        repeatedly for triage. Each message appears once, under the reason of its
+        latest advisory, with its original task payload looked up from the job
+        stream.
+        """
+        if self.nc is None or self.js is None:
+            raise RuntimeError("Connection is not open. Use TaskQueueManager as an async context manager.")
+
+        stream_name = self._get_stream_name(job_id)
+        consumer_name = self._get_consumer_name(job_id)
+        subject_filter = f"$JS.EVENT.ADVISORY.CONSUMER.*.{stream_name}.{consumer_name}"
+
+        advisories: dict[int, dict] = {}
+        psub = await self.js.pull_subscribe(
+            subject_filter,
+            stream=ADVISORY_STREAM_NAME,
+            config=ConsumerConfig(ack_policy=AckPolicy.NONE, deliver_policy=DeliverPolicy.ALL),
+        )
+        try:
+            while True:
+                try:
+                    msgs = await psub.fetch(256, timeout=1.0)
+                except (asyncio.TimeoutError, nats.errors.TimeoutError):
+                    break
+                for msg in msgs:
+                    advisory = json.loads(msg.data.decode())
+                    if advisory.get("type") in DEAD_LETTER_ADVISORY_TYPES and "stream_seq" in advisory:
+                        advisories[advisory["stream_seq"]] = advisory
+                if not msgs or msgs[-1].metadata.num_pending == 0:
+                    break
+        finally:
+            await psub.unsubscribe()
+
+        dead_letters = []
+        for stream_seq, advisory in sorted(advisories.items()):
+            reason = DEAD_LETTER_ADVISORY_TYPES[advisory["type"]]
+            if advisory.get("reason"):
+                reason = f"{reason}: {advisory['reason']}"
+            task = None
+            try:
+                job_msg = await self.js.get_msg(stream_name, stream_seq)
+                task = PipelineProcessingTask(**json.loads(job_msg.data.decode()))
+            except nats.js.errors.NotFoundError:
+                pass
+            dead_letters.append(
+                DeadLetter(
+                    stream_seq=stream_seq,
+                    reason=reason,
+                    deliveries=advisory.get("deliveries"),
+                    task=task,
+                )
+            )
+        return dead_letters
+
+    async def publish_tasks_paced(
+        self, job_id: int, tasks: list[PipelineProcessingTask], max_per_second: float | None = None
+    ) -> list[bool]:
+        """
+        Publish tasks one after another, at most ``max_per_second`` per second.
+
+        Used to re-drive dead letters: a replay of thousands of tasks should reach
+        the workers as a steady trickle, not as one burst that immediately times out
+        again. Returns the :meth:`publish_task` result for each task, in order.
+        """
+        interval = 1.0 / max_per_second if max_per_second else 0.0
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        published = []
+        for i, task in enumerate(tasks):
+            delay = start + i * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            published.append(await self.publish_task(job_id, task))
+        return published
+
     async def delete_dlq_consumer(self, job_id: int) -> bool:
         """
         Delete the durable DLQ advisory consumer for a job.
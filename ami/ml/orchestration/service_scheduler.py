@@ -0,0 +1,334 @@
+"""
+Load balancing across the processing services that serve a pipeline.
+
+The outcome of every synchronous ``/process`` request and every ``/readyz``
+status check is recorded per processing service in Redis, so that all web and
+Celery processes share the same view:
+
+  - a rolling (exponentially weighted) average of ``/process`` latency,
+  - a rolling error rate over ``/process`` requests and status checks,
+  - the ``/process`` requests currently outstanding, each with a deadline after
+    which it stops counting, so a worker killed mid-request doesn't leave its
+    request outstanding for good,
+  - a circuit breaker: after ``PROCESSING_SERVICE_CIRCUIT_FAILURES`` consecutive
+    failures a service is skipped for ``PROCESSING_SERVICE_CIRCUIT_COOLDOWN``
+    seconds, then given a single trial request. A success (including a passing
+    status check) closes the circuit again.
+
+``choose_service`` sends each batch to the available service with the fewest
+outstanding requests, weighted by how slow and how error-prone it has been, so
+several services registered for one pipeline share its traffic. Choosing a
+service and counting the request to it is one Lua script, so concurrent workers
+don't all pick the same service.
+
+Like ``metrics.py``, recording never raises: a Redis outage falls back to
+choosing by the last status check latency.
+"""
+
+import dataclasses
+import logging
+import random
+import time
+import typing
+import uuid
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+if typing.TYPE_CHECKING:
+    from ami.ml.models import ProcessingService
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the rolling latency and error rate averages
+SMOOTHING = 0.2
+
+# Health of a service nobody has sent requests to or checked for this long is forgotten
+HEALTH_TTL = 60 * 60
+
+# An outstanding request stops counting once its service's request timeout has passed
+# for every attempt, or after this many seconds for a service that waits indefinitely.
+UNFINISHED_REQUEST_TTL = 60 * 60
+
+# Error rates are capped here when weighing services, so a failing service
+# still costs a finite amount and stays ahead of a circuit-broken one.
+MAX_ERROR_RATE = 0.95
+
+# Picks a service and counts a request to it as outstanding, atomically.
+# KEYS: the health hash and outstanding requests of each candidate, in order of preference on ties.
+# ARGV: now, request ID, circuit failures, circuit cooldown, then each candidate's cost per outstanding
+# request and its request's deadline.
+# Returns the candidate's (1-based) position and its number of outstanding requests before this one.
+CHOOSE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local circuit_failures = tonumber(ARGV[3])
+local cooldown = tonumber(ARGV[4])
+local candidates = {}
+local trial = nil
+for i = 1, #KEYS / 2 do
+    local outstanding_key = KEYS[2 * i]
+    redis.call("ZREMRANGEBYSCORE", outstanding_key, "-inf", now)
+    local circuit = redis.call("HMGET", KEYS[2 * i - 1], "failures", "open_until")
+    local tripped = (tonumber(circuit[1]) or 0) >= circuit_failures
+    local open_until = tonumber(circuit[2]) or 0
+    candidates[i] = {
+        outstanding = redis.call("ZCARD", outstanding_key),
+        open = tripped and now < open_until,
+        cost = tonumber(ARGV[3 + 2 * i]),
+    }
+    if trial == nil and tripped and now >= open_until then
+        trial = i
+    end
+end
+
+local chosen = trial
+if chosen ~= nil then
+    -- Claim the single trial request; others keep skipping the service until it succeeds
+    redis.call("HSET", KEYS[2 * chosen - 1], "open_until", now + cooldown)
+else
+    local all_open = true
+    for i = 1, #candidates do
+        if not candidates[i].open then
+            all_open = false
+        end
+    end
+    local best = nil
+    for i = 1, #candidates do
+        local candidate = candidates[i]
+        if all_open or not candidate.open then
+            local cost = (candidate.outstanding + 1) * candidate.cost
+            if best == nil or cost < best then
+                chosen, best = i, cost
+            end
+        end
+    end
+end
+
+local outstanding_key = KEYS[2 * chosen]
+local deadline = tonumber(ARGV[4 + 2 * chosen])
+redis.call("ZADD", outstanding_key, deadline, ARGV[2])
+if redis.call("TTL", outstanding_key) < deadline - now then
+    redis.call("EXPIRE", outstanding_key, math.ceil(deadline - now))
+end
+return {chosen, candidates[chosen].outstanding}
+"""
+
+# Counts a request as outstanding until its deadline, keeping the set of requests until then.
+# KEYS: the outstanding requests of a service. ARGV: now, request ID, deadline.
+START_SCRIPT = """
+local now = tonumber(ARGV[1])
+local deadline = tonumber(ARGV[3])
+redis.call("ZADD", KEYS[1], deadline, ARGV[2])
+if redis.call("TTL", KEYS[1]) < deadline - now then
+    redis.call("EXPIRE", KEYS[1], math.ceil(deadline - now))
+end
+"""
+
+
+def _redis():
+    return get_redis_connection("default")
+
+
+def _key(service_id: int) -> str:
+    return f"processing_service:{service_id}:health"
+
+
+def _outstanding_key(service_id: int) -> str:
+    return f"processing_service:{service_id}:outstanding"
+
+
+def _request_ttl(service: "ProcessingService") -> float:
+    """Seconds a request to the service can take, including its retries."""
+    if not service.request_timeout:
+        return UNFINISHED_REQUEST_TTL
+    return service.request_timeout * (service.max_retries + 1)
+
+
+@dataclasses.dataclass
+class ServiceHealth:
+    latency: float | None = None
+    error_rate: float = 0.0
+    outstanding: int = 0
+    failures: int = 0
+    open_until: float = 0.0
+
+    @property
+    def tripped(self) -> bool:
+        return self.failures >= settings.PROCESSING_SERVICE_CIRCUIT_FAILURES
+
+    def circuit_open(self, now: float) -> bool:
+        return self.tripped and now < self.open_until
+
+    def half_open(self, now: float) -> bool:
+        return self.tripped and now >= self.open_until
+
+    @classmethod
+    def from_redis(cls, values: dict, outstanding: int = 0) -> "ServiceHealth":
+        values = {key.decode(): value.decode() for key, value in values.items()}
+        return cls(
+            latency=float(values["latency"]) if "latency" in values else None,
+            error_rate=float(values.get("error_rate", 0.0)),
+            outstanding=outstanding,
+            failures=int(values.get("failures", 0)),
+            open_until=float(values.get("open_until", 0.0)),
+        )
+
+
+def get_health(service_ids: typing.Iterable[int]) -> dict[int, ServiceHealth]:
+    service_ids = list(service_ids)
+    now = time.time()
+    with _redis().pipeline(transaction=False) as pipe:
+        for service_id in service_ids:
+            pipe.hgetall(_key(service_id))
+            pipe.zcount(_outstanding_key(service_id), f"({now}", "+inf")
+        results = pipe.execute()
+    return {
+        service_id: ServiceHealth.from_redis(values, outstanding)
+        for service_id, values, outstanding in zip(service_ids, results[::2], results[1::2])
+    }
+
+
+def reset_health(service_id: int) -> None:
+    try:
+        _redis().delete(_key(service_id), _outstanding_key(service_id))
+    except RedisError as e:
+        logger.warning(f"Could not reset health of processing service {service_id}: {e}")
+
+
+def request_started(service: "ProcessingService") -> str | None:
+    """
+    Count a ``/process`` request to the service as outstanding, and return its ID for ``request_finished``.
+
+    If ``choose_service`` chose the service for this request, it was counted then. Returns None
+    if the request could not be counted.
+    """
+    request_id = service.__dict__.pop("scheduled_request_id", None)
+    if request_id is not None:
+        return request_id
+
+    request_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        start = _redis().register_script(START_SCRIPT)
+        start(keys=[_outstanding_key(service.pk)], args=[now, request_id, now + _request_ttl(service)])
+    except RedisError as e:
+        logger.warning(f"Could not record request to processing service {service.pk}: {e}")
+        return None
+    return request_id
+
+
+def request_cancelled(service: "ProcessingService") -> None:
+    """Stop counting the request ``choose_service`` chose the service for, when it won't be sent."""
+    request_id = service.__dict__.pop("scheduled_request_id", None)
+    if request_id is None:
+        return
+    try:
+        _redis().zrem(_outstanding_key(service.pk), request_id)
+    except RedisError as e:
+        logger.warning(f"Could not record request to processing service {service.pk}: {e}")
+
+
+def request_finished(service_id: int, request_id: str | None, seconds: float, ok: bool) -> None:
+    """Record the outcome of a ``/process`` request counted by ``request_started``."""
+    if request_id is not None:
+        try:
+            _redis().zrem(_outstanding_key(service_id), request_id)
+        except RedisError as e:
+            logger.warning(f"Could not record request to processing service {service_id}: {e}")
+    _record_outcome(service_id, ok, latency=seconds if ok else None)
+
+
+def record_status_check(service_id: int, live: bool) -> None:
+    """Record the outcome of a status check; its latency is not comparable to ``/process`` latency."""
+    _record_outcome(service_id, live)
+
+
+def _rolling(previous: bytes | None, sample: float) -> float:
+    if previous is None:
+        return sample
+    return (1 - SMOOTHING) * float(previous) + SMOOTHING * sample
+
+
+def _record_outcome(service_id: int, ok: bool, latency: float | None = None) -> None:
+    key = _key(service_id)
+    try:
+        redis = _redis()
+        # Concurrent updates may drop a sample from the rolling averages; that's fine for weighting
+        previous_latency, previous_error_rate = redis.hmget(key, "latency", "error_rate")
+        mapping = {"error_rate": _rolling(previous_error_rate, 0.0 if ok else 1.0)}
+        if latency is not None:
+            mapping["latency"] = _rolling(previous_latency, latency)
+        with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=mapping)
+            if ok:
+                pipe.hset(key, "failures", 0)
+            else:
+                pipe.hincrby(key, "failures", 1)
+            pipe.expire(key, HEALTH_TTL)
+            results = pipe.execute()
+        failures = results[1]
+        if not ok and failures >= settings.PROCESSING_SERVICE_CIRCUIT_FAILURES:
+            # Opens the circuit, or re-opens it after a failed trial request
+            redis.hset(key, "open_until", time.time() + settings.PROCESSING_SERVICE_CIRCUIT_COOLDOWN)
+            logger.warning(
+                f"Processing service {service_id} failed {failures} times in a row, "
+                f"not sending it requests for {settings.PROCESSING_SERVICE_CIRCUIT_COOLDOWN}s"
+            )
+    except RedisError as e:
+        logger.warning(f"Could not record health of processing service {service_id}: {e}")
+
+
+def choose_service(services: list["ProcessingService"]) -> tuple["ProcessingService", ServiceHealth]:
+    """
+    Pick the service to send the next request to, from a non-empty list of online services.
+
+    A service whose circuit cooldown has passed gets the next request as its trial.
+    Services whose circuit is open are skipped, unless every one of them is. The rest are
+    weighed by ``(outstanding + 1) * latency / success rate``: a service twice as fast
+    takes twice the outstanding requests before the next one goes elsewhere. A service
+    with no recorded requests yet is assumed to be as fast as the fastest known one, so
+    new services get traffic; with no requests recorded at all, services are weighed by
+    their status check latency. Ties are broken at random.
+
+    The request is counted as outstanding right away, so that concurrent callers see it;
+    ``request_started`` picks it up from the chosen service, and ``request_cancelled``
+    releases it if it won't be sent.
+    """
+    now = time.time()
+    try:
+        health = get_health(service.pk for service in services)
+    except RedisError as e:
+        logger.warning(f"Could not read processing service health, choosing by last status check: {e}")
+        health = {service.pk: ServiceHealth() for service in services}
+
+    process_latencies = [health[service.pk].latency for service in services if health[service.pk].latency]
+
+    def cost_per_request(service: "ProcessingService") -> float:
+        service_health = health[service.pk]
+        if process_latencies:
+            latency = service_health.latency or min(process_latencies)
+        else:
+            # No /process requests recorded yet: fall back to the status check latency
+            latency = service.last_seen_latency or 1.0
+        success_rate = 1 - min(service_health.error_rate, MAX_ERROR_RATE)
+        return latency / success_rate
+
+    candidates = random.sample(services, len(services))
+    request_id = uuid.uuid4().hex
+    keys, args = [], [now, request_id, settings.PROCESSING_SERVICE_CIRCUIT_FAILURES]
+    args.append(settings.PROCESSING_SERVICE_CIRCUIT_COOLDOWN)
+    for service in candidates:
+        keys += [_key(service.pk), _outstanding_key(service.pk)]
+        args += [cost_per_request(service), now + _request_ttl(service)]
+    try:
+        position, outstanding = _redis().register_script(CHOOSE_SCRIPT)(keys=keys, args=args)
+    except RedisError as e:
+        logger.warning(f"Could not record request to a processing service, choosing by last status check: {e}")
+        available = [service for service in candidates if not health[service.pk].circuit_open(now)] or candidates
+        chosen = min(available, key=lambda service: (health[service.pk].outstanding + 1) * cost_per_request(service))
+        return chosen, health[chosen.pk]
+
+    chosen = candidates[position - 1]
+    chosen.scheduled_request_id = request_id
+    return chosen, dataclasses.replace(health[chosen.pk], outstanding=outstanding)
@@ -28,7 +28,7 @@ def _stub_manager(mock_manager_cls, publish_results=None):
     return instance
 
 
-@patch("ami.ml.orchestration.jobs.AsyncJobStateManager")
+@patch("ami.ml.orchestration.jobs.get_job_state_manager")
 @patch("ami.ml.orchestration.jobs.TaskQueueManager")
 class TestQueueImagesToNatsFanout(TestCase):
     """Unit-test the chunk+gather behaviour of queue_images_to_nats.
@@ -0,0 +1,71 @@
+"""Tests for the Prometheus metrics exporter, scraped through the API endpoint."""
+
+from django.urls import reverse
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from ami.ml.orchestration.metrics import observe_save_results, record_images, reset_recorded_metrics
+from ami.users.models import User
+
+
+class TestMetricsEndpoint(APITestCase):
+    def setUp(self):
+        reset_recorded_metrics()
+        self.addCleanup(reset_recorded_metrics)
+        self.url = reverse("api:status-metrics")
+        self.staff_user = User.objects.create_user(email="metrics@insectai.org", is_staff=True)  # type: ignore
+
+    def _scrape(self) -> dict[str, dict]:
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        samples = {}
+        for family in text_string_to_metric_families(response.content.decode()):
+            for sample in family.samples:
+                samples.setdefault(sample.name, {})[tuple(sorted(sample.labels.items()))] = sample.value
+        return samples
+
+    def test_requires_staff(self):
+        response = self.client.get(self.url)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+        user = User.objects.create_user(email="not-staff@insectai.org")  # type: ignore
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_recorded_counters_and_histogram(self):
+        record_images("moths", "queued", 10)
+        record_images("moths", "processed", 7)
+        record_images("moths", "processed", 1)
+        record_images("moths", "failed", 2)
+        record_images("moths", "saved", 0)  # no-op
+        observe_save_results("moths", 0.2)
+        observe_save_results("moths", 3.0)
+        observe_save_results("moths", 999.0)
+
+        samples = self._scrape()
+
+        images = samples["antenna_pipeline_images_total"]
+        self.assertEqual(images[(("pipeline", "moths"), ("status", "queued"))], 10)
+        self.assertEqual(images[(("pipeline", "moths"), ("status", "processed"))], 8)
+        self.assertEqual(images[(("pipeline", "moths"), ("status", "failed"))], 2)
+        self.assertNotIn((("pipeline", "moths"), ("status", "saved")), images)
+
+        buckets = samples["antenna_save_results_seconds_bucket"]
+        self.assertEqual(buckets[(("le", "0.1"), ("pipeline", "moths"))], 0)
+        self.assertEqual(buckets[(("le", "0.25"), ("pipeline", "moths"))], 1)
+        self.assertEqual(buckets[(("le", "5.0"), ("pipeline", "moths"))], 2)
+        self.assertEqual(buckets[(("le", "+Inf"), ("pipeline", "moths"))], 3)
+        self.assertEqual(samples["antenna_save_results_seconds_count"][(("pipeline", "moths"),)], 3)
+        self.assertAlmostEqual(samples["antenna_save_results_seconds_sum"][(("pipeline", "moths"),)], 1002.2)
+
+    def test_live_gauges(self):
+        samples = self._scrape()
+
+        self.assertEqual(samples["antenna_nats_up"][()], 1)
+        self.assertIn("antenna_nats_dead_letter_messages", samples)
+        self.assertEqual(samples["antenna_celery_broker_up"][()], 1)
+        queues = {dict(labels)["queue"] for labels in samples["antenna_celery_queue_messages"]}
+        self.assertEqual(queues, {"antenna", "jobs", "ml_results"})
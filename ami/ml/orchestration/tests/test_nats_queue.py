@@ -1,5 +1,6 @@
 """Unit tests for TaskQueueManager."""
 
+import asyncio
 import json
 import logging
 import unittest
@@ -137,6 +138,119 @@ class TestTaskQueueManager(unittest.IsolatedAsyncioTestCase):
                 self.assertEqual(len(tasks), 1)
                 self.assertEqual(tasks[0].reply_subject, "reply.subject.123")
 
+    def _mock_doorbell_subscriptions(self, nc):
+        """Record the callback of each core-NATS subscribe so a test can ring it."""
+        callbacks = {}
+        subs = []
+
+        async def subscribe(subject, cb=None):
+            callbacks[subject] = cb
+            sub = MagicMock()
+            sub.unsubscribe = AsyncMock()
+            subs.append(sub)
+            return sub
+
+        nc.subscribe = AsyncMock(side_effect=subscribe)
+        return callbacks, subs
+
+    async def test_reserve_tasks_long_poll_returns_available_tasks_without_waiting(self):
+        """Tasks already queued are returned from the first sweep, before any wait."""
+        nc, js = self._create_mock_nats_connection()
+        _, subs = self._mock_doorbell_subscriptions(nc)
+        js.consumer_info = AsyncMock(return_value=MagicMock(num_pending=2, num_ack_pending=0, num_redelivered=0))
+        sample_task = self._create_sample_task()
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                with patch.object(manager, "reserve_tasks", AsyncMock(return_value=[sample_task])) as reserve:
+                    reserved = await manager.reserve_tasks_long_poll([123], count=5, wait=30)
+
+        self.assertEqual(reserved, {123: [sample_task]})
+        reserve.assert_awaited_once()
+        for sub in subs:
+            sub.unsubscribe.assert_awaited_once()
+
+    async def test_reserve_tasks_long_poll_fills_batch_across_jobs(self):
+        """Jobs are swept in order and the sweep stops once `count` tasks are reserved."""
+        nc, js = self._create_mock_nats_connection()
+        self._mock_doorbell_subscriptions(nc)
+        js.consumer_info = AsyncMock(return_value=MagicMock(num_pending=5, num_ack_pending=0, num_redelivered=0))
+        sample_task = self._create_sample_task()
+
+        async def reserve(job_id, count, timeout):
+            return [sample_task] * min(count, 2)
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                with patch.object(manager, "reserve_tasks", AsyncMock(side_effect=reserve)) as reserve_mock:
+                    reserved = await manager.reserve_tasks_long_poll([1, 2, 3], count=3, wait=0)
+
+        self.assertEqual({job_id: len(tasks) for job_id, tasks in reserved.items()}, {1: 2, 2: 1})
+        self.assertEqual([c.args[0] for c in reserve_mock.call_args_list], [1, 2])
+
+    async def test_reserve_tasks_long_poll_sweep_stops_at_deadline(self):
+        """Sweeping many dry jobs splits the wait between them instead of spending a full fetch on each."""
+        nc, js = self._create_mock_nats_connection()
+        self._mock_doorbell_subscriptions(nc)
+        # Every consumer has un-acked work, so every job is a sweep candidate, but none delivers.
+        js.consumer_info = AsyncMock(return_value=MagicMock(num_pending=0, num_ack_pending=1, num_redelivered=0))
+
+        async def reserve(job_id, count, timeout):
+            await asyncio.sleep(timeout)
+            return []
+
+        loop = asyncio.get_running_loop()
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                with patch.object(manager, "reserve_tasks", AsyncMock(side_effect=reserve)) as reserve_mock:
+                    start = loop.time()
+                    reserved = await manager.reserve_tasks_long_poll(list(range(50)), count=5, wait=1)
+                    elapsed = loop.time() - start
+
+        self.assertEqual(reserved, {})
+        self.assertLess(elapsed, 1.5)
+        self.assertTrue(all(c.kwargs["timeout"] < 0.5 for c in reserve_mock.call_args_list))
+
+    async def test_reserve_tasks_long_poll_wakes_on_doorbell(self):
+        """A publish on one job's subject wakes the wait and only that job is fetched."""
+        nc, js = self._create_mock_nats_connection()
+        callbacks, _ = self._mock_doorbell_subscriptions(nc)
+        # Both consumers are idle, so the initial sweep has nothing to fetch.
+        js.consumer_info = AsyncMock(return_value=MagicMock(num_pending=0, num_ack_pending=0, num_redelivered=0))
+        sample_task = self._create_sample_task()
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                with patch.object(manager, "reserve_tasks", AsyncMock(return_value=[sample_task])) as reserve:
+
+                    async def ring_later():
+                        await asyncio.sleep(0.05)
+                        await callbacks["job.2.tasks"](MagicMock())
+
+                    ringer = asyncio.create_task(ring_later())
+                    reserved = await manager.reserve_tasks_long_poll([1, 2], count=5, wait=30)
+                    await ringer
+
+        self.assertEqual(reserved, {2: [sample_task]})
+        reserve.assert_awaited_once()
+        self.assertEqual(reserve.call_args.args[0], 2)
+
+    async def test_reserve_tasks_long_poll_returns_empty_after_wait(self):
+        """With nothing published, the call returns an empty dict once `wait` elapses."""
+        nc, js = self._create_mock_nats_connection()
+        _, subs = self._mock_doorbell_subscriptions(nc)
+        js.consumer_info = AsyncMock(side_effect=nats.js.errors.NotFoundError())
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                with patch.object(manager, "reserve_tasks", AsyncMock(return_value=[])) as reserve:
+                    reserved = await manager.reserve_tasks_long_poll([123], count=5, wait=0.1)
+
+        self.assertEqual(reserved, {})
+        reserve.assert_not_awaited()
+        for sub in subs:
+            sub.unsubscribe.assert_awaited_once()
+
     async def test_acknowledge_task_success(self):
         """Test successful task acknowledgment."""
         nc, js = self._create_mock_nats_connection()
@@ -237,6 +351,69 @@ class TestTaskQueueManager(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, [])
         mock_psub.unsubscribe.assert_called_once()
 
+    async def test_list_dead_letters_groups_reasons_without_consuming(self):
+        """Dead letters are read through a non-acking consumer and matched to their tasks."""
+        from nats.js.errors import NotFoundError
+
+        nc, js = self._create_mock_nats_connection()
+
+        def make_advisory(advisory, num_pending=0):
+            m = MagicMock()
+            m.data = json.dumps(advisory).encode()
+            m.metadata.num_pending = num_pending
+            m.ack = AsyncMock()
+            return m
+
+        advisories = [
+            make_advisory({"type": "io.nats.jetstream.advisory.v1.max_deliver", "stream_seq": 1, "deliveries": 2}),
+            make_advisory({"type": "io.nats.jetstream.advisory.v1.consumer_action", "action": "CREATE"}),
+            make_advisory({"type": "io.nats.jetstream.advisory.v1.terminated", "stream_seq": 2, "reason": "bad"}),
+            make_advisory({"type": "io.nats.jetstream.advisory.v1.max_deliver", "stream_seq": 3, "deliveries": 2}),
+        ]
+        job_msg = MagicMock()
+        job_msg.data = json.dumps(self._create_sample_task().dict()).encode()
+        js.get_msg = AsyncMock(side_effect=[job_msg, job_msg, NotFoundError])
+
+        mock_psub = MagicMock()
+        mock_psub.fetch = AsyncMock(return_value=advisories)
+        mock_psub.unsubscribe = AsyncMock()
+        js.pull_subscribe = AsyncMock(return_value=mock_psub)
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                dead_letters = await manager.list_dead_letters(123)
+
+        self.assertEqual(
+            [(d.stream_seq, d.reason, d.image_id) for d in dead_letters],
+            [
+                (1, "max_deliveries_exceeded", "img-456"),
+                (2, "terminated: bad", "img-456"),
+                (3, "max_deliveries_exceeded", None),
+            ],
+        )
+        subject = js.pull_subscribe.call_args.args[0]
+        self.assertEqual(subject, "$JS.EVENT.ADVISORY.CONSUMER.*.job_123.job-123-consumer")
+        self.assertIsNone(js.pull_subscribe.call_args.kwargs.get("durable"))
+        for advisory in advisories:
+            advisory.ack.assert_not_called()
+        mock_psub.unsubscribe.assert_called_once()
+
+    async def test_publish_tasks_paced(self):
+        """Tasks are published in order, spaced to the requested rate."""
+        nc, js = self._create_mock_nats_connection()
+        tasks = [self._create_sample_task() for _ in range(3)]
+
+        with patch("ami.ml.orchestration.nats_queue.get_connection", AsyncMock(return_value=(nc, js))):
+            async with TaskQueueManager() as manager:
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                published = await manager.publish_tasks_paced(123, tasks, max_per_second=20)
+                elapsed = loop.time() - start
+
+        self.assertEqual(published, [True, True, True])
+        self.assertEqual(js.publish.call_count, 3)
+        self.assertGreaterEqual(elapsed, 0.1)  # two 50ms gaps
+
 
 class TestTaskQueueManagerJobLogger(unittest.IsolatedAsyncioTestCase):
     """Tests covering the job_logger lifecycle-mirroring behavior (#1220)."""
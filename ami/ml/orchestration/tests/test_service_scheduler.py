@@ -0,0 +1,144 @@
+"""Tests for spreading synchronous ML requests across a pipeline's processing services."""
+
+import time
+from unittest.mock import Mock, patch
+
+from django.test import TestCase, override_settings
+
+from ami.main.models import Project
+from ami.ml.models import Pipeline, ProcessingService
+from ami.ml.models.pipeline import send_pipeline_request
+from ami.ml.orchestration.service_scheduler import (
+    choose_service,
+    get_health,
+    record_status_check,
+    request_cancelled,
+    request_finished,
+    request_started,
+    reset_health,
+)
+from ami.ml.schemas import PipelineRequest
+
+
+@override_settings(PROCESSING_SERVICE_CIRCUIT_FAILURES=3, PROCESSING_SERVICE_CIRCUIT_COOLDOWN=60)
+class TestServiceScheduler(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name="Scheduling project")
+        self.pipeline = Pipeline.objects.create(name="Scheduled pipeline", slug="scheduled-pipeline")
+        self.pipeline.projects.add(self.project)
+        self.fast = self._create_service("Fast service", latency=0.5)
+        self.slow = self._create_service("Slow service", latency=0.5)
+
+    def _create_service(self, name: str, latency: float) -> ProcessingService:
+        # save() rather than objects.create(), which would check the (unreachable) endpoint
+        service = ProcessingService(
+            name=name, endpoint_url=f"http://{name.lower().replace(' ', '-')}:2000", last_seen_live=True
+        )
+        service.last_seen_latency = latency
+        service.save()
+        service.projects.add(self.project)
+        service.pipelines.add(self.pipeline)
+        reset_health(service.pk)
+        self.addCleanup(reset_health, service.pk)
+        return service
+
+    def _finish_request(self, service: ProcessingService, seconds: float, ok: bool = True):
+        request_id = request_started(service)
+        request_finished(service.pk, request_id, seconds=seconds, ok=ok)
+
+    def _choose_and_send(self, times: int) -> list[ProcessingService]:
+        chosen = []
+        for _ in range(times):
+            service, _ = choose_service([self.fast, self.slow])
+            request_started(service)
+            chosen.append(service)
+        return chosen
+
+    def test_least_outstanding_requests_weighted_by_latency(self):
+        self._finish_request(self.fast, 1.0)
+        self._finish_request(self.slow, 2.9)
+
+        chosen = self._choose_and_send(8)
+
+        # Almost three times as fast, so it keeps almost three times the outstanding requests
+        self.assertEqual(chosen.count(self.fast), 6)
+        self.assertEqual(chosen.count(self.slow), 2)
+        self.assertEqual(get_health([self.fast.pk])[self.fast.pk].outstanding, 6)
+
+    def test_new_service_gets_traffic(self):
+        self._finish_request(self.fast, 1.0)
+
+        chosen = self._choose_and_send(2)
+
+        self.assertEqual(set(chosen), {self.fast, self.slow})
+
+    def test_circuit_breaker(self):
+        for _ in range(3):
+            self._finish_request(self.fast, 0.1, ok=False)
+
+        self.assertTrue(get_health([self.fast.pk])[self.fast.pk].tripped)
+        self.assertEqual(self._choose_and_send(3), [self.slow] * 3)
+
+        # Once the cooldown has passed, the service gets a single trial request
+        with patch("ami.ml.orchestration.service_scheduler.time.time", return_value=2e10):
+            self.assertEqual(choose_service([self.fast, self.slow])[0], self.fast)
+            self.assertEqual(choose_service([self.fast, self.slow])[0], self.slow)
+
+        # A passing status check closes the circuit again
+        record_status_check(self.fast.pk, live=True)
+        self.assertFalse(get_health([self.fast.pk])[self.fast.pk].tripped)
+
+    def test_every_circuit_open_still_chooses_a_service(self):
+        for service in (self.fast, self.slow):
+            for _ in range(3):
+                self._finish_request(service, 0.1, ok=False)
+
+        service, health = choose_service([self.fast, self.slow])
+        self.assertIn(service, (self.fast, self.slow))
+        self.assertTrue(health.tripped)
+
+    def test_choosing_counts_the_request(self):
+        """Concurrent choices see each other's requests before they are sent."""
+        self._finish_request(self.fast, 1.0)
+        self._finish_request(self.slow, 1.0)
+
+        first, _ = choose_service([self.fast, self.slow])
+        second, _ = choose_service([self.fast, self.slow])
+
+        self.assertNotEqual(first, second)
+        request_cancelled(first)
+        self.assertEqual(get_health([first.pk])[first.pk].outstanding, 0)
+        # The request counted when the service was chosen is the one that finishes
+        request_finished(second.pk, request_started(second), seconds=1.0, ok=True)
+        self.assertEqual(get_health([second.pk])[second.pk].outstanding, 0)
+
+    def test_unfinished_requests_expire(self):
+        """A request whose worker was killed stops counting once its timeout has passed."""
+        self.fast.request_timeout = 10
+        request_started(self.fast)
+        self.assertEqual(get_health([self.fast.pk])[self.fast.pk].outstanding, 1)
+
+        with patch("ami.ml.orchestration.service_scheduler.time.time", return_value=time.time() + 60):
+            self.assertEqual(get_health([self.fast.pk])[self.fast.pk].outstanding, 0)
+            self.assertEqual(choose_service([self.fast])[1].outstanding, 0)
+
+    def test_pipeline_spreads_across_online_services(self):
+        request_started(self.fast)
+        request_started(self.fast)
+
+        chosen = self.pipeline.choose_processing_service_for_pipeline(None, self.pipeline.name, self.project.pk)
+
+        self.assertEqual(chosen, self.slow)
+
+    def test_send_pipeline_request_records_outcome(self):
+        session = Mock()
+        session.post.return_value = Mock(status_code=503)
+        request_data = PipelineRequest(pipeline=self.pipeline.slug, source_images=[])
+
+        with patch.object(ProcessingService, "get_session", return_value=session):
+            send_pipeline_request(f"{self.fast.endpoint_url}/process", request_data, processing_service=self.fast)
+
+        health = get_health([self.fast.pk])[self.fast.pk]
+        self.assertEqual(health.outstanding, 0)
+        self.assertEqual(health.failures, 1)
+        self.assertEqual(health.error_rate, 1.0)
@@ -155,6 +155,9 @@ class ProcessingServiceSerializer(DefaultSerializer):
             "updated_at",
             "last_seen",
             "last_seen_live",
+            "max_connections",
+            "max_retries",
+            "request_timeout",
         ]
 
     def get_projects(self, obj):
@@ -1,7 +1,7 @@
 import logging
 import time
 
-from ami.ml.media import create_detection_images_from_source_image
+from ami.ml.media import create_detection_images_for_source_images
 from ami.tasks import default_soft_time_limit, default_time_limit
 from config import celery_app
 
@@ -57,15 +57,16 @@ def create_detection_images(source_image_ids: list[int]):
 
     logger.debug(f"Creating detection images for {len(source_image_ids)} capture(s)")
 
-    for source_image in SourceImage.objects.filter(pk__in=source_image_ids):
-        try:
-            processed_paths = create_detection_images_from_source_image(source_image)
-            logger.debug(f"Created {len(processed_paths)} detection images for SourceImage #{source_image.pk}")
-        except Exception as e:
-            logger.error(f"Error creating detection images for SourceImage {source_image.pk}: {str(e)}")
+    source_images = SourceImage.objects.filter(pk__in=source_image_ids).select_related("deployment__data_source")
+    result = create_detection_images_for_source_images(source_images)
+    for source_image_id, error in result.errors:
+        logger.error(f"Error creating detection images for SourceImage {source_image_id}: {error}")
 
     total_time = time.time() - start_time
-    logger.info(f"Created detection images for {len(source_image_ids)} capture(s) in {total_time:.2f} seconds")
+    logger.info(
+        f"Created {len(result.paths)} detection images for {len(source_image_ids)} capture(s) "
+        f"in {total_time:.2f} seconds"
+    )
 
 
 @celery_app.task(soft_time_limit=default_soft_time_limit, time_limit=default_time_limit)
@@ -1,10 +1,18 @@
 import concurrent.futures
 import datetime
+import io
 import pathlib
+import tempfile
 import unittest
 import uuid
-
-from django.test import TestCase
+from unittest.mock import ANY, patch
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image as PILImage
 from rest_framework.test import APIRequestFactory, APITestCase
 
 from ami.base.serializers import reverse_with_params
@@ -22,8 +30,15 @@ from ami.main.models import (
     TaxonRank,
     group_images_into_events,
 )
-from ami.ml.models import Algorithm, Pipeline, ProcessingService
-from ami.ml.models.pipeline import collect_images, get_or_create_algorithm_and_category_map, save_results
+from ami.ml.media import create_detection_images_for_source_images
+from ami.ml.models import Algorithm, Pipeline, ProcessedImage, ProcessingService
+from ami.ml.models.pipeline import (
+    collect_images,
+    get_or_create_algorithm_and_category_map,
+    save_results,
+    stream_images,
+)
+from ami.ml.models.processed_image import mark_images_processed
 from ami.ml.post_processing.small_size_filter import SmallSizeFilterTask
 from ami.ml.schemas import (
     AlgorithmConfigResponse,
@@ -42,6 +57,7 @@ from ami.tests.fixtures.main import (
 )
 from ami.tests.fixtures.ml import ALGORITHM_CHOICES
 from ami.users.models import User
+from ami.utils.requests import close_pooled_sessions
 
 
 class TestProcessingServiceAPI(APITestCase):
@@ -167,6 +183,45 @@ class TestProcessingServiceAPI(APITestCase):
         self.assertEqual(configs, [])
 
 
+class TestProcessingServiceSession(TestCase):
+    """Requests to a processing service share one pooled, keep-alive session per process."""
+
+    def setUp(self):
+        close_pooled_sessions()
+        self.addCleanup(close_pooled_sessions)
+
+    def test_status_checks_reuse_connection(self):
+        service = ProcessingService.objects.create(
+            name="Pooled Service", endpoint_url="http://processing_service:2000"
+        )
+
+        service.get_status()
+        service.get_pipeline_configs()
+
+        session = service.get_session()
+        self.assertIs(session, ProcessingService.objects.get(pk=service.pk).get_session())
+        pools = list(session.get_adapter(service.endpoint_url).poolmanager.pools._container.values())
+        self.assertEqual(len(pools), 1)
+        # Three requests (including the status check on create) over a single connection
+        self.assertEqual(pools[0].num_connections, 1)
+        self.assertEqual(pools[0].num_requests, 3)
+
+    def test_session_follows_service_settings(self):
+        service = ProcessingService(name="Tuned Service", endpoint_url="http://tuned-service:2000", max_retries=1)
+        session = service.get_session()
+        adapter = session.get_adapter(service.endpoint_url)
+        self.assertEqual(adapter.max_retries.total, 1)
+        self.assertEqual(adapter._pool_maxsize, 10)
+
+        service.max_retries = 5
+        service.max_connections = 32
+        new_session = service.get_session()
+        self.assertIsNot(new_session, session)
+        adapter = new_session.get_adapter(service.endpoint_url)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+
 class TestProcessingServiceLastSeen(TestCase):
     """Test the last_seen, last_seen_live, and last_seen_latency fields."""
 
@@ -557,6 +612,101 @@ class TestPipeline(TestCase):
         images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
         assert len(images) == 2
 
+    def test_stream_images_in_id_ordered_batches(self):
+        more_images = [SourceImage.objects.create(path=f"test{i}-20240101002000.jpg") for i in range(3, 6)]
+        self.image_collection.images.add(*more_images)
+
+        stream = stream_images(collection=self.image_collection, pipeline=self.pipeline, batch_size=2)
+
+        self.assertEqual(stream.total, 5)
+        batches = list(stream)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        image_ids = [image.pk for batch in batches for image in batch]
+        self.assertEqual(image_ids, sorted(image.pk for image in self.test_images + more_images))
+        self.assertEqual(stream.collected, 5)
+
+    def test_stream_images_skips_processed_images(self):
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        save_results(self.fake_pipeline_results(images, self.pipeline))
+
+        stream = stream_images(collection=self.image_collection, pipeline=self.pipeline)
+
+        # The total counts every candidate; processed images are only filtered out while streaming
+        self.assertEqual(stream.total, 2)
+        self.assertEqual(list(stream), [])
+        self.assertEqual(stream.collected, 0)
+
+    def test_save_results_records_processed_images(self):
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        save_results(self.fake_pipeline_results(images, self.pipeline))
+
+        processed = ProcessedImage.objects.filter(pipeline=self.pipeline)
+        self.assertEqual({row.source_image_id for row in processed}, {image.pk for image in images})
+        algorithm_ids = sorted(self.pipeline.algorithms.values_list("pk", flat=True))
+        self.assertTrue(all(row.algorithm_ids == algorithm_ids for row in processed))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(stream_images(collection=self.image_collection, pipeline=self.pipeline)), [])
+        # The index anti-join skips the images without inspecting their detections
+        self.assertFalse([query for query in queries.captured_queries if "main_detection" in query["sql"]])
+
+        counts = SourceImageCollection.objects.filter(pk=self.image_collection.pk)
+        self.assertEqual(
+            counts.with_source_images_unprocessed_count(self.pipeline).get().source_images_unprocessed_count, 0
+        )
+        self.assertEqual(
+            counts.with_source_images_unprocessed_count(self.pipeline_two).get().source_images_unprocessed_count, 2
+        )
+
+    def test_processed_image_index_follows_pipeline_algorithms(self):
+        mark_images_processed([image.pk for image in self.test_images], self.pipeline)
+        # Images without any detections are skipped on the index's word alone
+        self.assertEqual(list(collect_images(collection=self.image_collection, pipeline=self.pipeline)), [])
+
+        self.pipeline.algorithms.add(Algorithm.objects.create(name="NEW Classifier 2.0", task_type="classification"))
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        self.assertEqual(len(images), 2)
+
+    def test_processed_image_index_requires_a_classifier(self):
+        detector_only_pipeline = Pipeline.objects.create(name="Detector Only Pipeline")
+        detector_only_pipeline.algorithms.set([self.algorithms["random-detector"]])
+        mark_images_processed([image.pk for image in self.test_images], detector_only_pipeline)
+
+        # Like filter_processed_images, a pipeline without a classifier reprocesses every image
+        self.assertFalse(ProcessedImage.objects.covering(detector_only_pipeline).exists())
+        images = list(collect_images(collection=self.image_collection, pipeline=detector_only_pipeline))
+        self.assertEqual(len(images), 2)
+
+    def test_partial_results_are_not_recorded_as_processed(self):
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        # The service's results don't include this classifier
+        self.pipeline.algorithms.add(Algorithm.objects.create(name="NEW Classifier 2.0", task_type="classification"))
+        save_results(self.fake_pipeline_results(images, self.pipeline))
+
+        self.assertFalse(ProcessedImage.objects.filter(pipeline=self.pipeline).exists())
+        self.assertEqual(len(list(collect_images(collection=self.image_collection, pipeline=self.pipeline))), 2)
+
+    def test_rebuild_processed_image_index_drops_images_with_deleted_results(self):
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        save_results(self.fake_pipeline_results(images, self.pipeline))
+        images[0].detections.first().classifications.all().delete()
+
+        call_command("rebuild_processed_image_index", pipelines=[self.pipeline.slug], stdout=io.StringIO())
+
+        processed = ProcessedImage.objects.filter(pipeline=self.pipeline)
+        self.assertEqual({row.source_image_id for row in processed}, {images[1].pk})
+
+    def test_rebuild_processed_image_index(self):
+        images = list(collect_images(collection=self.image_collection, pipeline=self.pipeline))
+        save_results(self.fake_pipeline_results(images, self.pipeline))
+        ProcessedImage.objects.all().delete()
+
+        call_command("rebuild_processed_image_index", pipelines=[self.pipeline.slug], stdout=io.StringIO())
+
+        processed = ProcessedImage.objects.filter(pipeline=self.pipeline)
+        self.assertEqual({row.source_image_id for row in processed}, {image.pk for image in images})
+        self.assertFalse(ProcessedImage.objects.filter(pipeline=self.pipeline_two).exists())
+
     def test_collect_images_prefetches_deployment_and_data_source(self):
         """
         collect_images() must hand back SourceImage rows with deployment and
@@ -1437,6 +1587,132 @@ class TestAlgorithmCategoryMaps(TestCase):
         self.assertEqual(test_labels, converted_labels)
 
 
+class TestDetectionImages(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name="Detection images project")
+        self.source_images = [
+            SourceImage.objects.create(
+                path=f"crops_{i}.jpg", public_base_url="http://example.com", project=self.project
+            )
+            for i in range(3)
+        ]
+        for source_image in self.source_images:
+            for bbox in ([0, 0, 20, 10], [10, 10, 40, 30], None):
+                Detection.objects.create(source_image=source_image, bbox=bbox)
+        # A box outside the image can't be cropped
+        self.bad_detection = Detection.objects.create(source_image=self.source_images[0], bbox=[200, 200, 300, 300])
+        self.detections = Detection.objects.filter(source_image__in=self.source_images)
+
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (64, 48), color=(120, 80, 40)).save(buffer, format="JPEG")
+        self.image_content = buffer.getvalue()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def _create_detection_images(self, crop_threads: int):
+        with patch("ami.ml.media.fetch_image_content", return_value=self.image_content) as fetch:
+            result = create_detection_images_for_source_images(
+                SourceImage.objects.filter(pk__in=[image.pk for image in self.source_images]),
+                crop_threads=crop_threads,
+                io_threads=4,
+            )
+        return result, fetch
+
+    def test_fetches_each_source_image_once(self):
+        result, fetch = self._create_detection_images(crop_threads=1)
+
+        self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(len(result.paths), 6)
+        self.assertEqual(result.errors, [(self.source_images[0].pk, ANY)])
+        saved = self.detections.filter(path__isnull=False)
+        self.assertEqual(set(saved.values_list("path", flat=True)), set(result.paths))
+        for detection in saved:
+            with default_storage.open(detection.path) as f, PILImage.open(f) as crop:
+                x1, y1, x2, y2 = detection.bbox
+                self.assertEqual(crop.size, (x2 - x1, y2 - y1))
+        # The detection that failed, and null detections, are left for later
+        self.assertFalse(Detection.objects.filter(pk=self.bad_detection.pk, path__isnull=False).exists())
+        self.assertEqual(self.detections.filter(bbox__isnull=True, path__isnull=False).count(), 0)
+
+    def test_saves_crop_variants(self):
+        result, _ = self._create_detection_images(crop_threads=1)
+
+        for detection in self.detections.filter(path__isnull=False):
+            self.assertEqual(set(detection.image_variants), {"webp"})
+            with default_storage.open(detection.image_variants["webp"]) as f, PILImage.open(f) as crop:
+                x1, y1, x2, y2 = detection.bbox
+                self.assertEqual((crop.format, crop.size), ("WEBP", (x2 - x1, y2 - y1)))
+            self.assertTrue(detection.url("webp").endswith(".webp"))
+            self.assertTrue(detection.url().endswith(".jpg"))
+
+        self.detections.update(path=None, image_variants=None)
+        with override_settings(IMAGE_VARIANT_FORMATS=[]):
+            self._create_detection_images(crop_threads=1)
+        variants = list(self.detections.filter(path__isnull=False).values_list("image_variants", flat=True))
+        self.assertEqual(variants, [{}] * 6)
+
+    def test_crops_in_thread_pool(self):
+        result, fetch = self._create_detection_images(crop_threads=2)
+
+        self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(len(result.paths), 6)
+        self.assertEqual(self.detections.filter(path__isnull=False).count(), 6)
+
+        # Nothing left to crop on a second run
+        result, fetch = self._create_detection_images(crop_threads=2)
+        self.assertEqual(result.paths, [])
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("create_missing_detection_images", benchmark=2, crop_threads=2, stdout=out)
+        self.assertIn("crops/s", out.getvalue())
+        self.assertIn("Speedup", out.getvalue())
+
+
+def _run_create_detection_images_task(source_image_ids: list[int]):
+    """Run the task in a daemon process, as Celery's prefork pool does."""
+    from ami.ml.tasks import create_detection_images
+
+    try:
+        create_detection_images(source_image_ids)
+    finally:
+        connections.close_all()
+
+
+class TestDetectionImagesInPreforkWorker(TransactionTestCase):
+    def test_creates_detection_images_in_daemon_process(self):
+        """Prefork workers are daemon processes, which can't start processes of their own."""
+        import billiard
+
+        project = Project.objects.create(name="Detection images worker project")
+        source_image = SourceImage.objects.create(
+            path="crops_worker.jpg", public_base_url="http://example.com", project=project
+        )
+        for bbox in ([0, 0, 20, 10], [10, 10, 40, 30]):
+            Detection.objects.create(source_image=source_image, bbox=bbox)
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (64, 48), color=(120, 80, 40)).save(buffer, format="JPEG")
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+
+        # The forked worker opens its own database connection
+        connections.close_all()
+        with (
+            override_settings(MEDIA_ROOT=media_root.name, DETECTION_IMAGES_CROP_THREADS=2),
+            patch("ami.ml.media.fetch_image_content", return_value=buffer.getvalue()),
+        ):
+            worker = billiard.Process(target=_run_create_detection_images_task, args=([source_image.pk],))
+            worker.daemon = True
+            worker.start()
+            worker.join(timeout=60)
+
+        self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(Detection.objects.filter(source_image=source_image, path__isnull=False).count(), 2)
+
+
 class TestPostProcessingTasks(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -1922,6 +2198,33 @@ class TestTaskStateManager(TestCase):
         progress = self.manager.get_progress("process")
         self.assertIsNone(progress)
 
+    def test_requeue_images(self):
+        self._init_and_verify(self.image_ids)
+        self.manager.update_state({"img1", "img2"}, "process", failed_image_ids={"img1"})
+        self.manager.update_state({"img1", "img2"}, "results")
+
+        self.assertEqual(self.manager.requeue_images({"img1", "img3"}), 1)  # img3 was still pending
+
+        for stage in self.manager.STAGES:
+            progress = self.manager.get_progress(stage)
+            assert progress is not None
+            self.assertEqual(progress.remaining, 4)
+            self.assertEqual(progress.failed, 0)
+        # A result for the requeued image counts again
+        progress = self.manager.update_state({"img1"}, "process")
+        assert progress is not None
+        self.assertEqual(progress.newly_removed, 1)
+
+    def test_dead_letter_replay_claims(self):
+        self._init_and_verify(self.image_ids)
+        self.assertEqual(self.manager.claim_dead_letter_replays([1, 2]), [1, 2])
+        self.assertEqual(self.manager.claim_dead_letter_replays([2, 3]), [3])
+        self.manager.release_dead_letter_replays([3])
+        self.assertEqual(self.manager.get_replayed_dead_letters(), {1, 2})
+
+        self.manager.cleanup()
+        self.assertEqual(self.manager.get_replayed_dead_letters(), set())
+
     def test_update_state_raises_on_redis_error(self):
         """
         A transient Redis failure during update_state must propagate, not be
@@ -1961,6 +2264,136 @@ class TestTaskStateManager(TestCase):
         self.assertIsNone(progress)
 
 
+class TestBitmapTaskStateManager(TestCase):
+    """Test the bitmap-backed job state manager against the set-based contract."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        from ami.ml.orchestration.async_job_state import BitmapJobStateManager
+
+        cache.clear()
+        self.job_id = 124
+        self.manager = BitmapJobStateManager(self.job_id)
+        # Non-contiguous primary keys, as in a collection sampled from a large deployment
+        self.image_ids = ["1001", "1002", "1010", "1017", "1040"]
+        self.manager.initialize_job(self.image_ids)
+
+    def test_initialize_job(self):
+        for stage in self.manager.STAGES:
+            progress = self.manager.get_progress(stage)
+            assert progress is not None
+            self.assertEqual(progress.total, 5)
+            self.assertEqual(progress.remaining, 5)
+            self.assertEqual(progress.failed, 0)
+
+    def test_update_state_counts_and_replays(self):
+        progress = self.manager.update_state({"1001", "1017"}, "process")
+        assert progress is not None
+        self.assertEqual(progress.remaining, 3)
+        self.assertEqual(progress.processed, 2)
+        self.assertEqual(progress.percentage, 0.4)
+        self.assertEqual(progress.newly_removed, 2)
+
+        # Replaying the batch leaves counts untouched and reports nothing removed
+        progress = self.manager.update_state({"1001", "1017"}, "process")
+        assert progress is not None
+        self.assertEqual(progress.remaining, 3)
+        self.assertEqual(progress.newly_removed, 0)
+
+        # Stages are independent
+        results = self.manager.get_progress("results")
+        assert results is not None
+        self.assertEqual(results.remaining, 5)
+
+    def test_ids_outside_job_are_ignored(self):
+        progress = self.manager.update_state({"1003", "999", "5000"}, "process", failed_image_ids={"5000"})
+        assert progress is not None
+        self.assertEqual(progress.remaining, 5)
+        self.assertEqual(progress.failed, 0)
+        self.assertEqual(progress.newly_removed, 0)
+
+    def test_failed_image_tracking(self):
+        progress = self.manager.update_state({"1002", "1040"}, "process", failed_image_ids={"1002", "1040"})
+        assert progress is not None
+        self.assertEqual(progress.failed, 2)
+        self.assertEqual(progress.processed, 2)
+
+        progress = self.manager.update_state(set(), "results", failed_image_ids={"1002", "1010"})
+        assert progress is not None
+        self.assertEqual(progress.failed, 3)
+
+    def test_get_pending_image_ids(self):
+        self.manager.update_state({"1001", "1002"}, "process")
+        self.manager.update_state({"1001", "1010"}, "results")
+        # Union across stages: 1002 is still pending in results, 1010 in process
+        self.assertEqual(self.manager.get_pending_image_ids(), {"1002", "1010", "1017", "1040"})
+
+    def test_requeue_images(self):
+        self.manager.update_state({"1001", "1002"}, "process", failed_image_ids={"1001"})
+        self.manager.update_state({"1001"}, "results")
+
+        # 1010 was still pending; 99999 is outside the job and ignored
+        self.assertEqual(self.manager.requeue_images({"1001", "1010", "99999"}), 1)
+
+        self.assertEqual(self.manager.get_pending_image_ids(), {"1001", "1002", "1010", "1017", "1040"})
+        progress = self.manager.get_progress("process")
+        assert progress is not None
+        self.assertEqual(progress.remaining, 4)  # 1002 was processed and not requeued
+        self.assertEqual(progress.failed, 0)
+
+    def test_fresh_instance_reads_index_from_redis(self):
+        from ami.ml.orchestration.async_job_state import BitmapJobStateManager
+
+        progress = BitmapJobStateManager(self.job_id).update_state({"1040"}, "process")
+        assert progress is not None
+        self.assertEqual(progress.remaining, 4)
+
+    def test_empty_job(self):
+        self.manager.initialize_job([])
+        progress = self.manager.get_progress("process")
+        assert progress is not None
+        self.assertEqual(progress.total, 0)
+        self.assertEqual(progress.percentage, 1.0)
+        self.assertEqual(self.manager.get_pending_image_ids(), set())
+
+    def test_cleanup(self):
+        self.manager.update_state({"1001"}, "process", failed_image_ids={"1001"})
+        self.manager.cleanup()
+        self.assertIsNone(self.manager.get_progress("process"))
+        self.assertIsNone(self.manager.update_state({"1002"}, "process"))
+
+    def test_factory_follows_setting(self):
+        from django.test import override_settings
+
+        from ami.ml.orchestration.async_job_state import (
+            AsyncJobStateManager,
+            BitmapJobStateManager,
+            get_job_state_manager,
+        )
+
+        with override_settings(ASYNC_JOB_STATE_BACKEND="bitmap"):
+            self.assertIsInstance(get_job_state_manager(1), BitmapJobStateManager)
+        with override_settings(ASYNC_JOB_STATE_BACKEND="sets"):
+            self.assertIs(type(get_job_state_manager(1)), AsyncJobStateManager)
+
+    def test_factory_keeps_backend_of_initialized_job(self):
+        from django.test import override_settings
+
+        from ami.ml.orchestration.async_job_state import (
+            AsyncJobStateManager,
+            BitmapJobStateManager,
+            get_job_state_manager,
+        )
+
+        with override_settings(ASYNC_JOB_STATE_BACKEND="sets"):
+            self.assertIsInstance(get_job_state_manager(self.job_id), BitmapJobStateManager)
+            self.assertIs(type(get_job_state_manager(self.job_id, new=True)), AsyncJobStateManager)
+
+            self.manager.cleanup()
+            self.assertIs(type(get_job_state_manager(self.job_id)), AsyncJobStateManager)
+
+
 class TestSaveResultsRefreshesDeploymentCounts(TestCase):
     """save_results must refresh Deployment cached counts, not just Event counts.
 
@@ -114,6 +114,68 @@ def regroup_events(deployment_id: int) -> None:
         logger.info(f"{deployment} regroup skipped — see warning above")
 
 
+# Task to pre-generate capture thumbnails, queued after a deployment sync and by
+# cold requests to the thumbnail endpoint (which serves a placeholder meanwhile).
+@celery_app.task(soft_time_limit=one_day, time_limit=one_day + one_hour)
+def generate_thumbnails(
+    deployment_id: int | None = None,
+    event_id: int | None = None,
+    source_image_ids: list[int] | None = None,
+    batch_size: int = 100,
+) -> int:
+    from ami.main.models import SourceImage, generate_source_image_thumbnails
+
+    captures = SourceImage.objects.all()
+    if deployment_id is not None:
+        captures = captures.filter(deployment_id=deployment_id)
+    if event_id is not None:
+        captures = captures.filter(event_id=event_id)
+    if source_image_ids is not None:
+        captures = captures.filter(pk__in=source_image_ids)
+    # Only projects with thumbnails enabled (see Project.thumbnails_enabled)
+    captures = captures.filter(project__draft=False).select_related("deployment__data_source").with_thumbnails()
+
+    generated = 0
+    last_pk = 0
+    while batch := list(captures.filter(pk__gt=last_pk).order_by("pk")[:batch_size]):
+        generated += generate_source_image_thumbnails(batch)
+        last_pk = batch[-1].pk
+    logger.info(f"Generated {generated} thumbnails")
+    return generated
+
+
+# Task to rebuild a deployment's chart rollups, queued by queue_chart_rollup_refresh
+# after its captures sync, results are saved or determinations change.
+@celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
+def refresh_deployment_chart_rollups(deployment_id: int) -> None:
+    from django.core.cache import cache
+
+    from ami.main.models import Deployment, refresh_chart_rollups
+
+    # Changes from now on queue another refresh
+    cache.delete(f"chart_rollups:queued:{deployment_id}")
+    deployment = Deployment.objects.filter(pk=deployment_id).first()
+    if deployment is None:
+        logger.warning(f"Deployment {deployment_id} not found; skipping chart rollups")
+        return
+    refresh_chart_rollups(deployment)
+
+
+# Periodic task that queues building the chart rollups of deployments that have never
+# had them, e.g. after the rollup tables were added. Until then their projects' charts
+# aggregate the raw tables (see ami.main.charts).
+@celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
+def backfill_chart_rollups() -> int:
+    from ami.main.models import Deployment, queue_chart_rollup_refresh
+
+    missing = Deployment.objects.filter(chart_rollups_updated_at__isnull=True)
+    deployment_ids = list(missing.values_list("pk", flat=True))
+    queue_chart_rollup_refresh(deployment_ids)
+    if deployment_ids:
+        logger.info(f"Queued building the chart rollups of {len(deployment_ids)} deployments")
+    return len(deployment_ids)
+
+
 @celery_app.task(soft_time_limit=one_hour, time_limit=one_hour + 60)
 def save_model_instance(app_label: str, model_name: str, pk: int | str) -> bool:
     """
@@ -0,0 +1,197 @@
+"""
+Size-bounded local disk cache for source image bytes.
+
+Crop generation, thumbnails, dimension backfills and the ML media helpers all
+fetch the same source images from object storage, often within minutes of each
+other. ``get_or_fetch`` keeps the bytes in ``settings.SOURCE_IMAGE_CACHE_DIR``,
+which the web and worker processes on a host share:
+
+  - Entries are named by a SHA-256 of the image's location (an S3 bucket and key,
+    or a URL without its presigning query string), so every process finds the
+    same entry and a re-signed URL still hits. Entries are never revalidated, so
+    callers that know the image's checksum, size or modification time pass them
+    as its version: an image overwritten in storage then gets a new entry instead
+    of being served stale, and the old one ages out.
+  - Writes go to a temporary file that is renamed into place, so readers never
+    see a partial image, and concurrent writers of the same image both succeed.
+  - Reads bump the file's modification time. Once the cache grows past
+    ``settings.SOURCE_IMAGE_CACHE_MAX_SIZE`` bytes, the least recently used
+    entries are evicted, by whichever process holds the eviction lock.
+
+Hits, misses and evictions are counted in Redis and exported by the Prometheus
+metrics endpoint (see ``ami.ml.orchestration.metrics``). Like those metrics,
+the cache never raises: if it can't be read or written, the image is fetched.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import typing
+import urllib.parse
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics:source_image_cache"
+CACHE_EVENTS = ("hit", "miss", "eviction")
+
+# Eviction trims the cache to this fraction of its max size, so it doesn't run
+# again on the very next write.
+EVICT_TO_FRACTION = 0.9
+
+# Query parameters of presigned S3 URLs, which change every time a URL is signed
+PRESIGNING_PARAMS = {"awsaccesskeyid", "signature", "expires"}
+
+_lock = threading.Lock()
+_bytes_written_since_eviction = 0
+
+
+def _cache_dir() -> str | None:
+    if not settings.SOURCE_IMAGE_CACHE_DIR or settings.SOURCE_IMAGE_CACHE_MAX_SIZE <= 0:
+        return None
+    return settings.SOURCE_IMAGE_CACHE_DIR
+
+
+def _headroom() -> int:
+    # Images larger than this aren't cached, and each process checks the size of
+    # the shared cache after writing this much, rather than on every write.
+    max_size = settings.SOURCE_IMAGE_CACHE_MAX_SIZE
+    return max_size - int(max_size * EVICT_TO_FRACTION)
+
+
+def url_cache_key(url: str) -> str:
+    """Identify an image by its URL, ignoring the query parameters of presigned S3 URLs."""
+    parts = urllib.parse.urlsplit(url)
+    query = [
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("x-amz-") and name.lower() not in PRESIGNING_PARAMS
+    ]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query), fragment=""))
+
+
+def _entry_path(cache_dir: str, key: str, version: str) -> str:
+    digest = hashlib.sha256(f"{key}#{version}".encode() if version else key.encode()).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest)
+
+
+def record_cache_event(event: str, count: int = 1, size: int = 0) -> None:
+    assert event in CACHE_EVENTS, f"Unknown cache event {event!r}"
+    try:
+        with get_redis_connection("default").pipeline(transaction=False) as pipe:
+            pipe.hincrby(METRICS_KEY, event, count)
+            pipe.hincrby(METRICS_KEY, f"{event}_bytes", size)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not record source image cache {event}: {e}")
+
+
+def get_or_fetch(key: str, fetch: typing.Callable[[], bytes], version: str = "") -> bytes:
+    """
+    Return the cached bytes of the image identified by ``key``, or fetch and cache them.
+
+    ``version`` identifies the content at that location (see ``SourceImage.content_version``).
+    """
+    cache_dir = _cache_dir()
+    if not cache_dir:
+        return fetch()
+
+    path = _entry_path(cache_dir, key, version)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not read {key} from the source image cache: {e}")
+    else:
+        record_cache_event("hit", size=len(content))
+        return content
+
+    content = fetch()
+    record_cache_event("miss", size=len(content))
+    if content and len(content) <= _headroom():
+        _write(cache_dir, path, content)
+    return content
+
+
+def _write(cache_dir: str, path: str, content: bytes) -> None:
+    global _bytes_written_since_eviction
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning(f"Could not write to the source image cache: {e}")
+        return
+
+    with _lock:
+        _bytes_written_since_eviction += len(content)
+        due = _bytes_written_since_eviction >= _headroom()
+        if due:
+            _bytes_written_since_eviction = 0
+    if due:
+        try:
+            evict(cache_dir)
+        except OSError as e:
+            logger.warning(f"Could not evict images from the source image cache: {e}")
+
+
+def evict(cache_dir: str | None = None) -> int:
+    """
+    Delete the least recently used entries until the cache is back under its size limit.
+
+    Returns the number of bytes evicted. Does nothing if another process is
+    already evicting.
+    """
+    cache_dir = cache_dir or _cache_dir()
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    max_size = settings.SOURCE_IMAGE_CACHE_MAX_SIZE
+    with open(os.path.join(cache_dir, ".lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+
+        entries = []
+        for shard in os.scandir(cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total <= max_size:
+            return 0
+
+        evicted_count = evicted_bytes = 0
+        for _, size, path in sorted(entries):
+            if total - evicted_bytes <= max_size * EVICT_TO_FRACTION:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            evicted_count += 1
+            evicted_bytes += size
+
+    logger.info(f"Evicted {evicted_count} images ({evicted_bytes} bytes) from the source image cache")
+    record_cache_event("eviction", count=evicted_count, size=evicted_bytes)
+    return evicted_bytes
@@ -1,25 +1,161 @@
+import dataclasses
 import hashlib
+import io
 import logging
+import typing
 from datetime import datetime
 
 import requests
+from django.conf import settings
 from PIL import Image
 from PIL.ExifTags import TAGS
 
 from ami.utils.dates import get_image_timestamp_from_filename
+from ami.utils.image_cache import get_or_fetch, url_cache_key
 
 logger = logging.getLogger(__name__)
 
 
-def fetch_image_content(url: str, timeout: tuple[float, float] = (5.0, 30.0)) -> bytes:
+def fetch_image_content(url: str, timeout: tuple[float, float] = (5.0, 30.0), version: str = "") -> bytes:
     """Fetch raw image bytes from ``url``.
 
     The default ``(connect=5s, read=30s)`` timeout keeps a stalled upstream from
     tying up web workers — this runs synchronously in the thumbnail-generation path.
+    Reads through the local source image cache (see ``ami.utils.image_cache``), in
+    which ``version`` tells apart the contents of an image that was overwritten.
     """
-    response = requests.get(url, timeout=timeout)
-    response.raise_for_status()
-    return response.content
+
+    def fetch() -> bytes:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    return get_or_fetch(url_cache_key(url), fetch, version=version)
+
+
+# Formats thumbnails and detection crops can have variants in, besides JPEG, with the
+# MIME type browsers list in their ``Accept`` header for them. The most compact comes first.
+IMAGE_VARIANT_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+IMAGE_VARIANT_SAVE_OPTIONS = {
+    "avif": {"quality": 60, "speed": 6},
+    "webp": {"quality": 80, "method": 4},
+}
+
+
+def image_variant_formats() -> list[str]:
+    """
+    The formats in ``settings.IMAGE_VARIANT_FORMATS`` that the installed Pillow can encode.
+
+    WebP is built into Pillow. AVIF needs Pillow 11.2+, or the ``pillow-avif-plugin``
+    package, which registers the format when it's imported.
+    """
+    if "avif" in settings.IMAGE_VARIANT_FORMATS:
+        try:
+            import pillow_avif  # noqa: F401
+        except ImportError:
+            pass
+    Image.init()
+    formats = []
+    for image_format in settings.IMAGE_VARIANT_FORMATS:
+        if image_format not in IMAGE_VARIANT_MIME_TYPES:
+            logger.warning(f"Unknown image variant format {image_format!r}")
+        elif image_format.upper() not in Image.SAVE:
+            logger.warning(f"The installed Pillow can't encode {image_format} image variants")
+        else:
+            formats.append(image_format)
+    return formats
+
+
+def encode_image_variants(img: Image.Image, formats: typing.Iterable[str]) -> dict[str, bytes]:
+    """Encode ``img`` in each of the variant formats, e.g. ``{"webp": b"..."}``."""
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    variants = {}
+    for image_format in formats:
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format.upper(), **IMAGE_VARIANT_SAVE_OPTIONS[image_format])
+        variants[image_format] = buffer.getvalue()
+    return variants
+
+
+def preferred_image_format(accept: str | None, available: typing.Iterable[str]) -> str | None:
+    """
+    The most compact of the ``available`` variant formats the ``Accept`` header lists, if any.
+
+    Only explicit image types count: a wildcard like ``*/*`` (sent by API clients that
+    don't render images) gets the JPEG original, which every client can display.
+    """
+    if not accept:
+        return None
+    accepted = set()
+    for media_range in accept.split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(media_type.lower())
+    available = set(available)
+    for image_format, mime_type in IMAGE_VARIANT_MIME_TYPES.items():
+        if image_format in available and mime_type in accepted:
+            return image_format
+    return None
+
+
+@dataclasses.dataclass
+class Thumbnail:
+    content: bytes
+    height: int
+    # Encodings of the same thumbnail in other formats, e.g. {"webp": b"..."}
+    variants: dict[str, bytes] = dataclasses.field(default_factory=dict)
+
+
+def make_thumbnails(
+    image_content: bytes, sizes: dict[str, dict], variant_formats: typing.Iterable[str] = ()
+) -> dict[str, Thumbnail]:
+    """Encode one JPEG thumbnail per ``{label: {"width": ..., "height": ...}}`` size spec.
+
+    The source is decoded once: for JPEGs, ``draft`` has libjpeg scale the DCT down by
+    up to 8x while decoding, to no smaller than the largest requested size, so a 240px
+    thumbnail of a 4K capture never decodes the full-resolution pixels. Smaller sizes
+    are then resized from larger ones. Each thumbnail is also encoded in the
+    ``variant_formats`` (see ``encode_image_variants``).
+    """
+    img = Image.open(io.BytesIO(image_content))
+    orig_width, orig_height = img.size
+
+    targets = {}
+    for label, size in sizes.items():
+        width = size["width"]
+        height = size.get("height", None) or int(orig_height * (width / float(orig_width)))
+        targets[label] = (width, height)
+
+    # A no-op for formats other than JPEG, and for targets larger than the source
+    widths, heights = zip(*targets.values())
+    img.draft(img.mode, (max(widths), max(heights)))
+    # JPEG only supports L, RGB, CMYK — convert other modes (e.g. RGBA PNGs)
+    # or PIL raises ``OSError: cannot write mode <X> as JPEG``.
+    if img.mode not in ("L", "RGB", "CMYK"):
+        img = img.convert("RGB")
+
+    thumbnails = {}
+    for label, new_size in sorted(targets.items(), key=lambda item: item[1], reverse=True):
+        img.thumbnail(new_size)
+        thumbnails[label] = Thumbnail(encode_thumbnail(img), img.size[1], encode_image_variants(img, variant_formats))
+    return thumbnails
+
+
+def encode_thumbnail(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    # No ``exif=`` argument: detection boxes are overlaid on thumbnails in raw
+    # pixel coordinates, so the EXIF Orientation tag must not propagate.
+    img.save(buffer, format="JPEG", progressive=True, optimize=True, quality=82)
+    return buffer.getvalue()
 
 
 def extract_timestamp_from_exif(image: Image.Image) -> datetime | None:
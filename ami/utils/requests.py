@@ -1,3 +1,5 @@
+import os
+import threading
 import typing
 
 import requests
@@ -16,6 +18,7 @@ def create_session(
     retries: int = 3,
     backoff_factor: int = 2,
     status_forcelist: tuple[int, ...] = (500, 502, 503, 504),
+    pool_maxsize: int = 10,
 ) -> requests.Session:
     """
     Create a requests Session with retry capabilities.
@@ -24,6 +27,7 @@ def create_session(
         retries: Maximum number of retries
         backoff_factor: Backoff factor for retries
         status_forcelist: HTTP status codes to retry on
+        pool_maxsize: Connections kept open per host
 
     Returns:
         Session configured with retry behavior
@@ -36,12 +40,58 @@ def create_session(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
 
 
+_pooled_sessions: dict[tuple, requests.Session] = {}
+_pooled_sessions_lock = threading.Lock()
+
+
+def get_pooled_session(
+    endpoint_url: str,
+    retries: int = 3,
+    backoff_factor: int = 2,
+    status_forcelist: tuple[int, ...] = (500, 502, 503, 504),
+    pool_maxsize: int = 10,
+) -> requests.Session:
+    """
+    Return this process's shared session for an endpoint, creating it on first use.
+
+    Unlike `create_session`, the session (and the keep-alive connections in its pool)
+    outlives the call, so repeated requests to the same service skip the TCP and TLS
+    handshakes. Sessions are keyed by endpoint and retry/pool settings, so changing a
+    service's settings replaces its session, and by process ID, so a forked worker never
+    reuses its parent's sockets.
+    """
+    key = (os.getpid(), endpoint_url, retries, backoff_factor, tuple(status_forcelist), pool_maxsize)
+    with _pooled_sessions_lock:
+        session = _pooled_sessions.get(key)
+        if session is None:
+            # Drop the session built with this endpoint's previous settings, if any
+            for stale_key in [k for k in _pooled_sessions if k[:2] == key[:2]]:
+                _pooled_sessions.pop(stale_key).close()
+            session = create_session(
+                retries=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=status_forcelist,
+                pool_maxsize=pool_maxsize,
+            )
+            _pooled_sessions[key] = session
+        return session
+
+
+def close_pooled_sessions() -> None:
+    """Close every pooled session and its open connections."""
+    with _pooled_sessions_lock:
+        sessions = list(_pooled_sessions.values())
+        _pooled_sessions.clear()
+    for session in sessions:
+        session.close()
+
+
 def extract_error_message_from_response(resp: requests.Response) -> str:
     """
     Extract detailed error information from an HTTP response.
@@ -25,6 +25,7 @@ from mypy_boto3_s3.service_resource import Bucket, ObjectSummary, S3ServiceResou
 from mypy_boto3_s3.type_defs import BucketTypeDef, CreateBucketOutputTypeDef, ObjectTypeDef, PaginatorConfigTypeDef
 from rich import print
 
+from .image_cache import get_or_fetch
 from .storages import IMAGE_FILE_EXTENSIONS, ConnectionTestResult
 
 logger = logging.getLogger(__name__)
@@ -612,17 +613,21 @@ def file_exists(config: S3Config, key: str) -> bool:
         return True
 
 
-def read_image(config: S3Config, key: str) -> PIL.Image.Image:
+def read_image(config: S3Config, key: str, version: str = "") -> PIL.Image.Image:
     """
-    Download an image from S3 and return as a PIL Image.
+    Download an image from S3 (or the local source image cache) and return as a PIL Image.
+
+    ``version`` tells apart the cached contents of an image that was overwritten.
     """
-    bucket = get_bucket(config)
-    obj = bucket.Object(key)
-    logger.info(f"Fetching image {key} from S3")
+
+    def fetch() -> bytes:
+        bucket = get_bucket(config)
+        logger.info(f"Fetching image {key} from S3")
+        return bucket.Object(key).get()["Body"].read()
+
+    content = get_or_fetch(f"s3://{config.bucket_name}/{key}?endpoint={config.endpoint_url or ''}", fetch, version)
     try:
-        # StreamingBody inherits from io.IOBase, but type checkers don't see that
-        fp = obj.get()["Body"]
-        img = PIL.Image.open(fp)  # type: ignore[arg-type]
+        img = PIL.Image.open(io.BytesIO(content))
     except PIL.UnidentifiedImageError:
         logger.error(f"Could not read image {key}")
         raise
@@ -101,3 +101,110 @@ class TestUtils(TestCase):
 
         _, kwargs = mocked.call_args
         self.assertEqual(kwargs["timeout"], (2.0, 10.0))
+
+    def test_get_pooled_session_is_shared_per_endpoint(self):
+        from ami.utils.requests import close_pooled_sessions, get_pooled_session
+
+        self.addCleanup(close_pooled_sessions)
+        session = get_pooled_session("http://service-a:2000")
+        self.assertIs(get_pooled_session("http://service-a:2000"), session)
+        self.assertIsNot(get_pooled_session("http://service-b:2000"), session)
+
+        # New settings for the same endpoint replace its session
+        retuned = get_pooled_session("http://service-a:2000", retries=5)
+        self.assertIsNot(retuned, session)
+        self.assertIs(get_pooled_session("http://service-a:2000", retries=5), retuned)
+
+    def test_preferred_image_format(self):
+        from ami.utils.media import preferred_image_format
+
+        available = {"webp": "thumbnails/small.webp", "avif": "thumbnails/small.avif"}
+        chrome = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+        self.assertEqual(preferred_image_format(chrome, available), "avif")
+        self.assertEqual(preferred_image_format(chrome, {"webp": "thumbnails/small.webp"}), "webp")
+        self.assertEqual(preferred_image_format("image/avif;q=0, image/webp", available), "webp")
+        # Wildcards and missing headers get the JPEG
+        self.assertIsNone(preferred_image_format("*/*", available))
+        self.assertIsNone(preferred_image_format("application/json, text/plain, */*", available))
+        self.assertIsNone(preferred_image_format(None, available))
+        self.assertIsNone(preferred_image_format(chrome, {}))
+
+
+class TestSourceImageCache(TestCase):
+    def setUp(self):
+        import tempfile
+
+        from django.test import override_settings
+
+        from ami.utils.image_cache import METRICS_KEY
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        cache_settings = override_settings(SOURCE_IMAGE_CACHE_DIR=self.cache_dir, SOURCE_IMAGE_CACHE_MAX_SIZE=1000)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+        from django_redis import get_redis_connection
+
+        self.redis = get_redis_connection("default")
+        self.redis.delete(METRICS_KEY)
+        self.addCleanup(self.redis.delete, METRICS_KEY)
+
+    def _counts(self) -> dict[str, int]:
+        from ami.utils.image_cache import METRICS_KEY
+
+        return {key.decode(): int(value) for key, value in self.redis.hgetall(METRICS_KEY).items()}
+
+    def test_fetch_image_content_reads_through_cache(self):
+        from ami.utils.media import fetch_image_content
+
+        with patch("ami.utils.media.requests.get") as mocked:
+            mocked.return_value.raise_for_status = Mock()
+            mocked.return_value.content = b"\xff\xd8 image"
+
+            first = fetch_image_content("http://example.invalid/x.jpg?X-Amz-Signature=a&X-Amz-Expires=60")
+            # Re-signed URLs of the same image share its entry
+            second = fetch_image_content("http://example.invalid/x.jpg?X-Amz-Signature=b&X-Amz-Expires=60")
+            fetch_image_content("http://example.invalid/y.jpg")
+
+        self.assertEqual(first, b"\xff\xd8 image")
+        self.assertEqual(second, first)
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(self._counts()["hit"], 1)
+        self.assertEqual(self._counts()["miss"], 2)
+
+    def test_overwritten_image_is_fetched_again(self):
+        from ami.utils.image_cache import get_or_fetch
+
+        fetch = Mock(side_effect=[b"old image", b"new image"])
+        self.assertEqual(get_or_fetch("image", fetch, version="etag-1:9"), b"old image")
+        self.assertEqual(get_or_fetch("image", fetch, version="etag-1:9"), b"old image")
+        self.assertEqual(get_or_fetch("image", fetch, version="etag-2:9"), b"new image")
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_evicts_least_recently_used(self):
+        import os
+        import time
+
+        from ami.utils.image_cache import get_or_fetch
+
+        fetch = Mock(side_effect=lambda: b"x" * 100)
+        get_or_fetch("image-0", fetch)
+        get_or_fetch("image-1", fetch)
+        for i in range(2, 12):
+            # Keep image-0 in use; mtimes need to differ for the eviction order
+            time.sleep(0.01)
+            get_or_fetch("image-0", fetch)
+            get_or_fetch(f"image-{i}", fetch)
+
+        entries = [os.path.join(root, name) for root, _, names in os.walk(self.cache_dir) for name in names]
+        self.assertLessEqual(sum(os.path.getsize(path) for path in entries if not path.endswith(".lock")), 1000)
+        self.assertGreater(self._counts()["eviction"], 0)
+
+        fetch.reset_mock()
+        get_or_fetch("image-0", fetch)
+        get_or_fetch("image-11", fetch)
+        fetch.assert_not_called()
+        get_or_fetch("image-1", fetch)
+        fetch.assert_called_once()
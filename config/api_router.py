@@ -80,6 +80,7 @@ urlpatterns = [
     path("auth/", include("djoser.urls.authtoken")),
     path("status/summary/", views.SummaryView.as_view(), name="status-summary"),
     path("status/storage/", views.StorageStatus.as_view(), name="status-storage"),
+    path("status/metrics/", views.MetricsView.as_view(), name="status-metrics"),
     path(
         "users/roles/",
         RolesAPIView.as_view(),
@@ -292,6 +292,17 @@ CACHES = {
     }
 }
 REDIS_URL = env("REDIS_URL", default=None)
+# Project statistics for the dashboard (SummaryView) are cached until the project's data
+# version changes (see bump_project_data_version), or for at most this many seconds.
+PROJECT_SUMMARY_CACHE_TIMEOUT = env.int("PROJECT_SUMMARY_CACHE_TIMEOUT", default=60 * 60 * 24)
+# Recompute a project's cached statistics in the background when one of its jobs finishes
+PROJECT_SUMMARY_REWARM_AFTER_JOBS = env.bool("PROJECT_SUMMARY_REWARM_AFTER_JOBS", default=False)
+# Serve taxon suggestions (the name autocomplete) from a per-process index of the taxa's names,
+# rebuilt when taxa change. Without it, or until it's built, they come from a trigram query.
+TAXON_SUGGEST_INDEX = env.bool("TAXON_SUGGEST_INDEX", default=True)
+# Serialized taxonomy trees (the Label Studio taxonomy endpoints) are cached until taxa change
+# (see bump_taxa_version), or for at most this many seconds.
+TAXA_TREE_CACHE_TIMEOUT = env.int("TAXA_TREE_CACHE_TIMEOUT", default=60 * 60 * 24)
 
 
 # Redis DB numbering convention:
@@ -326,6 +337,59 @@ NATS_URL = env("NATS_URL", default="nats://localhost:4222")  # type: ignore[no-u
 # 5 minutes gives cold-start GPU pipelines headroom without holding tasks
 # invisibly long after a genuine worker crash (bounded by max_deliver).
 NATS_TASK_TTR = env.int("NATS_TASK_TTR", default=300)
+# Upper bound (seconds) on the long-poll ``wait`` a worker may request from the
+# jobs ``tasks`` endpoints. Keep it below the load balancer's idle timeout so an
+# empty long-poll returns cleanly instead of being cut off mid-request.
+NATS_TASKS_MAX_WAIT = env.int("NATS_TASKS_MAX_WAIT", default=30)
+# How many of those long polls a web process holds open at once. Each one costs a
+# NATS connection and a subscription per job; polls beyond the cap return the
+# tasks that are queued right away, as if they hadn't asked to wait.
+NATS_TASKS_MAX_LONG_POLLS = env.int("NATS_TASKS_MAX_LONG_POLLS", default=100)
+# Publish rate (tasks per second) when dead letters are replayed to a job's
+# stream (see ami/ml/orchestration/dead_letters.py), so a large replay reaches
+# the workers gradually instead of as one burst.
+NATS_DLQ_REPLAY_RATE = env.float("NATS_DLQ_REPLAY_RATE", default=20.0)  # type: ignore[no-untyped-call]
+
+# Redis storage for async job progress (see ami/ml/orchestration/async_job_state.py):
+# "sets" keeps one set member per image ID; "bitmap" keeps one bit per image and
+# uses far less memory on jobs with millions of images. Each job keeps the backend
+# it was queued with, so switching only affects jobs queued afterwards.
+ASYNC_JOB_STATE_BACKEND = env("ASYNC_JOB_STATE_BACKEND", default="sets")
+
+# Minimum seconds between Job.progress writes per stage while async results stream
+# in. Results arriving inside the window only update Redis; the next write folds
+# them in. Stage completion always writes immediately. 0 writes on every result.
+JOB_PROGRESS_FLUSH_INTERVAL = env.float("JOB_PROGRESS_FLUSH_INTERVAL", default=2.0)
+
+# Synchronous ML jobs (sync_api dispatch, see MLJob.process_images) keep up to this
+# many batch requests in flight to the processing service, so its GPU is not idle
+# while Antenna prepares the next batch or reads a response. A pipeline can override
+# it with the "request_concurrency" key of its config. 1 sends one batch at a time.
+ML_SYNC_REQUEST_CONCURRENCY = env.int("ML_SYNC_REQUEST_CONCURRENCY", default=2)
+# While this many result-saving sub-tasks of a synchronous ML job are unfinished, no
+# new batch is sent, so results don't pile up in the broker when saving falls behind.
+ML_SYNC_MAX_PENDING_SAVES = env.int("ML_SYNC_MAX_PENDING_SAVES", default=4)
+# Batches of a synchronous ML job are spread across the pipeline's online processing
+# services (see ami/ml/orchestration/service_scheduler.py). A service that fails this
+# many requests or status checks in a row gets no batches for the cooldown (seconds),
+# then a single trial batch.
+PROCESSING_SERVICE_CIRCUIT_FAILURES = env.int("PROCESSING_SERVICE_CIRCUIT_FAILURES", default=3)
+PROCESSING_SERVICE_CIRCUIT_COOLDOWN = env.int("PROCESSING_SERVICE_CIRCUIT_COOLDOWN", default=60)
+
+# Detection images (crops) are made by fetching each source image once, then cropping
+# and JPEG-encoding its detections in a pool of this many threads (1 crops in the
+# calling thread) while fetches and uploads run in a pool of this many threads.
+DETECTION_IMAGES_CROP_THREADS = env.int("DETECTION_IMAGES_CROP_THREADS", default=2)
+DETECTION_IMAGES_IO_THREADS = env.int("DETECTION_IMAGES_IO_THREADS", default=8)
+
+# Source image bytes fetched from object storage are kept in this directory, which
+# the web and worker processes on a host share, up to this many bytes; the least
+# recently used images are evicted first (see ami/utils/image_cache.py). An empty
+# directory or a size of 0 disables the cache. Off by default: cached copies are
+# never revalidated, so only enable it (e.g. at /tmp/antenna-source-images) where
+# images overwritten in storage are synced again before they are processed.
+SOURCE_IMAGE_CACHE_DIR = env("SOURCE_IMAGE_CACHE_DIR", default="")
+SOURCE_IMAGE_CACHE_MAX_SIZE = env.int("SOURCE_IMAGE_CACHE_MAX_SIZE", default=2 * 1024**3)
 
 # ADMIN
 # ------------------------------------------------------------------------------
@@ -588,9 +652,30 @@ DEFAULT_EXCLUDE_TAXA = env.list("DEFAULT_EXCLUDE_TAXA", default=[])  # type: ign
 # until the append-only ``JobLog`` child table (PR #1259) is in place.
 JOB_LOG_PERSIST_ENABLED = env.bool("JOB_LOG_PERSIST_ENABLED", default=True)  # type: ignore[no-untyped-call]
 
+# Per-job log lines are buffered per process and written to JobLog in batches:
+# when JOB_LOG_BUFFER_SIZE lines are waiting, when the oldest has waited
+# JOB_LOG_FLUSH_INTERVAL seconds, or when a Celery task ends. A process that dies
+# loses at most its unflushed lines (they are still in the container log).
+# JOB_LOG_BUFFER_SIZE=1 writes every line immediately.
+JOB_LOG_BUFFER_SIZE = env.int("JOB_LOG_BUFFER_SIZE", default=200)  # type: ignore[no-untyped-call]
+JOB_LOG_FLUSH_INTERVAL = env.float("JOB_LOG_FLUSH_INTERVAL", default=2.0)  # type: ignore[no-untyped-call]
+# JobLog rows older than this are deleted by the daily jobs.prune_job_logs task,
+# except for jobs that are still running. 0 keeps logs forever.
+JOB_LOG_RETENTION_DAYS = env.int("JOB_LOG_RETENTION_DAYS", default=180)  # type: ignore[no-untyped-call]
+
 
 # Sizes for Source Image Thumbnails ("large" backs the zoomable session detail view)
 THUMBNAILS = {
     "STORAGE_PREFIX": "thumbnails/",
     "SIZES": {"small": {"width": 240}, "medium": {"width": 1024}, "large": {"width": 2560}},
 }
+# Thumbnails are pre-generated by the generate_thumbnails task after each deployment
+# sync. A request for a thumbnail that doesn't exist yet gets a placeholder and queues
+# it, unless THUMBNAILS_GENERATE_ON_REQUEST makes the request wait to generate it.
+THUMBNAILS_GENERATE_ON_REQUEST = env.bool("THUMBNAILS_GENERATE_ON_REQUEST", default=False)
+# Threads fetching source images and uploading thumbnails in the generate_thumbnails task
+THUMBNAILS_IO_THREADS = env.int("THUMBNAILS_IO_THREADS", default=8)
+# Besides JPEG, thumbnails and detection crops are saved in these formats ("webp",
+# "avif"), and served in the most compact one a browser's Accept header lists.
+# AVIF needs Pillow 11.2+ or pillow-avif-plugin; formats Pillow can't encode are skipped.
+IMAGE_VARIANT_FORMATS = env.list("IMAGE_VARIANT_FORMATS", default=["webp"])
@@ -30,3 +30,14 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore # noqa: F405
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Write job progress on every result so tests can assert on intermediate
+# progress deterministically. Coalescing is covered by tests that override this.
+JOB_PROGRESS_FLUSH_INTERVAL = 0
+# Same for job logs: write each line as it's logged (no buffering).
+JOB_LOG_BUFFER_SIZE = 1
+# Tests that fetch images expect each fetch to reach the (mocked) source; the
+# source image cache is enabled explicitly by its own tests.
+SOURCE_IMAGE_CACHE_DIR = ""
+# The taxon suggestion index is keyed by a version in the cache, which outlives each
+# test's database; it's enabled explicitly by its own tests.
+TAXON_SUGGEST_INDEX = False